@@ -4,13 +4,16 @@ from typing import Any, Union, Dict
 
 from maga_transformer.access_logger.json_util import dump_json
 from maga_transformer.access_logger.log_utils import get_handler
+from maga_transformer.access_logger.async_log_writer import get_async_log_writer
 from maga_transformer.access_logger.py_access_log import RequestLog, ResponseLog, PyAccessLog
 from maga_transformer.structure.request_extractor import request_id_field_name
+from maga_transformer.metrics import kmonitor, AccMetrics
 
 ACCESS_LOGGER_NAME = 'access_logger'
 QUERY_ACCESS_LOGGER_NAME = 'query_access_logger'
 
 LOG_RESPONSE = int(os.environ.get('PY_INFERENCE_LOG_RESPONSE', '0')) == 1
+MAX_STRING_LENGTH = int(os.environ.get('ACCESS_LOG_MAX_STRING_LENGTH', '0'))
 
 def init_access_logger() -> None:
     access_logger = logging.getLogger(ACCESS_LOGGER_NAME)
@@ -38,6 +41,16 @@ class AccessLogger():
         init_query_access_logger()
         self.logger = logging.getLogger(ACCESS_LOGGER_NAME)
         self.query_logger = logging.getLogger(QUERY_ACCESS_LOGGER_NAME)
+        self.writer = get_async_log_writer()
+
+    def _write(self, logger: logging.Logger, access_log: PyAccessLog, droppable: bool = True) -> None:
+        # no log file configured
+        if not logger.handlers:
+            return
+        if self.writer is None:
+            logger.info(dump_json(access_log, MAX_STRING_LENGTH))
+        elif not self.writer.submit(logger, access_log, droppable):
+            kmonitor.report(AccMetrics.ACCESS_LOG_DROP_QPS_METRIC, 1)
 
     @staticmethod
     def is_private_request(request: Dict[str, Any]):
@@ -46,14 +59,14 @@ class AccessLogger():
     def log_access(self, request: Dict[str, Any], response: ResponseLog) -> None:
         request_log = RequestLog.from_request(request)
         access_log = PyAccessLog(request = request_log, response = response, id = request[request_id_field_name])
-        self.logger.info(dump_json(access_log))
+        self._write(self.logger, access_log, droppable=response.exception is None)
 
     def log_query_access(self, request: Dict[str, Any]) -> None:
         if not self.is_private_request(request):
             request_log = RequestLog.from_request(request)
             response_log = ResponseLog()
             access_log = PyAccessLog(request = request_log, response = response_log, id = request[request_id_field_name])
-            self.query_logger.info(dump_json(access_log))
+            self._write(self.query_logger, access_log)
 
     def log_success_access(self, request: Dict[str, Any], response: Any) -> None:
         if not self.is_private_request(request):
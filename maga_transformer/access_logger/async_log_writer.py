@@ -0,0 +1,118 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from maga_transformer.access_logger.json_util import dump_json
+
+_STOP = object()
+
+class AsyncLogWriter(object):
+    '''
+    access logs are written by a background thread instead of the event loop. a log is serialized when it
+    is submitted, so later changes to the request or response do not reach the file.
+    lines are batched per logger and written as one record when the batch reaches `buffer_bytes` or
+    `flush_interval_s` has passed, so the cross-process file lock of the handler is taken once per batch.
+    the queue is bounded: when it is full new logs are dropped; with the `sample` policy only one in
+    `sample_rate` droppable logs is kept once the queue is half full.
+    '''
+    def __init__(self,
+                 max_queue_size: int = 10000,
+                 flush_interval_s: float = 0.2,
+                 buffer_bytes: int = 1024 * 1024,
+                 full_policy: str = 'drop',
+                 sample_rate: int = 10,
+                 max_string_length: int = 0):
+        if full_policy not in ('drop', 'sample'):
+            raise ValueError(f"unknown access log queue full policy: {full_policy}")
+        self.max_queue_size = max_queue_size
+        self.flush_interval_s = flush_interval_s
+        self.buffer_bytes = buffer_bytes
+        self.full_policy = full_policy
+        self.sample_rate = max(sample_rate, 1)
+        self.max_string_length = max_string_length
+        self.dropped_count = 0
+        self._sample_count = 0
+        self._queue: queue.Queue = queue.Queue(max_queue_size)
+        self._thread = threading.Thread(target=self._run, name='access_log_writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, logger: logging.Logger, log: Any, droppable: bool = True) -> bool:
+        '''serialize log and queue it for writing, returns False if it is dropped'''
+        if droppable and self.full_policy == 'sample' and self._queue.qsize() * 2 >= self.max_queue_size:
+            self._sample_count += 1
+            if self._sample_count % self.sample_rate != 0:
+                self.dropped_count += 1
+                return False
+        if self._queue.full():
+            self.dropped_count += 1
+            return False
+        try:
+            line = dump_json(log, self.max_string_length)
+        except Exception as e:
+            logging.warning(f"failed to serialize access log: {e}")
+            return False
+        try:
+            self._queue.put_nowait((logger, line))
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            return False
+
+    def stop(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self) -> None:
+        pending: Dict[logging.Logger, List[str]] = {}
+        pending_bytes = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(self.flush_interval_s - (time.monotonic() - last_flush), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush(pending)
+                return
+            if item is not None:
+                logger, line = item
+                pending.setdefault(logger, []).append(line)
+                pending_bytes += len(line)
+            if pending_bytes >= self.buffer_bytes or time.monotonic() - last_flush >= self.flush_interval_s:
+                self._flush(pending)
+                pending = {}
+                pending_bytes = 0
+                last_flush = time.monotonic()
+
+    def _flush(self, pending: Dict[logging.Logger, List[str]]) -> None:
+        for logger, lines in pending.items():
+            try:
+                logger.info("\n".join(lines))
+            except Exception as e:
+                logging.warning(f"failed to write {len(lines)} access logs: {e}")
+
+_writer: Optional[AsyncLogWriter] = None
+_writer_lock = threading.Lock()
+
+def get_async_log_writer() -> Optional[AsyncLogWriter]:
+    '''writer shared by the access loggers of this process, None if ACCESS_LOG_ASYNC is off'''
+    global _writer
+    if int(os.environ.get('ACCESS_LOG_ASYNC', '1')) != 1:
+        return None
+    with _writer_lock:
+        if _writer is None:
+            _writer = AsyncLogWriter(
+                max_queue_size=int(os.environ.get('ACCESS_LOG_QUEUE_SIZE', '10000')),
+                flush_interval_s=int(os.environ.get('ACCESS_LOG_FLUSH_INTERVAL_MS', '200')) / 1000,
+                buffer_bytes=int(os.environ.get('ACCESS_LOG_BUFFER_BYTES', str(1024 * 1024))),
+                full_policy=os.environ.get('ACCESS_LOG_QUEUE_FULL_POLICY', 'drop'),
+                sample_rate=int(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '10')),
+                max_string_length=int(os.environ.get('ACCESS_LOG_MAX_STRING_LENGTH', '0')))
+        return _writer
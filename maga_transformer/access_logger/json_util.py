@@ -12,5 +12,21 @@ def response_encoder(element: Any) -> Any:
         return f"bytes[{len(element)}]"
     return element.__dict__
 
-def dump_json(obj: Any) -> str:
+def truncate_strings(obj: Any, max_length: int) -> Any:
+    '''copy of obj with strings longer than max_length (huge prompts, base64 images) truncated'''
+    if isinstance(obj, str):
+        if len(obj) <= max_length:
+            return obj
+        return obj[:max_length] + f"...[truncated {len(obj) - max_length} chars]"
+    if isinstance(obj, dict):
+        return {key: truncate_strings(value, max_length) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [truncate_strings(value, max_length) for value in obj]
+    if obj is None or isinstance(obj, (bool, int, float)):
+        return obj
+    return truncate_strings(response_encoder(obj), max_length)
+
+def dump_json(obj: Any, max_string_length: int = 0) -> str:
+    if max_string_length > 0:
+        obj = truncate_strings(obj, max_string_length)
     return json.dumps(obj, default=response_encoder, ensure_ascii=False)
@@ -16,7 +16,8 @@ class RequestLog:
     @staticmethod
     def from_request(request: Union[Dict[str, Any], str]) -> 'RequestLog':
         if isinstance(request, dict):
-            return RequestLog(request_json=request)
+            # logs may be serialized after the request has moved on
+            return RequestLog(request_json=dict(request))
         elif isinstance(request, str):
             return RequestLog(request_str=request)
         else:
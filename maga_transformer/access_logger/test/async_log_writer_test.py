@@ -0,0 +1,103 @@
+import json
+import logging
+import threading
+from typing import List
+from unittest import TestCase, main
+
+from maga_transformer.access_logger.async_log_writer import AsyncLogWriter
+
+class RecordHandler(logging.Handler):
+    '''keeps written records, blocks writing while `blocked` is set'''
+    def __init__(self):
+        super().__init__()
+        self.records: List[str] = []
+        self.writing = threading.Event()
+        self.blocked = threading.Event()
+        self.released = threading.Event()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.writing.set()
+        if self.blocked.is_set():
+            self.released.wait()
+        self.records.append(record.getMessage())
+
+    def lines(self) -> List[str]:
+        return [json.loads(line) for record in self.records for line in record.split("\n")]
+
+class AsyncLogWriterTest(TestCase):
+    def setUp(self):
+        self.handler = RecordHandler()
+        self.logger = logging.Logger('async_log_writer_test')
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.handler.released.set()
+
+    def _block_writer(self, writer: AsyncLogWriter) -> None:
+        # the writer thread holds the first log in the handler, the queue is empty after that
+        self.handler.blocked.set()
+        self.assertTrue(writer.submit(self.logger, {"id": -1}))
+        self.assertTrue(self.handler.writing.wait(10))
+
+    def test_order(self):
+        writer = AsyncLogWriter(max_queue_size=100, flush_interval_s=0.01, buffer_bytes=32)
+        for i in range(50):
+            self.assertTrue(writer.submit(self.logger, {"id": i}))
+        writer.stop()
+        self.assertEqual(self.handler.lines(), [{"id": i} for i in range(50)])
+        # small buffer: written in several batches
+        self.assertGreater(len(self.handler.records), 1)
+
+    def test_flush_on_stop(self):
+        writer = AsyncLogWriter(flush_interval_s=3600, buffer_bytes=1024 * 1024)
+        for i in range(10):
+            writer.submit(self.logger, {"id": i})
+        writer.stop()
+        self.assertEqual(self.handler.lines(), [{"id": i} for i in range(10)])
+        self.assertFalse(writer._thread.is_alive())
+        # stop twice is fine
+        writer.stop()
+
+    def test_serialized_on_submit(self):
+        writer = AsyncLogWriter(flush_interval_s=3600)
+        log = {"request": {"prompt": "a"}}
+        writer.submit(self.logger, log)
+        log["request"]["prompt"] = "b"
+        writer.stop()
+        self.assertEqual(self.handler.lines(), [{"request": {"prompt": "a"}}])
+
+    def test_drop_when_full(self):
+        writer = AsyncLogWriter(max_queue_size=2, flush_interval_s=3600, buffer_bytes=1)
+        self._block_writer(writer)
+        self.assertTrue(writer.submit(self.logger, {"id": 0}))
+        self.assertTrue(writer.submit(self.logger, {"id": 1}))
+        self.assertFalse(writer.submit(self.logger, {"id": 2}))
+        # logs that can not be dropped are dropped too when the queue is full
+        self.assertFalse(writer.submit(self.logger, {"id": 3}, droppable=False))
+        self.assertEqual(writer.dropped_count, 2)
+        self.handler.released.set()
+        writer.stop()
+        self.assertEqual(self.handler.lines(), [{"id": -1}, {"id": 0}, {"id": 1}])
+
+    def test_sample_when_half_full(self):
+        writer = AsyncLogWriter(max_queue_size=4, flush_interval_s=3600, buffer_bytes=1,
+                                full_policy='sample', sample_rate=2)
+        self._block_writer(writer)
+        self.assertTrue(writer.submit(self.logger, {"id": 0}))
+        self.assertTrue(writer.submit(self.logger, {"id": 1}))
+        # half full: one in two droppable logs is kept
+        self.assertFalse(writer.submit(self.logger, {"id": 2}))
+        self.assertTrue(writer.submit(self.logger, {"id": 3}))
+        self.assertTrue(writer.submit(self.logger, {"id": 4}, droppable=False))
+        self.assertFalse(writer.submit(self.logger, {"id": 5}, droppable=False))
+        self.assertEqual(writer.dropped_count, 2)
+        self.handler.released.set()
+        writer.stop()
+        self.assertEqual(self.handler.lines(), [{"id": i} for i in [-1, 0, 1, 3, 4]])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            AsyncLogWriter(full_policy='block')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, AsyncIterator
+
+import grpc
+
+from maga_transformer.metrics import kmonitor, AccMetrics, GaugeMetrics
+
+class PooledChannel(object):
+    def __init__(self, address: str, channel: Any):
+        self.address = address
+        self.channel = channel
+        self.active_streams = 0
+        self.total_streams = 0
+        self.retired = False
+
+    def is_healthy(self) -> bool:
+        state = self.channel.get_state(try_to_connect=False)
+        return state not in (grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+                             grpc.ChannelConnectivity.SHUTDOWN)
+
+class GrpcChannelPool(object):
+    '''
+    per-process pool of grpc.aio channels keyed by backend address.
+    grpc.aio channels are bound to the event loop that created them, so channels are created lazily
+    on the running loop and the pool is reset when it is used from another loop.
+    '''
+    def __init__(self,
+                 keepalive_time_ms: int = 30000,
+                 keepalive_timeout_ms: int = 10000,
+                 max_concurrent_streams: int = 100,
+                 max_channels_per_address: int = 8,
+                 channel_factory: Optional[Callable[[str, List[Any]], Any]] = None):
+        self.keepalive_time_ms = keepalive_time_ms
+        self.keepalive_timeout_ms = keepalive_timeout_ms
+        self.max_concurrent_streams = max(1, max_concurrent_streams)
+        self.max_channels_per_address = max(1, max_channels_per_address)
+        self._channel_factory = channel_factory or grpc.aio.insecure_channel
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._channels: Dict[str, List[PooledChannel]] = {}
+
+    def channel_options(self) -> List[Any]:
+        return [
+            ('grpc.keepalive_time_ms', self.keepalive_time_ms),
+            ('grpc.keepalive_timeout_ms', self.keepalive_timeout_ms),
+            ('grpc.keepalive_permit_without_calls', 1),
+            ('grpc.http2.max_pings_without_data', 0),
+            ('grpc.max_send_message_length', -1),
+            ('grpc.max_receive_message_length', -1),
+        ]
+
+    def size(self) -> int:
+        return sum(len(channels) for channels in self._channels.values())
+
+    def _check_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        old_loop, old_channels = self._loop, self._channels
+        self._loop = loop
+        self._channels = {}
+        if old_loop is not None:
+            logging.warning("grpc channel pool used from a new event loop, close channels of the old loop")
+            self._close_on_loop(old_loop, [pooled for channels in old_channels.values() for pooled in channels])
+
+    @staticmethod
+    def _close_on_loop(loop: asyncio.AbstractEventLoop, channels: List[PooledChannel]) -> None:
+        '''close channels on the loop that created them, channels with active streams close when they end'''
+        if loop.is_closed():
+            if channels:
+                logging.warning(f"event loop of {len(channels)} grpc channels is closed, can not close them")
+            return
+        for pooled in channels:
+            pooled.retired = True
+            if pooled.active_streams == 0:
+                asyncio.run_coroutine_threadsafe(pooled.channel.close(), loop)
+
+    def _create_channel(self, address: str) -> PooledChannel:
+        logging.info(f"create grpc channel to {address}")
+        kmonitor.report(AccMetrics.RPC_CHANNEL_CREATE_QPS_METRIC, 1)
+        return PooledChannel(address, self._channel_factory(address, self.channel_options()))
+
+    def _retire(self, pooled: PooledChannel) -> None:
+        pooled.retired = True
+        if pooled.active_streams == 0:
+            asyncio.get_running_loop().create_task(pooled.channel.close())
+
+    def _get_channel(self, address: str) -> PooledChannel:
+        self._check_loop()
+        channels = self._channels.setdefault(address, [])
+        healthy_channels = []
+        for pooled in channels:
+            if pooled.is_healthy():
+                healthy_channels.append(pooled)
+            else:
+                logging.warning(f"grpc channel to {address} is unhealthy, reconnect")
+                self._retire(pooled)
+        channels[:] = healthy_channels
+
+        pooled = min(channels, key=lambda c: c.active_streams, default=None)
+        if pooled is None or (pooled.active_streams >= self.max_concurrent_streams and
+                              len(channels) < self.max_channels_per_address):
+            pooled = self._create_channel(address)
+            channels.append(pooled)
+        elif pooled.total_streams > 0:
+            kmonitor.report(AccMetrics.RPC_CHANNEL_REUSE_QPS_METRIC, 1)
+        kmonitor.report(GaugeMetrics.RPC_CHANNEL_POOL_SIZE_METRIC, self.size())
+        return pooled
+
+    @asynccontextmanager
+    async def acquire(self, address: str) -> AsyncIterator[Any]:
+        pooled = self._get_channel(address)
+        pooled.active_streams += 1
+        pooled.total_streams += 1
+        try:
+            yield pooled.channel
+        finally:
+            pooled.active_streams -= 1
+            if pooled.retired and pooled.active_streams == 0:
+                await pooled.channel.close()
+
+    async def close(self) -> None:
+        for channels in self._channels.values():
+            for pooled in channels:
+                await pooled.channel.close()
+        self._channels = {}
+
+_global_channel_pool: Optional[GrpcChannelPool] = None
+
+def get_channel_pool() -> GrpcChannelPool:
+    global _global_channel_pool
+    if _global_channel_pool is None:
+        _global_channel_pool = GrpcChannelPool(
+            keepalive_time_ms=int(os.environ.get('RPC_CHANNEL_KEEPALIVE_TIME_MS', 30000)),
+            keepalive_timeout_ms=int(os.environ.get('RPC_CHANNEL_KEEPALIVE_TIMEOUT_MS', 10000)),
+            max_concurrent_streams=int(os.environ.get('RPC_CHANNEL_MAX_CONCURRENT_STREAMS', 100)),
+            max_channels_per_address=int(os.environ.get('RPC_CHANNEL_POOL_SIZE', 8)))
+    return _global_channel_pool
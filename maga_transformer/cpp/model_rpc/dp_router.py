@@ -0,0 +1,179 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+class DPBackend(object):
+    def __init__(self, address: str, status_url: Optional[str] = None):
+        self.address = address
+        self.status_url = status_url
+        # maintained locally by the router
+        self.outstanding_streams = 0
+        self.inflight_tokens = 0
+        # polled from backend /worker_status
+        self.available_kv_cache = 0
+        self.total_kv_cache = 0
+        self.step_latency_ms = 0.0
+        self.status_update_time = 0.0
+        # inflight_tokens when the status was polled, tokens above it are not counted in available_kv_cache yet
+        self.status_inflight_tokens = 0
+
+    def update_status(self, status: Dict[str, Any]) -> None:
+        self.available_kv_cache = int(status.get('available_kv_cache', 0))
+        self.total_kv_cache = int(status.get('total_kv_cache', 0))
+        self.step_latency_ms = float(status.get('step_latency_ms', 0))
+        self.status_update_time = time.time()
+        self.status_inflight_tokens = self.inflight_tokens
+
+    def has_status(self) -> bool:
+        return self.status_update_time > 0
+
+    def __str__(self):
+        return f"DPBackend:[ address={self.address} outstanding_streams={self.outstanding_streams} " \
+            f"inflight_tokens={self.inflight_tokens} available_kv_cache={self.available_kv_cache} " \
+            f"step_latency_ms={self.step_latency_ms} ]"
+
+StatusFetcher = Callable[[DPBackend], Awaitable[Optional[Dict[str, Any]]]]
+
+class DPRouter(object):
+    '''
+    choose dp rank for each request, subclasses implement `_select`.
+    load signals come from two sources: streams and tokens in flight are tracked locally when requests
+    start and finish, kv cache and step latency are polled from backend `/worker_status` in background.
+    '''
+    need_status = False
+
+    def __init__(self,
+                 backends: List[DPBackend],
+                 poll_interval_ms: int = 200,
+                 status_fetcher: Optional[StatusFetcher] = None):
+        assert len(backends) > 0
+        self.backends = backends
+        self._backend_map = {backend.address: backend for backend in backends}
+        self.poll_interval_ms = poll_interval_ms
+        self._status_fetcher = status_fetcher
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._poll_task: Optional[asyncio.Task[None]] = None
+
+    def select(self, request_id: int, token_num: int) -> DPBackend:
+        if len(self.backends) == 1:
+            return self.backends[0]
+        if self.need_status:
+            self._ensure_polling()
+        return self._select(request_id, token_num)
+
+    def _select(self, request_id: int, token_num: int) -> DPBackend:
+        raise NotImplementedError()
+
+    def on_start(self, backend: DPBackend, token_num: int) -> None:
+        backend.outstanding_streams += 1
+        backend.inflight_tokens += token_num
+
+    def on_tokens(self, backend: DPBackend, token_num: int) -> None:
+        backend.inflight_tokens += token_num
+
+    def on_finish(self, backend: DPBackend, token_num: int) -> None:
+        backend.outstanding_streams -= 1
+        backend.inflight_tokens -= token_num
+
+    def _ensure_polling(self) -> None:
+        if self._poll_task is not None and not self._poll_task.done() and \
+                self._poll_task.get_loop() is asyncio.get_running_loop():
+            return
+        self._session = None
+        self._poll_task = asyncio.get_running_loop().create_task(self._poll_loop())
+
+    async def _fetch_status(self, backend: DPBackend) -> Optional[Dict[str, Any]]:
+        if self._status_fetcher is not None:
+            return await self._status_fetcher(backend)
+        if not backend.status_url:
+            return None
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.poll_interval_ms / 1000 * 5))
+        async with self._session.get(backend.status_url) as response:
+            return await response.json()
+
+    async def poll_once(self) -> None:
+        results = await asyncio.gather(*[self._fetch_status(backend) for backend in self.backends],
+                                       return_exceptions=True)
+        for backend, result in zip(self.backends, results):
+            if isinstance(result, BaseException):
+                logging.debug(f"poll status of {backend.address} failed: {result}")
+            elif result:
+                backend.update_status(result)
+
+    async def _poll_loop(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"dp router poll worker status failed: {e}")
+            await asyncio.sleep(self.poll_interval_ms / 1000)
+
+    async def close(self) -> None:
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+class RequestIdRouter(DPRouter):
+    def _select(self, request_id: int, token_num: int) -> DPBackend:
+        return self.backends[request_id % len(self.backends)]
+
+class LeastOutstandingRouter(DPRouter):
+    def _select(self, request_id: int, token_num: int) -> DPBackend:
+        # start from request_id to break ties evenly
+        start = request_id % len(self.backends)
+        candidates = self.backends[start:] + self.backends[:start]
+        return min(candidates, key=lambda backend: backend.outstanding_streams)
+
+class PowerOfTwoRouter(DPRouter):
+    def _select(self, request_id: int, token_num: int) -> DPBackend:
+        first, second = random.sample(self.backends, 2)
+        return first if first.inflight_tokens <= second.inflight_tokens else second
+
+class WeightedLoadRouter(DPRouter):
+    '''
+    route to the backend with the most free kv cache, the one load signal that limits how many streams a
+    backend can run. streams and step latency are not scored: both grow with the kv cache in use, so adding
+    them would count the same load twice. outstanding streams only break ties.
+    '''
+    need_status = True
+
+    @staticmethod
+    def _score(backend: DPBackend) -> int:
+        '''free kv cache tokens: the polled value, less the tokens started since the poll'''
+        started_tokens = max(backend.inflight_tokens - backend.status_inflight_tokens, 0)
+        return backend.available_kv_cache - started_tokens
+
+    def _select(self, request_id: int, token_num: int) -> DPBackend:
+        if not all(backend.has_status() for backend in self.backends):
+            return min(self.backends, key=lambda backend: backend.outstanding_streams)
+        # start from request_id to break ties evenly
+        start = request_id % len(self.backends)
+        candidates = self.backends[start:] + self.backends[:start]
+        return max(candidates, key=lambda backend: (self._score(backend), -backend.outstanding_streams))
+
+DP_ROUTERS: Dict[str, Any] = {
+    'request_id': RequestIdRouter,
+    'least_outstanding': LeastOutstandingRouter,
+    'power_of_two': PowerOfTwoRouter,
+    'weighted': WeightedLoadRouter,
+}
+
+def create_dp_router(backends: List[DPBackend], strategy: Optional[str] = None) -> DPRouter:
+    if strategy is None:
+        strategy = os.environ.get('DP_ROUTE_STRATEGY', 'least_outstanding')
+    if strategy not in DP_ROUTERS:
+        raise Exception(f"unknown dp route strategy: {strategy}, supported: {list(DP_ROUTERS.keys())}")
+    poll_interval_ms = int(os.environ.get('DP_ROUTE_POLL_INTERVAL_MS', 200))
+    logging.info(f"dp route strategy: {strategy}, poll interval: {poll_interval_ms} ms")
+    return DP_ROUTERS[strategy](backends, poll_interval_ms=poll_interval_ms)
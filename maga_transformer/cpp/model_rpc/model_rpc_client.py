@@ -25,6 +25,8 @@ from maga_transformer.config.gpt_init_model_parameters import GptInitModelParame
 from maga_transformer.utils.grpc_util import trans_option, trans_option_cast, trans_tensor
 from maga_transformer.distribute.gang_info import get_gang_info, GangInfo
 from maga_transformer.utils.concurrency_controller import ConcurrencyException, get_global_controller
+from maga_transformer.cpp.model_rpc.channel_pool import get_channel_pool
+from maga_transformer.cpp.model_rpc.dp_router import DPBackend, create_dp_router
 
 MAX_GRPC_TIMEOUT_SECONDS = 3600
 
@@ -144,6 +146,7 @@ class ModelRpcClient(object):
         if not address:
             address = f'localhost:{g_worker_info.rpc_server_port}'
         self._addresses = []
+        backends = []
         # for test usage
         hack_ep_single_entry = bool(int(os.environ.get('HACK_EP_SINGLE_ENTRY', 0)))
         logging.info(f"hack ep single entry: {hack_ep_single_entry}")
@@ -155,12 +158,17 @@ class ModelRpcClient(object):
                 members_info_str += f"{member}\n"
                 if member.local_rank % g_parallel_info.tp_size == 0:
                     self._addresses.append(f'{member.ip}:{member.rpc_server_port}')
+                    backends.append(DPBackend(f'{member.ip}:{member.rpc_server_port}',
+                                              f'http://{member.ip}:{member.backend_server_port}/worker_status'))
             members_info_str += "}"
             logging.info(f"{members_info_str}")
         else:
             self._addresses = [address]
+            backends = [DPBackend(address)]
         logging.info(f"client connect to rpc addresses: {self._addresses}")
         self.model_config = config
+        self._router = create_dp_router(backends)
+        self._channel_pool = get_channel_pool()
 
     async def enqueue(self, input_py: GenerateInput) -> AsyncGenerator[GenerateOutputs, None]:
         request_timeout_ms = input_py.generate_config.timeout_ms
@@ -173,15 +181,25 @@ class ModelRpcClient(object):
         input_py.generate_config.timeout_ms = (int)(grpc_timeout_seconds * 1000)
         input_pb = trans_input(input_py)
         response_iterator = None
+        backend = self._router.select(input_py.request_id, input_py.prompt_length)
+        charged_tokens = input_py.prompt_length
+        output_len = 0
+        self._router.on_start(backend, charged_tokens)
         try:
-            async with grpc.aio.insecure_channel(self._addresses[input_py.request_id % len(self._addresses)]) as channel:
+            async with self._channel_pool.acquire(backend.address) as channel:
                 stub = RpcServiceStub(channel)
                 response_iterator = stub.GenerateStreamCall(input_pb, timeout=grpc_timeout_seconds)
                 # 调用服务器方法并接收流式响应
                 count = 0
                 async for response in response_iterator.__aiter__():
                     count += 1
-                    yield trans_output(input_py, response)
+                    outputs_py = trans_output(input_py, response)
+                    new_output_len = max([output.aux_info.output_len for output in outputs_py.generate_outputs], default=0)
+                    if new_output_len > output_len:
+                        self._router.on_tokens(backend, new_output_len - output_len)
+                        charged_tokens += new_output_len - output_len
+                        output_len = new_output_len
+                    yield outputs_py
         except grpc.RpcError as e:
             # TODO(xinfei.sxf) 非流式的请求无法取消了
             if response_iterator:
@@ -206,5 +224,6 @@ class ModelRpcClient(object):
             logging.error(f'rpc unknown error:{str(e)}')
             raise e
         finally:
+            self._router.on_finish(backend, charged_tokens)
             if response_iterator:
                 response_iterator.cancel()
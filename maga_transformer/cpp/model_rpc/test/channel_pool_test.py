@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from typing import Any, List, Optional
+from unittest import TestCase, main
+
+import grpc
+
+from maga_transformer.cpp.model_rpc.channel_pool import GrpcChannelPool
+
+
+class FakeChannel(object):
+    def __init__(self, address: str, options: List[Any]):
+        self.address = address
+        self.state = grpc.ChannelConnectivity.READY
+        self.closed = False
+        self.close_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get_state(self, try_to_connect: bool = False):
+        return self.state
+
+    async def close(self):
+        self.closed = True
+        self.close_loop = asyncio.get_running_loop()
+
+
+class GrpcChannelPoolTest(TestCase):
+    def setUp(self):
+        self.channels: List[FakeChannel] = []
+
+    def _create_pool(self, **kwargs: Any) -> GrpcChannelPool:
+        def channel_factory(address: str, options: List[Any]) -> FakeChannel:
+            channel = FakeChannel(address, options)
+            self.channels.append(channel)
+            return channel
+        return GrpcChannelPool(channel_factory=channel_factory, **kwargs)
+
+    def test_reuse(self):
+        pool = self._create_pool(max_concurrent_streams=2, max_channels_per_address=2)
+        async def run():
+            async with pool.acquire('a') as first:
+                pass
+            async with pool.acquire('a') as second:
+                self.assertIs(first, second)
+                async with pool.acquire('a') as third:
+                    self.assertIs(first, third)
+                    # first channel is full
+                    async with pool.acquire('a') as fourth:
+                        self.assertIsNot(first, fourth)
+                        # all channels are full, the least loaded one is shared
+                        async with pool.acquire('a') as fifth:
+                            self.assertIn(fifth, [first, fourth])
+            async with pool.acquire('b') as other:
+                self.assertIsNot(other, first)
+            self.assertEqual(pool.size(), 3)
+            await pool.close()
+        asyncio.run(run())
+        self.assertEqual(len(self.channels), 3)
+        self.assertTrue(all(channel.closed for channel in self.channels))
+        self.assertEqual(pool.size(), 0)
+
+    def test_unhealthy_channel(self):
+        pool = self._create_pool()
+        async def run():
+            async with pool.acquire('a') as first:
+                first.state = grpc.ChannelConnectivity.TRANSIENT_FAILURE
+                async with pool.acquire('a') as second:
+                    self.assertIsNot(first, second)
+                # active stream keeps the old channel open
+                self.assertFalse(first.closed)
+            self.assertTrue(first.closed)
+            self.assertEqual(pool.size(), 1)
+            await pool.close()
+        asyncio.run(run())
+
+    def test_reset_on_new_loop(self):
+        pool = self._create_pool()
+        old_loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=old_loop.run_forever)
+        thread.start()
+        try:
+            started = threading.Event()
+            release = asyncio.Event()
+            async def use_channel(address: str, hold: bool):
+                nonlocal release
+                async with pool.acquire(address):
+                    if hold:
+                        release = asyncio.Event()
+                        started.set()
+                        await release.wait()
+            asyncio.run_coroutine_threadsafe(use_channel('a', False), old_loop).result()
+            holding = asyncio.run_coroutine_threadsafe(use_channel('b', True), old_loop)
+            self.assertTrue(started.wait(10))
+            old_a, old_b = self.channels
+
+            async def run():
+                async with pool.acquire('a') as channel:
+                    self.assertIsNot(channel, old_a)
+                await pool.close()
+            asyncio.run(run())
+            # idle channel of the old loop is closed on it, the busy one when its stream ends
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0), old_loop).result()
+            self.assertTrue(old_a.closed)
+            self.assertIs(old_a.close_loop, old_loop)
+            self.assertFalse(old_b.closed)
+            old_loop.call_soon_threadsafe(release.set)
+            holding.result()
+            self.assertTrue(old_b.closed)
+            self.assertIs(old_b.close_loop, old_loop)
+        finally:
+            old_loop.call_soon_threadsafe(old_loop.stop)
+            thread.join()
+            old_loop.close()
+
+    def test_reset_after_loop_closed(self):
+        pool = self._create_pool()
+        async def run():
+            async with pool.acquire('a') as channel:
+                return channel
+        first = asyncio.run(run())
+        second = asyncio.run(run())
+        self.assertIsNot(first, second)
+        self.assertEqual(pool.size(), 1)
+
+    def test_concurrent_get(self):
+        pool = self._create_pool(max_concurrent_streams=4, max_channels_per_address=3)
+        async def run():
+            max_active = 0
+            async def stream(address: str):
+                nonlocal max_active
+                async with pool.acquire(address):
+                    max_active = max(max_active, max(pooled.active_streams
+                                                     for channels in pool._channels.values() for pooled in channels))
+                    await asyncio.sleep(0.01)
+            await asyncio.gather(*[stream(address) for address in ['a', 'b'] * 20])
+            for channels in pool._channels.values():
+                self.assertEqual(len(channels), 3)
+                self.assertTrue(all(pooled.active_streams == 0 for pooled in channels))
+                self.assertEqual(sum(pooled.total_streams for pooled in channels), 20)
+            await pool.close()
+            return max_active
+        # 20 streams on 3 channels: channels are created up to the limit, then shared evenly
+        self.assertEqual(asyncio.run(run()), 7)
+        self.assertEqual(len(self.channels), 6)
+
+
+if __name__ == '__main__':
+    main()
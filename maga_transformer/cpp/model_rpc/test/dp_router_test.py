@@ -0,0 +1,179 @@
+import asyncio
+from unittest import TestCase, main
+
+import grpc
+import torch
+
+from maga_transformer.config.generate_config import GenerateConfig
+from maga_transformer.models.base_model import GenerateInput
+from maga_transformer.cpp.model_rpc.model_rpc_client import ModelRpcClient
+from maga_transformer.cpp.model_rpc.channel_pool import GrpcChannelPool
+from maga_transformer.cpp.model_rpc.dp_router import DPBackend, LeastOutstandingRouter, \
+    PowerOfTwoRouter, WeightedLoadRouter, RequestIdRouter
+from maga_transformer.cpp.proto.model_rpc_service_pb2 import GenerateOutputsPB, TensorPB
+from maga_transformer.cpp.proto.model_rpc_service_pb2_grpc import RpcServiceServicer, \
+    add_RpcServiceServicer_to_server
+
+
+class FakeRpcService(RpcServiceServicer):
+    def __init__(self, step_delay: float):
+        self.step_delay = step_delay
+        self.request_count = 0
+
+    async def GenerateStreamCall(self, request, context):
+        self.request_count += 1
+        for i in range(3):
+            await asyncio.sleep(self.step_delay)
+            outputs = GenerateOutputsPB()
+            output = outputs.generate_outputs.add()
+            output.finished = i == 2
+            output.aux_info.output_len = i + 1
+            output.output_ids.data_type = TensorPB.DataType.INT32
+            output.output_ids.shape.extend([1, 1])
+            output.output_ids.int32_data = torch.tensor([i], dtype=torch.int32).numpy().tobytes()
+            yield outputs
+
+
+class FakeModelConfig:
+    max_rpc_timeout_ms = 0
+
+
+class FakeModelRpcClient(ModelRpcClient):
+    def __init__(self, router):
+        self.model_config = FakeModelConfig()
+        self._router = router
+        self._addresses = [backend.address for backend in router.backends]
+        self._channel_pool = GrpcChannelPool()
+
+
+class DPRouterTest(TestCase):
+
+    @staticmethod
+    async def _start_servers(delays):
+        servers = []
+        services = []
+        backends = []
+        for delay in delays:
+            server = grpc.aio.server()
+            service = FakeRpcService(delay)
+            add_RpcServiceServicer_to_server(service, server)
+            port = server.add_insecure_port('localhost:0')
+            await server.start()
+            servers.append(server)
+            services.append(service)
+            backends.append(DPBackend(f'localhost:{port}'))
+        return servers, services, backends
+
+    @staticmethod
+    async def _generate(client, request_id):
+        input = GenerateInput(request_id=request_id,
+                              token_ids=torch.tensor([1, 2, 3, 4]),
+                              mm_inputs=[],
+                              generate_config=GenerateConfig())
+        outputs = []
+        async for output in client.enqueue(input):
+            outputs.append(output)
+        return outputs
+
+    def _run_requests(self, router_cls, delays, request_num, **kwargs):
+        async def run():
+            servers, services, backends = await self._start_servers(delays)
+            router = router_cls(backends, **kwargs)
+            client = FakeModelRpcClient(router)
+            try:
+                results = await asyncio.gather(*[self._generate(client, i) for i in range(request_num)])
+                for outputs in results:
+                    self.assertEqual(len(outputs), 3)
+                    self.assertTrue(outputs[-1].generate_outputs[0].finished)
+                for backend in backends:
+                    self.assertEqual(backend.outstanding_streams, 0)
+                    self.assertEqual(backend.inflight_tokens, 0)
+                # all requests to one backend share the same pooled channel
+                self.assertEqual(client._channel_pool.size(), len(backends))
+                return [service.request_count for service in services]
+            finally:
+                await router.close()
+                await client._channel_pool.close()
+                for server in servers:
+                    await server.stop(None)
+        return asyncio.run(run())
+
+    def test_request_id_router(self):
+        counts = self._run_requests(RequestIdRouter, [0.01, 0.01], 8)
+        self.assertEqual(counts, [4, 4])
+
+    def test_least_outstanding_router(self):
+        counts = self._run_requests(LeastOutstandingRouter, [0.01, 0.01, 0.01], 9)
+        self.assertEqual(counts, [3, 3, 3])
+
+    def test_power_of_two_router(self):
+        counts = self._run_requests(PowerOfTwoRouter, [0.01, 0.01], 16)
+        self.assertEqual(sum(counts), 16)
+        self.assertEqual(counts, [8, 8])
+
+    def test_weighted_router(self):
+        async def run():
+            servers, services, backends = await self._start_servers([0.01, 0.01])
+            # first backend is nearly out of kv cache
+            status = {
+                backends[0].address: {'available_kv_cache': 10, 'total_kv_cache': 10000, 'step_latency_ms': 50},
+                backends[1].address: {'available_kv_cache': 10000, 'total_kv_cache': 10000, 'step_latency_ms': 10},
+            }
+            async def fetch_status(backend):
+                return status[backend.address]
+            router = WeightedLoadRouter(backends, poll_interval_ms=10, status_fetcher=fetch_status)
+            await router.poll_once()
+            client = FakeModelRpcClient(router)
+            try:
+                await asyncio.gather(*[self._generate(client, i) for i in range(4)])
+                return [service.request_count for service in services]
+            finally:
+                await router.close()
+                await client._channel_pool.close()
+                for server in servers:
+                    await server.stop(None)
+
+        counts = asyncio.run(run())
+        self.assertEqual(counts, [0, 4])
+
+    def test_select_by_load(self):
+        backends = [DPBackend(f'localhost:{i}') for i in range(3)]
+        backends[0].outstanding_streams = 5
+        backends[1].outstanding_streams = 1
+        backends[2].outstanding_streams = 3
+        self.assertEqual(LeastOutstandingRouter(backends).select(0, 10).address, 'localhost:1')
+
+        backends[0].inflight_tokens = 100
+        backends[1].inflight_tokens = 10
+        router = PowerOfTwoRouter(backends[:2])
+        for i in range(10):
+            self.assertEqual(router.select(i, 10).address, 'localhost:1')
+
+    def test_weighted_score(self):
+        backends = [DPBackend(f'localhost:{i}') for i in range(2)]
+        router = WeightedLoadRouter(backends)
+        # signals disagree: the first backend runs more streams with slower steps but has more free kv cache
+        backends[0].update_status({'available_kv_cache': 6000, 'total_kv_cache': 10000, 'step_latency_ms': 50})
+        backends[0].outstanding_streams = 8
+        backends[1].update_status({'available_kv_cache': 4000, 'total_kv_cache': 10000, 'step_latency_ms': 10})
+        backends[1].outstanding_streams = 1
+        self.assertEqual(router._score(backends[0]), 6000)
+        self.assertEqual(router._score(backends[1]), 4000)
+        self.assertEqual(router._select(0, 100).address, 'localhost:0')
+
+        # tokens started since the poll are charged against the polled kv cache, those before are counted in it
+        router.on_start(backends[0], 2500)
+        self.assertEqual(router._score(backends[0]), 3500)
+        self.assertEqual(router._select(1, 100).address, 'localhost:1')
+        backends[0].update_status({'available_kv_cache': 3500, 'total_kv_cache': 10000, 'step_latency_ms': 50})
+        self.assertEqual(router._score(backends[0]), 3500)
+        router.on_finish(backends[0], 2500)
+        self.assertEqual(router._score(backends[0]), 3500)
+
+        # same free kv cache: fewer streams wins
+        backends[1].update_status({'available_kv_cache': 3500, 'total_kv_cache': 10000, 'step_latency_ms': 10})
+        self.assertEqual(router._select(0, 100).address, 'localhost:1')
+
+
+if __name__ == '__main__':
+    main()
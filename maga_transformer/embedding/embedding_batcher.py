@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import logging
+import torch
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional
+
+from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
+from maga_transformer.async_decoder_engine.embedding.interface import EngineInputs, EngineOutputs
+
+class _BatchItem(object):
+    __slots__ = ('inputs', 'future', 'submit_time')
+
+    def __init__(self, inputs: EngineInputs, future: asyncio.Future):
+        self.inputs = inputs
+        self.future = future
+        self.submit_time = time.monotonic()
+
+class EmbeddingBatcher(object):
+    '''
+    merges engine inputs of concurrent embedding requests into one engine decode. inputs submitted while a decode
+    runs are batched into the next one, up to `max_batch_size` requests and `max_batch_tokens` tokens (0 for no
+    limit); a batch waits at most `max_wait_ms` after its first input for more. outputs are split back per
+    request, so post process and render of each request are unchanged.
+    '''
+    def __init__(self,
+                 decode_func: Callable[[EngineInputs], Awaitable[EngineOutputs]],
+                 max_batch_size: int = 32,
+                 max_batch_tokens: int = 0,
+                 max_wait_ms: float = 0):
+        self.decode_func = decode_func
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_wait_s = max_wait_ms / 1000
+        self._pending: Deque[_BatchItem] = deque()
+        self._new_item: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.batch_count = 0
+        self.item_count = 0
+
+    @staticmethod
+    def batchable(inputs: EngineInputs) -> bool:
+        # multimodal features are expanded into token ids by the engine, run these requests alone
+        return len(inputs.multimodal_inputs) == 0 and len(inputs.config) == 0 and inputs.batch_size > 0
+
+    async def decode(self, inputs: EngineInputs) -> EngineOutputs:
+        if self.max_batch_size <= 1 or not self.batchable(inputs):
+            return await self.decode_func(inputs)
+        item = _BatchItem(inputs, asyncio.get_running_loop().create_future())
+        self._pending.append(item)
+        if self._worker is None:
+            self._new_item = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+        else:
+            self._new_item.set()
+        return await item.future
+
+    async def _run(self):
+        batch: List[_BatchItem] = []
+        try:
+            while self._pending:
+                batch = await self._form_batch()
+                if not batch:
+                    continue
+                self.batch_count += 1
+                self.item_count += len(batch)
+                await self._process(batch)
+                batch = []
+        except BaseException as e:
+            # fail requests of the running decode and the ones waiting for it
+            for item in batch + list(self._pending):
+                if not item.future.done():
+                    item.future.set_exception(e)
+            self._pending.clear()
+            raise
+        finally:
+            self._worker = None
+
+    def _take(self, batch: List[_BatchItem], tokens: int) -> Optional[_BatchItem]:
+        while self._pending and self._pending[0].future.done():
+            # request cancelled before its decode
+            self._pending.popleft()
+        if not self._pending or len(batch) >= self.max_batch_size:
+            return None
+        item = self._pending[0]
+        if batch and self.max_batch_tokens > 0 and tokens + item.inputs.input_length > self.max_batch_tokens:
+            # keep submit order of requests
+            return None
+        return self._pending.popleft()
+
+    async def _form_batch(self) -> List[_BatchItem]:
+        batch: List[_BatchItem] = []
+        tokens = 0
+        while True:
+            item = self._take(batch, tokens)
+            if item is not None:
+                batch.append(item)
+                tokens += item.inputs.input_length
+                continue
+            if not batch or self._pending or len(batch) >= self.max_batch_size:
+                return batch
+            timeout = batch[0].submit_time + self.max_wait_s - time.monotonic()
+            if timeout <= 0:
+                return batch
+            self._new_item.clear()
+            try:
+                await asyncio.wait_for(self._new_item.wait(), timeout)
+            except asyncio.TimeoutError:
+                return batch
+
+    async def _process(self, batch: List[_BatchItem]):
+        if len(batch) == 1:
+            await self._process_one(batch[0])
+            return
+        try:
+            outputs = await self.decode_func(merge_engine_inputs([item.inputs for item in batch]))
+            results = split_engine_outputs(outputs, [item.inputs for item in batch])
+        except Exception as e:
+            # decode requests one by one, a bad request only fails itself
+            logging.warning(f"embedding decode of {len(batch)} requests failed: {e}, decode them one by one")
+            for item in batch:
+                await self._process_one(item)
+            return
+        for item, result in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(result)
+
+    async def _process_one(self, item: _BatchItem):
+        try:
+            result = await self.decode_func(item.inputs)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        if not item.future.done():
+            item.future.set_result(result)
+
+def merge_engine_inputs(inputs_list: List[EngineInputs]) -> EngineInputs:
+    return EngineInputs(token_ids=torch.cat([inputs.token_ids for inputs in inputs_list]),
+                        token_type_ids=torch.cat([inputs.token_type_ids for inputs in inputs_list]),
+                        input_lengths=torch.cat([inputs.input_lengths for inputs in inputs_list]))
+
+def split_engine_outputs(outputs: EngineOutputs, inputs_list: List[EngineInputs]) -> List[EngineOutputs]:
+    batch_size = sum(inputs.batch_size for inputs in inputs_list)
+    if outputs.outputs is None or len(outputs.outputs) != batch_size:
+        raise Exception(f"embedding outputs can not be split into {len(inputs_list)} requests of {batch_size} inputs")
+    results: List[EngineOutputs] = []
+    offset = 0
+    for inputs in inputs_list:
+        # outputs are a tensor or a list with one item per input, both sliced on the first dim
+        results.append(EngineOutputs(outputs=outputs.outputs[offset: offset + inputs.batch_size], input_length=inputs.input_length))
+        offset += inputs.batch_size
+    return results
+
+def create_embedding_batcher(decode_func: Callable[[EngineInputs], Awaitable[EngineOutputs]],
+                             config: GptInitModelParameters) -> EmbeddingBatcher:
+    # engine scheduler fails streams over max_context_batch_size * max_seq_len tokens
+    default_max_tokens = config.max_context_batch_size * config.max_seq_len
+    return EmbeddingBatcher(decode_func,
+                            # off by default, the engine scheduler already merges concurrent streams
+                            max_batch_size=int(os.environ.get('EMBEDDING_BATCH_MAX_SIZE', '1')),
+                            max_batch_tokens=int(os.environ.get('EMBEDDING_BATCH_MAX_TOKENS', str(default_max_tokens))),
+                            max_wait_ms=float(os.environ.get('EMBEDDING_BATCH_MAX_WAIT_MS', '0')))
@@ -7,6 +7,7 @@ from maga_transformer.async_decoder_engine.embedding.embedding_engine import Emb
 from maga_transformer.models.downstream_modules.custom_module import CustomModule
 from maga_transformer.async_decoder_engine.embedding.interface import EngineOutputs
 from maga_transformer.embedding.embedding_type import TYPE_STR, EmbeddingType
+from maga_transformer.embedding.embedding_batcher import create_embedding_batcher
 from maga_transformer.ops import MultimodalInputCpp
 
 class EmbeddingEndpoint(object):
@@ -15,6 +16,7 @@ class EmbeddingEndpoint(object):
         self.decoder_engine_: EmbeddingCppEngine = model.decoder_engine_
         assert model.model.custom_module is not None, "custom model should not be None"
         self.custom_model_: CustomModule = model.model.custom_module
+        self.batcher_ = create_embedding_batcher(self.decoder_engine_.decode, model.config)
 
     async def handle(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
         if isinstance(request, str):
@@ -23,11 +25,12 @@ class EmbeddingEndpoint(object):
         handler = self.custom_model_.get_handler()
         try:
             formated_request = renderer.render_request(request)
-            batch_input = renderer.create_input(formated_request)
+            # tokenize in a thread, concurrent requests are tokenized by the tokenizer pool
+            batch_input = await asyncio.to_thread(renderer.create_input, formated_request)
         except Exception as e:
             raise FtRuntimeException(ExceptionType.ERROR_INPUT_FORMAT_ERROR, str(e))
         try:
-            batch_output = await self.decoder_engine_.decode(batch_input)
+            batch_output = await self.batcher_.decode(batch_input)
             batch_output = handler.post_process(formated_request, batch_output)
             response = await renderer.render_response(formated_request, batch_input, batch_output)
             logable_response = await renderer.render_log_response(response)
@@ -0,0 +1,153 @@
+import time
+import asyncio
+import logging
+import threading
+import torch
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, List, Optional, Tuple
+from unittest import TestCase, main
+
+from maga_transformer.async_decoder_engine.embedding.interface import EngineInputs, EngineOutputs
+from maga_transformer.embedding.embedding_batcher import EmbeddingBatcher
+
+class FakeEmbeddingEngine(object):
+    '''
+    stands in for the cpp engine on cpu: like EmbeddingScheduler::scheduleNew, streams waiting while a forward runs
+    are merged into the next forward up to `max_tokens` tokens (max_context_batch_size * max_seq_len). each forward
+    costs a fixed launch overhead plus a small cost per token, outputs [token sum, length] of each input.
+    '''
+    def __init__(self, overhead_ms: float = 2, token_us: float = 1, max_tokens: int = 8192):
+        self.overhead_s = overhead_ms / 1000
+        self.token_s = token_us / 1000000
+        self.max_tokens = max_tokens
+        self.cond = threading.Condition()
+        self.waiting: Deque[Tuple[EngineInputs, Future]] = deque()
+        self.worker: Optional[threading.Thread] = None
+        # inputs of each forward
+        self.batch_sizes: List[int] = []
+
+    def _submit(self, inputs: EngineInputs) -> Future:
+        future: Future = Future()
+        with self.cond:
+            self.waiting.append((inputs, future))
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+            self.cond.notify()
+        return future
+
+    def decode_sync(self, inputs: EngineInputs) -> EngineOutputs:
+        return self._submit(inputs).result()
+
+    async def decode(self, inputs: EngineInputs) -> EngineOutputs:
+        # no thread per request, every request in flight waits in the engine queue
+        return await asyncio.wrap_future(self._submit(inputs))
+
+    def _schedule_new(self) -> List[Tuple[EngineInputs, Future]]:
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.waiting) > 0)
+            streams: List[Tuple[EngineInputs, Future]] = []
+            tokens = 0
+            while self.waiting and tokens + self.waiting[0][0].input_length <= self.max_tokens:
+                inputs, future = self.waiting.popleft()
+                # skip streams cancelled while waiting
+                if future.set_running_or_notify_cancel():
+                    streams.append((inputs, future))
+                    tokens += inputs.input_length
+            if not streams and self.waiting:
+                inputs, future = self.waiting.popleft()
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(Exception("long prompt error, not scheduled"))
+            return streams
+
+    def _run(self):
+        while True:
+            streams = self._schedule_new()
+            if not streams:
+                continue
+            self.batch_sizes.append(sum(inputs.batch_size for inputs, _ in streams))
+            time.sleep(self.overhead_s + self.token_s * sum(inputs.input_length for inputs, _ in streams))
+            if any((inputs.token_ids < 0).any() for inputs, _ in streams):
+                # a bad stream fails the whole forward
+                for _, future in streams:
+                    future.set_exception(ValueError("bad token id"))
+                continue
+            for inputs, future in streams:
+                sums = torch.stack([ids.sum() for ids in torch.split(inputs.token_ids, inputs.input_lengths.tolist())])
+                outputs = torch.stack([sums, inputs.input_lengths.to(sums.dtype)], dim=1)
+                future.set_result(EngineOutputs(outputs=outputs, input_length=inputs.input_length))
+
+def create_inputs(lengths: List[int], start: int = 0) -> EngineInputs:
+    token_ids = torch.arange(start, start + sum(lengths), dtype=torch.int32)
+    return EngineInputs(token_ids=token_ids,
+                        token_type_ids=torch.zeros_like(token_ids),
+                        input_lengths=torch.tensor(lengths, dtype=torch.int32))
+
+class EmbeddingBatcherTest(TestCase):
+    def setUp(self):
+        # requests with 1 to 4 inputs of different lengths
+        self.inputs = [create_inputs([5 + index % 7 + i for i in range(index % 4 + 1)], index * 100) for index in range(64)]
+
+    async def _decode_all(self, batcher: EmbeddingBatcher, inputs: List[EngineInputs]) -> List[EngineOutputs]:
+        return await asyncio.gather(*[batcher.decode(x) for x in inputs], return_exceptions=True)
+
+    def test_batch_results(self):
+        engine = FakeEmbeddingEngine()
+        batcher = EmbeddingBatcher(engine.decode, max_batch_size=16, max_wait_ms=5)
+        results = asyncio.run(self._decode_all(batcher, self.inputs))
+        for inputs, outputs in zip(self.inputs, results):
+            expected = engine.decode_sync(inputs)
+            self.assertTrue(torch.equal(outputs.outputs, expected.outputs))
+            self.assertEqual(outputs.input_length, inputs.input_length)
+        self.assertLess(batcher.batch_count, len(self.inputs))
+        self.assertEqual(batcher.item_count, len(self.inputs))
+
+    def test_batch_limits(self):
+        engine = FakeEmbeddingEngine()
+        batcher = EmbeddingBatcher(engine.decode, max_batch_size=4, max_batch_tokens=40, max_wait_ms=20)
+        inputs = [create_inputs([10]) for _ in range(8)] + [create_inputs([50])]
+        results = asyncio.run(self._decode_all(batcher, inputs))
+        self.assertEqual([int(outputs.outputs[0][1]) for outputs in results], [10] * 8 + [50])
+        # a request over max_batch_tokens still runs alone
+        self.assertEqual(engine.batch_sizes, [4, 4, 1])
+
+    def test_failed_request(self):
+        engine = FakeEmbeddingEngine()
+        batcher = EmbeddingBatcher(engine.decode, max_batch_size=8, max_wait_ms=20)
+        inputs = [create_inputs([3]), create_inputs([3], -10), create_inputs([4])]
+        results = asyncio.run(self._decode_all(batcher, inputs))
+        self.assertEqual(results[0].outputs.tolist(), [[3, 3]])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2].outputs.tolist(), [[6, 4]])
+
+    def test_cancelled_worker(self):
+        engine = FakeEmbeddingEngine(overhead_ms=50)
+        batcher = EmbeddingBatcher(engine.decode, max_batch_size=2)
+
+        async def cancel_running_decode():
+            tasks = [asyncio.create_task(batcher.decode(create_inputs([3]))) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            batcher._worker.cancel()
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        results = asyncio.run(cancel_running_decode())
+        # two requests in the running decode and one waiting for it all fail
+        self.assertEqual(engine.batch_sizes, [2])
+        for result in results:
+            self.assertIsInstance(result, asyncio.CancelledError)
+
+    def test_benchmark(self):
+        inputs = self.inputs * 4
+        throughputs = {}
+        for max_batch_size in [1, 32]:
+            batcher = EmbeddingBatcher(FakeEmbeddingEngine().decode, max_batch_size=max_batch_size)
+            start = time.time()
+            asyncio.run(self._decode_all(batcher, inputs))
+            throughputs[max_batch_size] = len(inputs) / (time.time() - start)
+        # the engine already merges waiting streams, only logged
+        logging.info(f"embedding requests/s, one decode per request: {throughputs[1]:.0f}, "
+                     f"dynamic batching: {throughputs[32]:.0f}")
+
+if __name__ == '__main__':
+    main()
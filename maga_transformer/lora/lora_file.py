@@ -83,7 +83,7 @@ class LoraCkpt:
             if not key.name == lora_name:
                 continue
             for ckpt_file in value:
-                if tensor_name in ckpt_file.get_tensor_names():
+                if ckpt_file.has_tensor(tensor_name):
                     tensors.append(ckpt_file.load_tensor(tensor_name))
         return tensors
 
@@ -13,6 +13,20 @@ class AccMetrics(Enum):
     UPDATE_QPS_METRIC = "py_rtp_update_qps_metric"
     ERROR_UPDATE_QPS_METRIC = "py_rtp_error_update_target_qps"
 
+    RPC_CHANNEL_CREATE_QPS_METRIC = "py_rtp_rpc_channel_create_qps"
+    RPC_CHANNEL_REUSE_QPS_METRIC = "py_rtp_rpc_channel_reuse_qps"
+
+    PROMPT_CACHE_HIT_QPS_METRIC = "py_rtp_prompt_token_cache_hit_qps"
+    PROMPT_CACHE_MISS_QPS_METRIC = "py_rtp_prompt_token_cache_miss_qps"
+    PROMPT_SEGMENT_ENCODE_TOKEN_METRIC = "py_rtp_prompt_segment_encode_tokens"
+    PROMPT_SEGMENT_CACHE_HIT_TOKEN_METRIC = "py_rtp_prompt_segment_cache_hit_tokens"
+
+    ACCESS_LOG_DROP_QPS_METRIC = "py_rtp_access_log_drop_qps"
+
+    VIT_CACHE_HIT_QPS_METRIC = "py_rtp_vit_cache_hit_qps"
+    VIT_CACHE_MISS_QPS_METRIC = "py_rtp_vit_cache_miss_qps"
+    VIT_CACHE_EVICT_QPS_METRIC = "py_rtp_vit_cache_evict_qps"
+
 class GaugeMetrics(Enum):
     RESPONSE_FIRST_TOKEN_RT_METRIC = "py_rtp_response_first_token_rt"
     RESPONSE_ITER_RT_METRIC = "py_rtp_response_iterate_rt"
@@ -28,6 +42,10 @@ class GaugeMetrics(Enum):
 
     UPDATE_LANTENCY_METRIC = "py_rtp_update_framework_rt"
 
+    RPC_CHANNEL_POOL_SIZE_METRIC = "py_rtp_rpc_channel_pool_size"
+
+    PROMPT_CACHE_REUSE_TOKEN_METRIC = "py_rtp_prompt_token_cache_reuse_length"
+
 class MetricReporter(object):
     def __init__(self, kmonitor: Any):
         self._kmon = kmonitor
@@ -1,18 +1,21 @@
 import gc
 import logging
 import os
+import threading
 import torch
 from collections import OrderedDict
 import safetensors
 
-from typing import Optional
+from typing import Any, Dict, Iterable, Optional, Tuple
 from maga_transformer.utils.time_util import timer_wrapper
 from maga_transformer.utils.util import check_with_info
 from maga_transformer.utils.model_weight import WeightStyle
-from maga_transformer.utils.database import BaseDatabase
+from maga_transformer.utils.database import BaseDatabase, CkptDatabase
 from maga_transformer.lora.lora_weights import LoRAWeights
 from maga_transformer.device import get_current_device
 from maga_transformer.model_loader.load_config import LoadConfig
+from maga_transformer.model_loader.weight_prefetcher import create_weight_prefetcher
+from maga_transformer.model_loader.weight_cache import WeightCache, get_weight_cache, weight_cache_key
 from maga_transformer.model_loader.model_weight_info import ModelDeployWeightInfo, ModelWeightInfo, ModelWeights
 
 
@@ -33,9 +36,44 @@ class ModelLoader:
     @timer_wrapper(description="load weights")
     @torch.inference_mode()
     def load_weights(self, device: str):
+        try:
+            return self._load_weights_with_cache(device)
+        finally:
+            # checkpoint shards stay mapped while loading only
+            self._load_config.database.release()
+
+    def _load_weights_with_cache(self, device: str):
         if self._weights_info.weight_style == WeightStyle.RTP_LLM_STYLE:
             return self._load_from_ft_style(device)
 
+        weight_cache = get_weight_cache() if self._support_weight_cache() else None
+        if weight_cache is not None:
+            cache_key = self._weight_cache_key()
+            cache_dir = weight_cache.lookup(cache_key)
+            if cache_dir is not None:
+                logging.info(f"load converted weights from cache: {cache_dir}")
+                try:
+                    return self._load_from_ft_style(device, CkptDatabase(cache_dir))
+                except Exception as e:
+                    logging.warning(f"load weights from cache {cache_dir} failed, load from checkpoint: {e}")
+
+        weights = self._load_weights(device)
+        if weight_cache is not None:
+            # copying weights to host and writing them to disk would delay startup, store them in background
+            threading.Thread(target=self._store_weight_cache, args=(weight_cache, cache_key, weights),
+                             name='weight_cache_store', daemon=True).start()
+        return weights
+
+    @torch.inference_mode()
+    def _store_weight_cache(self, weight_cache: WeightCache, cache_key: str, weights: ModelWeights):
+        try:
+            cache_dir = weight_cache.store(cache_key, lambda output_dir: self._save_ft_style(weights, output_dir))
+            if cache_dir is not None:
+                logging.info(f"converted weights saved to cache: {cache_dir}")
+        except Exception as e:
+            logging.warning(f"save weights to cache failed: {e}")
+
+    def _load_weights(self, device: str):
         weights = self._create_model_weights(device)
         convert_device = self._choose_weight_convert_device(device)  # choose convert device to avoid out of mem
         logging.info(f"load weight by device: {convert_device}")
@@ -85,6 +123,31 @@ class ModelLoader:
         ep_rank = self._load_config.ep_rank
         weights = self._create_model_weights(device)
 
+        def named_tensors():
+            for (layer_id, name, tensor) in self.prepare_weights(device):
+                if layer_id is not None:
+                    yield f"{weights.layer_weight_prefix(tp_rank, dp_rank, ep_rank)}{layer_id}.{name}", tensor
+                else:
+                    yield f"{weights.global_weight_prefix(tp_rank,dp_rank, ep_rank)}{name}", tensor
+        self._save_ft_style_parts(named_tensors(), output_dir)
+
+    def _save_ft_style(self, weights: ModelWeights, output_dir: str):
+        tp_rank = self._load_config.tp_rank
+        dp_rank = self._load_config.dp_rank
+        ep_rank = self._load_config.ep_rank
+
+        def named_tensors():
+            for layer_id, layer_weights in enumerate(weights.weights):
+                for name, tensor in layer_weights.items():
+                    yield f"{weights.layer_weight_prefix(tp_rank, dp_rank, ep_rank)}{layer_id}.{name}", tensor
+            for name, tensor in weights.global_weights.items():
+                yield f"{weights.global_weight_prefix(tp_rank,dp_rank, ep_rank)}{name}", tensor
+        self._save_ft_style_parts(named_tensors(), output_dir)
+
+    def _save_ft_style_parts(self, named_tensors: Iterable[Tuple[str, torch.Tensor]], output_dir: str):
+        tp_rank = self._load_config.tp_rank
+        dp_rank = self._load_config.dp_rank
+
         filename_prefix = f"{output_dir}/model-{tp_rank:02d}-{dp_rank:02d}-"
         os.makedirs(output_dir, exist_ok=True)
 
@@ -105,11 +168,7 @@ class ModelLoader:
                 part_idx += 1
                 current_size = 0
 
-        for (layer_id, name, tensor) in self.prepare_weights(device):
-            if layer_id is not None:
-                tensor_name = f"{weights.layer_weight_prefix(tp_rank, dp_rank, ep_rank)}{layer_id}.{name}"
-            else:
-                tensor_name = f"{weights.global_weight_prefix(tp_rank,dp_rank, ep_rank)}{name}"
+        for (tensor_name, tensor) in named_tensors:
             tensor_size = tensor.numel() * tensor.element_size()
             current_dict[tensor_name] = tensor.cpu().contiguous()
             current_size += tensor_size
@@ -123,8 +182,27 @@ class ModelLoader:
             logging.info(f"Saved final partition {part_idx} ({current_size/1024**3:.2f}GB)")
             del current_dict
 
+    def _support_weight_cache(self) -> bool:
+        database = self._load_config.database
+        # lora merged at load time is not part of the cache key
+        return isinstance(database, CkptDatabase) and not database.has_lora()
+
+    def _weight_cache_key(self) -> str:
+        database: CkptDatabase = self._load_config.database
+        file_names = [ckpt_file.file_name for ckpt_file in database.PretrainFileList + database.FinetuneFileList]
+        config: Dict[str, Any] = self._load_config.model_dump(exclude={'database', 'exported_device', 'quant_algo'})
+        quant_algo = self._load_config.quant_algo
+        if quant_algo is not None:
+            config['quant_algo'] = {attr: getattr(quant_algo, attr)() for attr in
+                                    ['isQuant', 'isGptq', 'isAwq', 'isSmoothQuant', 'isOmniQuant', 'isFp8', 'isPerTensorQuant',
+                                     'isWeightOnlyPerCol', 'isGroupwise', 'getGroupSize', 'getWeightBits', 'getActivationBits']}
+        config['weight_info'] = type(self._weights_info).__name__
+        config['exported_device'] = type(self._load_config.exported_device).__name__
+        return weight_cache_key(file_names, config)
+
     @timer_wrapper(description="load_from_ft_style")
-    def _load_from_ft_style(self, device: str):
+    def _load_from_ft_style(self, device: str, database: Optional[BaseDatabase] = None):
+        database = database if database is not None else self._load_config.database
         num_layers = self._load_config.num_layers
         tp_rank = self._load_config.tp_rank
         dp_rank = self._load_config.dp_rank
@@ -138,7 +216,7 @@ class ModelLoader:
         weights = [ {} for _ in range(num_layers)]
         global_weights = {}
         # 重新构建权重
-        all_tensors = self._load_config.database.load_tensors_by_prefix((layer_weight_prefix, global_weight_prefix), device, direct_io=direct_io)
+        all_tensors = database.load_tensors_by_prefix((layer_weight_prefix, global_weight_prefix), device, direct_io=direct_io)
         for key, tensor in all_tensors.items():
             if key.startswith(layer_weight_prefix):
                 # 解析键名，例如 "layers.0.weight"
@@ -159,8 +237,10 @@ class ModelLoader:
 
     def prepare_weights(self, device: str):
         if self._load_config.vit_separation != 1:
-            for id in range(self._load_config.num_layers):
-                results =  self._load_layer_weights(id, device)
+            # layers after the one being consumed are loaded in background
+            prefetcher = create_weight_prefetcher(lambda layer_id: self._load_layer_weights(layer_id, device))
+            logging.info(f"load weight with {prefetcher.worker_num} workers, prefetch byte budget: {prefetcher.byte_budget}")
+            for (id, results) in prefetcher.iterate(list(range(self._load_config.num_layers))):
                 for (name, tensor) in results.items():
                     yield (id, name, tensor)
 
@@ -194,7 +274,11 @@ class ModelLoader:
         else:
             free_mem = device_mem_info.free / (1024.0 ** 2)
         model_mem = model_size / self._load_config.tp_size / (1024.0 ** 2)
-        return current_device if free_mem * 0.8 > model_mem else "cpu"
+        # layers are converted concurrently by the prefetcher, reserve memory of the layers in flight
+        layer_size = model_size / self._load_config.tp_size / max(1, self._load_config.num_layers)
+        prefetch_mem = create_weight_prefetcher(None).reserved_bytes(int(layer_size)) / (1024.0 ** 2)
+        logging.info(f"free mem: {free_mem:.0f}MB, model mem: {model_mem:.0f}MB, prefetch mem: {prefetch_mem:.0f}MB")
+        return current_device if free_mem * 0.8 > model_mem + prefetch_mem else "cpu"
 
     def _load_layer_weights(self, layer_id: int, device: str):
         assert isinstance(self._model_weights_info.layer_weights[0], list)
@@ -367,7 +367,7 @@ class ModelDeployWeightInfo:
         if not self.is_ft_style_weight:
             # call subclass process_meta
             meta_dicts = [ckpt_file.get_metadata() for ckpt_file in ckpt_metas]
-            weight_keys = set(functools.reduce(lambda x,y:x+y, [list(meta.keys()) for meta in meta_dicts], []))
+            weight_keys = set(key for meta in meta_dicts for key in meta.keys())
             self._process_meta(meta_dicts, weight_keys)
 
     def _process_meta(self, meta_dict, weight_keys):
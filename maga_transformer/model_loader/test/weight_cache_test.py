@@ -0,0 +1,85 @@
+import os
+import time
+import subprocess
+import tempfile
+from unittest import TestCase, main
+
+import torch
+from safetensors.torch import save_file
+
+from maga_transformer.utils.database import CkptDatabase
+from maga_transformer.model_loader.weight_cache import WeightCache, weight_cache_key
+
+
+class WeightCacheTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ckpt_file = os.path.join(self.tmp_dir.name, 'model.safetensors')
+        save_file({'w': torch.zeros(4)}, self.ckpt_file)
+        self.cache = WeightCache(os.path.join(self.tmp_dir.name, 'cache'), max_bytes=3000)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def _write_weights(nbytes: int):
+        def write(output_dir: str):
+            save_file({'rank_00_00_00.global.w': torch.ones(nbytes // 4)},
+                      os.path.join(output_dir, 'model-00-00-part-00000.safetensors'))
+        return write
+
+    def test_key(self):
+        config = {'tp_size': 2, 'tp_rank': 0, 'quant_algo': {'getWeightBits': 8}}
+        key = weight_cache_key([self.ckpt_file], config)
+        self.assertEqual(key, weight_cache_key([self.ckpt_file], dict(config)))
+        self.assertNotEqual(key, weight_cache_key([self.ckpt_file], dict(config, tp_rank=1)))
+        self.assertNotEqual(key, weight_cache_key([self.ckpt_file], dict(config, quant_algo={'getWeightBits': 4})))
+        os.utime(self.ckpt_file, ns=(0, 0))
+        self.assertNotEqual(key, weight_cache_key([self.ckpt_file], config))
+
+    def test_store_and_lookup(self):
+        self.assertIsNone(self.cache.lookup('a'))
+        entry_dir = self.cache.store('a', self._write_weights(1024))
+        self.assertEqual(self.cache.lookup('a'), entry_dir)
+        tensors = CkptDatabase(entry_dir).load_tensors_by_prefix(('rank_00_00_00.global.',), 'cpu', direct_io=False)
+        self.assertTrue(torch.equal(tensors['rank_00_00_00.global.w'][0], torch.ones(256)))
+
+    def test_failed_store_leaves_nothing(self):
+        def write(output_dir: str):
+            self._write_weights(1024)(output_dir)
+            raise RuntimeError('disk full')
+        with self.assertRaises(RuntimeError):
+            self.cache.store('a', write)
+        self.assertIsNone(self.cache.lookup('a'))
+        self.assertEqual(os.listdir(self.cache.cache_dir), [])
+
+    def test_remove_stale_tmp_dirs(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        stale_dir = os.path.join(self.cache.cache_dir, f'a.tmp.{process.pid}')
+        storing_dir = os.path.join(self.cache.cache_dir, f'b.tmp.{os.getpid()}')
+        os.makedirs(stale_dir)
+        os.makedirs(storing_dir)
+        self.cache.store('c', self._write_weights(1024))
+        self.assertFalse(os.path.exists(stale_dir))
+        # a store still running in a live process is kept
+        self.assertTrue(os.path.exists(storing_dir))
+        self.assertIsNotNone(self.cache.lookup('c'))
+
+    def test_evict_least_recently_used(self):
+        for key in ['a', 'b']:
+            self.cache.store(key, self._write_weights(1024))
+            time.sleep(0.01)
+        # a is used again, b becomes the least recently used entry
+        self.cache.lookup('a')
+        self.cache.store('c', self._write_weights(1024))
+        self.assertIsNotNone(self.cache.lookup('a'))
+        self.assertIsNone(self.cache.lookup('b'))
+        self.assertIsNotNone(self.cache.lookup('c'))
+        # entry larger than the whole cache is not kept
+        self.assertIsNone(self.cache.store('d', self._write_weights(8192)))
+        self.assertIsNone(self.cache.lookup('d'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from unittest import TestCase, main
+
+import torch
+from safetensors.torch import save_file
+
+from maga_transformer.utils.database import CkptDatabase
+from maga_transformer.model_loader.weight_prefetcher import WeightPrefetcher, tensors_nbytes
+
+
+class FakeLayerLoader(object):
+    '''read a layer from a fake checkpoint, split for tp and transpose like a weight module'''
+    def __init__(self, database: CkptDatabase, io_delay: float):
+        self.database = database
+        self.io_delay = io_delay
+        self.loading = 0
+        self.max_loading = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, layer_id: int):
+        with self.lock:
+            self.loading += 1
+            self.max_loading = max(self.max_loading, self.loading)
+        # cold disk read
+        time.sleep(self.io_delay)
+        weights = {}
+        for name in ['q', 'k', 'v', 'o']:
+            tensor = self.database.load_tensor(f"layers.{layer_id}.{name}.weight", torch.float32)[0]
+            weights[name] = torch.chunk(tensor, 2, dim=0)[0].t().contiguous()
+        with self.lock:
+            self.loading -= 1
+        return weights
+
+
+class WeightPrefetcherTest(TestCase):
+    layer_num = 16
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tensors = {f"layers.{i}.{name}.weight": torch.randn(256, 256).to(torch.bfloat16)
+                   for i in range(self.layer_num) for name in ['q', 'k', 'v', 'o']}
+        save_file(tensors, os.path.join(self.tmp_dir.name, "model.safetensors"))
+        self.database = CkptDatabase(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _load_all(self, worker_num: int, byte_budget: int = 1024 ** 3):
+        loader = FakeLayerLoader(self.database, 0.02)
+        prefetcher = WeightPrefetcher(loader, worker_num, byte_budget)
+        begin = time.perf_counter()
+        results = list(prefetcher.iterate(list(range(self.layer_num))))
+        return results, time.perf_counter() - begin, loader, prefetcher
+
+    def test_same_result_in_order(self):
+        sequential, _, _, _ = self._load_all(1)
+        prefetched, _, _, _ = self._load_all(4)
+        self.assertEqual([layer_id for layer_id, _ in prefetched], list(range(self.layer_num)))
+        for (_, expect), (_, actual) in zip(sequential, prefetched):
+            self.assertEqual(expect.keys(), actual.keys())
+            for name in expect:
+                self.assertTrue(torch.equal(expect[name], actual[name]))
+
+    def test_byte_budget(self):
+        layer_bytes = 4 * 128 * 256 * 4
+        _, _, loader, prefetcher = self._load_all(8, byte_budget=layer_bytes * 2)
+        self.assertLessEqual(loader.max_loading, 2)
+        self.assertLessEqual(prefetcher.peak_pending_bytes, layer_bytes * 2)
+
+        # budget smaller than one layer still makes progress
+        results, _, loader, _ = self._load_all(8, byte_budget=1)
+        self.assertEqual(len(results), self.layer_num)
+        self.assertEqual(loader.max_loading, 1)
+
+    def test_reserved_bytes(self):
+        layer_bytes = 4 * 128 * 256 * 4
+        self.assertEqual(WeightPrefetcher(None, 1).reserved_bytes(layer_bytes), 0)
+        self.assertEqual(WeightPrefetcher(None, 4).reserved_bytes(layer_bytes), layer_bytes * 4)
+        self.assertEqual(WeightPrefetcher(None, 8, byte_budget=layer_bytes * 2).reserved_bytes(layer_bytes), layer_bytes * 2)
+        self.assertEqual(WeightPrefetcher(None, 8, byte_budget=1).reserved_bytes(layer_bytes), layer_bytes)
+        _, _, _, prefetcher = self._load_all(8, byte_budget=layer_bytes * 3)
+        self.assertLessEqual(prefetcher.peak_pending_bytes, prefetcher.reserved_bytes(layer_bytes))
+
+    def test_consumer_stops(self):
+        prefetcher = WeightPrefetcher(FakeLayerLoader(self.database, 0.01), 4)
+        it = prefetcher.iterate(list(range(self.layer_num)))
+        layer_id, tensors = next(it)
+        self.assertEqual(layer_id, 0)
+        self.assertEqual(tensors_nbytes(tensors), 4 * 128 * 256 * 4)
+        it.close()
+
+    def test_benchmark(self):
+        _, sequential_cost, _, _ = self._load_all(1)
+        _, prefetch_cost, _, _ = self._load_all(4)
+        logging.info(f"load {self.layer_num} layers: sequential {sequential_cost:.3f}s, prefetch {prefetch_cost:.3f}s")
+        self.assertLess(prefetch_cost * 2, sequential_cost)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+# bump when the layout of cached weights changes
+WEIGHT_CACHE_VERSION = 1
+_DONE_FILE = 'DONE'
+
+def weight_cache_key(file_names: List[str], config: Dict[str, Any]) -> str:
+    '''
+    content address of converted weights: checkpoint files (path, size, mtime) plus everything that
+    changes the conversion result (quant config, parallel ranks, model config, device).
+    '''
+    files = []
+    for file_name in sorted(file_names):
+        stat = os.stat(file_name)
+        files.append([os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns])
+    content = json.dumps({'version': WEIGHT_CACHE_VERSION, 'files': files, 'config': config},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+class WeightCache(object):
+    '''
+    local directory of converted weights, one sub directory per cache key.
+    entries are written into a temporary directory and renamed when complete, so a crash never leaves
+    a partial entry behind; least recently used entries are evicted to keep the directory under `max_bytes`.
+    entries are stored in background after loading, temporary directories of processes that exited while
+    storing are removed by the next store.
+    '''
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key: str) -> Optional[str]:
+        entry_dir = self._entry_dir(key)
+        done_file = os.path.join(entry_dir, _DONE_FILE)
+        if not os.path.exists(done_file):
+            return None
+        # mtime of the done file orders entries for eviction
+        os.utime(done_file)
+        return entry_dir
+
+    def store(self, key: str, write_func: Callable[[str], None]) -> Optional[str]:
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp.{os.getpid()}"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._remove_stale_tmp_dirs()
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            write_func(tmp_dir)
+            size = _dir_size(tmp_dir)
+            if size > self.max_bytes:
+                logging.warning(f"weight cache entry {key} size {size} exceeds cache limit {self.max_bytes}, skip")
+                return None
+            with open(os.path.join(tmp_dir, _DONE_FILE), 'w') as f:
+                json.dump({'size': size}, f)
+            if os.path.exists(entry_dir):
+                # stored concurrently by another process with the same key
+                return entry_dir
+            os.rename(tmp_dir, entry_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=key)
+        return entry_dir
+
+    def _remove_stale_tmp_dirs(self) -> None:
+        for name in os.listdir(self.cache_dir):
+            _, sep, pid = name.rpartition('.tmp.')
+            if sep and pid.isdigit() and not _pid_alive(int(pid)):
+                logging.info(f"remove weight cache temporary directory {name} of exited process")
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+
+    def _entries(self) -> List[Dict[str, Any]]:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            done_file = os.path.join(self._entry_dir(name), _DONE_FILE)
+            if not os.path.exists(done_file):
+                continue
+            with open(done_file) as f:
+                size = json.load(f)['size']
+            entries.append({'key': name, 'size': size, 'mtime': os.path.getmtime(done_file)})
+        return entries
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        entries = sorted(self._entries(), key=lambda entry: entry['mtime'])
+        total = sum(entry['size'] for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry['key'] == keep:
+                continue
+            logging.info(f"evict weight cache entry {entry['key']} ({entry['size'] / 1024 ** 3:.2f}GB)")
+            shutil.rmtree(self._entry_dir(entry['key']), ignore_errors=True)
+            total -= entry['size']
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, file))
+               for root, _, files in os.walk(path) for file in files)
+
+def get_weight_cache() -> Optional[WeightCache]:
+    cache_dir = os.environ.get('WEIGHT_CACHE_DIR', None)
+    if not cache_dir:
+        return None
+    max_bytes = int(os.environ.get('WEIGHT_CACHE_MAX_BYTES', 256 * 1024 ** 3))
+    return WeightCache(cache_dir, max_bytes)
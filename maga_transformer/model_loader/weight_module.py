@@ -7,7 +7,8 @@ import inspect
 import weakref
 from maga_transformer.model_loader.load_config import LoadConfig
 from maga_transformer.utils.database import BaseDatabase
-from maga_transformer.utils.model_weight import CkptWeightInfo, W, WeightStyle, identity, sp_0, sp_head_lora, sp_id, sp_neg1
+from maga_transformer.utils.model_weight import CkptWeightInfo, W, WeightStyle, identity, sp_0, sp_head_lora, sp_id, sp_neg1, \
+    transpose, concat_0, concat_1, stack_, merge_qkv_hf
 import traceback
 
 
@@ -245,6 +246,40 @@ class AtomicWeight(WeightModule):
         else:
             return False
         
+    @torch.inference_mode()
+    def load(self, database: BaseDatabase, layer_id: Optional[int], device: str, load_config: LoadConfig):
+        if not self._split_before_convert(load_config):
+            return super().load(database, layer_id, device, load_config)
+        convert_type = self.data_type if self.data_type is not None else load_config.compute_dtype
+        before_merge_tensors = []
+        for ckpt_weight in self.weights:
+            name = ckpt_weight.tensor_name(layer_id)
+            try:
+                # checkpoint dtype views of the mapped file, nothing is converted before the split
+                before_merge_tensors.append(ckpt_weight.merge_fun(database.load_tensor(name, None)))
+            except Exception as e:
+                logging.error(f"加载 {self.name}: {name} 失败，完整堆栈:\n{traceback.format_exc()}")
+                raise e
+        raw_tensor = self.process_fun(before_merge_tensors)
+        split_tensor = self._split_tensor(raw_tensor, load_config, convert_type).to(device)
+        processed_tensors = self._postprocess(split_tensor, device, load_config)
+        shape_info = {k: (v.shape, v.dtype) for k, v in processed_tensors.items()}
+        logging.debug(f"extract weight: {self.name} layer_id: {layer_id}, res:{shape_info}")
+        return {k: v.to(device) for k, v in processed_tensors.items()}
+
+    def _split_before_convert(self, load_config: LoadConfig) -> bool:
+        '''
+        plain atomic weights whose transforms only move data are split in checkpoint dtype,
+        so only the shard of this rank is read from the mapped file and converted.
+        subclasses overriding the load steps (quant, moe, ...) keep the generic path.
+        '''
+        cls = type(self)
+        if load_config.merge_lora or cls._load_raw_tensor is not AtomicWeight._load_raw_tensor \
+                or cls._split is not AtomicWeight._split or cls._postprocess is not AtomicWeight._postprocess:
+            return False
+        funcs = [self.process_fun] + [ckpt_weight.merge_fun for ckpt_weight in self.weights]
+        return all(_unwrap_partial(func) in _LAYOUT_ONLY_FUNCS for func in funcs)
+
     def _load_raw_tensor(self, database: BaseDatabase, layer_id: Optional[int], device: str, load_config: LoadConfig):
         before_merge_tensors = []
         convert_type = self.data_type if self.data_type is not None else load_config.compute_dtype
@@ -371,21 +406,30 @@ class AtomicWeight(WeightModule):
         return {self.name : raw_tensor}
     
         
-    def _split(self, tensor: Union[torch.Tensor, Dict[str, torch.Tensor]], load_config: LoadConfig):
-        raw_tensor = tensor if isinstance(tensor, torch.Tensor) else tensor[self.name]
+    def _need_split(self, load_config: LoadConfig) -> bool:
         if load_config.tp_size <= 1 and load_config.dp_size <= 1 and load_config.ep_size <= 1 :
-            return {self.name : raw_tensor}
+            return False
 
         tp_split_emb_and_lm_head = load_config.tp_split_emb_and_lm_head
 
         if (not tp_split_emb_and_lm_head and
             self.name in [W.lm_head, W.lm_head_b, W.embedding, W.positional_embedding, W.token_type_embedding]):
-            return {self.name : raw_tensor}
+            return False
+        return True
+
+    def _split_tensor(self, raw_tensor: torch.Tensor, load_config: LoadConfig, datatype: Optional[torch.dtype] = None) -> torch.Tensor:
+        if not self._need_split(load_config):
+            return raw_tensor if datatype is None else raw_tensor.to(datatype)
 
         split_func = self._get_split_func()
 
-        ts = self.__split_tensor(split_func, raw_tensor, load_config).contiguous().clone()
-        return {self.name: ts}
+        ts = self.__split_tensor(split_func, raw_tensor, load_config)
+        # one copy makes the shard contiguous, owning its memory and of the target dtype
+        return ts.to(datatype if datatype is not None else ts.dtype, memory_format=torch.contiguous_format, copy=True)
+
+    def _split(self, tensor: Union[torch.Tensor, Dict[str, torch.Tensor]], load_config: LoadConfig):
+        raw_tensor = tensor if isinstance(tensor, torch.Tensor) else tensor[self.name]
+        return {self.name: self._split_tensor(raw_tensor, load_config)}
 
     def _postprocess(self, tensor: Union[torch.Tensor, Dict[str, torch.Tensor]], device:str, load_config: LoadConfig):
         raw_tensor = tensor.get(self.name) if isinstance(tensor, dict) else tensor
@@ -412,6 +456,14 @@ class AtomicWeight(WeightModule):
         return self.__str__()
 
 
+# process and merge funcs that only move data, applying them before or after dtype conversion gives the same result
+_LAYOUT_ONLY_FUNCS = [identity, transpose, concat_0, concat_1, stack_, merge_qkv_hf]
+
+def _unwrap_partial(func: Callable) -> Callable:
+    while isinstance(func, functools.partial):
+        func = func.func
+    return func
+
 class QuantWeight(WeightModule):
     def __init__(self, name: str, quant_algo, *args, **kwargs):
         super().__init__(name)
@@ -0,0 +1,80 @@
+import os
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+def _set_cuda_device(device: int):
+    torch.cuda.set_device(device)
+
+def tensors_nbytes(tensors: Dict[str, torch.Tensor]) -> int:
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors.values())
+
+class WeightPrefetcher(object):
+    '''
+    load layers ahead of the consumer with a thread pool, results are yielded in layer order.
+    each task reads, splits and transforms one layer, so disk io, cpu conversion and the consumer's
+    host to device copy overlap. torch ops and file reads release the gil.
+    bytes of loaded but not yet consumed layers (estimated from the largest layer seen) are kept
+    under `byte_budget`, at least one layer is always in flight. bytes are counted on the device load_func
+    returns the tensors on, so when weights are converted on gpu the budget limits gpu memory of prefetched layers.
+    '''
+    def __init__(self,
+                 load_func: Callable[[int], Dict[str, torch.Tensor]],
+                 worker_num: int = 4,
+                 byte_budget: int = 8 * 1024 ** 3):
+        self.load_func = load_func
+        self.worker_num = max(1, worker_num)
+        self.byte_budget = byte_budget
+        self.peak_pending_bytes = 0
+
+    @torch.inference_mode()
+    def _load(self, layer_id: int) -> Dict[str, torch.Tensor]:
+        return self.load_func(layer_id)
+
+    def iterate(self, layer_ids: List[int]) -> Iterator[Tuple[int, Dict[str, torch.Tensor]]]:
+        if self.worker_num == 1 or len(layer_ids) <= 1:
+            for layer_id in layer_ids:
+                yield layer_id, self._load(layer_id)
+            return
+
+        layer_bytes: Optional[int] = None
+        pending: Deque[Tuple[int, Future[Dict[str, torch.Tensor]]]] = deque()
+        next_index = 0
+        # current cuda device is per thread, workers use the device of the caller instead of device 0
+        initializer_args = dict(initializer=_set_cuda_device, initargs=(torch.cuda.current_device(),)) \
+            if torch.cuda.is_available() else {}
+        executor = ThreadPoolExecutor(self.worker_num, thread_name_prefix='load_weight', **initializer_args)
+        try:
+            while next_index < len(layer_ids) or pending:
+                while next_index < len(layer_ids) and len(pending) < self.worker_num and \
+                        (len(pending) == 0 or (layer_bytes is not None and (len(pending) + 1) * layer_bytes <= self.byte_budget)):
+                    layer_id = layer_ids[next_index]
+                    pending.append((layer_id, executor.submit(self._load, layer_id)))
+                    next_index += 1
+                layer_id, future = pending.popleft()
+                tensors = future.result()
+                nbytes = tensors_nbytes(tensors)
+                layer_bytes = nbytes if layer_bytes is None else max(layer_bytes, nbytes)
+                self.peak_pending_bytes = max(self.peak_pending_bytes, (len(pending) + 1) * layer_bytes)
+                yield layer_id, tensors
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def reserved_bytes(self, layer_bytes: int) -> int:
+        '''
+        memory of layers loaded at the same time as the one being consumed, i.e. on top of loading layers one
+        at a time. at most `worker_num` layers are in flight, and no more than the byte budget once a layer is seen.
+        '''
+        if self.worker_num == 1:
+            return 0
+        return min(self.worker_num * layer_bytes, max(self.byte_budget, layer_bytes))
+
+def create_weight_prefetcher(load_func: Callable[[int], Dict[str, torch.Tensor]]) -> WeightPrefetcher:
+    worker_num = int(os.environ.get('LOAD_WEIGHT_WORKER_NUM', 4))
+    byte_budget = int(os.environ.get('LOAD_WEIGHT_PREFETCH_BYTES', 8 * 1024 ** 3))
+    return WeightPrefetcher(load_func, worker_num, byte_budget)
@@ -17,7 +17,14 @@ from maga_transformer.utils.util import get_config_from_path, to_torch_dtype
 class ChatGlmV4VisionImageEmbedding(EVA2CLIPImageEmbedding):
     @torch.inference_mode()
     def mm_process(self, mm_input, **kwargs):
-        embeddings = self.image_embedding([mm_input])[0]
+        return self._with_pos_ids(self.image_embedding([mm_input])[0])
+
+    @torch.inference_mode()
+    def mm_process_batch(self, mm_inputs, **kwargs):
+        return [self._with_pos_ids(embeddings) for embeddings in self.image_embedding(mm_inputs)]
+
+    @staticmethod
+    def _with_pos_ids(embeddings: torch.Tensor):
         pos_ids = [1] * embeddings.shape[0]
         pos_ids[0] = 0
         pos_ids[-1] = 2
@@ -1,7 +1,7 @@
 from typing import Union, List, Dict, Optional, Any
 from enum import Enum
 from maga_transformer.config.base_model_config import PyDanticModelBase
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class Usage(PyDanticModelBase):
     prompt_tokens: int = 0
@@ -76,10 +76,14 @@ class SimilarityRequest(PyDanticModelBase):
     right: Union[List[str], List[ContentPart]]
     model: str = ""
     return_response: bool = False
+    # only return the top k similarities of each left input, in descending order
+    top_k: Optional[int] = Field(default=None, ge=1)
 
 class SimilarityResponse(PyDanticModelBase):
     model: str = ""
     similarity: List[List[float]]
+    # indices in right of each similarity when top_k is set
+    indices: Optional[List[List[int]]] = None
     left_response: Optional[OpenAIEmbeddingResponse] = None
     right_response: Optional[OpenAIEmbeddingResponse] = None
 
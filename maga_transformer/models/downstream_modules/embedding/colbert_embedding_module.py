@@ -6,6 +6,7 @@ from transformers import PreTrainedTokenizerBase
 from maga_transformer.utils.util import to_torch_dtype
 from maga_transformer.models.downstream_modules.custom_module import CustomModule, CustomHandler
 from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
+from maga_transformer.async_decoder_engine.embedding.interface import EngineInputs, EngineOutputs
 from maga_transformer.models.downstream_modules.embedding.misc import combo_to_batch, EmbeddingRendererBase
 from maga_transformer.models.downstream_modules.embedding.api_datatype import EmbeddingResponseType, EmbeddingResponseFormat, ColbertEmbeddingRequest, SimilarityRequest
 
@@ -40,6 +41,26 @@ class ColbertEmbeddingRenderer(EmbeddingRendererBase):
         scores = torch.sum(scores) / left_t.size(0)
         return float(scores)
 
+    async def similarity_matrix(self, request: SimilarityRequest, inputs: EngineInputs, outputs: EngineOutputs) -> torch.Tensor:
+        if not isinstance(outputs.outputs, torch.Tensor):
+            return await super().similarity_matrix(request, inputs, outputs)
+        # same vectors as embedding_func, first token dropped and padded to the longest input
+        vecs = outputs.outputs.float()
+        vec_lengths = (inputs.input_lengths - 1).tolist()
+        left_num = len(request.left)
+        right = vecs[left_num:]
+        if left_num == 0 or right.size(0) == 0:
+            return torch.zeros((left_num, right.size(0)))
+        right_mask = torch.arange(right.size(1), device=right.device)[None, :] >= \
+            torch.tensor(vec_lengths[left_num:], device=right.device)[:, None]
+        rows: List[torch.Tensor] = []
+        for i in range(left_num):
+            left = vecs[i, :vec_lengths[i]]
+            # [right_num, left_len, right_len], max sim of each left token over tokens of each right input
+            token_scores = torch.einsum('in,rjn->rij', left, right).masked_fill(right_mask[:, None, :], float('-inf'))
+            rows.append(token_scores.max(-1)[0].sum(-1) / left.size(0))
+        return torch.stack(rows)
+
 
 class ColBertEmbeddingHandler(CustomHandler):
     def __init__(self, config: GptInitModelParameters):
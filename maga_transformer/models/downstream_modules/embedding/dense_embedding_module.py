@@ -14,7 +14,8 @@ from maga_transformer.utils.util import to_torch_dtype
 from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
 from maga_transformer.models.downstream_modules.custom_module import CustomModule, CustomHandler
 from maga_transformer.utils.tensor_utils import get_last_token_from_combo_tokens, get_first_token_from_combo_tokens
-from maga_transformer.models.downstream_modules.embedding.misc import combo_to_batch, EmbeddingRendererBase
+from maga_transformer.async_decoder_engine.embedding.interface import EngineInputs, EngineOutputs
+from maga_transformer.models.downstream_modules.embedding.misc import combo_to_batch, dense_similarity, EmbeddingRendererBase
 from maga_transformer.models.downstream_modules.embedding.api_datatype import EmbeddingResponseType, EmbeddingResponseFormat, OpenAIEmbeddingRequest, SimilarityRequest
 
 class DenseEmbeddingModule(CustomModule):
@@ -41,6 +42,11 @@ class DenseEmbeddingRenderer(EmbeddingRendererBase):
     def similar_func(self, left: EmbeddingResponseFormat, right: EmbeddingResponseFormat) -> float:
         return float(torch.tensor(left.embedding) @ torch.tensor(right.embedding).T)
 
+    async def similarity_matrix(self, request: SimilarityRequest, inputs: EngineInputs, outputs: EngineOutputs) -> torch.Tensor:
+        if not isinstance(outputs.outputs, torch.Tensor):
+            return await super().similarity_matrix(request, inputs, outputs)
+        return dense_similarity(outputs.outputs, len(request.left))
+
     def embedding_func(self, request: Any, res: torch.Tensor, input_length: int, input_tokens: torch.Tensor) -> List[float]:
         assert isinstance(res, torch.Tensor)
         return res.tolist()
@@ -7,13 +7,14 @@ import copy
 import json
 import os
 import math
+import threading
 from PIL import Image
 from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
 from maga_transformer.models.downstream_modules.custom_module import CustomModule, CustomHandler
-from maga_transformer.models.downstream_modules.embedding.misc import EmbeddingRendererBase
+from maga_transformer.models.downstream_modules.embedding.misc import EmbeddingRendererBase, dense_similarity
 from maga_transformer.config.exceptions import FtRuntimeException, ExceptionType
 from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
-from maga_transformer.async_decoder_engine.embedding.interface import EngineInputs
+from maga_transformer.async_decoder_engine.embedding.interface import EngineInputs, EngineOutputs
 from maga_transformer.metrics import kmonitor, GaugeMetrics
 from maga_transformer.utils.time_util import current_time_ms
 from maga_transformer.utils.multimodal_util import MMUrlType, MultimodalInput, get_bytes_io_from_url
@@ -156,6 +157,8 @@ class MiniCPMVInputGenerator(object):
                  tokenizer: PreTrainedTokenizerBase):
         self.tokenizer_ = tokenizer
         self.config_ = config
+        # inputs are created in threads, tokenizer is not thread safe
+        self.tokenizer_lock = threading.Lock()
         self.vit_config = config.mm_related_params.config
         self.im_start = self.tokenizer_.im_start
         self.im_end = self.tokenizer_.im_end
@@ -263,14 +266,15 @@ class MiniCPMVInputGenerator(object):
         if self.config_.position_ids_style == 1:
             truncate_length = self.config_.max_seq_len - (
                 self.config_.special_tokens.pad_token_id + 1)
-        encoded = self.tokenizer_(msgs,
-                                  max_length=truncate_length,
-                                  return_attention_mask=False,
-                                  padding=False,
-                                  return_length=True,
-                                  truncation=truncate,
-                                  return_tensors='np',
-                                  **tokenizer_config)
+        with self.tokenizer_lock:
+            encoded = self.tokenizer_(msgs,
+                                      max_length=truncate_length,
+                                      return_attention_mask=False,
+                                      padding=False,
+                                      return_length=True,
+                                      truncation=truncate,
+                                      return_tensors='np',
+                                      **tokenizer_config)
         combo_tokens = torch.from_numpy(np.concatenate(
             encoded['input_ids'])).to(torch.int32)
         if 'token_type_ids' in encoded:
@@ -331,6 +335,13 @@ class MiniCPMVRenderer(EmbeddingRendererBase):
                      right: EmbeddingResponseFormat) -> float:
         return float(
             torch.tensor(left.embedding) @ torch.tensor(right.embedding).T)
+
+    async def similarity_matrix(self, request: SimilarityRequest,
+                                inputs: EngineInputs,
+                                outputs: EngineOutputs) -> torch.Tensor:
+        if not isinstance(outputs.outputs, torch.Tensor):
+            return await super().similarity_matrix(request, inputs, outputs)
+        return dense_similarity(outputs.outputs, len(request.left))
     
     def render_request(self, request_json: Dict[str, Any]) -> Union[SimilarityRequest, OpenAIEmbeddingRequest]:
         if 'left' in request_json:
@@ -13,40 +13,31 @@ from maga_transformer.models.downstream_modules.common_input_generator import Co
 from maga_transformer.models.downstream_modules.embedding.api_datatype import SimilarityRequest, SimilarityResponse, OpenAIEmbeddingRequest, \
     Usage, EmbeddingResponseFormat, EmbeddingResponseType, OpenAIEmbeddingResponse
 
+def _split_lengths(input_lengths: Union[torch.Tensor, List[int]]) -> List[int]:
+    return input_lengths.tolist() if isinstance(input_lengths, torch.Tensor) else [int(x) for x in input_lengths]
+
 def combo_to_batch(hidde_states: torch.Tensor, input_ids: torch.Tensor, input_lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
-    sliced_hidden_states: List[torch.Tensor] = []
-    sliced_input_ids: List[torch.Tensor] = []
-    hidden_bias = 0
-    for input_length in input_lengths:
-        sliced_hidden_states.append(hidde_states[hidden_bias: hidden_bias + input_length])
-        sliced_input_ids.append(torch.IntTensor(input_ids[hidden_bias: hidden_bias + input_length]))
-        hidden_bias += input_length
-    batched_hidden_states = pad_sequence(sliced_hidden_states, batch_first=True)
-    batched_input_ids = pad_sequence(sliced_input_ids, batch_first=True)
+    lengths = _split_lengths(input_lengths)
+    batched_hidden_states = pad_sequence(torch.split(hidde_states[:sum(lengths)], lengths), batch_first=True)
+    batched_input_ids = pad_sequence(torch.split(torch.as_tensor(input_ids[:sum(lengths)], dtype=torch.int32), lengths), batch_first=True)
     # create attention mask from input_length
-    max_input_length: int = max(input_lengths)
-    batch_size = len(input_lengths)
-    batched_attention_mask = torch.ones((batch_size, max_input_length), dtype=torch.bool, device=g_parallel_info.device)
-    for b, input_length in enumerate(input_lengths):
-        batched_attention_mask[b, input_length:] = 0
+    length_tensor = torch.tensor(lengths, device=g_parallel_info.device)
+    batched_attention_mask = torch.arange(max(lengths), device=g_parallel_info.device)[None, :] < length_tensor[:, None]
     return batched_input_ids, batched_hidden_states, batched_attention_mask
 
 def hidden_combo_to_batch(hidde_states: torch.Tensor, input_lengths: torch.Tensor) -> torch.Tensor:
-    sliced_hidden_states: List[torch.Tensor] = []
-    hidden_bias = 0
-    for input_length in input_lengths:
-        sliced_hidden_states.append(hidde_states[hidden_bias: hidden_bias + input_length])
-        hidden_bias += input_length
-    return pad_sequence(sliced_hidden_states, batch_first=True)
+    lengths = _split_lengths(input_lengths)
+    return pad_sequence(torch.split(hidde_states[:sum(lengths)], lengths), batch_first=True)
 
 def combo_to_list(tensor: torch.Tensor, input_length: torch.Tensor) -> List[torch.Tensor]:
-    result: List[torch.Tensor] = []
-    bias = 0
-    for length in input_length:
-        result.append(tensor[bias: bias + length])
-        bias += length
-    return result
+    lengths = _split_lengths(input_length)
+    return list(torch.split(tensor[:sum(lengths)], lengths))
 
+def dense_similarity(embeddings: torch.Tensor, left_num: int) -> torch.Tensor:
+    '''[left_num, right_num] dot products, embeddings of left inputs followed by right inputs'''
+    # same fp32 values as the rendered embedding lists
+    embeddings = embeddings.float()
+    return embeddings[:left_num] @ embeddings[left_num:].T
 
 class EmbeddingRendererBase(CustomRenderer):
     embedding_type: EmbeddingResponseType
@@ -81,17 +72,12 @@ class EmbeddingRendererBase(CustomRenderer):
             bias += input_length
         return data
 
-    async def _render_similarity_output(self, request: SimilarityRequest, inputs: EngineInputs, outputs: EngineOutputs) -> List[List[float]]:
+    async def similarity_matrix(self, request: SimilarityRequest, inputs: EngineInputs, outputs: EngineOutputs) -> torch.Tensor:
+        '''[len(left), len(right)] similarity, by similar_func of each pair if not vectorized'''
         embedding_outputs = await self._render_embedding_output(request, inputs, outputs)
         left = embedding_outputs[:len(request.left)]
         right = embedding_outputs[len(request.left): ]
-        batch_results: List[List[float]] = []
-        for l_item in left:
-            result: List[float] = []
-            for r_item in right:                
-                result.append(self.similar_func(l_item, r_item))
-            batch_results.append(result)
-        return batch_results        
+        return torch.tensor([[self.similar_func(l_item, r_item) for r_item in right] for l_item in left], dtype=torch.float64)
 
     async def render_response(self, request: Union[OpenAIEmbeddingRequest, SimilarityRequest], inputs: EngineInputs, outputs: EngineOutputs) -> Dict[str, Any]:
         usage = Usage(prompt_tokens=outputs.input_length, total_tokens=outputs.input_length)
@@ -99,5 +85,9 @@ class EmbeddingRendererBase(CustomRenderer):
             data = await self._render_embedding_output(request, inputs, outputs)
             return OpenAIEmbeddingResponse(data=data, usage=usage).model_dump()
         else:
-            batch_results = await self._render_similarity_output(request, inputs, outputs)
-            return SimilarityResponse(similarity=batch_results).model_dump()
\ No newline at end of file
+            similarity = await self.similarity_matrix(request, inputs, outputs)
+            indices = None
+            if request.top_k is not None:
+                similarity, top_k_indices = similarity.topk(min(request.top_k, similarity.size(1)), dim=1)
+                indices = top_k_indices.tolist()
+            return SimilarityResponse(similarity=similarity.tolist(), indices=indices).model_dump()
\ No newline at end of file
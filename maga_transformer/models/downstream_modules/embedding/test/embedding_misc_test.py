@@ -0,0 +1,125 @@
+import time
+import asyncio
+import logging
+import torch
+from types import SimpleNamespace
+from pydantic import ValidationError
+from typing import List, Tuple
+from unittest import TestCase, main
+from torch.nn.utils.rnn import pad_sequence
+
+from maga_transformer.distribute.worker_info import g_parallel_info
+from maga_transformer.async_decoder_engine.embedding.interface import EngineInputs, EngineOutputs
+from maga_transformer.models.downstream_modules.embedding.misc import combo_to_batch, hidden_combo_to_batch, combo_to_list, EmbeddingRendererBase
+from maga_transformer.models.downstream_modules.embedding.dense_embedding_module import DenseEmbeddingRenderer
+from maga_transformer.models.downstream_modules.embedding.colbert_embedding_module import ColbertEmbeddingRenderer
+from maga_transformer.models.downstream_modules.embedding.api_datatype import SimilarityRequest
+
+def loop_combo_to_batch(hidde_states: torch.Tensor, input_ids: torch.Tensor, input_lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    # previous implementation, slices and masks each input in python
+    sliced_hidden_states: List[torch.Tensor] = []
+    sliced_input_ids: List[torch.Tensor] = []
+    hidden_bias = 0
+    for input_length in input_lengths:
+        sliced_hidden_states.append(hidde_states[hidden_bias: hidden_bias + input_length])
+        sliced_input_ids.append(torch.IntTensor(input_ids[hidden_bias: hidden_bias + input_length]))
+        hidden_bias += input_length
+    batched_hidden_states = pad_sequence(sliced_hidden_states, batch_first=True)
+    batched_input_ids = pad_sequence(sliced_input_ids, batch_first=True)
+    max_input_length: int = max(input_lengths)
+    batch_size = len(input_lengths)
+    batched_attention_mask = torch.ones((batch_size, max_input_length), dtype=torch.bool, device=g_parallel_info.device)
+    for b, input_length in enumerate(input_lengths):
+        batched_attention_mask[b, input_length:] = 0
+    return batched_input_ids, batched_hidden_states, batched_attention_mask
+
+def create_renderer(renderer_cls):
+    return renderer_cls(SimpleNamespace(), None)
+
+class EmbeddingMiscTest(TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+
+    def _combo(self, lengths: List[int], hidden_size: int):
+        input_lengths = torch.tensor(lengths, dtype=torch.int32)
+        hidden_states = torch.randn(sum(lengths), hidden_size)
+        input_ids = torch.randint(0, 30000, (sum(lengths),), dtype=torch.int32)
+        return input_ids, hidden_states, input_lengths
+
+    def _similarity_inputs(self, outputs: torch.Tensor, lengths: List[int], left_num: int):
+        request = SimilarityRequest(left=["l"] * left_num, right=["r"] * (len(lengths) - left_num))
+        inputs = EngineInputs(token_ids=torch.zeros(sum(lengths), dtype=torch.int32),
+                              token_type_ids=torch.zeros(sum(lengths), dtype=torch.int32),
+                              input_lengths=torch.tensor(lengths, dtype=torch.int32))
+        return request, inputs, EngineOutputs(outputs=outputs, input_length=sum(lengths))
+
+    def _reference_similarity(self, renderer: EmbeddingRendererBase, request, inputs, outputs) -> torch.Tensor:
+        return asyncio.run(EmbeddingRendererBase.similarity_matrix(renderer, request, inputs, outputs))
+
+    def test_combo_to_batch(self):
+        for lengths in [[1], [7, 3, 12], [5, 5, 5, 5]]:
+            input_ids, hidden_states, input_lengths = self._combo(lengths, 16)
+            expected = loop_combo_to_batch(hidden_states, input_ids, input_lengths)
+            res = combo_to_batch(hidden_states, input_ids, input_lengths)
+            for x, y in zip(res, expected):
+                self.assertEqual(x.dtype, y.dtype)
+                self.assertTrue(torch.equal(x, y))
+            self.assertTrue(torch.equal(hidden_combo_to_batch(hidden_states, input_lengths), expected[1]))
+            for x, length in zip(combo_to_list(hidden_states, input_lengths), lengths):
+                self.assertEqual(x.size(0), length)
+
+    def test_dense_similarity(self):
+        renderer = create_renderer(DenseEmbeddingRenderer)
+        lengths = [4] * 10
+        outputs = torch.nn.functional.normalize(torch.randn(10, 32), dim=1).half()
+        request, inputs, engine_outputs = self._similarity_inputs(outputs, lengths, 3)
+        expected = self._reference_similarity(renderer, request, inputs, engine_outputs)
+        res = asyncio.run(renderer.similarity_matrix(request, inputs, engine_outputs))
+        self.assertEqual(res.shape, (3, 7))
+        self.assertTrue(torch.allclose(res.double(), expected, atol=1e-6))
+
+        request.top_k = 2
+        response = asyncio.run(renderer.render_response(request, inputs, engine_outputs))
+        top_k, indices = expected.topk(2, dim=1)
+        self.assertEqual(response['indices'], indices.tolist())
+        self.assertTrue(torch.allclose(torch.tensor(response['similarity']).double(), top_k, atol=1e-6))
+        with self.assertRaises(ValidationError):
+            SimilarityRequest(left=["l"], right=["r"], top_k=0)
+
+    def test_colbert_similarity(self):
+        renderer = create_renderer(ColbertEmbeddingRenderer)
+        lengths = [9, 4, 17, 6, 12]
+        outputs = torch.nn.functional.normalize(torch.randn(len(lengths), max(lengths) - 1, 16), dim=-1)
+        for i, length in enumerate(lengths):
+            outputs[i, length - 1:] = 0
+        request, inputs, engine_outputs = self._similarity_inputs(outputs, lengths, 2)
+        expected = self._reference_similarity(renderer, request, inputs, engine_outputs)
+        res = asyncio.run(renderer.similarity_matrix(request, inputs, engine_outputs))
+        self.assertTrue(torch.allclose(res.double(), expected, atol=1e-6))
+
+    def test_benchmark(self):
+        # 64 inputs of 16 ~ 512 tokens with hidden size 1024, similarity of 64 x 64 inputs
+        lengths = torch.randint(16, 513, (64,)).tolist()
+        input_ids, hidden_states, input_lengths = self._combo(lengths, 1024)
+        start = time.time()
+        loop_combo_to_batch(hidden_states, input_ids, input_lengths)
+        loop_time = time.time() - start
+        start = time.time()
+        combo_to_batch(hidden_states, input_ids, input_lengths)
+        vectorized_time = time.time() - start
+
+        renderer = create_renderer(DenseEmbeddingRenderer)
+        outputs = torch.nn.functional.normalize(torch.randn(128, 1024), dim=1)
+        request, inputs, engine_outputs = self._similarity_inputs(outputs, [8] * 128, 64)
+        start = time.time()
+        self._reference_similarity(renderer, request, inputs, engine_outputs)
+        pair_time = time.time() - start
+        start = time.time()
+        asyncio.run(renderer.similarity_matrix(request, inputs, engine_outputs))
+        matmul_time = time.time() - start
+        logging.info(f"combo_to_batch of 64 inputs, loop: {loop_time * 1000:.1f}ms, vectorized: {vectorized_time * 1000:.1f}ms; "
+                     f"64 x 64 similarity, per pair: {pair_time * 1000:.1f}ms, matmul: {matmul_time * 1000:.1f}ms")
+        self.assertLess(matmul_time, pair_time)
+
+if __name__ == '__main__':
+    main()
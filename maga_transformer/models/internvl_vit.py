@@ -1,11 +1,6 @@
 from typing import List, Optional, Tuple, Union, Dict, Any
 
 from PIL import Image
-try:
-    from decord import VideoReader, cpu
-except ModuleNotFoundError:
-    VideoReader = None
-    cpu = None
 
 import os
 import copy
@@ -28,6 +23,7 @@ from torchvision.transforms.functional import InterpolationMode
 import torchvision.transforms as T
 
 from maga_transformer.models.multimodal.multimodal_common import MultiModalEmbeddingInterface
+from maga_transformer.models.multimodal.video_loader import VideoLoader
 from maga_transformer.utils.multimodal_util import MMUrlType
 from maga_transformer.utils.flash_attn_utils import can_use_flash_attn
 from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
@@ -139,16 +135,12 @@ def get_index(bound, fps, max_frame, first_idx=0, num_segments=32):
     return frame_indices
 
 def load_video(video_path, bound=None, input_size=448, max_num=1, num_segments=32):
-    vr = VideoReader(video_path, ctx=cpu(0), num_threads=1)
-    max_frame = len(vr) - 1
-    fps = float(vr.get_avg_fps())
+    loader = VideoLoader(video_path)
+    max_frame = loader.frame_num - 1
+    fps = loader.fps
 
-    img_list = []
     frame_indices = get_index(bound, fps, max_frame, first_idx=0, num_segments=num_segments)
-    for frame_index in frame_indices:
-        img = Image.fromarray(vr[frame_index].asnumpy()).convert('RGB')
-        img_list.append(img)
-    return img_list
+    return loader.get_images(frame_indices)
 
 class InternVLImageEmbedding(MultiModalEmbeddingInterface):
     def __init__(self, config: GptInitModelParameters):
@@ -209,38 +201,51 @@ class InternVLImageEmbedding(MultiModalEmbeddingInterface):
         else:
             raise Exception("unknown mm url type")
 
+    def mm_batch_key(self, mm_input, mm_type: MMUrlType, **kwargs):
+        return MMUrlType.IMAGE if mm_type == MMUrlType.IMAGE else None
+
+    @torch.inference_mode()
+    def mm_process_batch(self, mm_inputs, **kwargs):
+        return self.image_features(mm_inputs, 12)
+
     @torch.no_grad()
     def image_embedding(self, images: List[Image.Image], max_num):
+        return torch.stack(self.image_features(images, max_num))
+
+    @torch.no_grad()
+    def image_features(self, images: List[Image.Image], max_num) -> List[torch.Tensor]:
         # hugging face default value
         device = self._device
         config = self.config.mm_related_params.config
         input_size = config["image_size"]
         transform = build_transform(input_size=config["image_size"])
-        res = []
+        # tiles of all images run in one forward
+        pixel_values = []
+        tile_nums = []
         for image in images:
             now_images = dynamic_preprocess(image, image_size=input_size, use_thumbnail=True, max_num=max_num)
-            pixel_values = [transform(now_image) for now_image in now_images]
-            pixel_values = torch.stack(pixel_values).to(device=device).to(self._data_type)
-
-            if self.select_layer == -1:
-                vit_embeds = self.vision_model(
-                    pixel_values=pixel_values,
-                    output_hidden_states=False,
-                    return_dict=True).last_hidden_state
-            else:
-                vit_embeds = self.vision_model(
-                    pixel_values=pixel_values,
-                    output_hidden_states=True,
-                    return_dict=True).hidden_states[self.select_layer]
-            vit_embeds = vit_embeds[:, 1:, :]
-
-            h = w = int(vit_embeds.shape[1] ** 0.5)
-            vit_embeds = vit_embeds.reshape(vit_embeds.shape[0], h, w, -1)
-            vit_embeds = pixel_shuffle(self.ps_version, vit_embeds, scale_factor=self.downsample_ratio)
-            vit_embeds = vit_embeds.reshape(vit_embeds.shape[0], -1, vit_embeds.shape[-1])
-            vit_embeds = self.mlp1(vit_embeds)
-            res.append(vit_embeds.reshape(-1, vit_embeds.shape[-1]))
-        return torch.stack(res)
+            pixel_values.extend([transform(now_image) for now_image in now_images])
+            tile_nums.append(len(now_images))
+        pixel_values = torch.stack(pixel_values).to(device=device).to(self._data_type)
+
+        if self.select_layer == -1:
+            vit_embeds = self.vision_model(
+                pixel_values=pixel_values,
+                output_hidden_states=False,
+                return_dict=True).last_hidden_state
+        else:
+            vit_embeds = self.vision_model(
+                pixel_values=pixel_values,
+                output_hidden_states=True,
+                return_dict=True).hidden_states[self.select_layer]
+        vit_embeds = vit_embeds[:, 1:, :]
+
+        h = w = int(vit_embeds.shape[1] ** 0.5)
+        vit_embeds = vit_embeds.reshape(vit_embeds.shape[0], h, w, -1)
+        vit_embeds = pixel_shuffle(self.ps_version, vit_embeds, scale_factor=self.downsample_ratio)
+        vit_embeds = vit_embeds.reshape(vit_embeds.shape[0], -1, vit_embeds.shape[-1])
+        vit_embeds = self.mlp1(vit_embeds)
+        return [embeds.reshape(-1, embeds.shape[-1]) for embeds in torch.split(vit_embeds, tile_nums)]
 
 class InternVisionConfig(PretrainedConfig):
     r"""
@@ -16,17 +16,12 @@ import copy
 from PIL import Image
 from transformers import CLIPVisionModel, CLIPImageProcessor, CLIPVisionConfig
 from maga_transformer.models.multimodal.multimodal_common import MultiModalEmbeddingInterface
+from maga_transformer.models.multimodal.video_loader import VideoLoader
 from maga_transformer.utils.multimodal_util import MMUrlType
 from maga_transformer.models.llava_utils import expand2square, process_anyres_image, unpad_image, get_anyres_image_grid_shape
 from maga_transformer.distribute.worker_info import g_parallel_info
 from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
 
-try:
-    import av
-    from decord import VideoReader, cpu
-except ImportError:
-    print("Please install pyav to use video processing functions.")
-
 from transformers.image_processing_utils import BatchFeature, get_size_dict
 from transformers.image_transforms import (
     convert_to_rgb,
@@ -78,6 +73,14 @@ class LlavaImageEmbedding(MultiModalEmbeddingInterface):
         else:
             raise Exception("unknown mm url type")
 
+    def mm_batch_key(self, mm_input, mm_type: MMUrlType, **kwargs):
+        # process_images already encodes a list of images in one forward
+        return MMUrlType.IMAGE if mm_type == MMUrlType.IMAGE else None
+
+    @torch.inference_mode()
+    def mm_process_batch(self, mm_inputs, **kwargs):
+        return self.image_embedding(mm_inputs)
+
     def _mm_preprocess(self, data, **kwargs):
         mm_type = kwargs.get("mm_type")
         if mm_type == MMUrlType.DEFAULT:
@@ -101,9 +104,9 @@ class LlavaImageEmbedding(MultiModalEmbeddingInterface):
 
     def load_video(self, data, configs, **kwargs):
         fps = 1 if configs.fps == -1 else configs.fps
-        vr = VideoReader(data, ctx=cpu(0), num_threads=1)
-        total_frame_num = len(vr)
-        video_time = total_frame_num / vr.get_avg_fps()
+        loader = VideoLoader(data)
+        total_frame_num = loader.frame_num
+        video_time = total_frame_num / loader.fps
         frame_num = round(video_time * fps)
         # set frame num between 1 and 100
         max_frame_num = configs.max_frames if configs.max_frames != -1 else 100
@@ -114,11 +117,7 @@ class LlavaImageEmbedding(MultiModalEmbeddingInterface):
         frame_idx = np.linspace(0, total_frame_num - 1, frame_num).tolist()
         frame_idx = [int(idx) for idx in frame_idx]
         
-        video = vr.get_batch(frame_idx).asnumpy()
-
-        num_frames_to_sample = num_frames = len(frame_idx)
-        vr.seek(0)
-        return [Image.fromarray(frame) for frame in video]
+        return loader.get_images(frame_idx)
 
     @property
     def _device(self):
@@ -11,33 +11,26 @@ from maga_transformer.distribute.worker_info import g_parallel_info
 from maga_transformer.model_factory_register import register_model
 from maga_transformer.models.qwen_v2 import QWenV2, QWenV2Weight
 from maga_transformer.models.multimodal.multimodal_mixin import MultiModalMixin, BaseVitWeights
-from maga_transformer.models.multimodal.multimodal_common import MultiModalEmbeddingInterface, mm_lock 
+from maga_transformer.models.multimodal.multimodal_common import MultiModalEmbeddingInterface, mm_embedding_cache_key
+from maga_transformer.models.multimodal.video_loader import VideoLoader
 from maga_transformer.utils.multimodal_util import MMUrlType
 from maga_transformer.models.minicpmv.modeling_navit_siglip import SiglipVisionTransformer, SiglipVisionConfig
 from maga_transformer.models.minicpmv.resampler import Resampler
 from maga_transformer.models.multimodal.multimodal_mixin import BaseVitWeights, BaseMultiModalWeightInfo
 from maga_transformer.utils.multimodal_util import MMUrlType, vit_emb_cache_, get_bytes_io_from_url
 
-try:
-    from decord import VideoReader, cpu
-except ModuleNotFoundError:
-    VideoReader = None
-    cpu = None
-
 def encode_video(video_path, max_num_frames: int = 32):
     def uniform_sample(l, n):
         gap = len(l) / n
         idxs = [int(i * gap + gap / 2) for i in range(n)]
         return [l[i] for i in idxs]
 
-    vr = VideoReader(video_path, ctx=cpu(0))
-    sample_fps = round(vr.get_avg_fps() / 1)  # FPS
-    frame_idx = [i for i in range(0, len(vr), sample_fps)]
+    loader = VideoLoader(video_path)
+    sample_fps = round(loader.fps / 1)  # FPS
+    frame_idx = [i for i in range(0, loader.frame_num, sample_fps)]
     if len(frame_idx) > max_num_frames:
         frame_idx = uniform_sample(frame_idx, max_num_frames)
-    frames = vr.get_batch(frame_idx).asnumpy()
-    frames = [Image.fromarray(v.astype('uint8')) for v in frames]
-    return frames
+    return loader.get_images(frame_idx)
 
 class ImageEmbeddingInterface(MultiModalEmbeddingInterface):
 
@@ -66,17 +59,17 @@ class ImageEmbeddingInterface(MultiModalEmbeddingInterface):
         dtype = self._data_type
         if g_parallel_info.tp_rank > 0:
             return torch.Tensor([])
-        cached_res = vit_emb_cache_.check_cache(url)
+        cached_url_res = get_bytes_io_from_url(url)
+        cache_key = mm_embedding_cache_key(cached_url_res, mm_type, **kwargs)
+        cached_res = vit_emb_cache_.check_cache(cache_key)
         if cached_res is None:
-            cached_url_res = get_bytes_io_from_url(url)
             cached_url_res = self._mm_preprocess(cached_url_res, mm_type)
-            with mm_lock:
-                features = self.mm_process(cached_url_res,
-                                        mm_type=mm_type,
-                                        **kwargs)
+            features = self.run_mm_process(cached_url_res,
+                                           mm_type=mm_type,
+                                           **kwargs)
             if isinstance(features, list):
                 features = torch.stack(features).to(dtype).contiguous()
-            vit_emb_cache_.insert_cache(url, features)
+            vit_emb_cache_.insert_cache(cache_key, features)
             return (features, None)
         else:
             return (cached_res, None)
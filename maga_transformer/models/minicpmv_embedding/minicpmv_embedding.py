@@ -11,7 +11,7 @@ from maga_transformer.config.gpt_init_model_parameters import \
 from maga_transformer.distribute.worker_info import ParallelInfo, g_parallel_info
 from maga_transformer.model_factory_register import register_model
 from maga_transformer.models.multimodal.multimodal_mixin import MultiModalMixin, BaseVitWeights
-from maga_transformer.models.multimodal.multimodal_common import MultiModalEmbeddingInterface, mm_lock
+from maga_transformer.models.multimodal.multimodal_common import MultiModalEmbeddingInterface, mm_embedding_cache_key
 from maga_transformer.utils.multimodal_util import MMUrlType
 from transformers import LlamaTokenizer
 # from maga_transformer.models.minicpmv.modeling_navit_siglip import SiglipVisionTransformer, SiglipVisionConfig
@@ -124,17 +124,17 @@ class ImageEmbeddingInterface(MultiModalEmbeddingInterface):
         dtype = self._data_type
         if g_parallel_info.tp_rank > 0:
             return torch.Tensor([])
-        cached_res = vit_emb_cache_.check_cache(url)
+        cached_url_res = get_bytes_io_from_url(url)
+        cache_key = mm_embedding_cache_key(cached_url_res, mm_type, **kwargs)
+        cached_res = vit_emb_cache_.check_cache(cache_key)
         if cached_res is None:
-            cached_url_res = get_bytes_io_from_url(url)
             cached_url_res = self._mm_preprocess(cached_url_res, mm_type)
-            with mm_lock:
-                features = self.mm_process(cached_url_res,
-                                        mm_type=mm_type,
-                                        **kwargs)
+            features = self.run_mm_process(cached_url_res,
+                                           mm_type=mm_type,
+                                           **kwargs)
             if isinstance(features, list):
                 features = torch.stack(features).to(dtype).contiguous()
-            vit_emb_cache_.insert_cache(url, features)
+            vit_emb_cache_.insert_cache(cache_key, features)
             return (features, None)
         else:
             return (cached_res, None)
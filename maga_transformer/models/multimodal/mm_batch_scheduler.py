@@ -0,0 +1,147 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+class _BatchItem(object):
+    __slots__ = ('mm_input', 'batch_key', 'cost', 'kwargs', 'future', 'submit_time')
+
+    def __init__(self, mm_input: Any, batch_key: Optional[Hashable], cost: int, kwargs: Dict[str, Any]):
+        self.mm_input = mm_input
+        self.batch_key = batch_key
+        self.cost = cost
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.submit_time = time.monotonic()
+
+class MMBatchScheduler(object):
+    '''
+    runs vit forwards of all requests in one thread. inputs submitted while a forward runs are batched into the
+    next one, up to `max_batch_size` inputs and `max_batch_cost` (patches, 0 for no limit); a batch waits at
+    most `max_wait_ms` after its first input for more. only inputs with the same batch key and the same kwargs
+    are batched together, since the batch runs with the kwargs of its first input. inputs with key None always
+    run alone.
+    '''
+    def __init__(self,
+                 process_batch_func: Callable[..., List[Any]],
+                 max_batch_size: int = 8,
+                 max_batch_cost: int = 0,
+                 max_wait_ms: float = 0):
+        self.process_batch_func = process_batch_func
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_cost = max_batch_cost
+        self.max_wait_s = max_wait_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+        # inputs taken from queue but not batched yet, in submit order
+        self._pending: Deque[_BatchItem] = deque()
+        self._stopped = False
+        self.batch_count = 0
+        self.item_count = 0
+        self._thread = threading.Thread(target=self._run, name='mm_batch_scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, mm_input: Any, batch_key: Optional[Hashable] = None, cost: int = 1, **kwargs: Any) -> Future:
+        item = _BatchItem(mm_input, batch_key, cost, kwargs)
+        if self._stopped:
+            item.future.set_exception(RuntimeError("mm batch scheduler is stopped"))
+        else:
+            self._queue.put(item)
+        return item.future
+
+    def stop(self):
+        if not self._stopped:
+            self._stopped = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            if not self._pending:
+                item = self._queue.get()
+                if item is None:
+                    return
+                self._pending.append(item)
+            if not self._drain():
+                self._fail_pending()
+                return
+            batch = self._form_batch(self._pending.popleft())
+            self.batch_count += 1
+            self.item_count += len(batch)
+            self._process(batch)
+
+    def _drain(self, timeout: Optional[float] = None) -> bool:
+        '''move submitted inputs to pending, waits up to timeout for the first one. False after stop'''
+        try:
+            item = self._queue.get(timeout=timeout) if timeout is not None else self._queue.get_nowait()
+            while True:
+                if item is None:
+                    return False
+                self._pending.append(item)
+                item = self._queue.get_nowait()
+        except queue.Empty:
+            return True
+
+    def _take(self, head: _BatchItem, cost: int) -> Optional[_BatchItem]:
+        for index, item in enumerate(self._pending):
+            if item.batch_key != head.batch_key or item.kwargs != head.kwargs:
+                continue
+            if self.max_batch_cost > 0 and cost + item.cost > self.max_batch_cost:
+                # keep submit order of inputs in the same batch
+                return None
+            del self._pending[index]
+            return item
+        return None
+
+    def _form_batch(self, head: _BatchItem) -> List[_BatchItem]:
+        batch = [head]
+        if head.batch_key is None:
+            return batch
+        cost = head.cost
+        deadline = head.submit_time + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            item = self._take(head, cost)
+            if item is not None:
+                batch.append(item)
+                cost += item.cost
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or (self.max_batch_cost > 0 and cost >= self.max_batch_cost):
+                break
+            pending_num = len(self._pending)
+            if not self._drain(timeout):
+                self._queue.put(None)
+                break
+            if len(self._pending) == pending_num:
+                break
+        return batch
+
+    def _process(self, batch: List[_BatchItem]):
+        try:
+            results = self.process_batch_func([item.mm_input for item in batch], **batch[0].kwargs)
+            if len(results) != len(batch):
+                raise Exception(f"mm batch process returns {len(results)} results for {len(batch)} inputs")
+        except BaseException as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            # run inputs one by one, a bad input only fails its own request
+            logging.warning(f"mm batch process of {len(batch)} inputs failed: {e}, process them one by one")
+            for item in batch:
+                self._process([item])
+            return
+        for item, result in zip(batch, results):
+            item.future.set_result(result)
+
+    def _fail_pending(self):
+        while self._pending:
+            self._pending.popleft().future.set_exception(RuntimeError("mm batch scheduler is stopped"))
+
+def create_mm_batch_scheduler(process_batch_func: Callable[..., List[Any]]) -> MMBatchScheduler:
+    return MMBatchScheduler(process_batch_func,
+                            max_batch_size=int(os.environ.get('VIT_BATCH_MAX_SIZE', '8')),
+                            max_batch_cost=int(os.environ.get('VIT_BATCH_MAX_PATCHES', '0')),
+                            max_wait_ms=float(os.environ.get('VIT_BATCH_MAX_WAIT_MS', '0')))
@@ -1,12 +1,8 @@
-from typing import List, Tuple, Union, Any
+from typing import List, Optional, Tuple, Union, Any
+from io import BytesIO
 
 import torch
 from threading import Lock
-try:
-    from decord import VideoReader, cpu
-except ModuleNotFoundError:
-    VideoReader = None
-    cpu = None
 from PIL import Image, ImageFile
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 import pillow_avif
@@ -20,9 +16,18 @@ from maga_transformer.utils.multimodal_util import (vit_emb_cache_,
                                                     get_bytes_io_from_url,
                                                     MMUrlType,
                                                     get_vit_compute_dtype)
+from maga_transformer.models.multimodal.mm_batch_scheduler import MMBatchScheduler, create_mm_batch_scheduler
+from maga_transformer.models.multimodal.video_loader import VideoLoader
 
 import threading
-mm_lock = threading.Lock()
+mm_scheduler_lock = threading.Lock()
+
+def mm_embedding_cache_key(bytes_io: BytesIO, mm_type: MMUrlType, **kwargs: Any) -> Optional[bytes]:
+    '''vit embedding cache key of downloaded data, None when the cache is off'''
+    if not vit_emb_cache_.enabled:
+        return None
+    with bytes_io.getbuffer() as data:
+        return vit_emb_cache_.cache_key(data, mm_type, kwargs.get('configs'))
 
 class ImageTransform:
 
@@ -56,20 +61,51 @@ class MultiModalEmbeddingInterface:
         dtype = self._data_type
         if g_parallel_info.tp_rank > 0:
             return torch.Tensor([])
-        cached_res = vit_emb_cache_.check_cache(url)
+        bytes_io = get_bytes_io_from_url(url)
+        cache_key = mm_embedding_cache_key(bytes_io, mm_type, **kwargs)
+        cached_res = vit_emb_cache_.check_cache(cache_key)
         if cached_res is not None:
             return cached_res
-        bytes_io = get_bytes_io_from_url(url)
         mm_input = self._mm_preprocess(bytes_io, mm_type=mm_type, **kwargs)
-        with mm_lock:
-            features = self.mm_process(mm_input, mm_type=mm_type, **kwargs)
+        features = self.run_mm_process(mm_input, mm_type=mm_type, **kwargs)
         if isinstance(features, tuple):
             features = (features[0].to(dtype).contiguous(), features[1].contiguous())
         else:
             features = (features.to(dtype).contiguous(), None)
-        vit_emb_cache_.insert_cache(url, features)
+        vit_emb_cache_.insert_cache(cache_key, features)
         return features
 
+    def run_mm_process(self, mm_input, mm_type: MMUrlType, **kwargs: Any):
+        '''mm_process through the batch scheduler, which runs all vit forwards of the process in one thread'''
+        batch_key = self.mm_batch_key(mm_input, mm_type=mm_type, **kwargs)
+        cost = self.mm_input_cost(mm_input, mm_type=mm_type, **kwargs) if batch_key is not None else 1
+        future = self._get_batch_scheduler().submit(mm_input, batch_key, cost, mm_type=mm_type, **kwargs)
+        return future.result()
+
+    def _get_batch_scheduler(self) -> MMBatchScheduler:
+        scheduler = getattr(self, '_mm_batch_scheduler', None)
+        if scheduler is None:
+            with mm_scheduler_lock:
+                scheduler = getattr(self, '_mm_batch_scheduler', None)
+                if scheduler is None:
+                    scheduler = create_mm_batch_scheduler(self._mm_process_batch)
+                    self._mm_batch_scheduler = scheduler
+        return scheduler
+
+    @torch.inference_mode()
+    def _mm_process_batch(self, mm_inputs: List[Any], **kwargs: Any) -> List[Any]:
+        if len(mm_inputs) == 1:
+            return [self.mm_process(mm_inputs[0], **kwargs)]
+        return self.mm_process_batch(mm_inputs, **kwargs)
+
+    def mm_batch_key(self, mm_input, mm_type: MMUrlType, **kwargs: Any) -> Optional[Any]:
+        '''inputs with the same key can run in one mm_process_batch, None runs alone'''
+        return None
+
+    def mm_input_cost(self, mm_input, mm_type: MMUrlType, **kwargs: Any) -> int:
+        '''cost of input counted against VIT_BATCH_MAX_PATCHES'''
+        return 1
+
     def _mm_preprocess(self, data, **kwargs):
         raise NotImplementedError
 
@@ -77,6 +113,11 @@ class MultiModalEmbeddingInterface:
     def mm_process(self, mm_input, **kwargs):
         raise NotImplementedError
 
+    @torch.inference_mode()
+    def mm_process_batch(self, mm_inputs: List[Any], **kwargs) -> List[Any]:
+        '''mm_process of inputs with the same batch key, in one forward'''
+        return [self.mm_process(mm_input, **kwargs) for mm_input in mm_inputs]
+
 class ImageEmbeddingInterface(MultiModalEmbeddingInterface):
     def _mm_preprocess(self, data, **kwargs):
         return Image.open(data).convert("RGB")
@@ -85,6 +126,14 @@ class ImageEmbeddingInterface(MultiModalEmbeddingInterface):
     def mm_process(self, mm_input, **kwargs):
         return self.image_embedding([mm_input])[0]
 
+    def mm_batch_key(self, mm_input, mm_type: MMUrlType, **kwargs: Any) -> Optional[Any]:
+        # images are resized to the same size
+        return mm_type
+
+    @torch.inference_mode()
+    def mm_process_batch(self, mm_inputs: List[Any], **kwargs) -> List[Any]:
+        return list(self.image_embedding(mm_inputs))
+
     @torch.inference_mode()
     def image_embedding(self, images: List[Image.Image]):
         raise NotImplementedError()
@@ -106,7 +155,7 @@ class AudioEmbeddingInterface(MultiModalEmbeddingInterface):
 
 class VideoEmbeddingInterface(MultiModalEmbeddingInterface):
     def _mm_preprocess(self, data, **kwargs):
-        return VideoReader(data, ctx=cpu(0))
+        return VideoLoader(data).reader
 
     @torch.inference_mode()
     def mm_process(self, mm_input, **kwargs):
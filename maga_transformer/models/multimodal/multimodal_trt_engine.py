@@ -265,6 +265,10 @@ class MultiModalTRTEngine(
         images = self.image_transform.encode(images, device, self.dtype)
         return self(images)
 
+    def mm_batch_key(self, mm_input, mm_type, **kwargs):
+        # engine is built with max_batch_size 1
+        return None
+
     def image_embedding(
         self, images: List[Image.Image], device: Union[str, torch.device]
     ) -> torch.Tensor:
@@ -0,0 +1,191 @@
+import time
+import logging
+import threading
+import numpy as np
+import torch
+from PIL import Image
+from types import SimpleNamespace
+from typing import List
+from unittest import TestCase, main
+
+from maga_transformer.models.multimodal.mm_batch_scheduler import MMBatchScheduler
+from maga_transformer.models.multimodal.multimodal_common import ImageEmbeddingInterface
+from maga_transformer.models.qwen2_vl.qwen2_vl_vit import Qwen2VLImageEmbedding
+from maga_transformer.models.qwen2_vl.image_processing_qwen2_vl import Qwen2VLImageProcessor
+from maga_transformer.models.qwen2_vl.modeling_qwen2_vl import Qwen2VisionTransformerPretrainedModel
+from maga_transformer.utils.multimodal_util import MMUrlType, MMPreprocessConfig
+
+class TinyVit(torch.nn.Module):
+    def __init__(self, image_size: int = 32, patch_size: int = 8, hidden_size: int = 64):
+        super().__init__()
+        self.patch_embed = torch.nn.Conv2d(3, hidden_size, kernel_size=patch_size, stride=patch_size)
+        self.pos_embed = torch.nn.Parameter(torch.randn(1, (image_size // patch_size) ** 2, hidden_size))
+        layer = torch.nn.TransformerEncoderLayer(hidden_size, nhead=4, dim_feedforward=hidden_size * 2, batch_first=True)
+        self.encoder = torch.nn.TransformerEncoder(layer, num_layers=2)
+        self.eval()
+
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        x = self.patch_embed(images).flatten(2).transpose(1, 2) + self.pos_embed
+        return self.encoder(x)
+
+class TinyImageEmbedding(ImageEmbeddingInterface):
+    def __init__(self):
+        self.config = SimpleNamespace(data_type="fp32")
+        self.vit = TinyVit()
+        self.batch_sizes: List[int] = []
+
+    @property
+    def _data_type(self):
+        return torch.float32
+
+    def image_embedding(self, images: List[torch.Tensor]) -> torch.Tensor:
+        self.batch_sizes.append(len(images))
+        return self.vit(torch.stack(images))
+
+def run_concurrently(func, inputs: List[torch.Tensor], thread_num: int) -> List[torch.Tensor]:
+    results: List[torch.Tensor] = [None] * len(inputs)
+    def worker(offset: int):
+        for index in range(offset, len(inputs), thread_num):
+            results[index] = func(inputs[index])
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(thread_num)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+class MMBatchSchedulerTest(TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.vit = TinyVit()
+        self.images = [torch.randn(3, 32, 32) for _ in range(64)]
+        with torch.inference_mode():
+            self.expected = [self.vit(image[None])[0] for image in self.images]
+
+    def _process_batch(self, images: List[torch.Tensor], **kwargs) -> List[torch.Tensor]:
+        with torch.inference_mode():
+            return list(self.vit(torch.stack(images)))
+
+    def test_batch_results(self):
+        scheduler = MMBatchScheduler(self._process_batch, max_batch_size=8, max_wait_ms=5)
+        try:
+            results = run_concurrently(lambda image: scheduler.submit(image, batch_key=MMUrlType.IMAGE).result(),
+                                       self.images, 16)
+        finally:
+            scheduler.stop()
+        for result, expected in zip(results, self.expected):
+            self.assertTrue(torch.allclose(result, expected, atol=1e-5))
+        self.assertLess(scheduler.batch_count, len(self.images))
+
+    def test_batch_limits(self):
+        batches: List[int] = []
+        def process_batch(images, **kwargs):
+            batches.append(len(images))
+            time.sleep(0.01)
+            return images
+        scheduler = MMBatchScheduler(process_batch, max_batch_size=4, max_batch_cost=3, max_wait_ms=20)
+        try:
+            futures = [scheduler.submit(index, batch_key="image") for index in range(8)] + \
+                [scheduler.submit(index, batch_key=None) for index in range(2)]
+            self.assertEqual([future.result() for future in futures], list(range(8)) + [0, 1])
+        finally:
+            scheduler.stop()
+        self.assertEqual(max(batches), 3)
+        self.assertEqual(sum(batches), 10)
+
+    def test_failed_input(self):
+        def process_batch(values, **kwargs):
+            if "bad" in values:
+                raise ValueError("bad input")
+            return values
+        scheduler = MMBatchScheduler(process_batch, max_batch_size=4, max_wait_ms=20)
+        try:
+            futures = [scheduler.submit(value, batch_key="image") for value in ["a", "bad", "c"]]
+            self.assertEqual(futures[0].result(), "a")
+            with self.assertRaises(ValueError):
+                futures[1].result()
+            self.assertEqual(futures[2].result(), "c")
+        finally:
+            scheduler.stop()
+
+    def test_different_kwargs(self):
+        batches: List[List[str]] = []
+        started = threading.Event()
+        release = threading.Event()
+        def process_batch(values, configs):
+            started.set()
+            release.wait()
+            batches.append([value + configs.width for value in values])
+            return batches[-1]
+        scheduler = MMBatchScheduler(process_batch, max_batch_size=4)
+        try:
+            # inputs submitted while the first one runs are batched only with equal kwargs
+            first = scheduler.submit("a", batch_key="image", configs=MMPreprocessConfig(width="1"))
+            self.assertTrue(started.wait(10))
+            futures = [scheduler.submit(value, batch_key="image", configs=MMPreprocessConfig(width=width))
+                       for value, width in [("b", "2"), ("c", "3"), ("d", "2")]]
+            release.set()
+            self.assertEqual(first.result(), "a1")
+            self.assertEqual([future.result() for future in futures], ["b2", "c3", "d2"])
+        finally:
+            scheduler.stop()
+        self.assertEqual(batches, [["a1"], ["b2", "d2"], ["c3"]])
+
+    def test_embedding_interface(self):
+        embedding = TinyImageEmbedding()
+        embedding.vit = self.vit
+        results = run_concurrently(lambda image: embedding.run_mm_process(image, mm_type=MMUrlType.IMAGE),
+                                   self.images, 16)
+        for result, expected in zip(results, self.expected):
+            self.assertTrue(torch.allclose(result, expected, atol=1e-5))
+        self.assertEqual(sum(embedding.batch_sizes), len(self.images))
+
+    def test_benchmark(self):
+        images = self.images * 4
+        throughputs = {}
+        for max_batch_size in [1, 16]:
+            scheduler = MMBatchScheduler(self._process_batch, max_batch_size=max_batch_size)
+            try:
+                start = time.time()
+                run_concurrently(lambda image: scheduler.submit(image, batch_key=MMUrlType.IMAGE).result(), images, 16)
+                throughputs[max_batch_size] = len(images) / (time.time() - start)
+            finally:
+                scheduler.stop()
+        logging.info(f"vit images/s, batch size 1: {throughputs[1]:.0f}, dynamic batching: {throughputs[16]:.0f}")
+        self.assertGreater(throughputs[16], throughputs[1])
+
+class Qwen2VLBatchEmbeddingTest(TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        vision_config = {"depth": 2, "embed_dim": 32, "hidden_size": 48, "num_heads": 4,
+                         "patch_size": 14, "spatial_merge_size": 2, "temporal_patch_size": 2}
+        self.embedding = Qwen2VLImageEmbedding.__new__(Qwen2VLImageEmbedding)
+        self.embedding.image_processor = Qwen2VLImageProcessor(min_pixels=4 * 28 * 28, max_pixels=16384 * 28 * 28)
+        self.embedding.visual = Qwen2VisionTransformerPretrainedModel(vision_config).eval()
+        self.embedding.config = SimpleNamespace(data_type="fp32", mm_related_params=SimpleNamespace(config=vision_config))
+        rng = np.random.default_rng(0)
+        self.images = [Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+                       for height, width in [(56, 84), (112, 56), (56, 84), (84, 140)]]
+
+    def test_same_as_single_image(self):
+        with torch.inference_mode():
+            results = self.embedding.batch_image_embedding(self.images)
+            expected = [self.embedding.image_embedding([image]) for image in self.images]
+        self.assertEqual(len(results), len(self.images))
+        for (embedding, pos_id), (expected_embedding, expected_pos_id) in zip(results, expected):
+            self.assertEqual(embedding.shape, expected_embedding.shape)
+            self.assertTrue(torch.allclose(embedding, expected_embedding, atol=1e-5))
+            self.assertTrue(torch.equal(pos_id, expected_pos_id))
+
+    def test_scheduler(self):
+        results = run_concurrently(lambda image: self.embedding.run_mm_process(image, mm_type=MMUrlType.IMAGE),
+                                   self.images * 4, 8)
+        with torch.inference_mode():
+            expected = [self.embedding.image_embedding([image]) for image in self.images * 4]
+        for (embedding, pos_id), (expected_embedding, expected_pos_id) in zip(results, expected):
+            self.assertTrue(torch.allclose(embedding, expected_embedding, atol=1e-5))
+            self.assertTrue(torch.equal(pos_id, expected_pos_id))
+        self.embedding._mm_batch_scheduler.stop()
+
+if __name__ == '__main__':
+    main()
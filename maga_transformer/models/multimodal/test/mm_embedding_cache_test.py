@@ -0,0 +1,72 @@
+import os
+import tempfile
+import torch
+from types import SimpleNamespace
+from unittest import TestCase, main
+
+from maga_transformer.models.multimodal import multimodal_common
+from maga_transformer.models.multimodal.multimodal_common import MultiModalEmbeddingInterface
+from maga_transformer.utils.multimodal_util import MMEmbeddingCache, MMPreprocessConfig, MMUrlType
+
+class FakeEmbedding(MultiModalEmbeddingInterface):
+    def __init__(self):
+        self.config = SimpleNamespace(data_type="fp16")
+        self.process_count = 0
+
+    def _mm_preprocess(self, data, **kwargs):
+        return data.read()
+
+    def mm_process(self, mm_input, **kwargs):
+        self.process_count += 1
+        width = kwargs["configs"].width
+        return torch.tensor([float(len(mm_input)), float(width)])
+
+class MMEmbeddingCacheTest(TestCase):
+    def setUp(self):
+        multimodal_common.vit_emb_cache_ = MMEmbeddingCache(1024 * 1024)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.embedding = FakeEmbedding()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_same_content_different_url(self):
+        url_a = self._write("a.png", b"image" * 10)
+        url_b = self._write("b.png", b"image" * 10)
+        config = MMPreprocessConfig(width=224)
+        res_a = self.embedding.mm_embedding(url_a, MMUrlType.IMAGE, configs=config)
+        res_b = self.embedding.mm_embedding(url_b, MMUrlType.IMAGE, configs=config)
+        self.assertEqual(self.embedding.process_count, 1)
+        self.assertTrue(torch.equal(res_a[0], res_b[0]))
+
+    def test_same_url_different_config(self):
+        url = self._write("a.png", b"image" * 10)
+        res_small = self.embedding.mm_embedding(url, MMUrlType.IMAGE, configs=MMPreprocessConfig(width=224))
+        res_large = self.embedding.mm_embedding(url, MMUrlType.IMAGE, configs=MMPreprocessConfig(width=448))
+        self.assertEqual(self.embedding.process_count, 2)
+        self.assertEqual(res_small[0][1].item(), 224)
+        self.assertEqual(res_large[0][1].item(), 448)
+        self.embedding.mm_embedding(url, MMUrlType.IMAGE, configs=MMPreprocessConfig(width=224))
+        self.assertEqual(self.embedding.process_count, 2)
+
+    def test_evict_by_bytes(self):
+        # each embedding is 2 fp16 values, 4 bytes
+        cache = MMEmbeddingCache(8)
+        multimodal_common.vit_emb_cache_ = cache
+        urls = [self._write(f"{i}.png", bytes([i]) * 8) for i in range(3)]
+        for url in urls:
+            self.embedding.mm_embedding(url, MMUrlType.IMAGE, configs=MMPreprocessConfig())
+        self.assertEqual(cache.total_bytes, 8)
+        self.embedding.mm_embedding(urls[0], MMUrlType.IMAGE, configs=MMPreprocessConfig())
+        self.assertEqual(self.embedding.process_count, 4)
+        self.embedding.mm_embedding(urls[2], MMUrlType.IMAGE, configs=MMPreprocessConfig())
+        self.assertEqual(self.embedding.process_count, 4)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import numpy as np
+from PIL import Image
+from unittest import TestCase, main
+
+from maga_transformer.models.qwen2_vl.image_processing_qwen2_vl import Qwen2VLImageProcessor
+
+class Qwen2VLImageProcessorTest(TestCase):
+    def setUp(self):
+        self.processor = Qwen2VLImageProcessor(min_pixels=4 * 28 * 28, max_pixels=16384 * 28 * 28)
+        self.rng = np.random.default_rng(0)
+
+    def _random_image(self, height: int, width: int, mode: str = "RGB") -> Image.Image:
+        channel = 4 if mode == "RGBA" else 3
+        return Image.fromarray(self.rng.integers(0, 256, (height, width, channel), dtype=np.uint8), mode)
+
+    def _reference(self, images):
+        # preprocess images one by one
+        pixel_values, grid_thws = [], []
+        for image in images:
+            patches, grid_thw = self.processor._preprocess(
+                image,
+                do_resize=self.processor.do_resize,
+                resample=self.processor.resample,
+                do_rescale=self.processor.do_rescale,
+                rescale_factor=self.processor.rescale_factor,
+                do_normalize=self.processor.do_normalize,
+                image_mean=self.processor.image_mean,
+                image_std=self.processor.image_std,
+                do_convert_rgb=self.processor.do_convert_rgb,
+            )
+            pixel_values.append(patches)
+            grid_thws.append(grid_thw)
+        return np.concatenate(pixel_values), np.array(grid_thws)
+
+    def test_same_as_reference(self):
+        # sizes already resized by load_image, sizes resized by the processor, and a rgba image
+        images = [self._random_image(280, 420), self._random_image(280, 420), self._random_image(560, 224),
+                  self._random_image(57, 90), self._random_image(300, 500), self._random_image(100, 140, "RGBA")]
+        res = self.processor(images=images, return_tensors="np")
+        pixel_values, grid_thws = self._reference(images)
+        self.assertEqual(res["pixel_values"].dtype, pixel_values.dtype)
+        self.assertTrue(np.array_equal(res["pixel_values"], pixel_values))
+        self.assertTrue(np.array_equal(res["image_grid_thw"], grid_thws))
+
+    def test_single_image(self):
+        image = self._random_image(336, 672)
+        res = self.processor(images=image, return_tensors="np")
+        pixel_values, grid_thws = self._reference([image])
+        self.assertTrue(np.array_equal(res["pixel_values"], pixel_values))
+        self.assertEqual(res["image_grid_thw"].tolist(), [[1, 24, 48]])
+
+    def test_unsupported_input(self):
+        # float images are preprocessed one by one
+        image = self.rng.random((56, 84, 3)).astype(np.float32)
+        res = self.processor(images=[image], do_rescale=False, return_tensors="np")
+        self.assertEqual(res["image_grid_thw"].tolist(), [[1, 4, 6]])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import os
+import time
+import logging
+import tempfile
+import numpy as np
+from unittest import TestCase, main, skipIf
+
+from maga_transformer.models.multimodal.video_loader import VideoLoader, VideoReader, cpu, snap_to_keyframes
+
+try:
+    import av
+except ImportError:
+    av = None
+
+FRAME_NUM = 300
+GOP_SIZE = 60
+
+def write_video(path: str, frame_num: int = FRAME_NUM, width: int = 320, height: int = 240, fps: int = 30):
+    container = av.open(path, "w")
+    stream = container.add_stream("libx264", rate=fps)
+    stream.width = width
+    stream.height = height
+    stream.pix_fmt = "yuv420p"
+    stream.codec_context.gop_size = GOP_SIZE
+    stream.options = {"preset": "ultrafast"}
+    base = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    for index in range(frame_num):
+        frame = av.VideoFrame.from_ndarray(np.roll(base, index * 4, axis=1), format="rgb24")
+        for packet in stream.encode(frame):
+            container.mux(packet)
+    for packet in stream.encode():
+        container.mux(packet)
+    container.close()
+
+class SnapToKeyframesTest(TestCase):
+    def test_snap(self):
+        keys = [0, 60, 120, 180]
+        self.assertEqual(snap_to_keyframes([5, 55, 100, 170], keys, 10), [0, 60, 100, 180])
+        self.assertEqual(snap_to_keyframes([5, 55, 100, 170], keys, 0), [5, 55, 100, 170])
+        # keyframe taken by another sampled frame, or out of order
+        self.assertEqual(snap_to_keyframes([58, 60], keys, 10), [58, 60])
+        self.assertEqual(snap_to_keyframes([55, 58], keys, 10), [55, 60])
+
+@skipIf(VideoReader is None or av is None, "decord or av is not installed")
+class VideoLoaderTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.video_path = os.path.join(cls.temp_dir.name, "test.mp4")
+        write_video(cls.video_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    def test_frames(self):
+        indices = np.linspace(0, FRAME_NUM - 1, 12).round().astype(int).tolist()
+        loader = VideoLoader(self.video_path)
+        self.assertEqual(loader.frame_num, FRAME_NUM)
+        self.assertEqual(loader.fps, 30)
+        frames = loader.get_frames(indices, snap_ratio=0)
+        reader = VideoReader(self.video_path, ctx=cpu(0), num_threads=1)
+        for frame, index in zip(frames, indices):
+            self.assertTrue(np.array_equal(frame, reader[index].asnumpy()))
+        images = VideoLoader(self.video_path).get_images(indices[:2], snap_ratio=0)
+        self.assertEqual(images[0].size, (320, 240))
+
+    def test_snapped_frames(self):
+        indices = [5, 50, 100, 170, 290]
+        loader = VideoLoader(self.video_path)
+        self.assertEqual(loader.snap_indices(indices, snap_ratio=0.5), [0, 60, 120, 180, 290])
+        # by default only frames within a quarter of the interval move
+        self.assertEqual(loader.snap_indices(indices), [0, 60, 100, 180, 290])
+
+    def test_benchmark(self):
+        indices = np.linspace(0, FRAME_NUM - 1, 16).round().astype(int).tolist()
+        start = time.time()
+        reader = VideoReader(self.video_path, ctx=cpu(0), num_threads=1)
+        [reader[index].asnumpy() for index in indices]
+        frame_by_frame = time.time() - start
+        start = time.time()
+        VideoLoader(self.video_path).get_frames(indices, snap_ratio=0)
+        batch = time.time() - start
+        start = time.time()
+        VideoLoader(self.video_path).get_frames(indices, snap_ratio=0.5)
+        snapped = time.time() - start
+        logging.info(f"decode 16 frames, frame by frame: {frame_by_frame * 1000:.1f}ms, "
+                     f"batch: {batch * 1000:.1f}ms, snapped to keyframes: {snapped * 1000:.1f}ms")
+
+if __name__ == '__main__':
+    main()
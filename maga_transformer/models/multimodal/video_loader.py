@@ -0,0 +1,63 @@
+import os
+import bisect
+import numpy as np
+from typing import Any, List, Optional, Sequence
+from PIL import Image
+try:
+    from decord import VideoReader, cpu
+except ModuleNotFoundError:
+    VideoReader = None
+    cpu = None
+
+VIDEO_DECODE_THREADS = int(os.environ.get('VIDEO_DECODE_THREADS', str(min(4, os.cpu_count() or 1))))
+# sampled frames within this ratio of the sampling interval from a keyframe are moved to the keyframe,
+# a quarter keeps the sampling close to uniform, 0 decodes exactly the sampled frames
+VIDEO_KEYFRAME_SNAP_RATIO = float(os.environ.get('VIDEO_KEYFRAME_SNAP_RATIO', '0.25'))
+
+def snap_to_keyframes(indices: Sequence[int], key_indices: Sequence[int], max_distance: float) -> List[int]:
+    '''
+    moves sorted frame indices to keyframes at most max_distance away, a keyframe decodes without the frames
+    before it in its group of pictures.
+    '''
+    if max_distance <= 0 or len(key_indices) == 0:
+        return list(indices)
+    res: List[int] = []
+    for i, index in enumerate(indices):
+        pos = bisect.bisect_left(key_indices, index)
+        candidates = [key_indices[j] for j in (pos - 1, pos) if 0 <= j < len(key_indices)]
+        nearest = min(candidates, key=lambda key: abs(key - index))
+        # keep frames in order and distinct
+        lower = res[-1] if res else -1
+        upper = indices[i + 1] if i + 1 < len(indices) else float('inf')
+        if abs(nearest - index) <= max_distance and lower < nearest < upper:
+            res.append(nearest)
+        else:
+            res.append(index)
+    return res
+
+class VideoLoader(object):
+    '''
+    one decord reader for the metadata and the frames of a video, decoding with VIDEO_DECODE_THREADS threads.
+    '''
+    def __init__(self, data: Any, num_threads: Optional[int] = None):
+        if VideoReader is None:
+            raise Exception("decord is not installed, can not load video")
+        self.reader = VideoReader(data, ctx=cpu(0), num_threads=VIDEO_DECODE_THREADS if num_threads is None else num_threads)
+        self.frame_num = len(self.reader)
+        self.fps = float(self.reader.get_avg_fps())
+
+    def snap_indices(self, indices: Sequence[int], snap_ratio: Optional[float] = None) -> List[int]:
+        snap_ratio = VIDEO_KEYFRAME_SNAP_RATIO if snap_ratio is None else snap_ratio
+        indices = [int(index) for index in indices]
+        if snap_ratio <= 0 or len(indices) < 2 or any(b < a for a, b in zip(indices, indices[1:])):
+            return indices
+        interval = (indices[-1] - indices[0]) / (len(indices) - 1)
+        return snap_to_keyframes(indices, self.reader.get_key_indices(), interval * snap_ratio)
+
+    def get_frames(self, indices: Sequence[int], snap_ratio: Optional[float] = None) -> np.ndarray:
+        '''uint8 frames in (frame, height, width, channel)'''
+        # get_batch seeks to the keyframe before each frame instead of decoding the skipped frames
+        return self.reader.get_batch(self.snap_indices(indices, snap_ratio)).asnumpy()
+
+    def get_images(self, indices: Sequence[int], snap_ratio: Optional[float] = None) -> List[Image.Image]:
+        return [Image.fromarray(frame) for frame in self.get_frames(indices, snap_ratio)]
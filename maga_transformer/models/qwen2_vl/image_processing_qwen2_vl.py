@@ -319,6 +319,112 @@ class Qwen2VLImageProcessor(BaseImageProcessor):
 
         return flatten_patches, (grid_t, grid_h, grid_w)
 
+    def _normalize_table(self, rescale_factor: float, image_mean, image_std, num_channels: int) -> np.ndarray:
+        """
+        Normalized value of every uint8 pixel value per channel, computed with the same float operations as
+        `rescale` followed by `normalize`, so looking it up gives the same pixel values.
+        """
+        if not isinstance(image_mean, (list, tuple)):
+            image_mean = [image_mean] * num_channels
+        if not isinstance(image_std, (list, tuple)):
+            image_std = [image_std] * num_channels
+        key = (rescale_factor, tuple(image_mean), tuple(image_std))
+        tables = self.__dict__.setdefault("_normalize_tables", {})
+        table = tables.get(key)
+        if table is None:
+            scaled = (np.arange(256, dtype=np.float64) * rescale_factor).astype(np.float32)
+            mean = np.array(image_mean, dtype=np.float32)
+            std = np.array(image_std, dtype=np.float32)
+            table = (scaled[None, :] - mean[:, None]) / std[:, None]
+            tables[key] = table
+        return table
+
+    def _flatten_image_patches(self, images: np.ndarray, table: np.ndarray) -> np.ndarray:
+        """
+        Patches of same-size uint8 images in (batch, height, width, channel), in the layout of `_preprocess`:
+        each image is repeated `temporal_patch_size` times, patches are ordered by merge window.
+        """
+        batch, height, width, channel = images.shape
+        grid_h, grid_w = height // self.patch_size, width // self.patch_size
+        patches = images.reshape(
+            batch,
+            grid_h // self.merge_size,
+            self.merge_size,
+            self.patch_size,
+            grid_w // self.merge_size,
+            self.merge_size,
+            self.patch_size,
+            channel,
+        )
+        patches = patches.transpose(0, 1, 4, 2, 5, 7, 3, 6)
+        flatten_patches = np.empty(patches.shape[:6] + (self.temporal_patch_size,) + patches.shape[6:], dtype=table.dtype)
+        # table lookup of the uint8 patches is the only float pass
+        for c in range(channel):
+            flatten_patches[:, :, :, :, :, c] = np.take(table[c], patches[:, :, :, :, :, c], mode="clip")[:, :, :, :, :, None]
+        return flatten_patches.reshape(
+            batch, grid_h * grid_w, channel * self.temporal_patch_size * self.patch_size * self.patch_size
+        )
+
+    def _fast_preprocess_images(
+        self,
+        images: List[ImageInput],
+        do_resize: bool,
+        resample: PILImageResampling,
+        do_rescale: bool,
+        rescale_factor: float,
+        do_normalize: bool,
+        image_mean: Optional[Union[float, List[float]]],
+        image_std: Optional[Union[float, List[float]]],
+        data_format: Optional[ChannelDimension],
+        do_convert_rgb: bool,
+        input_data_format: Optional[Union[str, ChannelDimension]],
+    ):
+        """
+        Same output as preprocessing `images` one by one with `_preprocess`, for uint8 channels-last images.
+        Images already at their target size (resized by the caller) are not resized again, rescale and normalize
+        are a single table lookup, and images of the same size are flattened together. Returns None when the
+        images are not supported, they are preprocessed one by one then.
+        """
+        if not (do_rescale and do_normalize) or data_format != ChannelDimension.FIRST or \
+                input_data_format not in (None, ChannelDimension.LAST):
+            return None
+        arrays = []
+        for image in images:
+            if do_convert_rgb:
+                image = convert_to_rgb(image)
+            image = to_numpy_array(image)
+            if image.dtype != np.uint8 or image.ndim != 3 or image.shape[-1] != 3:
+                return None
+            height, width = image.shape[:2]
+            if do_resize:
+                resized_height, resized_width = smart_resize(
+                    height,
+                    width,
+                    factor=self.patch_size * self.merge_size,
+                    min_pixels=self.min_pixels,
+                    max_pixels=self.max_pixels,
+                )
+                if (resized_height, resized_width) != (height, width):
+                    image = resize(
+                        image, size=(resized_height, resized_width), resample=resample,
+                        input_data_format=ChannelDimension.LAST
+                    )
+                    if image.dtype != np.uint8:
+                        return None
+            arrays.append(image)
+
+        table = self._normalize_table(rescale_factor, image_mean, image_std, 3)
+        patches: List[Optional[np.ndarray]] = [None] * len(arrays)
+        indexes_by_size: Dict[tuple, List[int]] = {}
+        for index, image in enumerate(arrays):
+            indexes_by_size.setdefault(image.shape, []).append(index)
+        for indexes in indexes_by_size.values():
+            batch_patches = self._flatten_image_patches(np.stack([arrays[index] for index in indexes]), table)
+            for index, image_patches in zip(indexes, batch_patches):
+                patches[index] = image_patches
+        grid_thws = [(1, image.shape[0] // self.patch_size, image.shape[1] // self.patch_size) for image in arrays]
+        return np.concatenate(patches), np.array(grid_thws)
+
     def preprocess(
         self,
         images: ImageInput = None,
@@ -417,6 +523,22 @@ class Qwen2VLImageProcessor(BaseImageProcessor):
         )
 
         if images is not None:
+            fast_res = self._fast_preprocess_images(
+                images,
+                do_resize=do_resize,
+                resample=resample,
+                do_rescale=do_rescale,
+                rescale_factor=rescale_factor,
+                do_normalize=do_normalize,
+                image_mean=image_mean,
+                image_std=image_std,
+                data_format=data_format,
+                do_convert_rgb=do_convert_rgb,
+                input_data_format=input_data_format,
+            )
+        if images is not None and fast_res is not None:
+            data = {"pixel_values": fast_res[0], "image_grid_thw": fast_res[1]}
+        elif images is not None:
             pixel_values, vision_grid_thws = [], []
             for image in images:
                 patches, image_grid_thw = self._preprocess(
@@ -432,9 +554,9 @@ class Qwen2VLImageProcessor(BaseImageProcessor):
                     do_convert_rgb=do_convert_rgb,
                     input_data_format=input_data_format,
                 )
-                pixel_values.extend(patches)
+                pixel_values.append(patches)
                 vision_grid_thws.append(image_grid_thw)
-            pixel_values = np.array(pixel_values)
+            pixel_values = np.concatenate(pixel_values)
             vision_grid_thws = np.array(vision_grid_thws)
             data = {"pixel_values": pixel_values, "image_grid_thw": vision_grid_thws}
 
@@ -454,9 +576,9 @@ class Qwen2VLImageProcessor(BaseImageProcessor):
                     do_convert_rgb=do_convert_rgb,
                     input_data_format=input_data_format,
                 )
-                pixel_values.extend(patches)
+                pixel_values.append(patches)
                 vision_grid_thws.append(video_grid_thw)
-            pixel_values = np.array(pixel_values)
+            pixel_values = np.concatenate(pixel_values)
             vision_grid_thws = np.array(vision_grid_thws)
             data = {"pixel_values_videos": pixel_values, "video_grid_thw": vision_grid_thws}
 
@@ -2,17 +2,13 @@ import copy
 import math
 from typing import List, Any, Tuple, Dict
 from PIL import Image
-try:
-    from decord import VideoReader, cpu
-except ModuleNotFoundError:
-    VideoReader = None
-    cpu = None
 from torchvision import io, transforms
 from torchvision.transforms import InterpolationMode
 import torch
 import torch.nn as nn
 
 from maga_transformer.models.multimodal.multimodal_common import MultiModalEmbeddingInterface
+from maga_transformer.models.multimodal.video_loader import VideoLoader
 from maga_transformer.utils.multimodal_util import MMUrlType, MMPreprocessConfig
 from maga_transformer.models.qwen2_vl.image_processing_qwen2_vl import Qwen2VLImageProcessor
 from maga_transformer.models.qwen2_vl.modeling_qwen2_vl import Qwen2VisionTransformerPretrainedModel
@@ -96,6 +92,19 @@ class Qwen2VLImageEmbedding(MultiModalEmbeddingInterface):
         else:
             raise Exception("unknown mm url type")
         
+    def mm_batch_key(self, mm_input, mm_type: MMUrlType, **kwargs):
+        # images of different sizes run in one forward, attention is split by grid_thw
+        return MMUrlType.IMAGE if mm_type == MMUrlType.IMAGE else None
+
+    def mm_input_cost(self, mm_input, mm_type: MMUrlType, **kwargs):
+        patch_size = self.config.mm_related_params.config.get("patch_size", 14)
+        width, height = mm_input.size
+        return (width // patch_size) * (height // patch_size)
+
+    @torch.inference_mode()
+    def mm_process_batch(self, mm_inputs, **kwargs):
+        return self.batch_image_embedding(mm_inputs)
+
     def _mm_preprocess(self, data, **kwargs):
         mm_type = kwargs.get("mm_type")
         if mm_type == MMUrlType.DEFAULT:
@@ -131,12 +140,12 @@ class Qwen2VLImageEmbedding(MultiModalEmbeddingInterface):
         return image
         
     def load_video(self, data, configs, **kwargs):
-        vr = VideoReader(data, ctx=cpu(0), num_threads=1)
-        frames = len(vr)
-        
+        loader = VideoLoader(data)
+        frames = loader.frame_num
+
         fps = FPS if configs.fps == -1 else configs.fps
         size_factor = FRAME_FACTOR
-        nframes = frames / vr.get_avg_fps() * fps
+        nframes = frames / loader.fps * fps
         nframes = round_by_factor(nframes, size_factor)
         min_frames = FPS_MIN_FRAMES if configs.min_frames == -1 else configs.min_frames
         if nframes < min_frames:
@@ -146,9 +155,9 @@ class Qwen2VLImageEmbedding(MultiModalEmbeddingInterface):
             nframes = floor_by_factor(max_frames, size_factor)
 
         idx = torch.linspace(0, frames - 1, nframes).round().long().tolist()
-        height, width = vr[0].shape[:2]
-        video = torch.tensor(vr.get_batch(idx).asnumpy()).permute(0, 3, 1, 2)
-        del vr
+        video = torch.from_numpy(loader.get_frames(idx)).permute(0, 3, 1, 2)
+        height, width = video.shape[2:]
+        del loader
 
         if configs.height != -1 and configs.width != -1:
             resized_height, resized_width = smart_resize(
@@ -186,6 +195,17 @@ class Qwen2VLImageEmbedding(MultiModalEmbeddingInterface):
         pos_id = self.get_position_ids(image_grid_thw)
         return embeddings, pos_id
     
+    def batch_image_embedding(self, images) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        device = self._device
+        image_inputs = self.image_processor(images=images, videos=None, return_tensors="pt")
+        pixel_values = image_inputs["pixel_values"].to(device).to(self._data_type)
+        image_grid_thw = image_inputs["image_grid_thw"].to(device)
+        embeddings = self.visual(pixel_values, grid_thw=image_grid_thw).to(device)
+        spatial_merge_size = self.config.mm_related_params.config.get("spatial_merge_size", 2)
+        split_sizes = (image_grid_thw.prod(-1) // (spatial_merge_size ** 2)).tolist()
+        return [(embedding, self.get_position_ids(image_grid_thw[index:index + 1]))
+                for index, embedding in enumerate(torch.split(embeddings, split_sizes))]
+
     def video_embedding(self, video, **kwargs):
         device = self._device
         videos_inputs = self.image_processor(images=None, videos=video, return_tensors="pt")
@@ -26,8 +26,9 @@ class FunctionCall(BaseModel):
 class ToolCall(BaseModel):
     # 参照 openai 官方api definition
     index: Optional[int] = None
-    id: str
-    type: str
+    # streamed argument fragments only carry index and arguments
+    id: Optional[str] = None
+    type: Optional[str] = None
     function: FunctionCall
 
 class RoleEnum(str, Enum):
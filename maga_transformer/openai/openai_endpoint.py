@@ -1,6 +1,6 @@
 from fastapi import Request
 import torch
-from typing import Union, Optional, List, Dict, Generator, Coroutine, AsyncGenerator, Any, Iterator
+from typing import Union, Optional, List, Dict, Tuple, Generator, Coroutine, AsyncGenerator, Any, Iterator
 import os
 import json
 import logging
@@ -9,11 +9,11 @@ from functools import partial
 
 from transformers import PreTrainedTokenizerBase
 from maga_transformer.utils.util import str_to_bool
-from maga_transformer.utils.complete_response_async_generator import CompleteResponseAsyncGenerator
+from maga_transformer.utils.complete_response_async_generator import CompleteResponseAsyncGenerator, ResponseAggregator
 from transformers import PreTrainedTokenizerBase
 from maga_transformer.openai.api_datatype import ModelCard, ModelList, ChatMessage, RoleEnum, \
     ChatCompletionRequest, ChatCompletionResponse, ChatCompletionResponseChoice, UsageInfo, \
-    ChatCompletionStreamResponse, \
+    ChatCompletionStreamResponse, ToolCall, \
     DebugInfo
 from maga_transformer.openai.renderers.custom_renderer import RendererParams, \
     StreamResponseObject, RenderedInputs, CustomChatRenderer
@@ -24,6 +24,109 @@ from maga_transformer.utils.mm_process_engine import MMProcessEngine
 from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
 from maga_transformer.async_decoder_engine.backend_rpc_server_visitor import BackendRPCServerVisitor
 
+class ChatCompletionResponseAggregator(ResponseAggregator):
+    '''
+    complete chat response folded from stream responses as they pass: contents and tool call arguments
+    are kept as fragment lists and joined once, logprobs are extended in place.
+    '''
+    def __init__(self, model_name: str, debug_info: Optional[DebugInfo]):
+        self.model_name = model_name
+        self.debug_info = debug_info
+        self.choices: List[ChatCompletionResponseChoice] = []
+        self.usage: Optional[UsageInfo] = None
+        self.aux_info = None
+        self._contents: List[List[str]] = []
+        self._reasoning_contents: List[List[str]] = []
+        # per choice: tool calls in order of appearance with their argument fragments, and by index
+        self._tool_calls: List[List[Tuple[ToolCall, List[str]]]] = []
+        self._tool_call_index: List[Dict[int, Tuple[ToolCall, List[str]]]] = []
+
+    def add(self, response: StreamResponseObject) -> None:
+        if len(response.choices) != len(self.choices):
+            if self.choices:
+                raise ValueError(f"response.choices has different length! "
+                                 f"[{response.choices}] vs [{self.choices}].")
+            for i, choice in enumerate(response.choices):
+                self.choices.append(ChatCompletionResponseChoice(
+                    index=i,
+                    message=ChatMessage(role=RoleEnum.assistant),
+                ))
+                self._contents.append([])
+                self._reasoning_contents.append([])
+                self._tool_calls.append([])
+                self._tool_call_index.append({})
+        for i, choice in enumerate(response.choices):
+            delta = choice.delta
+            message = self.choices[i].message
+            if delta.content:
+                self._contents[i].append(delta.content)
+            if delta.reasoning_content:
+                self._reasoning_contents[i].append(delta.reasoning_content)
+            message.role = delta.role or message.role
+            message.function_call = delta.function_call or message.function_call
+            if delta.tool_calls:
+                self._merge_tool_calls(i, delta.tool_calls)
+            self.choices[i].finish_reason = choice.finish_reason or self.choices[i].finish_reason
+            if self.choices[i].logprobs != None:
+                if choice.logprobs != None:
+                    self.choices[i].logprobs.content += choice.logprobs.content
+            else:
+                self.choices[i].logprobs = choice.logprobs
+        self.usage = response.usage or self.usage
+        self.aux_info = response.aux_info or self.aux_info
+
+    def _merge_tool_calls(self, i: int, delta_tool_calls: List[ToolCall]) -> None:
+        '''streamed tool calls: the first delta of an index carries id and name, later ones append arguments'''
+        for delta in delta_tool_calls:
+            merged = self._tool_call_index[i].get(delta.index) if delta.index is not None else None
+            if merged is None:
+                tool_call = delta.model_copy(deep=True)
+                merged = (tool_call, [tool_call.function.arguments] if tool_call.function.arguments else [])
+                self._tool_calls[i].append(merged)
+                if delta.index is not None:
+                    self._tool_call_index[i][delta.index] = merged
+            else:
+                tool_call, fragments = merged
+                tool_call.id = tool_call.id or delta.id
+                tool_call.type = tool_call.type or delta.type
+                tool_call.function.name = tool_call.function.name or delta.function.name
+                if delta.function.arguments:
+                    fragments.append(delta.function.arguments)
+
+    def result(self) -> ChatCompletionResponse:
+        # choices are copied, so that the aggregator keeps folding responses after a result
+        choices: List[ChatCompletionResponseChoice] = []
+        for choice, contents, reasoning_contents, tool_calls in zip(
+                self.choices, self._contents, self._reasoning_contents, self._tool_calls):
+            merged_tool_calls = [
+                tool_call.model_copy(update={'function': tool_call.function.model_copy(update={'arguments': "".join(fragments)})})
+                if fragments else tool_call.model_copy(deep=True)
+                for tool_call, fragments in tool_calls
+            ]
+            message = choice.message.model_copy(update={
+                'content': "".join(contents) if contents else None,
+                'reasoning_content': "".join(reasoning_contents) if reasoning_contents else None,
+                'tool_calls': merged_tool_calls or None,
+            })
+            logprobs = choice.logprobs.model_copy(update={'content': list(choice.logprobs.content)}) \
+                if choice.logprobs is not None and choice.logprobs.content is not None else choice.logprobs
+            choices.append(choice.model_copy(update={'message': message, 'logprobs': logprobs}))
+        usage = self.usage
+        if (usage == None):
+            logging.warning(f"No usage returned from stream response. use empty value.")
+            usage = UsageInfo(
+                prompt_tokens=0,
+                total_tokens=0,
+                completion_tokens=0
+            )
+        return ChatCompletionResponse(
+            choices=choices,
+            usage=usage,
+            aux_info=self.aux_info,
+            model=self.model_name,
+            debug_info=self.debug_info,
+        )
+
 class OpenaiEndopoint():
     def __init__(self, model_config: GptInitModelParameters,
                  tokenizer: PreTrainedTokenizerBase,
@@ -104,7 +207,7 @@ class OpenaiEndopoint():
         if isinstance(request_stop_words_list, str):
             request_stop_words_list = [request_stop_words_list]
         config.stop_words_str = self.stop_words_str_list + request_stop_words_list
-        config.stop_words_list = self.stop_words_id_list + self.chat_renderer.tokenize_words(request_stop_words_list)
+        config.stop_words_list = self.stop_words_id_list + self.chat_renderer.tokenize_stop_words(request_stop_words_list)
         if request.chat_id != None:
             config.chat_id = request.chat_id
         if request.seed != None:
@@ -121,72 +224,6 @@ class OpenaiEndopoint():
         config.add_thinking_params(self.tokenizer)
         return config
 
-    async def _collect_complete_response(
-            self,
-            choice_generator: Optional[AsyncGenerator[StreamResponseObject, None]],
-            debug_info: Optional[DebugInfo]) -> ChatCompletionResponse:
-        all_choices = []
-        usage = None
-        aux_info = None
-        async for response in choice_generator:
-            if len(response.choices) != len(all_choices):
-                if (all_choices == []):
-                    all_choices = [
-                        ChatCompletionResponseChoice(
-                            index=i,
-                            message=ChatMessage(
-                                role=choice.delta.role or RoleEnum.assistant,
-                                content=choice.delta.content or None,
-                                function_call=choice.delta.function_call or None,
-                                tool_calls=choice.delta.tool_calls or None,
-                            ),
-                            finish_reason=choice.finish_reason,
-                            logprobs=choice.logprobs,
-                        ) for i, choice in enumerate(response.choices)
-                    ]
-                else:
-                    raise ValueError(f"response.choices has different length! "
-                                     f"[{response.choices}] vs [{all_choices}].")
-            else:
-                for i in range(len(all_choices)):
-                    if all_choices[i].message.content == None:
-                        all_choices[i].message.content = (response.choices[i].delta.content or None)
-                    else:
-                        all_choices[i].message.content += (response.choices[i].delta.content or "")
-                    if all_choices[i].message.reasoning_content == None:
-                        all_choices[i].message.reasoning_content = (response.choices[i].delta.reasoning_content or None)
-                    else:
-                        all_choices[i].message.reasoning_content += (response.choices[i].delta.reasoning_content or "")
-                    all_choices[i].message.role = response.choices[i].delta.role or all_choices[i].message.role
-                    all_choices[i].message.function_call = response.choices[i].delta.function_call or all_choices[i].message.function_call
-                    all_choices[i].message.tool_calls = (
-                        response.choices[i].delta.tool_calls
-                        or all_choices[i].message.tool_calls
-                    )
-                    all_choices[i].finish_reason = response.choices[i].finish_reason or all_choices[i].finish_reason
-                    if all_choices[i].logprobs != None:
-                        if response.choices[i].logprobs != None:
-                            all_choices[i].logprobs.content += response.choices[i].logprobs.content
-                    else:
-                        all_choices[i].logprobs = response.choices[i].logprobs
-            usage = response.usage or usage
-            aux_info = response.aux_info or aux_info
-
-        if (usage == None):
-            logging.warning(f"No usage returned from stream response. use empty value.")
-            usage = UsageInfo(
-                prompt_tokens=0,
-                total_tokens=0,
-                completion_tokens=0
-            )
-        return ChatCompletionResponse(
-            choices=all_choices,
-            usage=usage,
-            aux_info=aux_info,
-            model=self.model_config.model_name,
-            debug_info=debug_info,
-        )
-
     def _complete_stream_response(
             self, choice_generator: AsyncGenerator[StreamResponseObject, None],
             debug_info: Optional[DebugInfo]
@@ -202,8 +239,8 @@ class OpenaiEndopoint():
                 )
                 debug_info_responded = True
 
-        complete_response_collect_func = partial(self._collect_complete_response, debug_info=debug_info)
-        return CompleteResponseAsyncGenerator(response_generator(), complete_response_collect_func)
+        create_aggregator_func = partial(ChatCompletionResponseAggregator, self.model_config.model_name, debug_info)
+        return CompleteResponseAsyncGenerator(response_generator(), create_aggregator_func)
 
     def _get_debug_info(self, renderer: CustomChatRenderer,
                         renderered_input: RenderedInputs, gen_config: GenerateConfig) -> DebugInfo:
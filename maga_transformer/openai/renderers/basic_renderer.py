@@ -147,7 +147,7 @@ class BasicRenderer(CustomChatRenderer):
 
     def render_chat(self, request: ChatCompletionRequest) -> RenderedInputs:
         template = self._get_template(request)
-        request_dict = json.loads(request.model_dump_json(exclude_none=True))
+        request_dict = request.model_dump(mode='json', exclude_none=True)
         render_args = {
             "messages": request_dict['messages'],
             "json": json,
@@ -160,5 +160,6 @@ class BasicRenderer(CustomChatRenderer):
         rendered = template.render(
             **render_args
         )
-        logging.debug(f"request [{request.model_dump_json(indent=4)}] rendered string: [{rendered}]]")
-        return RenderedInputs(input_ids=self.tokenizer.encode(rendered))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"request [{request.model_dump_json(indent=4)}] rendered string: [{rendered}]]")
+        return RenderedInputs(input_ids=self.encode_prompt(rendered))
@@ -21,8 +21,12 @@ from maga_transformer.openai.api_datatype import ChatMessage, GPTFunctionDefinit
     ChatCompletionTokenLogprob, TopLogprob, ChoiceLogprobs, \
     ChatCompletionResponseChoice, ChatCompletionResponse, DebugInfo
 from maga_transformer.async_decoder_engine.async_model import AsyncModel
-from maga_transformer.utils.word_util import get_stop_word_slices, truncate_response_with_stop_words, is_truncated
-from maga_transformer.utils.util import has_overlap, has_overlap_kmp
+from maga_transformer.utils.word_util import truncate_response_with_stop_words
+from maga_transformer.utils.stop_word_matcher import StopWordAutomaton, StopWordIdsTable, get_stop_word_automaton
+from maga_transformer.utils.tokenizer_utils import StreamDetokenizer
+from maga_transformer.utils.think_tag_splitter import ThinkTagSplitter, split_think_tag
+from maga_transformer.utils.prompt_token_cache import PromptTokenCache, create_prompt_token_cache
+from maga_transformer.metrics import kmonitor, AccMetrics, GaugeMetrics
 from maga_transformer.utils.multimodal_util import MMUrlType, MultimodalInput, MMPreprocessConfig
 from maga_transformer.async_decoder_engine.backend_rpc_server_visitor import BackendRPCServerVisitor
 
@@ -34,17 +38,25 @@ class StreamStatus:
     index: int = 0
     request: ChatCompletionRequest
     output: Optional[GenerateOutput] = None
-    origin_output_ids: torch.Tensor = torch.empty(0, dtype=torch.int32)
-    output_ids: torch.Tensor = torch.empty(0, dtype=torch.int32)
-    last_output_ids: List[int] = []
+    # eos-cleaned output ids of all steps, only appended to
+    output_token_ids: List[int] = []
+    output_ids: List[int] = []
+    last_output_length: int = 0
     last_token_length: int = 0
     finish_reason = None
     tokenizer = None
     responded_string = ""
     delta_output_string = ""
+    detokenizer: Optional[StreamDetokenizer] = None
+    # (all_probs, top logprobs) prepared for the whole step, see `_prepare_top_logprobs`
+    top_logprobs: Optional[Tuple[torch.Tensor, Tuple[List[float], List[int]]]] = None
 
     def __init__(self, request: ChatCompletionRequest):
         self.request = request
+        self.output_token_ids = []
+        self.output_ids = self.output_token_ids
+        self.detokenizer = None
+        self.top_logprobs = None
 
     def update_output(self,
                       output: GenerateOutput,
@@ -53,15 +65,17 @@ class StreamStatus:
                       remove_stop_word_ids_func):
         self.index += 1
         self.output = output
-        self.origin_output_ids = torch.cat((self.origin_output_ids, output.output_ids), dim=1)
-        self.output_ids = clean_output_func(self.origin_output_ids)
+        self.output_token_ids.extend(clean_output_func(output.output_ids))
+        self.output_ids = self.output_token_ids
         self.finish_reason = check_finish_func(self.output_ids, self.input_token_length)
         self.output_ids = remove_stop_word_ids_func(self.output_ids)
 
     def update_result(self):
-        self.last_token_length = len(self.output_ids) - len(self.last_output_ids)
-        self.last_output_ids = self.output_ids
+        self.last_token_length = len(self.output_ids) - self.last_output_length
+        self.last_output_length = len(self.output_ids)
         self.responded_string += self.delta_output_string
+        if self.detokenizer is not None:
+            self.detokenizer.commit()
 
     @property
     def output_token_length(self):
@@ -75,28 +89,41 @@ class StreamStatus:
     def reuse_length(self):
         return self.output.aux_info.reuse_len
 
+    @property
+    def last_output_ids(self):
+        return self.output_token_ids[:self.last_output_length]
+
     @property
     def prev_token_id(self):
-        return self.last_output_ids[-self.last_token_length:]
+        # same as last_output_ids[-last_token_length:] without copying the history
+        start = slice(-self.last_token_length, None).indices(self.last_output_length)[0]
+        return self.output_token_ids[start:self.last_output_length]
 
     @property
     def tokens_to_decode(self):
-        return self.prev_token_id + self.output_ids[len(self.last_output_ids):]
+        return self.prev_token_id + self.output_ids[self.last_output_length:]
 
 class StreamStatusSync:
     index: int = 0
     request: ChatCompletionRequest
-    origin_output_ids: torch.Tensor = torch.empty(0, dtype=torch.int32)
-    output_ids: torch.Tensor = torch.empty(0, dtype=torch.int32)
-    last_output_ids: List[int] = []
+    output_token_ids: List[int] = []
+    output_ids: List[int] = []
+    last_output_length: int = 0
     last_token_length: int = 0
     finish_reason = None
     tokenizer = None
     responded_string = ""
     delta_output_string = ""
+    detokenizer: Optional[StreamDetokenizer] = None
+    # (all_probs, top logprobs) prepared for the whole step, see `_prepare_top_logprobs`
+    top_logprobs: Optional[Tuple[torch.Tensor, Tuple[List[float], List[int]]]] = None
 
     def __init__(self, request: ChatCompletionRequest):
         self.request = request
+        self.output_token_ids = []
+        self.output_ids = self.output_token_ids
+        self.detokenizer = None
+        self.top_logprobs = None
 
     def update_output_sync(self,
                            output_ids,
@@ -105,23 +132,30 @@ class StreamStatusSync:
                            check_finish_func,
                            remove_stop_word_ids_func):
         self.index += 1
-        self.origin_output_ids = torch.cat((self.origin_output_ids, output_ids), dim=1)
-        self.output_ids = clean_output_func(self.origin_output_ids)
+        self.output_token_ids.extend(clean_output_func(output_ids))
+        self.output_ids = self.output_token_ids
         self.finish_reason = check_finish_func(self.output_ids, input_len)
         self.output_ids = remove_stop_word_ids_func(self.output_ids)
 
     def update_result(self):
-        self.last_token_length = len(self.output_ids) - len(self.last_output_ids)
-        self.last_output_ids = self.output_ids
+        self.last_token_length = len(self.output_ids) - self.last_output_length
+        self.last_output_length = len(self.output_ids)
         self.responded_string += self.delta_output_string
+        if self.detokenizer is not None:
+            self.detokenizer.commit()
+
+    @property
+    def last_output_ids(self):
+        return self.output_token_ids[:self.last_output_length]
 
     @property
     def prev_token_id(self):
-        return self.last_output_ids[-self.last_token_length:]
+        start = slice(-self.last_token_length, None).indices(self.last_output_length)[0]
+        return self.output_token_ids[start:self.last_output_length]
 
     @property
     def tokens_to_decode(self):
-        return self.prev_token_id + self.output_ids[len(self.last_output_ids):]
+        return self.prev_token_id + self.output_ids[self.last_output_length:]
 
 @dataclass
 class StreamResponseObject:
@@ -155,9 +189,20 @@ class OutputDelta():
 @dataclass
 class ThinkStatus():
     in_think_mode: int = 0
-    think_buffer: str = ""
-    think_tokens: int = 0
     is_streaming: bool = False
+    # per choice splitter and reasoning token count
+    splitters: List[ThinkTagSplitter] = field(default_factory=list)
+    choice_think_tokens: List[int] = field(default_factory=list)
+
+    def get_splitter(self, index: int) -> ThinkTagSplitter:
+        while len(self.splitters) <= index:
+            self.splitters.append(ThinkTagSplitter(think_start_tag, think_end_tag, bool(self.in_think_mode)))
+            self.choice_think_tokens.append(0)
+        return self.splitters[index]
+
+    @property
+    def think_tokens(self) -> int:
+        return sum(self.choice_think_tokens)
 
 class RenderedInputs:
     input_ids: List[int] = []
@@ -198,6 +243,17 @@ class CustomChatRenderer():
         # NOTE: stop words or their ids only need to be added to one of these two lists.
         self.extra_stop_words: List[str] = []
         self.extra_stop_word_ids_list: List[List[int]] = []
+        # compiled lazily, reset when extra stop words are added
+        self._all_extra_stop_word_ids_list: Optional[List[List[int]]] = None
+        self._stop_word_ids_table: Optional[StopWordIdsTable] = None
+        self._stop_word_ids_table_len = 0
+        self._tokenize_stop_words = functools.lru_cache(maxsize=128)(
+            lambda words: self.tokenize_words(list(words)))
+        # token id -> (text, utf-8 bytes) for logprobs, bounded by vocab size
+        self._token_str_table: Dict[int, Tuple[str, List[int]]] = {}
+        # created on first use, renderers that tokenize prompts by other means never build it
+        self._prompt_token_cache: Optional[PromptTokenCache] = None
+        self._prompt_token_cache_inited = False
 
     def __str__(self) -> str:
         return str(self.get_renderer_info())
@@ -221,9 +277,13 @@ class CustomChatRenderer():
 
     def add_extra_stop_words(self, extra_stop_words: List[str]):
         self.extra_stop_words.extend(extra_stop_words)
+        self._all_extra_stop_word_ids_list = None
+        self._stop_word_ids_table = None
 
     def add_extra_stop_word_ids(self, extra_stop_word_ids: List[List[int]]):
         self.extra_stop_word_ids_list.extend(extra_stop_word_ids)
+        self._all_extra_stop_word_ids_list = None
+        self._stop_word_ids_table = None
 
     def tokenize_words(self, words: List[str]) -> List[List[int]]:
         ids_list = []
@@ -240,9 +300,38 @@ class CustomChatRenderer():
                 ids_list.append(self.tokenizer.encode(word))
         return ids_list
 
+    def tokenize_stop_words(self, words: List[str]) -> List[List[int]]:
+        '''tokenize_words for per-request stop words, recent word lists are cached'''
+        return [list(ids) for ids in self._tokenize_stop_words(tuple(words))]
+
     def get_all_extra_stop_word_ids_list(self) -> List[List[int]]:
-        ids_list_from_words = self.tokenize_words(self.extra_stop_words)
-        return self.extra_stop_word_ids_list + ids_list_from_words
+        if self._all_extra_stop_word_ids_list is None:
+            ids_list_from_words = self.tokenize_words(self.extra_stop_words)
+            self._all_extra_stop_word_ids_list = self.extra_stop_word_ids_list + ids_list_from_words
+        return list(self._all_extra_stop_word_ids_list)
+
+    def _get_stop_word_ids_table(self) -> StopWordIdsTable:
+        # stop_words_id_list is shared with the endpoint, which extends it after creating the renderer
+        if self._stop_word_ids_table is None or self._stop_word_ids_table_len != len(self.stop_words_id_list):
+            self._stop_word_ids_table = StopWordIdsTable(self.get_all_extra_stop_word_ids_list() + self.stop_words_id_list)
+            self._stop_word_ids_table_len = len(self.stop_words_id_list)
+        return self._stop_word_ids_table
+
+    def encode_prompt(self, prompt: str) -> List[int]:
+        '''tokenizer.encode(prompt), reusing the ids of prompt prefixes (system prompt, tools, earlier turns) seen before'''
+        if not self._prompt_token_cache_inited:
+            self._prompt_token_cache_inited = True
+            if isinstance(self.tokenizer, PreTrainedTokenizerBase):
+                self._prompt_token_cache = create_prompt_token_cache(self.tokenizer)
+        if self._prompt_token_cache is None or not self._prompt_token_cache.enabled:
+            return self.tokenizer.encode(prompt)
+        input_ids, reuse_length = self._prompt_token_cache.encode(prompt)
+        if reuse_length > 0:
+            kmonitor.report(AccMetrics.PROMPT_CACHE_HIT_QPS_METRIC, 1)
+        else:
+            kmonitor.report(AccMetrics.PROMPT_CACHE_MISS_QPS_METRIC, 1)
+        kmonitor.report(GaugeMetrics.PROMPT_CACHE_REUSE_TOKEN_METRIC, reuse_length)
+        return input_ids
 
     def _check_all_finished(self, status_list) -> bool:
         for s in status_list:
@@ -293,64 +382,110 @@ class CustomChatRenderer():
             reuse_length=aux_info.reuse_len
         )
 
-    async def _generate_log_probs(self, status: StreamStatus, output: Optional[GenerateOutput]) -> Optional[ChatCompletionTokenLogprob]:
-        assert output is not None
+    def _get_token_str(self, token_id: int) -> Tuple[str, List[int]]:
+        '''text and utf-8 bytes of a single token, decoded once per token id and shared by all requests'''
+        token_str = self._token_str_table.get(token_id)
+        if token_str is None:
+            token = self.tokenizer.decode([token_id])
+            token_str = (token, list(token.encode("utf-8", errors="replace")))
+            self._token_str_table[token_id] = token_str
+        return token_str
+
+    @staticmethod
+    def _top_logprobs(all_probs: torch.Tensor, k: int) -> List[Tuple[List[float], List[int]]]:
+        '''log probs and ids of the (at most k, non zero) most probable tokens of each row of all_probs'''
+        all_probs = all_probs.reshape(-1, all_probs.shape[-1])
+        probs, ids = torch.topk(all_probs, min(k, all_probs.shape[-1]), dim=-1)
+        non_zero_sizes = (probs > 0).sum(dim=-1).tolist()
+        log_values = probs.log()
+        return [(log_values[i, :size].tolist(), ids[i, :size].tolist()) for i, size in enumerate(non_zero_sizes)]
+
+    def _prepare_top_logprobs(self,
+                              status_list: List[Union[StreamStatus, StreamStatusSync]],
+                              all_probs_list: List[Optional[torch.Tensor]]) -> None:
+        '''select top logprobs of all choices of a step with a single topk'''
+        if len(status_list) <= 1 or not status_list[0].request.logprobs:
+            return
+        if any(all_probs is None for all_probs in all_probs_list):
+            return
+        shapes = set(all_probs.shape[-1] for all_probs in all_probs_list)
+        if len(shapes) != 1:
+            return
+        k = status_list[0].request.top_logprobs or 1
+        results = self._top_logprobs(torch.stack([all_probs.reshape(-1) for all_probs in all_probs_list]), k)
+        for status, all_probs, result in zip(status_list, all_probs_list, results):
+            status.top_logprobs = (all_probs, result)
+
+    def _build_log_probs(self,
+                         status: Union[StreamStatus, StreamStatusSync],
+                         all_probs: Optional[torch.Tensor],
+                         output_ids: Optional[torch.Tensor]) -> Optional[ChatCompletionTokenLogprob]:
         if not status.request.logprobs:
             return None
-        prob_return_num = status.request.top_logprobs or 1
-        all_probs = output.all_probs
-        output_id = output.output_ids
-        if output_id == None:
+        if output_ids == None:
             return None
-        selected_id = output_id[-1].item()
+        selected_id = output_ids[-1].item()
         if (all_probs == None):
             raise Exception("all_probs is None when logprobs is true. There should be a internal bug.")
-        all_probs = all_probs.squeeze()
-        probs, tokens = all_probs.sort(descending=True)
-        non_zero_size = probs.nonzero().shape[0]
-        log_values = probs.log()
-        prob_return_num = min(prob_return_num, non_zero_size)
+        if status.top_logprobs is not None and status.top_logprobs[0] is all_probs:
+            log_values, tokens = status.top_logprobs[1]
+        else:
+            log_values, tokens = self._top_logprobs(all_probs, status.request.top_logprobs or 1)[0]
+        status.top_logprobs = None
 
-        selected_token = self.tokenizer.decode([selected_id])
+        selected_token, selected_bytes = self._get_token_str(selected_id)
         chat_logprob = ChatCompletionTokenLogprob(
             token=selected_token,
-            bytes=list(selected_token.encode("utf-8", errors="replace")),
-            logprob=all_probs[output_id].log().item(),
+            bytes=selected_bytes,
+            logprob=all_probs.reshape(-1)[selected_id].log().item(),
             top_logprobs=[]
         )
-        for i in range(prob_return_num):
-            token = self.tokenizer.decode(tokens[i].item())
+        for log_value, token_id in zip(log_values, tokens):
+            token, token_bytes = self._get_token_str(token_id)
             chat_logprob.top_logprobs.append(TopLogprob(
                 token=token,
-                logprob=log_values[i].item(),
-                bytes=list(token.encode("utf-8", errors="replace")),
+                logprob=log_value,
+                bytes=token_bytes,
             ))
 
-        logging.debug(f"chat_logprob: {chat_logprob.model_dump_json(indent=4)}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"chat_logprob: {chat_logprob.model_dump_json(indent=4)}")
 
         return chat_logprob
 
-    async def _update_single_status(self, status: StreamStatus, output: GenerateOutput, max_new_tokens: int, stop_words_str: List[str], stop_word_slice_list: List[str], is_streaming: bool) -> OutputDelta:
-        if status.finish_reason != None:
-            return await self._create_empty_delta(status.output.aux_info)
-        status.update_output(output,
-                             self._clean_output_ids,
-                             functools.partial(self._check_finish_reason, max_new_tokens=max_new_tokens),
-                             self._remove_stop_word_ids)
-        decoded_prev_token = self.tokenizer.decode(status.prev_token_id)
-        decoded_string = self.tokenizer.decode(status.tokens_to_decode)
+    async def _generate_log_probs(self, status: StreamStatus, output: Optional[GenerateOutput]) -> Optional[ChatCompletionTokenLogprob]:
+        assert output is not None
+        return self._build_log_probs(status, output.all_probs, output.output_ids)
+
+    def _decode_output_delta(self, status: Union[StreamStatus, StreamStatusSync], is_streaming: bool) -> Optional[str]:
+        '''text of status.output_ids not responded yet, None while streaming text ends with an incomplete char'''
+        if status.detokenizer is None:
+            status.detokenizer = StreamDetokenizer(self.tokenizer)
+        decoded_string = status.detokenizer.decode(status.output_ids)
         # For some tokenizers (e.g. ChatGLM), decode a single token differs from decode a list of tokens.
         if is_streaming:
             if len(decoded_string) > 0 and u'\uFFFD' == decoded_string[-1]:
-                return await self._create_empty_delta(output.aux_info)
+                return None
         else:
             while (len(decoded_string) > 0) and (u'\uFFFD' == decoded_string[-1]):
                 decoded_string = decoded_string[:-1]
-        status.delta_output_string = decoded_string[len(decoded_prev_token):]
-        if is_truncated(status.delta_output_string, stop_words_str, is_streaming):
+        return decoded_string
+
+    async def _update_single_status(self, status: StreamStatus, output: GenerateOutput, max_new_tokens: int, stop_words_str: List[str], stop_word_automaton: StopWordAutomaton, is_streaming: bool) -> OutputDelta:
+        if status.finish_reason != None:
+            return await self._create_empty_delta(status.output.aux_info)
+        status.update_output(output,
+                             self._clean_output_ids,
+                             functools.partial(self._check_finish_reason, max_new_tokens=max_new_tokens),
+                             self._remove_stop_word_ids)
+        decoded_string = self._decode_output_delta(status, is_streaming)
+        if decoded_string is None:
+            return await self._create_empty_delta(output.aux_info)
+        status.delta_output_string = decoded_string
+        if stop_word_automaton.is_truncated(status.delta_output_string, is_streaming):
             status.finish_reason = FinisheReason.stop
             return await self._create_empty_delta(output.aux_info)
-        if not is_truncated(status.delta_output_string, stop_word_slice_list, is_streaming):
+        if not stop_word_automaton.is_truncated(status.delta_output_string, is_streaming, partial=True):
             status.update_result()
             delta = OutputDelta(
                 output_str=status.delta_output_string,
@@ -374,49 +509,21 @@ class CustomChatRenderer():
                     ) for i in range(n)]
         )
         
-    def _split_reasoning_text_and_content(self, item: OutputDelta, think_status: ThinkStatus):
-        
+    def _split_reasoning_text_and_content(self, item: OutputDelta, think_status: ThinkStatus, index: int = 0):
         if isinstance(item.output_str, str):
-            processing_index, output_len = 0, len(item.output_str)
-            if output_len == 0:
+            if len(item.output_str) == 0:
                 return DeltaMessage(content="")
-            
-            reasoning_text, content = "", ""
-            update_think_tokens = think_status.in_think_mode
-            while processing_index < output_len:
-                if think_status.in_think_mode:
-                    think_status.think_buffer += item.output_str[processing_index]
-                    if think_status.think_buffer.startswith(think_start_tag):
-                        think_status.think_buffer = think_status.think_buffer[len(think_start_tag):]
-                        
-                    if think_status.think_buffer.endswith(think_end_tag):
-                        reasoning_text = think_status.think_buffer[:-len(think_end_tag)]
-                        think_status.think_buffer = ""
-                        think_status.in_think_mode = False
-                    elif has_overlap_kmp(think_status.think_buffer, think_end_tag) \
-                        or think_start_tag.startswith(think_status.think_buffer):
-                        pass
-                    else:
-                        reasoning_text = think_status.think_buffer
-                    processing_index += 1
-                else:
-                    content += item.output_str[processing_index:]
-                    processing_index = output_len
-
-            if think_status.in_think_mode:
-                if has_overlap_kmp(think_status.think_buffer, think_end_tag) \
-                    or think_start_tag.startswith(think_status.think_buffer):
-                    reasoning_text = ""
-                else:
-                    think_status.think_buffer = ""
-                    
+            splitter = think_status.get_splitter(index)
+            update_think_tokens = splitter.in_think_mode
+            reasoning_text, content = splitter.feed(item.output_str)
             if think_mode and update_think_tokens:
-                if not think_status.is_streaming:
-                    think_status.think_tokens = item.output_length - len(self.tokenizer.tokenize(content or ""))
-                else:
-                    think_status.think_tokens = item.output_length
+                think_tokens = item.output_length
+                if content:
+                    # only the content following the end tag in this delta is tokenized, at most once per choice
+                    think_tokens -= len(self.tokenizer.tokenize(content))
+                think_status.choice_think_tokens[index] = think_tokens
             return DeltaMessage(reasoning_content=reasoning_text or "", content=content or "")
-        
+
         elif isinstance(item.output_str, DeltaMessage):
             return item.output_str
         
@@ -432,7 +539,7 @@ class CustomChatRenderer():
         
         all_choices = []
         for i, item in enumerate(items):
-            delta = self._split_reasoning_text_and_content(item, think_status)
+            delta = self._split_reasoning_text_and_content(item, think_status, i)
             all_choices.append(ChatCompletionResponseStreamChoice(
                 index=i,
                 delta=delta,
@@ -517,12 +624,12 @@ class CustomChatRenderer():
             request: ChatCompletionRequest,
             generate_config: GenerateConfig
     ) -> AsyncGenerator[StreamResponseObject, None]:
-        stop_word_slice_list = get_stop_word_slices(generate_config.stop_words_str)
+        stop_word_automaton = get_stop_word_automaton(generate_config.stop_words_str)
         num_return_sequences = request.n if request.n is not None else 1
         status_list = await self._create_status_list(num_return_sequences, request)
         index = 0
         global think_mode
-        think_status = ThinkStatus(in_think_mode=think_mode, think_buffer="", think_tokens=0, is_streaming=generate_config.is_streaming)
+        think_status = ThinkStatus(in_think_mode=think_mode, is_streaming=generate_config.is_streaming)
         async for outputs in output_generator:
             if index == 0:
                 yield await self._generate_first(num_return_sequences)
@@ -530,10 +637,11 @@ class CustomChatRenderer():
             if len(outputs.generate_outputs) != num_return_sequences:
                 raise Exception("output num != num_return_sequences")
             delta_list: List[OutputDelta] = []
+            self._prepare_top_logprobs(status_list, [output.all_probs for output in outputs.generate_outputs])
             for status, output in zip(status_list, outputs.generate_outputs):
                 delta_list.append(await self._update_single_status(
                     status, output, generate_config.max_new_tokens, generate_config.stop_words_str,
-                    stop_word_slice_list, generate_config.is_streaming))
+                    stop_word_automaton, generate_config.is_streaming))
             yield await self._generate_stream_response(delta_list, think_status)
             if self._check_all_finished(status_list):
                 break
@@ -554,40 +662,7 @@ class CustomChatRenderer():
                                  status: StreamStatusSync,
                                  all_probs: torch.Tensor,
                                  output_ids: torch.Tensor) -> Optional[ChatCompletionTokenLogprob]:
-        if not status.request.logprobs:
-            return None
-        prob_return_num = status.request.top_logprobs or 1
-        all_probs = all_probs
-        output_id = output_ids
-        if output_id == None:
-            return None
-        selected_id = output_id[-1].item()
-        if (all_probs == None):
-            raise Exception("all_probs is None when logprobs is true. There should be a internal bug.")
-        all_probs = all_probs.squeeze()
-        probs, tokens = all_probs.sort(descending=True)
-        non_zero_size = probs.nonzero().shape[0]
-        log_values = probs.log()
-        prob_return_num = min(prob_return_num, non_zero_size)
-
-        selected_token = self.tokenizer.decode([selected_id])
-        chat_logprob = ChatCompletionTokenLogprob(
-            token=selected_token,
-            bytes=list(selected_token.encode("utf-8", errors="replace")),
-            logprob=all_probs[output_id].log().item(),
-            top_logprobs=[]
-        )
-        for i in range(prob_return_num):
-            token = self.tokenizer.decode(tokens[i].item())
-            chat_logprob.top_logprobs.append(TopLogprob(
-                token=token,
-                logprob=log_values[i].item(),
-                bytes=list(token.encode("utf-8", errors="replace")),
-            ))
-
-        logging.debug(f"chat_logprob: {chat_logprob.model_dump_json(indent=4)}")
-
-        return chat_logprob
+        return self._build_log_probs(status, all_probs, output_ids)
 
     def _update_single_status_sync(self,
                               status: StreamStatusSync,
@@ -598,7 +673,7 @@ class CustomChatRenderer():
                               output_ids: torch.Tensor,
                               max_new_tokens: int,
                               stop_words_str: List[str],
-                              stop_word_slice_list: List[str],
+                              stop_word_automaton: StopWordAutomaton,
                               is_streaming: bool) -> OutputDelta:
         if status.finish_reason != None:
             return self._create_empty_delta_sync(input_len, output_len, reuse_len)
@@ -606,20 +681,14 @@ class CustomChatRenderer():
                                   self._clean_output_ids,
                                   functools.partial(self._check_finish_reason, max_new_tokens=max_new_tokens),
                                   self._remove_stop_word_ids)
-        decoded_prev_token = self.tokenizer.decode(status.prev_token_id)
-        decoded_string = self.tokenizer.decode(status.tokens_to_decode)
-        # For some tokenizers (e.g. ChatGLM), decode a single token differs from decode a list of tokens.
-        if is_streaming:
-            if len(decoded_string) > 0 and u'\uFFFD' == decoded_string[-1]:
-                return self._create_empty_delta_sync(input_len, output_len, reuse_len)
-        else:
-            while (len(decoded_string) > 0) and (u'\uFFFD' == decoded_string[-1]):
-                decoded_string = decoded_string[:-1]
-        status.delta_output_string = decoded_string[len(decoded_prev_token):]
-        if is_truncated(status.delta_output_string, stop_words_str, is_streaming):
+        decoded_string = self._decode_output_delta(status, is_streaming)
+        if decoded_string is None:
+            return self._create_empty_delta_sync(input_len, output_len, reuse_len)
+        status.delta_output_string = decoded_string
+        if stop_word_automaton.is_truncated(status.delta_output_string, is_streaming):
             status.finish_reason = FinisheReason.stop
             return self._create_empty_delta_sync(input_len, output_len, reuse_len)
-        if not is_truncated(status.delta_output_string, stop_word_slice_list, is_streaming):
+        if not stop_word_automaton.is_truncated(status.delta_output_string, is_streaming, partial=True):
             status.update_result()
             delta = OutputDelta(
                 output_str=status.delta_output_string,
@@ -748,8 +817,9 @@ class CustomChatRenderer():
                                         max_new_tokens, # GenerateConfig
                                         stop_words_str, # GenerateConfig
                                         is_streaming):
-        stop_word_slice_list = get_stop_word_slices(stop_words_str) # move into cpp, then pass in
+        stop_word_automaton = get_stop_word_automaton(stop_words_str)
         delta_list: List[OutputDelta] = []
+        self._prepare_top_logprobs(status_list, all_probs_list)
         for status, input_len, output_len, reuse_len, all_probs, output_ids in zip(
                 status_list,
                 input_len_list, output_len_list, reuse_len_list, # AuxInfo
@@ -759,7 +829,7 @@ class CustomChatRenderer():
                                                               input_len, output_len, reuse_len,
                                                               all_probs, output_ids,
                                                               max_new_tokens, stop_words_str,
-                                                              stop_word_slice_list,
+                                                              stop_word_automaton,
                                                               is_streaming))
         stream_response =  self._generate_stream_response_sync(delta_list)
         chat_response = ChatCompletionStreamResponse(
@@ -814,8 +884,9 @@ class CustomChatRenderer():
                                         stop_words_str, # GenerateConfig
                                         is_streaming
                                         ):
-        stop_word_slice_list = get_stop_word_slices(stop_words_str) # move into cpp, then pass in
+        stop_word_automaton = get_stop_word_automaton(stop_words_str)
         delta_list: List[OutputDelta] = []
+        self._prepare_top_logprobs(status_list, all_probs_list)
         for status, input_len, output_len, reuse_len, all_probs, output_ids in zip(
                 status_list,
                 input_len_list, output_len_list, reuse_len_list, # AuxInfo
@@ -825,7 +896,7 @@ class CustomChatRenderer():
                                                               input_len, output_len, reuse_len,
                                                               all_probs, output_ids,
                                                               max_new_tokens, stop_words_str,
-                                                              stop_word_slice_list,
+                                                              stop_word_automaton,
                                                               is_streaming))
         stream_response =  self._generate_stream_response_sync(delta_list)
         return stream_response
@@ -854,27 +925,19 @@ class CustomChatRenderer():
         all_choices = []
         usage = None
         aux_info = None
-        
-        def split_think_tag(text: Optional[str]):
-            if text is None:
-                return None, None
-            text_results = text.split(think_end_tag, 1)
-            reasoning_content = text_results[0] if len(text_results) == 2 else None
-            content = text_results[1] if len(text_results) == 2 else text
-            return content, reasoning_content
-        
+        # content deltas of each choice, joined and split at the think end tag once all are collected
+        all_contents: List[List[str]] = []
+
         for response in choice_generator:
             
             if len(response.choices) != len(all_choices):
                 if (all_choices == []):
                     for i, choice in enumerate(response.choices):
-                        content, reasoning_content = split_think_tag(choice.delta.content)
+                        all_contents.append([choice.delta.content] if choice.delta.content else [])
                         all_choices.append(ChatCompletionResponseChoice(
                                 index=i,
                                 message=ChatMessage(
                                     role=choice.delta.role or RoleEnum.assistant,
-                                    content=content or None,
-                                    reasoning_content=reasoning_content or None,
                                     function_call=choice.delta.function_call or None,
                                 ),
                                 finish_reason=choice.finish_reason,
@@ -886,13 +949,8 @@ class CustomChatRenderer():
                                      f"[{response.choices}] vs [{all_choices}].")
             else:
                 for i in range(len(all_choices)):
-                    if all_choices[i].message.content == None:
-                        all_choices[i].message.content = (response.choices[i].delta.content or None)
-                    else:
-                        all_choices[i].message.content += (response.choices[i].delta.content or "")
-                    content, reasoning_content = split_think_tag(all_choices[i].message.content)
-                    all_choices[i].message.content = content
-                    all_choices[i].message.reasoning_content = reasoning_content
+                    if response.choices[i].delta.content:
+                        all_contents[i].append(response.choices[i].delta.content)
                     all_choices[i].message.role = response.choices[i].delta.role or all_choices[i].message.role
                     all_choices[i].message.function_call = response.choices[i].delta.function_call or all_choices[i].message.function_call
                     all_choices[i].finish_reason = response.choices[i].finish_reason or all_choices[i].finish_reason
@@ -904,6 +962,12 @@ class CustomChatRenderer():
             usage = response.usage or usage
             aux_info = response.aux_info or aux_info
 
+        # an empty output is kept as empty content
+        for choice, contents in zip(all_choices, all_contents):
+            content, reasoning_content = split_think_tag("".join(contents), think_end_tag)
+            choice.message.content = content
+            choice.message.reasoning_content = reasoning_content
+
         if (usage == None):
             logging.warning(f"No usage returned from stream response. use empty value.")
             usage = UsageInfo(
@@ -920,29 +984,21 @@ class CustomChatRenderer():
         return chat_response.model_dump_json(exclude_none=True)
 
     def _check_finish_reason(self, token_ids: List[int], input_token_length: int, max_new_tokens: int = -1) -> Optional[FinisheReason]:
-        stop_word_ids_list_all = self.get_all_extra_stop_word_ids_list() + self.stop_words_id_list
         if max_new_tokens > 0 and len(token_ids) >= max_new_tokens:
             return FinisheReason.length
         if len(token_ids) + input_token_length >= self.max_seq_len:
             return FinisheReason.length
         if token_ids and token_ids[-1] == self.eos_token_id:
             return FinisheReason.stop
-        for stop_word_ids in stop_word_ids_list_all:
-            if (len(token_ids) >= len(stop_word_ids)) and (token_ids[-len(stop_word_ids):] == stop_word_ids):
-                return FinisheReason.stop
+        if self._get_stop_word_ids_table().is_stopped(token_ids):
+            return FinisheReason.stop
         return None
 
     def _remove_stop_word_ids(self, output_ids: List[int]) -> List[int]:
-        stop_word_ids_list_all = self.get_all_extra_stop_word_ids_list() + self.stop_words_id_list
-        for stop_word_ids in stop_word_ids_list_all:
-            #  此处应该从最大的范围开始判断
-            # 有可能会有stopword_ids 重复的情况，比如[144575, 14098, 144575]
-            # 若从1开始判断会导致 去除了最后一个 144575 就退出了
-            for i in range(len(stop_word_ids) + 1, 1, -1):
-                if output_ids[-i:] == stop_word_ids[:i]:
-                    output_ids = output_ids[:-i]
-                    break
-        return output_ids
+        #  此处应该从最大的范围开始判断
+        # 有可能会有stopword_ids 重复的情况，比如[144575, 14098, 144575]
+        # 若从1开始判断会导致 去除了最后一个 144575 就退出了
+        return self._get_stop_word_ids_table().remove_stop_word_ids(output_ids)
 
     def _clean_output_ids(self, output_ids_tensor: torch.Tensor) -> list[int]:
         output_ids_tensor = output_ids_tensor.cpu().reshape([-1])
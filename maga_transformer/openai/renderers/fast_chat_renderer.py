@@ -47,6 +47,6 @@ class FastChatRenderer(CustomChatRenderer):
             conversaion.append_message(self.roles_map[RoleEnum.assistant], "")
 
         prompt = conversaion.get_prompt()
-        input_ids = self.tokenizer.encode(prompt)
+        input_ids = self.encode_prompt(prompt)
 
         return RenderedInputs(input_ids=input_ids)
@@ -28,7 +28,7 @@ import dataclasses
 from enum import IntEnum, auto
 from typing import Any, Dict, List, Tuple, Union
 
-from maga_transformer.utils.word_util import is_truncated
+from maga_transformer.utils.stop_word_matcher import StopWordAutomaton
 
 class InternVLConversation(Conversation):
     def render_messages(self, messages: List[ChatMessage], video_frame_num: int = 8) -> PromptWithMMInput:
@@ -125,7 +125,7 @@ class InternVLRenderer(CustomChatRenderer):
         else:
             raise Exception("no config.json found")
     
-    async def _update_single_status(self, status: StreamStatus, output: GenerateOutput, max_new_tokens: int, stop_words_str: List[str], stop_word_slice_list: List[str], is_streaming: bool) -> OutputDelta:
+    async def _update_single_status(self, status: StreamStatus, output: GenerateOutput, max_new_tokens: int, stop_words_str: List[str], stop_word_automaton: StopWordAutomaton, is_streaming: bool) -> OutputDelta:
         if status.finish_reason != None:
             return await self._create_empty_delta(status.output.aux_info)
         status.update_output(output, self._clean_output_ids, functools.partial(self._check_finish_reason, max_new_tokens=max_new_tokens), self._remove_stop_word_ids)
@@ -144,10 +144,10 @@ class InternVLRenderer(CustomChatRenderer):
             status.delta_output_string = decoded_string[len(decoded_prev_token) + 1: ]
         else: 
             status.delta_output_string = decoded_string[len(decoded_prev_token):]
-        if is_truncated(status.delta_output_string, stop_words_str, is_streaming):
+        if stop_word_automaton.is_truncated(status.delta_output_string, is_streaming):
             status.finish_reason = FinisheReason.stop
             return await self._create_empty_delta(output.aux_info)
-        if not is_truncated(status.delta_output_string, stop_word_slice_list, is_streaming):
+        if not stop_word_automaton.is_truncated(status.delta_output_string, is_streaming, partial=True):
             status.update_result()
             delta = OutputDelta(
                 output_str=status.delta_output_string,
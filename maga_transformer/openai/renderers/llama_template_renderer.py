@@ -10,6 +10,7 @@ from dataclasses import dataclass
 from maga_transformer.openai.api_datatype import ChatMessage, GPTFunctionDefinition, \
     ChatCompletionRequest, RoleEnum, FunctionCall, RendererInfo
 from maga_transformer.openai.renderers.llama_template import Template, get_template_and_fix_tokenizer
+from maga_transformer.utils.prompt_token_cache import create_cached_encode_tokenizer
 from maga_transformer.openai.renderers.custom_renderer import CustomChatRenderer, RendererParams, \
     StreamResponseObject, RenderedInputs
 from maga_transformer.openai.api_datatype import ChatMessage, GPTFunctionDefinition, RoleEnum, \
@@ -29,6 +30,8 @@ class LlamaTemplateRenderer(CustomChatRenderer):
         model_name = renderer_params.model_type
         self.template = get_template_and_fix_tokenizer(model_name, tokenizer)
         self.add_extra_stop_words(self.template.stop_words)
+        # the template tokenizes system prompt and turns one by one, repeated ones are memoized
+        self.segment_tokenizer = create_cached_encode_tokenizer(tokenizer)
 
     def get_renderer_info(self) -> RendererInfo:
         renderer_info = super().get_renderer_info()
@@ -69,7 +72,7 @@ class LlamaTemplateRenderer(CustomChatRenderer):
         template_args = self._extract_history(request.messages)
         assert isinstance(self.tokenizer, PreTrainedTokenizerBase)
         encoded_ids = self.template.encode_oneturn(
-            self.tokenizer,
+            self.segment_tokenizer,
             query=template_args.query,
             resp=template_args.resp,
             history=template_args.history,
@@ -17,7 +17,8 @@ from maga_transformer.openai.renderers.custom_renderer import CustomChatRenderer
     StreamResponseObject, RenderedInputs
 from maga_transformer.openai.renderers.basic_renderer import BasicRenderer
 from maga_transformer.openai.renderer_factory_register import register_renderer
-from maga_transformer.utils.word_util import get_stop_word_slices, truncate_response_with_stop_words
+from maga_transformer.utils.word_util import truncate_response_with_stop_words
+from maga_transformer.utils.stop_word_matcher import get_stop_word_automaton
 
 import pathlib
 current_file_path = pathlib.Path(__file__).parent.absolute()
@@ -141,7 +142,7 @@ class QwenAgentRenderer(CustomChatRenderer):
         output_token_length = 0
         finish_reason: Optional[FinisheReason] = None
         generating_function_call = False
-        stop_word_slice_list = get_stop_word_slices(generate_config.stop_words_str)
+        stop_word_automaton = get_stop_word_automaton(generate_config.stop_words_str)
         output_tokens_list = torch.empty(0, dtype=torch.int32)
         input_with_functions = not (request.functions == None or len(request.functions) == 0)
 
@@ -178,7 +179,7 @@ class QwenAgentRenderer(CustomChatRenderer):
 
             if (output_length > responded_length + len('✿FUNCTION✿:')):
                 delta_string = output_string[responded_length : output_length - len('✿FUNCTION✿:')]
-                trunc_string = truncate_response_with_stop_words(delta_string, stop_word_slice_list, generate_config.is_streaming)
+                trunc_string = stop_word_automaton.truncate(delta_string, generate_config.is_streaming, partial=True)
                 if trunc_string != delta_string:
                     continue
                 responded_string = output_string[: output_length - len('✿FUNCTION✿:')]
@@ -19,7 +19,9 @@ from maga_transformer.openai.renderers.custom_renderer import CustomChatRenderer
     StreamResponseObject, RenderedInputs, StreamStatus, StreamStatusSync, OutputDelta, ThinkStatus
 from maga_transformer.openai.renderers.basic_renderer import BasicRenderer
 from maga_transformer.openai.renderer_factory_register import register_renderer
-from maga_transformer.utils.word_util import get_stop_word_slices, truncate_response_with_stop_words, is_truncated
+from maga_transformer.utils.word_util import truncate_response_with_stop_words
+from maga_transformer.utils.stop_word_matcher import StopWordAutomaton
+from maga_transformer.utils.prompt_token_cache import create_cached_encode_tokenizer
 
 QwenTokenizerTypes = Union[QWenTokenizer, Qwen2Tokenizer]
 
@@ -57,8 +59,8 @@ class QwenStreamStatus(StreamStatus):
         super().__init__(request)
 
     def update_result(self):
-        self.last_token_length = len(self.output_ids) - len(self.last_output_ids)
-        self.last_output_ids = self.output_ids
+        self.last_token_length = len(self.output_ids) - self.last_output_length
+        self.last_output_length = len(self.output_ids)
         self.responded_string = self.total_output_string[: - len('\nAction:')]
 
     @property
@@ -171,6 +173,8 @@ class QwenRenderer(CustomChatRenderer):
         self.add_extra_stop_word_ids([[37763, 367, 25], [151643]]) # Observation:
 
         self.qwen_tool_renderer = QwenToolRenderer(tokenizer, renderer_params)
+        # make_context tokenizes system prompt and turns one by one, repeated ones are memoized
+        self.segment_tokenizer = create_cached_encode_tokenizer(tokenizer)
 
         self.template_chat_renderer: Optional[BasicRenderer] = None
         try:
@@ -196,7 +200,7 @@ class QwenRenderer(CustomChatRenderer):
             input_ids = self.text_complete_last_message(history)
         else:
             assert (isinstance(query, str))
-            input_ids = make_context(self.tokenizer, query, history, system)[1]
+            input_ids = make_context(self.segment_tokenizer, query, history, system)[1]
         return RenderedInputs(input_ids=input_ids)
 
     def text_complete_last_message(self, history):
@@ -210,7 +214,7 @@ class QwenRenderer(CustomChatRenderer):
             prompt += f"\n{im_start}assistant\n{response}{im_end}"
         prompt = prompt[: -len(im_end)]
 
-        return self.tokenizer.encode(prompt)
+        return self.encode_prompt(prompt)
 
     def parse_messages(
             self,
@@ -340,13 +344,13 @@ class QwenRenderer(CustomChatRenderer):
 
     async def _update_single_status(self, status: StreamStatus, 
                                     output: GenerateOutput, max_new_tokens: int,
-                                    stop_words_str: List[str], stop_word_slice_list: List[str], is_streaming: bool) -> OutputDelta:
+                                    stop_words_str: List[str], stop_word_automaton: StopWordAutomaton, is_streaming: bool) -> OutputDelta:
         if status.request.tools:
             return await self.qwen_tool_renderer._update_single_status(
-                status, output, max_new_tokens, stop_words_str, stop_word_slice_list, is_streaming)
+                status, output, max_new_tokens, stop_words_str, stop_word_automaton, is_streaming)
 
         if not isinstance(status, QwenStreamStatus):
-            return await super()._update_single_status(status, output, max_new_tokens, stop_words_str, stop_word_slice_list, is_streaming)
+            return await super()._update_single_status(status, output, max_new_tokens, stop_words_str, stop_word_automaton, is_streaming)
         if status.finish_reason != None:
             return await self._create_empty_delta(status.output.aux_info)
         status.update_output(output,
@@ -362,12 +366,12 @@ class QwenRenderer(CustomChatRenderer):
             return await self._create_empty_delta(output.aux_info)
         if (status.generating_function_call):
             return await self._create_empty_delta(output.aux_info)
-        if is_truncated(status.total_output_string, stop_words_str, is_streaming):
+        if stop_word_automaton.is_truncated(status.total_output_string, is_streaming):
             status.finish_reason = FinisheReason.stop
             return await self._create_empty_delta(output.aux_info)
         if (len(status.total_output_string) > status.responded_length + len('\nAction:')):
             status.delta_output_string = status.total_output_string[status.responded_length : status.output_length - len('\nAction:')]
-            if is_truncated(status.delta_output_string, stop_word_slice_list, is_streaming):
+            if stop_word_automaton.is_truncated(status.delta_output_string, is_streaming, partial=True):
                 return await self._create_empty_delta(output.aux_info)
             else:
                 status.update_result()
@@ -431,7 +435,7 @@ class QwenRenderer(CustomChatRenderer):
                                    output_ids: torch.Tensor,
                                    max_new_tokens: int,
                                    stop_words_str: List[str],
-                                   stop_word_slice_list: List[str],
+                                   stop_word_automaton: StopWordAutomaton,
                                    is_streaming: bool) -> OutputDelta:
         # function call is disabled when logprobs is required.
         if not isinstance(status, QwenStreamStatusSync):
@@ -439,7 +443,7 @@ class QwenRenderer(CustomChatRenderer):
                                                        input_len, output_len, reuse_len,
                                                        all_probs, output_ids,
                                                        max_new_tokens, stop_words_str,
-                                                       stop_word_slice_list,
+                                                       stop_word_automaton,
                                                        is_streaming)
         if status.finish_reason != None:
             return self._create_empty_delta_sync(input_len, output_len, reuse_len)
@@ -456,12 +460,12 @@ class QwenRenderer(CustomChatRenderer):
             return self._create_empty_delta_sync(input_len, output_len, reuse_len)
         if (status.generating_function_call):
             return self._create_empty_delta_sync(input_len, output_len, reuse_len)
-        if is_truncated(status.total_output_string, stop_words_str, is_streaming):
+        if stop_word_automaton.is_truncated(status.total_output_string, is_streaming):
             status.finish_reason = FinisheReason.stop
             return self._create_empty_delta_sync(input_len, output_len, reuse_len)
         if (len(status.total_output_string) > status.responded_length + len('\nAction:')):
             status.delta_output_string = status.total_output_string[status.responded_length : status.output_length - len('\nAction:')]
-            if is_truncated(status.delta_output_string, stop_word_slice_list, is_streaming):
+            if stop_word_automaton.is_truncated(status.delta_output_string, is_streaming, partial=True):
                 return self._create_empty_delta_sync(input_len, output_len, reuse_len)
             else:
                 status.update_result()
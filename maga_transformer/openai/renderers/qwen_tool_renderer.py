@@ -24,9 +24,10 @@ from maga_transformer.openai.renderers.custom_renderer import (
 )
 from maga_transformer.openai.renderer_factory_register import register_renderer
 from maga_transformer.utils.word_util import (
-    is_truncated,
     truncate_response_with_stop_words,
 )
+from maga_transformer.utils.stop_word_matcher import StopWordAutomaton
+from maga_transformer.utils.tool_call_parser import StreamToolCallParser, ToolCallDelta
 from jinja2 import Environment, BaseLoader
 
 """
@@ -81,8 +82,9 @@ class ToolCallMessageExtractStrategy(str, Enum):
 
 class QwenToolStreamStatus(StreamStatus):
     generating_tool_call: bool = False
-    tool_call_index = 0
-    tool_call_responded_string = ""
+    tool_call_parser: Optional[StreamToolCallParser] = None
+    # content outside tool calls, held while it may end with a stop word prefix
+    tool_call_content = ""
     tool_call_message_extract_strategy: ToolCallMessageExtractStrategy = (
         ToolCallMessageExtractStrategy.DEFAULT
     )
@@ -105,6 +107,22 @@ class QwenToolRenderer(CustomChatRenderer):
             self.chat_template = JINJA_TEMPLATE
         else:
             self.chat_template = tokenizer.chat_template
+        self._template = self._compile_template(self.chat_template)
+
+    @staticmethod
+    def _compile_template(chat_template: str):
+        env = Environment(loader=BaseLoader())
+        # 重写tojson过滤器, 这里存在三个注意点
+        # 1. tojson过滤器默认会排序, 导致生成的json字符串不符合预期
+        # 2. tojson过滤器默认会转义汉字, 导致生成的json字符串不符合预期
+        # 3. arguments默认是str, 而官方模板会对json str再次dumps
+
+        env.filters["tojson"] = lambda value: (
+            value
+            if isinstance(value, str)
+            else json.dumps(value, sort_keys=False, ensure_ascii=False)
+        )
+        return env.from_string(chat_template)
 
     # override
     async def _create_status_list(
@@ -118,7 +136,7 @@ class QwenToolRenderer(CustomChatRenderer):
     # override
     def render_chat(self, request: ChatCompletionRequest) -> RenderedInputs:
         prompt: str = self._build_prompt(request)
-        input_ids: List[int] = self.tokenizer.encode(prompt)  # type: ignore
+        input_ids: List[int] = self.encode_prompt(prompt)
         return RenderedInputs(input_ids=input_ids)
 
     def _build_prompt(
@@ -139,22 +157,9 @@ class QwenToolRenderer(CustomChatRenderer):
         if request.messages[-1].role != RoleEnum.assistant:
             context["add_generation_prompt"] = True
 
-        env = Environment(loader=BaseLoader())
-        # 重写tojson过滤器, 这里存在三个注意点
-        # 1. tojson过滤器默认会排序, 导致生成的json字符串不符合预期
-        # 2. tojson过滤器默认会转义汉字, 导致生成的json字符串不符合预期
-        # 3. arguments默认是str, 而官方模板会对json str再次dumps
-
-        env.filters["tojson"] = lambda value: (
-            value
-            if isinstance(value, str)
-            else json.dumps(value, sort_keys=False, ensure_ascii=False)
-        )
-
         try:
-            # 使用自定义环境创建模板
-            template = env.from_string(self.chat_template)
-            rendered_prompt = template.render(**context)
+            # 模板在初始化时编译一次
+            rendered_prompt = self._template.render(**context)
             return rendered_prompt
         except Exception as e:
             raise ValueError(f"Error rendering prompt template: {str(e)}")
@@ -165,7 +170,7 @@ class QwenToolRenderer(CustomChatRenderer):
         output: GenerateOutput,
         max_new_tokens: int,
         stop_words_str: List[str],
-        stop_word_slice_list: List[str],
+        stop_word_automaton: StopWordAutomaton,
         is_streaming: bool,
     ) -> OutputDelta:
         if status.finish_reason != None:  # type: ignore
@@ -176,32 +181,24 @@ class QwenToolRenderer(CustomChatRenderer):
             functools.partial(self._check_finish_reason, max_new_tokens=max_new_tokens),
             self._remove_stop_word_ids,
         )
-        decoded_prev_token = self.tokenizer.decode(status.prev_token_id)  # type: ignore
-        decoded_string = self.tokenizer.decode(status.tokens_to_decode)  # type: ignore
-        # For some tokenizers (e.g. ChatGLM), decode a single token differs from decode a list of tokens.
-        if is_streaming:
-            if len(decoded_string) > 0 and "\uFFFD" == decoded_string[-1]:
-                return await self._create_empty_delta(output.aux_info)
-        else:
-            while (len(decoded_string) > 0) and ("\uFFFD" == decoded_string[-1]):
-                decoded_string = decoded_string[:-1]
-        status.delta_output_string = decoded_string[len(decoded_prev_token) :]
+        decoded_string = self._decode_output_delta(status, is_streaming)  # type: ignore
+        if decoded_string is None:
+            return await self._create_empty_delta(output.aux_info)
+        status.delta_output_string = decoded_string
 
         # <qwen_tool_renderer>, 其他部分同父类custom_renderer保持一致
         if isinstance(status, QwenToolStreamStatus) and status.request.tools:
-            tool_delta = await self.process_tool_calls(status, output, is_streaming)
+            tool_delta = await self.process_tool_calls(status, output, is_streaming, stop_word_automaton)
             # tool_delta为None代表继续默认逻辑处理
             if tool_delta is not None:
                 status.update_result()
                 return tool_delta
         # </qwen_tool_renderer>
 
-        if is_truncated(status.delta_output_string, stop_words_str, is_streaming):
+        if stop_word_automaton.is_truncated(status.delta_output_string, is_streaming):
             status.finish_reason = FinisheReason.stop
             return await self._create_empty_delta(output.aux_info)
-        if not is_truncated(
-            status.delta_output_string, stop_word_slice_list, is_streaming
-        ):
+        if not stop_word_automaton.is_truncated(status.delta_output_string, is_streaming, partial=True):
             status.update_result()
             delta = OutputDelta(
                 output_str=status.delta_output_string,
@@ -220,13 +217,14 @@ class QwenToolRenderer(CustomChatRenderer):
         status: QwenToolStreamStatus,
         output: GenerateOutput,
         is_streaming: bool,
+        stop_word_automaton: Optional[StopWordAutomaton] = None,
     ) -> Optional[OutputDelta]:
         status.tool_call_message_extract_strategy = (
             ToolCallMessageExtractStrategy.from_extra_configs(status.request)
         )
 
         return await (
-            self._handle_streaming_case(status, output)
+            self._handle_streaming_case(status, output, stop_word_automaton)
             if is_streaming
             else self._handle_no_streaming_case(status, output)
         )
@@ -344,99 +342,68 @@ class QwenToolRenderer(CustomChatRenderer):
         self,
         status: QwenToolStreamStatus,
         output: GenerateOutput,
-    ) -> Optional[OutputDelta]:
-        # 如果是qwen2.5之前的qwen, 可能会提前stream出<tool_call这样的内容
-        if (
-            "<tool_call>" in status.tool_call_responded_string
-            or status.delta_output_string == "<tool_call>"
+        stop_word_automaton: Optional[StopWordAutomaton] = None,
+    ) -> OutputDelta:
+        if status.tool_call_parser is None:
+            status.tool_call_parser = StreamToolCallParser(
+                skip_invalid=status.tool_call_message_extract_strategy
+                == ToolCallMessageExtractStrategy.SKIP_ON_FAILURE
+            )
+        # parser消费全部增量文本, name和arguments片段随token到达即输出, tool_call之外的文本做stop word检查后输出
+        text, call_deltas = status.tool_call_parser.feed(status.delta_output_string)
+        status.delta_output_string = ""
+        status.tool_call_content += text
+        content = ""
+        if stop_word_automaton is not None and stop_word_automaton.is_truncated(
+            status.tool_call_content, True
         ):
-            status.tool_call_responded_string += status.delta_output_string
-            status.delta_output_string = ""
-            if "</tool_call>" not in status.tool_call_responded_string:
-                return await self._create_empty_delta(output.aux_info)
-            else:
-                # 提取和处理工具调用
-                function_call, status.tool_call_responded_string = (
-                    self._extract_function_call_from_streaming_message(
-                        status.tool_call_responded_string,
-                        status.tool_call_message_extract_strategy,
-                    )
-                )
-                # 设置工具调用状态
-                if not function_call:
-                    # 如果没有提取到工具调用，则把完整的原始文本作为delta输出
-                    status.delta_output_string = status.tool_call_responded_string
-                    status.tool_call_responded_string = ""
-                else:
-                    status.generating_tool_call = True
-                    # 创建工具调用的delta输出
-                    delta = OutputDelta(
-                        output_str=DeltaMessage(
-                            tool_calls=[
-                                ToolCall(
-                                    index=status.tool_call_index,
-                                    id=self._generate_random_call_id(),
-                                    type="function",
-                                    function=function_call,
-                                )
-                            ]
-                        ),
-                        logprobs=await self._generate_log_probs(status, output),
-                        input_length=output.aux_info.input_len,
-                        output_length=output.aux_info.output_len,
-                        reuse_length=output.aux_info.reuse_len,
-                    )
-                    status.tool_call_index += 1
-                    return delta
-
-        """
-        处理特殊换行情况, 例如
-        <tool_call>
-        {"name": "get_current_temperature", "arguments": {"location": "北京, China", "unit": "celsius"}}
-        </tool_call>\n<tool_call>
-        {"name": "get_current_temperature", "arguments": {"location": "上海, China", "unit": "celsius"}}
-        </tool_call>
-        """
+            status.finish_reason = FinisheReason.stop
+            status.tool_call_content = ""
+        elif stop_word_automaton is None or not stop_word_automaton.is_truncated(
+            status.tool_call_content, True, partial=True
+        ):
+            content = status.tool_call_content
+            status.tool_call_content = ""
 
-        if status.generating_tool_call and status.delta_output_string == "\n":
+        if not call_deltas and not content:
             return await self._create_empty_delta(output.aux_info)
-
-        # 返回None的意义是让_update_single_status按照默认逻辑继续返回status.delta_output_string的delta
-        return None
-
-    def _extract_function_call_from_streaming_message(
-        self,
-        text: str,
-        tool_call_message_extract_strategy: ToolCallMessageExtractStrategy = ToolCallMessageExtractStrategy.DEFAULT,
-    ) -> Tuple[Optional[FunctionCall], str]:
-        tool_call_name_args_str = text[
-            text.index("<tool_call>") + len("<tool_call>") : text.index("</tool_call>")
-        ]
-
-        # 更新tool_call_responded_string
-        extracted_text = (
-            text[: text.index("<tool_call>")]
-            + text[text.index("</tool_call>") + len("</tool_call>") :]
+        if call_deltas:
+            status.generating_tool_call = True
+        return OutputDelta(
+            output_str=self._tool_call_delta_message(content, call_deltas),
+            logprobs=await self._generate_log_probs(status, output),
+            input_length=output.aux_info.input_len,
+            output_length=output.aux_info.output_len,
+            reuse_length=output.aux_info.reuse_len,
         )
 
-        # 解析工具调用参数
-        try:
-            function_name, function_args = self._extract_name_args(
-                tool_call_name_args_str
-            )
-            return (
-                FunctionCall(name=function_name, arguments=function_args),
-                extracted_text,
-            )
-        except Exception as e:
-            # json提取失败的时候, 返回原始文本
-            logging.error(f"qwen tool extract function call error: {str(e)}")
-            if (
-                tool_call_message_extract_strategy
-                == ToolCallMessageExtractStrategy.SKIP_ON_FAILURE
-            ):
-                return None, ""
-            return None, text
+    def _tool_call_delta_message(
+        self, content: str, call_deltas: List[ToolCallDelta]
+    ) -> Union[str, DeltaMessage]:
+        if not call_deltas:
+            return content
+        tool_calls: List[ToolCall] = []
+        for call_delta in call_deltas:
+            if call_delta.name is not None:
+                # 首个delta带上id和name, 之后只有arguments片段
+                tool_calls.append(
+                    ToolCall(
+                        index=call_delta.index,
+                        id=self._generate_random_call_id(),
+                        type="function",
+                        function=FunctionCall(
+                            name=call_delta.name, arguments=call_delta.arguments
+                        ),
+                    )
+                )
+            else:
+                tool_calls.append(
+                    ToolCall(
+                        index=call_delta.index,
+                        function=FunctionCall(name=None, arguments=call_delta.arguments),
+                    )
+                )
+        return DeltaMessage(content=content or None, tool_calls=tool_calls)
 
     def _generate_random_call_id(self, length: int = 24) -> str:
         """生成随机调用ID"""
@@ -472,14 +439,13 @@ class QwenToolRenderer(CustomChatRenderer):
         for buffer in buffer_list:
             # 解被截断的bad_case
             # "response":"<tool_call>\n{\"name\": \"get_average_month"
-            if (
-                isinstance(buffer, QwenToolStreamStatus)
-                and buffer.tool_call_responded_string
-                and "<tool_call>" in buffer.tool_call_responded_string
-                and buffer.tool_call_message_extract_strategy
-                == ToolCallMessageExtractStrategy.DEFAULT
-            ):
-                buffer.delta_output_string += buffer.tool_call_responded_string
+            call_deltas: List[ToolCallDelta] = []
+            if isinstance(buffer, QwenToolStreamStatus) and buffer.tool_call_parser is not None:
+                text, call_deltas = buffer.tool_call_parser.flush()
+                buffer.delta_output_string = buffer.tool_call_content + text + buffer.delta_output_string
+                buffer.tool_call_content = ""
+                if call_deltas:
+                    buffer.generating_tool_call = True
 
             if buffer.output is None:
                 raise Exception("last output should not be None")
@@ -489,7 +455,7 @@ class QwenToolRenderer(CustomChatRenderer):
             )
             output_items.append(
                 OutputDelta(
-                    trunc_string,
+                    self._tool_call_delta_message(trunc_string, call_deltas),
                     await self._generate_log_probs(buffer, buffer.output),
                     aux_info.input_len,
                     aux_info.output_len,
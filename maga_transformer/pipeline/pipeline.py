@@ -2,9 +2,7 @@ import os
 import logging
 import torch
 import asyncio
-import threading
 import platform
-import queue
 import json
 from typing import Any, List, Union, Iterator, Tuple, Callable, Optional, Dict, Generator, AsyncGenerator
 from concurrent.futures import Future
@@ -12,6 +10,7 @@ from torch.nn.utils.rnn import pad_sequence
 from transformers.tokenization_utils_base import PreTrainedTokenizerBase
 
 from maga_transformer.utils.util import AtomicCounter
+from maga_transformer.utils.background_loop import get_background_loop
 from maga_transformer.utils.time_util import current_time_ms
 from maga_transformer.config.exceptions import ExceptionType, FtRuntimeException
 from maga_transformer.config.generate_config import GenerateConfig
@@ -22,9 +21,10 @@ from maga_transformer.utils.multimodal_util import MultimodalInput
 from maga_transformer.model_factory import ModelFactory, AsyncModel, ModelConfig
 from maga_transformer.async_decoder_engine.backend_rpc_server_visitor import BackendRPCServerVisitor
 from maga_transformer.pipeline.pipeline_custom_func import PipelineCustomFunc, get_piple_custom_func
-from maga_transformer.utils.word_util import remove_padding_eos, get_stop_word_slices, \
-            truncate_response_with_stop_words, truncate_token_with_stop_word_id, match_stop_words
+from maga_transformer.utils.word_util import remove_padding_eos
+from maga_transformer.utils.stop_word_matcher import StopWordAutomaton, StopWordMatcher, get_stop_word_automaton
 from maga_transformer.utils.tokenizer_utils import DecodingState
+from maga_transformer.utils.token_buffer import TokenBuffer
 from maga_transformer.utils.weight_type import WEIGHT_TYPE
 from maga_transformer.utils.mm_process_engine import MMProcessEngine
 from maga_transformer.config.gpt_init_model_parameters import GptInitModelParameters
@@ -80,42 +80,9 @@ class Pipeline(object):
                  urls: Optional[List[str]] = None,
                  **kwargs: Any) -> Iterator[GenerateResponse]:
 
-        q = queue.Queue()
-
-        async def generator():
-            res = None
-            try:
-                res = self.pipeline_async(prompt, request_id, urls, **kwargs)
-                async for x in res:
-                    q.put(x)
-                q.put(None)
-            except Exception as e:
-                q.put(e)
-            finally:
-                # if pipline break, should call aclose() to remove async_generator task from loop
-                if res is not None:
-                    res.aclose()
-
-        def start_loop():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(generator())
-
-        backgroud_thread = threading.Thread(target=start_loop)
-        backgroud_thread.start()
-        try:
-            while True:
-                try:
-                    r = q.get(timeout=0.01)
-                    if r is None:
-                        break
-                    if isinstance(r, Exception):
-                        raise r
-                    yield r
-                except queue.Empty:
-                    continue
-        finally:
-            backgroud_thread.join()
+        # shared background loop instead of a thread and event loop per call
+        return get_background_loop().iterate(
+            lambda: self.pipeline_async(prompt, request_id, urls, **kwargs))
 
     @torch.inference_mode()
     def pipeline_async( # type: ignore
@@ -159,54 +126,50 @@ class Pipeline(object):
                         generate_config: GenerateConfig,
                         generate_output: GenerateOutput,
                         tokens,
-                        stop_word_ids: List[List[int]],
-                        stop_word_id_slices: List[List[int]]):
+                        stop_word_id_automaton: StopWordAutomaton):
         if not generate_config.print_stop_words:
-            if not generate_output.finished:
-                tokens = truncate_token_with_stop_word_id(tokens, stop_word_id_slices)
-            else:
-                tokens = truncate_token_with_stop_word_id(tokens, stop_word_ids)
+            # hold back trailing stop word prefix until it is resolved
+            tokens = stop_word_id_automaton.truncate(tokens, partial=not generate_output.finished)
         return tokens
 
     def process_stop_str(self,
                     generate_config: GenerateConfig,
                     generate_output: GenerateOutput,
                     text: str, all_text: str,
-                    stop_word_str_list: List[str],
-                    stop_word_str_slices: List[str],
+                    stop_word_matcher: StopWordMatcher,
                     token_buffer: str,
                     **kwargs: Any):
         generate_output.finished = self.piple_funcs.stop_generate_func(all_text, **kwargs) or generate_output.finished
-        if stop_word_str_list and not generate_output.finished and match_stop_words(all_text, stop_word_str_list):
+        # only the text appended since last step is scanned
+        stop_index = stop_word_matcher.update(all_text)
+        if stop_index >= 0:
             generate_output.finished = True
 
         if not generate_config.print_stop_words:
-            if not generate_config.return_incremental:
-                if not generate_output.finished:
-                    text = truncate_response_with_stop_words(text, stop_word_str_slices, generate_config.is_streaming)
-                else:
-                    text = truncate_response_with_stop_words(text, stop_word_str_list, generate_config.is_streaming)
-            else:
-                if not generate_output.finished:
-                    text = token_buffer + text
-                    trunc_text = truncate_response_with_stop_words(text, stop_word_str_slices, generate_config.is_streaming)
-                    token_buffer = text[len(trunc_text):]
-                    text = trunc_text
-                else:
-                    text = truncate_response_with_stop_words(token_buffer + text, stop_word_str_list, generate_config.is_streaming)
+            if generate_config.return_incremental:
+                text = token_buffer + text
+                token_buffer = ""
+            # text is a suffix of all_text
+            offset = len(all_text) - len(text)
+            if stop_index >= 0:
+                text = text[:max(stop_index - offset, 0)]
+            elif not generate_output.finished:
+                hold_length = min(stop_word_matcher.hold_length, len(text))
+                if generate_config.return_incremental:
+                    token_buffer = text[len(text) - hold_length:]
+                text = text[:len(text) - hold_length]
         return text, token_buffer
 
     def decode_tokens(self,
                       generate_config: GenerateConfig,
                       generate_outputs: GenerateOutputs,
-                      stop_word_str_list: List[str],
-                      stop_word_str_slices: List[str],
-                      stop_word_ids: List[int],
-                      stop_word_id_slices: List[int],
+                      stop_word_str_automaton: StopWordAutomaton,
+                      stop_word_id_automaton: StopWordAutomaton,
                       decoding_states: List[DecodingState],
                       token_buffers: List[str],
-                      ouput_tokens_list: List[torch.Tensor],
-                      **kwargs: Any) -> Tuple[List[str], List[int], List[DecodingState], List[str], List[torch.Tensor]]:
+                      stop_word_matchers: List[StopWordMatcher],
+                      ouput_tokens_list: List[TokenBuffer],
+                      **kwargs: Any) -> Tuple[List[str], List[int], List[DecodingState], List[str], List[StopWordMatcher], List[TokenBuffer]]:
         texts = []
         all_texts = []
         output_lens = []
@@ -220,21 +183,27 @@ class Pipeline(object):
         if len(token_buffers) == 0:
             token_buffers = [""] * len(generate_outputs.generate_outputs)
 
+        if len(stop_word_matchers) == 0:
+            stop_word_matchers = [StopWordMatcher(stop_word_str_automaton) for _ in range(len(generate_outputs.generate_outputs))]
+
         if len(ouput_tokens_list) == 0:
-            ouput_tokens_list = [torch.empty(0, dtype=torch.int32) for _ in range(len(generate_outputs.generate_outputs))]
+            ouput_tokens_list = [TokenBuffer(self._special_tokens.eos_token_id) for _ in range(len(generate_outputs.generate_outputs))]
 
         # TODO(xinfei.sxf) remove i
         i = 0
         for generate_output in generate_outputs.generate_outputs:
             # all model incremental return output_ids
             if generate_config.num_beams == 1:
-                ouput_tokens_list[i] = torch.cat((ouput_tokens_list[i], generate_output.output_ids), dim=1)
-                generate_output.output_ids = ouput_tokens_list[i]
-            tokens = generate_output.output_ids
-            tokens = remove_padding_eos(tokens, self._special_tokens.eos_token_id)
-            output_lens.append(tokens.nelement())
+                # finished outputs are kept in cache and passed in again, their tokens are already appended
+                if not ouput_tokens_list[i].finished:
+                    ouput_tokens_list[i].append(generate_output.output_ids)
+                generate_output.output_ids = ouput_tokens_list[i].output_ids()
+                tokens = ouput_tokens_list[i].token_ids
+            else:
+                tokens = remove_padding_eos(generate_output.output_ids, self._special_tokens.eos_token_id).tolist()
+            output_lens.append(len(tokens))
 
-            tokens = self.process_stop_id(generate_config, generate_output, tokens.tolist(), stop_word_ids, stop_word_id_slices)
+            tokens = self.process_stop_id(generate_config, generate_output, tokens, stop_word_id_automaton)
 
             text, all_text = self.piple_funcs.process_decode_func(tokens,
                                           generate_config=generate_config.model_dump(),
@@ -243,8 +212,8 @@ class Pipeline(object):
                                           return_incremental=generate_config.return_incremental,
                                           **kwargs)
 
-            text, token_buffers[i] = self.process_stop_str(generate_config, generate_output, text, all_text, stop_word_str_list,
-                    stop_word_str_slices, token_buffers[i], **kwargs)
+            text, token_buffers[i] = self.process_stop_str(generate_config, generate_output, text, all_text,
+                    stop_word_matchers[i], token_buffers[i], **kwargs)
 
             text = self.piple_funcs.modify_response_func(
                     text, hidden_states=generate_output.hidden_states,
@@ -253,8 +222,9 @@ class Pipeline(object):
 
             texts.append(text)
             all_texts.append(all_text)
+            ouput_tokens_list[i].finished = generate_output.finished
             i += 1
-        return texts, output_lens, decoding_states, token_buffers, ouput_tokens_list
+        return texts, output_lens, decoding_states, token_buffers, stop_word_matchers, ouput_tokens_list
 
     @torch.inference_mode()
     async def generate_stream(self, request_id: int, token_ids: List[int], mm_inputs: List[MultimodalInput],
@@ -269,16 +239,16 @@ class Pipeline(object):
                               generate_config=generate_config,
                               tokenizer=self.tokenizer,
                               token_type_ids=token_type_ids)
-        stop_word_strs = generate_config.stop_words_str
-        stop_word_str_slices = get_stop_word_slices(stop_word_strs)
-        stop_word_ids = generate_config.stop_words_list
-        stop_word_id_slices = get_stop_word_slices(stop_word_ids)
+        # compiled once per stop word set and shared across requests
+        stop_word_str_automaton = get_stop_word_automaton(generate_config.stop_words_str)
+        stop_word_id_automaton = get_stop_word_automaton(generate_config.stop_words_list)
 
         stream: AsyncGenerator[GenerateOutputs, None] = self.backend_rpc_server_visitor.enqueue(input)
 
         decoding_states: List[DecodingState] = []
-        ouput_tokens_list: List[torch.Tensor] = []
+        ouput_tokens_list: List[TokenBuffer] = []
         token_buffers: List[str] = []
+        stop_word_matchers: List[StopWordMatcher] = []
         generate_outputs_cache = GenerateOutputs()
 
         # TODO(xinfei.sxf) add batch and stop test
@@ -290,9 +260,9 @@ class Pipeline(object):
                                                            for i, out in enumerate(generate_outputs_cache.generate_outputs)]
             assert len(generate_outputs_cache.generate_outputs) == len(generate_outputs.generate_outputs)
             begin_time = current_time_ms()
-            generate_texts, output_lens, decoding_states, token_buffers, ouput_tokens_list = self.decode_tokens(
-                generate_config, generate_outputs_cache, stop_word_strs, stop_word_str_slices,
-                stop_word_ids, stop_word_id_slices, decoding_states, token_buffers, ouput_tokens_list, **kwargs)
+            generate_texts, output_lens, decoding_states, token_buffers, stop_word_matchers, ouput_tokens_list = self.decode_tokens(
+                generate_config, generate_outputs_cache, stop_word_str_automaton, stop_word_id_automaton,
+                decoding_states, token_buffers, stop_word_matchers, ouput_tokens_list, **kwargs)
 
             kmonitor.report(GaugeMetrics.POST_PIPELINE_RT_METRIC, current_time_ms() - begin_time)
 
@@ -25,13 +25,14 @@ from uvicorn.loops.auto import auto_loop_setup
 from maga_transformer.distribute.worker_info import g_worker_info
 from maga_transformer.openai.openai_endpoint import OpenaiEndopoint
 from maga_transformer.openai.api_datatype import ChatCompletionRequest, ChatCompletionStreamResponse
-from maga_transformer.embedding.frontend_embedding_app import register_frontend_embedding_api
+from maga_transformer.embedding.frontend_embedding_app import register_frontend_embedding_api, proxy_backend_request
 from maga_transformer.utils.version_info import VersionInfo
 from maga_transformer.config.uvicorn_config import UVICORN_LOGGING_CONFIG
 from maga_transformer.models.base_model import BaseModel
 from maga_transformer.server.frontend_server import FrontendServer
 from maga_transformer.config.exceptions import ExceptionType, FtRuntimeException
-from maga_transformer.utils.util import AtomicCounter, request_server
+from maga_transformer.utils.util import AtomicCounter
+from maga_transformer.utils.async_http_client import async_request_server
 from maga_transformer.utils.concurrency_controller import ConcurrencyController
 
 # make buffer larger to avoid throw exception "RemoteProtocolError Receive buffer too long"
@@ -122,23 +123,23 @@ class FrontendApp(object):
         @app.post("/status")
         @app.post("/health_check")
         async def health():
-            return request_server("post", g_worker_info.backend_server_port, "health_check", {})
+            return await async_request_server("post", g_worker_info.backend_server_port, "health_check", {})
 
         @app.get("/")
         async def health():
-            return request_server("get", g_worker_info.backend_server_port, "", {})
+            return await async_request_server("get", g_worker_info.backend_server_port, "", {})
 
         @app.get("/worker_status")
-        def worker_status():
-            response = request_server("get", g_worker_info.backend_server_port, "worker_status", {})
+        async def worker_status():
+            response = await async_request_server("get", g_worker_info.backend_server_port, "worker_status", {})
             if "error" not in response:
                 response["frontend_available_concurrency"] = self.frontend_server._global_controller.get_available_concurrency()
             return response
 
         # example : {"peft_info": {"lora_info": {"lora_0": "/lora/llama-lora-test/""}}}
         @app.post("/update")
-        def update(version_info: VersionInfo):
-            return request_server("post", g_worker_info.backend_server_port, "update", version_info.model_dump())
+        async def update(version_info: VersionInfo):
+            return await async_request_server("post", g_worker_info.backend_server_port, "update", version_info.model_dump())
 
         @app.get("/v1/models")
         async def list_models():
@@ -148,7 +149,7 @@ class FrontendApp(object):
         # request format: {"log_level": "DEBUG"}, {"log_level": "info"}
         @app.post("/set_log_level")
         async def set_log_level(req: Union[str, Dict[Any, Any]]):
-            return request_server("post", g_worker_info.backend_server_port, "set_log_level", req)
+            return await async_request_server("post", g_worker_info.backend_server_port, "set_log_level", req)
 
         @app.post("/")
         async def inference(req: Union[str,Dict[Any, Any]], raw_request: RawRequest):
@@ -157,7 +158,7 @@ class FrontendApp(object):
             active_requests.increment()
             try:
                 if self.frontend_server.is_embedding:
-                    return request_server("post", g_worker_info.backend_server_port, "v1/embeddings", req)
+                    return await proxy_backend_request(g_worker_info.backend_server_port, "v1/embeddings", req)
                 else:
                     return await self.frontend_server.inference(req, raw_request)
             finally:
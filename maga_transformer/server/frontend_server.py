@@ -28,6 +28,7 @@ from maga_transformer.embedding.embedding_endpoint import EmbeddingEndpoint
 from maga_transformer.openai.api_datatype import ChatCompletionRequest
 from maga_transformer.server.frontend_worker import FrontendWorker, TokenizerEncodeResponse
 from maga_transformer.server.misc import format_exception
+from maga_transformer.server.stream_encoder import StreamChunkEncoder, encode_stream_chunks
 from maga_transformer.config.task_type import TaskType
 from maga_transformer.structure.request_extractor import request_id_field_name
 from maga_transformer.utils.concurrency_controller import ConcurrencyException, get_global_controller
@@ -76,10 +77,10 @@ class FrontendServer(object):
     ):
         is_openai_response = request.get("stream", False)
         response_data_prefix = "data: " if is_openai_response else "data:"
+        encoder = StreamChunkEncoder(response_data_prefix)
         try:
-            async for res in response:
-                data_str = res.model_dump_json(exclude_none=True)
-                yield response_data_prefix + data_str + "\r\n\r\n"
+            async for data in encode_stream_chunks(response, encoder):
+                yield data
                 await asyncio.sleep(0)
             if not is_openai_response:
                 yield f"data:[done]\r\n\r\n"
@@ -226,7 +227,7 @@ class FrontendServer(object):
         assert self._frontend_worker is not None
         start_time = current_time_ms()
         response_generator = generate_call()
-        return CompleteResponseAsyncGenerator(__gen_response_with_report(start_time, response_generator), response_generator._collect_complete_response_func)
+        return CompleteResponseAsyncGenerator(__gen_response_with_report(start_time, response_generator), response_generator._create_aggregator_func)
     
     async def _collect_complete_response_and_record_access_log(self, req: Dict[Any, Any], res: Any):
         complete_response = await res.gen_complete_response_once()
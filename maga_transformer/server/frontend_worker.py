@@ -14,7 +14,7 @@ current_file_path = pathlib.Path(__file__).parent.absolute()
 sys.path.append(str(current_file_path.parent.absolute()))
 
 from maga_transformer.pipeline.pipeline import Pipeline
-from maga_transformer.utils.complete_response_async_generator import CompleteResponseAsyncGenerator
+from maga_transformer.utils.complete_response_async_generator import CompleteResponseAsyncGenerator, ResponseAggregator
 from maga_transformer.config.exceptions import FtRuntimeException, ExceptionType
 from maga_transformer.models.base_model import GenerateResponse, GenerateConfig
 from maga_transformer.structure.request_extractor import RequestExtractor, Request
@@ -83,11 +83,11 @@ class FrontendWorker():
 
         response_generator = self._inference(request, **kwargs)
 
-        complete_response_collect_func = partial(FrontendWorker.collect_complete_response,
-                                                 incremental=request.incremental,
-                                                 batch_infer=request.batch_infer,
-                                                 num_return_sequences=request.num_return_sequences)
-        return CompleteResponseAsyncGenerator(response_generator, complete_response_collect_func)
+        create_aggregator_func = partial(PipelineResponseAggregator,
+                                         incremental=request.incremental,
+                                         batch_infer=request.batch_infer,
+                                         num_return_sequences=request.num_return_sequences)
+        return CompleteResponseAsyncGenerator(response_generator, create_aggregator_func)
 
 
     def _inference(self, request: Request, **kwargs: Any):
@@ -221,70 +221,71 @@ class FrontendWorker():
             else:
                 yield batch[0]
 
-    #TODO(xinfei.sxf) 这个函数将逻辑又写了一遍
-    @staticmethod
-    async def collect_complete_response(
-        all_responses: List[Union[PipelineResponse, MultiSequencesPipelineResponse, BatchPipelineResponse]],
-        incremental: bool,
-        batch_infer: bool,
-        num_return_sequences: int
-    ) -> Union[PipelineResponse, MultiSequencesPipelineResponse, BatchPipelineResponse]:
-
-        if not incremental:
-            return await CompleteResponseAsyncGenerator.get_last_value(all_responses)
-
-        if batch_infer:
-            batch_response_incremental_stream = None
-            async for response in all_responses:
-                if not batch_response_incremental_stream:
-                    batch_response_incremental_stream = [[_] for _ in response.response_batch]
-                else:
-                    for batch_idx, single_response in enumerate(response.response_batch):
-                        batch_response_incremental_stream[batch_idx].append(single_response)
-            complete_batch_response = []
-            async for single_response_incremental_stream in CompleteResponseAsyncGenerator.generate_from_list(batch_response_incremental_stream):
-                single_yield_response = CompleteResponseAsyncGenerator.generate_from_list(single_response_incremental_stream)
-                single_complete_response = await FrontendWorker.collect_complete_response(single_yield_response, incremental, False, num_return_sequences)
-                complete_batch_response.append(single_complete_response)
-            return BatchPipelineResponse(response_batch=complete_batch_response)
-
-        if num_return_sequences > 0:
-            complete_multi_seq_response = None
-            complete_multi_seq_finished = None
-            complete_multi_seq_aux_info = None
-            async for response in all_responses:
-                if not complete_multi_seq_response:
-                    complete_multi_seq_response = [_ for _ in response.response]
-                    complete_multi_seq_aux_info = [_ for _ in response.aux_info]
-                    complete_multi_seq_finished = response.finished
-                for seq_idx, seq_reponse in enumerate(response.response):
-                    complete_multi_seq_response[seq_idx] = complete_multi_seq_response[seq_idx] + seq_reponse
-                    if response.aux_info and response.aux_info[seq_idx]:
-                        complete_multi_seq_aux_info[seq_idx] = response.aux_info[seq_idx]
-                    if response.finished:
-                        complete_multi_seq_finished = True
-            return MultiSequencesPipelineResponse(response=complete_multi_seq_response,
-                                                  aux_info=complete_multi_seq_aux_info,
-                                                  finished=complete_multi_seq_finished)
-        complete_response = ""
-        finished = False
-        aux_info = None
-        output_ids = None
-        input_ids = None
-        async for response in all_responses:
-            complete_response = complete_response + response.response
+class PipelineResponseAggregator(ResponseAggregator):
+    '''
+    complete response of a pipeline request. incremental responses are folded in as they stream:
+    texts are kept as fragment lists and joined once, other fields keep the latest value.
+    '''
+    def __init__(self, incremental: bool, batch_infer: bool, num_return_sequences: int):
+        self.incremental = incremental
+        self.batch_infer = batch_infer
+        self.num_return_sequences = num_return_sequences
+        self._last_response = None
+        # batch_infer: one aggregator per batch index
+        self._batch_aggregators: List[PipelineResponseAggregator] = []
+        # one fragment list per sequence
+        self._fragments: List[List[str]] = []
+        self._finished = False
+        self._aux_info: Any = None
+        self._output_ids = None
+        self._input_ids = None
+
+    def add(self, response: Any) -> None:
+        if not self.incremental:
+            self._last_response = response
+        elif self.batch_infer:
+            for batch_idx, single_response in enumerate(response.response_batch):
+                if batch_idx == len(self._batch_aggregators):
+                    self._batch_aggregators.append(
+                        PipelineResponseAggregator(self.incremental, False, self.num_return_sequences))
+                self._batch_aggregators[batch_idx].add(single_response)
+        elif self.num_return_sequences > 0:
+            if not self._fragments:
+                self._fragments = [[] for _ in response.response]
+                self._aux_info = list(response.aux_info)
+                self._finished = response.finished
+            for seq_idx, seq_response in enumerate(response.response):
+                self._fragments[seq_idx].append(seq_response)
+                if response.aux_info and response.aux_info[seq_idx]:
+                    self._aux_info[seq_idx] = response.aux_info[seq_idx]
             if response.finished:
-                finished = response.finished
+                self._finished = True
+        else:
+            if not self._fragments:
+                self._fragments = [[]]
+            self._fragments[0].append(response.response)
+            if response.finished:
+                self._finished = response.finished
             if response.aux_info:
-                aux_info = response.aux_info
+                self._aux_info = response.aux_info
             if response.output_ids:
-                output_ids = response.output_ids
+                self._output_ids = response.output_ids
             if response.input_ids:
-                input_ids = response.input_ids
+                self._input_ids = response.input_ids
+
+    def result(self) -> Union[PipelineResponse, MultiSequencesPipelineResponse, BatchPipelineResponse]:
+        if not self.incremental:
+            return self._last_response
+        if self.batch_infer:
+            return BatchPipelineResponse(response_batch=[aggregator.result() for aggregator in self._batch_aggregators])
+        if self.num_return_sequences > 0:
+            return MultiSequencesPipelineResponse(response=["".join(fragments) for fragments in self._fragments],
+                                                  aux_info=self._aux_info,
+                                                  finished=self._finished)
         return PipelineResponse(
-            response=complete_response,
-            finished=finished,
-            aux_info=aux_info,
-            output_ids=output_ids,
-            input_ids=input_ids
+            response="".join(self._fragments[0]) if self._fragments else "",
+            finished=self._finished,
+            aux_info=self._aux_info or {},
+            output_ids=self._output_ids,
+            input_ids=self._input_ids
         )
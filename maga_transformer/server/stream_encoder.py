@@ -0,0 +1,160 @@
+import orjson
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+from maga_transformer.openai.api_datatype import ChatCompletionStreamResponse, ChatCompletionResponseStreamChoice, \
+    DeltaMessage, ChoiceLogprobs, ChatCompletionTokenLogprob
+
+SSE_DELIMITER = b"\r\n\r\n"
+
+_dumps = orjson.dumps
+# leading bytes of a choice, by choice index
+_CHOICE_PREFIXES = [b'{"index":%d,"delta":' % index for index in range(16)]
+
+# fields are read from the model __dict__, attribute access on pydantic models costs more than the encoding
+
+def _token_logprob(logprob: ChatCompletionTokenLogprob) -> Dict[str, Any]:
+    fields = logprob.__dict__
+    item: Dict[str, Any] = {"token": fields["token"]}
+    if fields["bytes"] is not None:
+        item["bytes"] = fields["bytes"]
+    item["logprob"] = fields["logprob"]
+    top_logprobs = []
+    for top in fields["top_logprobs"]:
+        top_fields = top.__dict__
+        top_item: Dict[str, Any] = {"token": top_fields["token"]}
+        if top_fields["bytes"] is not None:
+            top_item["bytes"] = top_fields["bytes"]
+        top_item["logprob"] = top_fields["logprob"]
+        top_logprobs.append(top_item)
+    item["top_logprobs"] = top_logprobs
+    return item
+
+def _encode_logprobs(logprobs: ChoiceLogprobs) -> bytes:
+    value: Dict[str, Any] = {}
+    if logprobs.content is not None:
+        value["content"] = [_token_logprob(logprob) for logprob in logprobs.content]
+    if logprobs.refusal is not None:
+        value["refusal"] = [_token_logprob(logprob) for logprob in logprobs.refusal]
+    return _dumps(value)
+
+def _encode_delta(delta: DeltaMessage) -> bytes:
+    fields = delta.__dict__
+    if fields["function_call"] is not None or fields["tool_calls"] is not None:
+        return delta.model_dump_json(exclude_none=True).encode("utf-8")
+    role = fields["role"]
+    content = fields["content"]
+    reasoning_content = fields["reasoning_content"]
+    if role is None and reasoning_content is None:
+        return b'{}' if content is None else b'{"content":' + _dumps(content) + b'}'
+    parts: List[bytes] = []
+    if role is not None:
+        parts.append(b'"role":' + _dumps(role.value))
+    if content is not None:
+        parts.append(b'"content":' + _dumps(content))
+    if reasoning_content is not None:
+        parts.append(b'"reasoning_content":' + _dumps(reasoning_content))
+    return b"{" + b",".join(parts) + b"}"
+
+def _encode_choice(choice: ChatCompletionResponseStreamChoice) -> bytes:
+    fields = choice.__dict__
+    index = fields["index"]
+    prefix = _CHOICE_PREFIXES[index] if 0 <= index < len(_CHOICE_PREFIXES) else b'{"index":%d,"delta":' % index
+    data = prefix + _encode_delta(fields["delta"])
+    if fields["finish_reason"] is not None:
+        data += b',"finish_reason":' + _dumps(fields["finish_reason"].value)
+    if fields["logprobs"] is not None:
+        data += b',"logprobs":' + _encode_logprobs(fields["logprobs"])
+    return data + b"}"
+
+class StreamChunkEncoder(object):
+    '''
+    sse encoder of stream responses, output is the same json as `model_dump_json(exclude_none=True)`.
+    chat chunks only differ from each other in choices and a few trailing fields: the leading fields are
+    encoded once into a byte template, deltas and logprobs are encoded with orjson, pydantic is only used for
+    rare fields (tool calls, usage, debug info). other response types are dumped by pydantic.
+    '''
+    def __init__(self, data_prefix: str):
+        self.data_prefix = data_prefix.encode("utf-8")
+        self._header_key: Optional[Tuple[Any, ...]] = None
+        self._header = b""
+
+    def _chat_header(self, fields: Dict[str, Any]) -> bytes:
+        key = (fields["id"], fields["object"], fields["created"], fields["model"])
+        if key != self._header_key:
+            header = self.data_prefix + b'{"id":' + _dumps(fields["id"]) + b',"object":' + _dumps(fields["object"]) + \
+                b',"created":%d' % fields["created"]
+            if fields["model"] is not None:
+                header += b',"model":' + _dumps(fields["model"])
+            self._header = header + b',"choices":['
+            self._header_key = key
+        return self._header
+
+    def encode_chat_chunk(self, res: ChatCompletionStreamResponse) -> bytes:
+        fields = res.__dict__
+        choices = fields["choices"]
+        data = self._chat_header(fields) + (_encode_choice(choices[0]) if len(choices) == 1 else
+                                            b",".join([_encode_choice(choice) for choice in choices])) + b"]"
+        if fields["usage"] is not None:
+            data += b',"usage":' + fields["usage"].model_dump_json(exclude_none=True).encode("utf-8")
+        debug_info = fields["debug_info"]
+        if debug_info is not None:
+            data += b',"debug_info":' + (_dumps(debug_info) if isinstance(debug_info, str) else
+                                         debug_info.model_dump_json(exclude_none=True).encode("utf-8"))
+        if fields["aux_info"] is not None:
+            data += b',"aux_info":' + fields["aux_info"].model_dump_json(exclude_none=True).encode("utf-8")
+        return data + b"}" + SSE_DELIMITER
+
+    def encode(self, res: Any) -> bytes:
+        if type(res) is ChatCompletionStreamResponse:
+            return self.encode_chat_chunk(res)
+        if isinstance(res, BaseModel):
+            data = res.model_dump_json(exclude_none=True).encode("utf-8")
+        else:
+            data = _dumps(res)
+        return self.data_prefix + data + SSE_DELIMITER
+
+async def encode_stream_chunks(responses: AsyncIterator[Any], encoder: StreamChunkEncoder,
+                               max_pending: int = 64) -> AsyncGenerator[bytes, None]:
+    '''
+    encoded responses, read by a separate task. responses produced while the previous write is still pending
+    (client slower than generation) are joined into one write; the task waits once `max_pending` encoded
+    responses are not written yet.
+    '''
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+    finished = object()
+
+    async def produce():
+        try:
+            async for response in responses:
+                await queue.put(encoder.encode(response))
+            await queue.put(finished)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            chunks: List[bytes] = []
+            end = None
+            for item in items:
+                if isinstance(item, bytes):
+                    chunks.append(item)
+                else:
+                    end = item
+                    break
+            if chunks:
+                yield b"".join(chunks)
+            if isinstance(end, Exception):
+                raise end
+            if end is finished:
+                return
+    finally:
+        if not task.done():
+            task.cancel()
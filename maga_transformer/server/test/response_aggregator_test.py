@@ -0,0 +1,253 @@
+import asyncio
+from typing import Any, List
+from unittest import TestCase, main
+
+from maga_transformer.server.frontend_worker import PipelineResponseAggregator, PipelineResponse, \
+    MultiSequencesPipelineResponse, BatchPipelineResponse
+from maga_transformer.openai.openai_endpoint import ChatCompletionResponseAggregator
+from maga_transformer.openai.api_datatype import ChatMessage, RoleEnum, ChatCompletionResponse, \
+    ChatCompletionResponseChoice, ChatCompletionResponseStreamChoice, DeltaMessage, FinisheReason, UsageInfo, \
+    ChoiceLogprobs, ChatCompletionTokenLogprob, TopLogprob, ToolCall, FunctionCall
+from maga_transformer.openai.renderers.custom_renderer import StreamResponseObject
+from maga_transformer.utils.complete_response_async_generator import CompleteResponseAsyncGenerator
+
+def collect_pipeline_responses(responses: List[Any], incremental: bool, batch_infer: bool, num_return_sequences: int):
+    '''the collector the aggregator replaced: keeps all responses and merges them at the end'''
+    if not incremental:
+        return responses[-1]
+    if batch_infer:
+        return BatchPipelineResponse(response_batch=[
+            collect_pipeline_responses([response.response_batch[i] for response in responses],
+                                       incremental, False, num_return_sequences)
+            for i in range(len(responses[0].response_batch))])
+    if num_return_sequences > 0:
+        # the old collector also added the first chunk twice, which was a bug
+        texts = ["" for _ in responses[0].response]
+        aux_info = list(responses[0].aux_info)
+        finished = responses[0].finished
+        for response in responses:
+            for seq_idx, seq_response in enumerate(response.response):
+                texts[seq_idx] = texts[seq_idx] + seq_response
+                if response.aux_info and response.aux_info[seq_idx]:
+                    aux_info[seq_idx] = response.aux_info[seq_idx]
+            if response.finished:
+                finished = True
+        return MultiSequencesPipelineResponse(response=texts, aux_info=aux_info, finished=finished)
+    text = ""
+    finished = False
+    aux_info = None
+    output_ids = None
+    input_ids = None
+    for response in responses:
+        text = text + response.response
+        if response.finished:
+            finished = response.finished
+        if response.aux_info:
+            aux_info = response.aux_info
+        if response.output_ids:
+            output_ids = response.output_ids
+        if response.input_ids:
+            input_ids = response.input_ids
+    return PipelineResponse(response=text, finished=finished, aux_info=aux_info,
+                            output_ids=output_ids, input_ids=input_ids)
+
+def merge_tool_calls(tool_calls, delta_tool_calls):
+    if not delta_tool_calls:
+        return tool_calls
+    tool_calls = tool_calls or []
+    for delta in delta_tool_calls:
+        tool_call = next((x for x in tool_calls if delta.index is not None and x.index == delta.index), None)
+        if tool_call is None:
+            tool_calls.append(delta.model_copy(deep=True))
+        else:
+            tool_call.id = tool_call.id or delta.id
+            tool_call.type = tool_call.type or delta.type
+            tool_call.function.name = tool_call.function.name or delta.function.name
+            tool_call.function.arguments = (tool_call.function.arguments or "") + (delta.function.arguments or "")
+    return tool_calls
+
+def collect_chat_responses(responses: List[StreamResponseObject]) -> ChatCompletionResponse:
+    '''the collector the aggregator replaced: keeps all responses and merges them at the end'''
+    all_choices = []
+    usage = None
+    aux_info = None
+    for response in responses:
+        if not all_choices:
+            all_choices = [
+                ChatCompletionResponseChoice(
+                    index=i,
+                    message=ChatMessage(
+                        role=choice.delta.role or RoleEnum.assistant,
+                        content=choice.delta.content or None,
+                        function_call=choice.delta.function_call or None,
+                        tool_calls=merge_tool_calls(None, choice.delta.tool_calls),
+                    ),
+                    finish_reason=choice.finish_reason,
+                    logprobs=choice.logprobs,
+                ) for i, choice in enumerate(response.choices)
+            ]
+        else:
+            for i, choice in enumerate(all_choices):
+                delta = response.choices[i].delta
+                if choice.message.content == None:
+                    choice.message.content = delta.content or None
+                else:
+                    choice.message.content += delta.content or ""
+                if choice.message.reasoning_content == None:
+                    choice.message.reasoning_content = delta.reasoning_content or None
+                else:
+                    choice.message.reasoning_content += delta.reasoning_content or ""
+                choice.message.role = delta.role or choice.message.role
+                choice.message.function_call = delta.function_call or choice.message.function_call
+                choice.message.tool_calls = merge_tool_calls(choice.message.tool_calls, delta.tool_calls)
+                choice.finish_reason = response.choices[i].finish_reason or choice.finish_reason
+                if choice.logprobs != None:
+                    if response.choices[i].logprobs != None:
+                        choice.logprobs.content += response.choices[i].logprobs.content
+                else:
+                    choice.logprobs = response.choices[i].logprobs
+        usage = response.usage or usage
+        aux_info = response.aux_info or aux_info
+    return ChatCompletionResponse(choices=all_choices, usage=usage or UsageInfo(), aux_info=aux_info, model="fake")
+
+def logprobs(token: str) -> ChoiceLogprobs:
+    return ChoiceLogprobs(content=[ChatCompletionTokenLogprob(
+        token=token, logprob=-0.5, top_logprobs=[TopLogprob(token=token, logprob=-0.5)])])
+
+def chat_stream() -> List[StreamResponseObject]:
+    '''two choices: one answers with text and logprobs, the other calls a tool and stops later'''
+    def response(deltas, finish_reasons=[None, None], usage=None, with_logprobs=False):
+        return StreamResponseObject(choices=[
+            ChatCompletionResponseStreamChoice(
+                index=i, delta=delta, finish_reason=finish_reason,
+                logprobs=logprobs(delta.content) if with_logprobs and delta.content else None)
+            for i, (delta, finish_reason) in enumerate(zip(deltas, finish_reasons))
+        ], usage=usage)
+    return [
+        response([DeltaMessage(role=RoleEnum.assistant, content=""), DeltaMessage(role=RoleEnum.assistant, content="")]),
+        response([DeltaMessage(reasoning_content="想"), DeltaMessage(reasoning_content="查")], with_logprobs=True),
+        response([DeltaMessage(content="你"), DeltaMessage(content="我来查")], with_logprobs=True),
+        response([DeltaMessage(content="好"), DeltaMessage(tool_calls=[ToolCall(
+            index=0, id="call_0", type="function", function=FunctionCall(name="get_weather", arguments=""))])],
+            with_logprobs=True),
+        response([DeltaMessage(content="!"), DeltaMessage(tool_calls=[ToolCall(
+            index=0, function=FunctionCall(name=None, arguments='{"city": '))])],
+            finish_reasons=[FinisheReason.stop, None], with_logprobs=True),
+        response([DeltaMessage(), DeltaMessage(tool_calls=[ToolCall(
+            index=0, function=FunctionCall(name=None, arguments='"北京"}'))])],
+            finish_reasons=[None, FinisheReason.tool_calls]),
+        response([DeltaMessage(), DeltaMessage()],
+                 usage=UsageInfo(prompt_tokens=3, completion_tokens=8, total_tokens=11)),
+    ]
+
+async def consume(generator: CompleteResponseAsyncGenerator):
+    async for _ in generator:
+        pass
+    return await generator.gen_complete_response_once()
+
+async def generate(responses: List[Any]):
+    for response in responses:
+        yield response
+
+class PipelineResponseAggregatorTest(TestCase):
+    def _check(self, create_stream, incremental: bool, batch_infer: bool, num_return_sequences: int):
+        expected = collect_pipeline_responses(create_stream(), incremental, batch_infer, num_return_sequences)
+        aggregator = PipelineResponseAggregator(incremental, batch_infer, num_return_sequences)
+        for response in create_stream():
+            aggregator.add(response)
+        self.assertEqual(expected.model_dump(), aggregator.result().model_dump())
+        return aggregator.result()
+
+    @staticmethod
+    def _single_stream():
+        return [PipelineResponse(response=text, finished=i == 2, aux_info={"output_len": i + 1},
+                                 output_ids=[[i]], input_ids=[[1, 2]])
+                for i, text in enumerate(["你", "好", "!"])]
+
+    @staticmethod
+    def _multi_stream():
+        return [MultiSequencesPipelineResponse(response=texts, finished=i == 2,
+                                               aux_info=[{"output_len": i + 1}, {} if i == 2 else {"output_len": i + 1}])
+                for i, texts in enumerate([["a", "x"], ["b", "y"], ["c", ""]])]
+
+    def test_single(self):
+        result = self._check(self._single_stream, True, False, 0)
+        self.assertEqual(result.response, "你好!")
+        self.assertEqual(result.aux_info, {"output_len": 3})
+        self.assertEqual(result.output_ids, [[2]])
+        self.assertTrue(result.finished)
+
+    def test_not_incremental(self):
+        result = self._check(self._single_stream, False, False, 0)
+        self.assertEqual(result.response, "!")
+
+    def test_num_return_sequences(self):
+        result = self._check(self._multi_stream, True, False, 2)
+        self.assertEqual(result.response, ["abc", "xy"])
+        self.assertEqual(result.aux_info, [{"output_len": 3}, {"output_len": 2}])
+        self.assertTrue(result.finished)
+
+    def test_batch(self):
+        def create_stream():
+            return [BatchPipelineResponse(response_batch=[first, second])
+                    for first, second in zip(self._single_stream(), self._single_stream()[::-1])]
+        result = self._check(create_stream, True, True, 0)
+        self.assertEqual([x.response for x in result.response_batch], ["你好!", "!好你"])
+
+    def test_batch_num_return_sequences(self):
+        def create_stream():
+            return [BatchPipelineResponse(response_batch=[first, second])
+                    for first, second in zip(self._multi_stream(), self._multi_stream())]
+        result = self._check(create_stream, True, True, 2)
+        self.assertEqual([x.response for x in result.response_batch], [["abc", "xy"], ["abc", "xy"]])
+
+    def test_complete_response_generator(self):
+        generator = CompleteResponseAsyncGenerator(
+            generate(self._single_stream()), lambda: PipelineResponseAggregator(True, False, 0))
+        result = asyncio.run(consume(generator))
+        self.assertEqual(result.model_dump(),
+                         collect_pipeline_responses(self._single_stream(), True, False, 0).model_dump())
+
+class ChatCompletionResponseAggregatorTest(TestCase):
+    def test_same_as_collect_all(self):
+        expected = collect_chat_responses(chat_stream())
+        generator = CompleteResponseAsyncGenerator(
+            generate(chat_stream()), lambda: ChatCompletionResponseAggregator("fake", None))
+        result = asyncio.run(consume(generator))
+        exclude = {"id", "created"}
+        self.assertEqual(expected.model_dump(exclude=exclude), result.model_dump(exclude=exclude))
+
+        first, second = result.choices
+        self.assertEqual(first.message.content, "你好!")
+        self.assertEqual(first.message.reasoning_content, "想")
+        self.assertEqual([x.token for x in first.logprobs.content], ["你", "好", "!"])
+        self.assertEqual(first.finish_reason, FinisheReason.stop)
+        self.assertEqual(second.message.content, "我来查")
+        self.assertEqual(len(second.message.tool_calls), 1)
+        self.assertEqual(second.message.tool_calls[0].id, "call_0")
+        self.assertEqual(second.message.tool_calls[0].function.name, "get_weather")
+        self.assertEqual(second.message.tool_calls[0].function.arguments, '{"city": "北京"}')
+        self.assertEqual([x.token for x in second.logprobs.content], ["我来查"])
+        self.assertEqual(second.finish_reason, FinisheReason.tool_calls)
+        self.assertEqual(result.usage.total_tokens, 11)
+
+    def test_result_in_middle_of_stream(self):
+        stream = chat_stream()
+        aggregator = ChatCompletionResponseAggregator("fake", None)
+        for response in stream[:3]:
+            aggregator.add(response)
+        self.assertEqual(aggregator.result().choices[0].message.content, "你")
+        for response in stream[3:]:
+            aggregator.add(response)
+        self.assertEqual(aggregator.result().choices[0].message.content, "你好!")
+        self.assertEqual(aggregator.result().choices[1].message.tool_calls[0].function.arguments, '{"city": "北京"}')
+
+    def test_different_choice_num(self):
+        stream = chat_stream()
+        aggregator = ChatCompletionResponseAggregator("fake", None)
+        aggregator.add(stream[0])
+        with self.assertRaises(ValueError):
+            aggregator.add(StreamResponseObject(choices=stream[1].choices[:1]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import json
+import time
+import asyncio
+import logging
+from unittest import TestCase, main
+
+from maga_transformer.openai.api_datatype import ChatCompletionStreamResponse, ChatCompletionResponseStreamChoice, \
+    DeltaMessage, RoleEnum, FinisheReason, UsageInfo, ToolCall, FunctionCall, ChoiceLogprobs, \
+    ChatCompletionTokenLogprob, TopLogprob
+from maga_transformer.server.stream_encoder import StreamChunkEncoder, encode_stream_chunks
+
+def chat_chunk(**kwargs) -> ChatCompletionStreamResponse:
+    return ChatCompletionStreamResponse(
+        choices=[ChatCompletionResponseStreamChoice(index=0, delta=DeltaMessage(**kwargs))], model="fake")
+
+class StreamEncoderTest(TestCase):
+    def _pydantic_encode(self, res) -> bytes:
+        return ("data: " + res.model_dump_json(exclude_none=True) + "\r\n\r\n").encode("utf-8")
+
+    def test_same_as_pydantic(self):
+        encoder = StreamChunkEncoder("data: ")
+        logprobs = ChoiceLogprobs(content=[ChatCompletionTokenLogprob(
+            token="a", bytes=[97], logprob=-0.25, top_logprobs=[TopLogprob(token="b", logprob=-1.5)])])
+        chunks = [
+            chat_chunk(role=RoleEnum.assistant, content=""),
+            chat_chunk(content="你好\"\n"),
+            chat_chunk(reasoning_content="think"),
+            ChatCompletionStreamResponse(choices=[
+                ChatCompletionResponseStreamChoice(index=0, delta=DeltaMessage(content="a"), logprobs=logprobs),
+                ChatCompletionResponseStreamChoice(index=1, delta=DeltaMessage(content="b"),
+                                                   finish_reason=FinisheReason.stop)]),
+            ChatCompletionStreamResponse(choices=[ChatCompletionResponseStreamChoice(
+                index=0, delta=DeltaMessage(tool_calls=[ToolCall(index=0, function=FunctionCall(name="f", arguments="{}"))]),
+                finish_reason=FinisheReason.tool_calls)],
+                usage=UsageInfo(prompt_tokens=3, total_tokens=5, completion_tokens=2), debug_info="debug"),
+        ]
+        for chunk in chunks:
+            self.assertEqual(encoder.encode(chunk), self._pydantic_encode(chunk))
+        self.assertEqual(json.loads(encoder.encode({"a": 1})[len("data: "):]), {"a": 1})
+
+    def test_coalesce(self):
+        encoder = StreamChunkEncoder("data:")
+        chunks = [chat_chunk(content=str(i)) for i in range(10)]
+
+        async def responses():
+            for chunk in chunks:
+                yield chunk
+            raise ValueError("failed")
+
+        async def slow_client():
+            writes = []
+            try:
+                async for data in encode_stream_chunks(responses(), encoder):
+                    writes.append(data)
+                    await asyncio.sleep(0.01)
+            except ValueError:
+                return writes, True
+            return writes, False
+
+        writes, raised = asyncio.run(slow_client())
+        self.assertTrue(raised)
+        self.assertLess(len(writes), len(chunks))
+        self.assertEqual(b"".join(writes), b"".join(encoder.encode(chunk) for chunk in chunks))
+
+    def test_backpressure(self):
+        encoder = StreamChunkEncoder("data:")
+        produced = []
+
+        async def responses():
+            for i in range(100):
+                produced.append(i)
+                yield {"i": i}
+
+        async def stalled_client():
+            stream = encode_stream_chunks(responses(), encoder, max_pending=4)
+            first = await stream.__anext__()
+            await asyncio.sleep(0.05)
+            count = len(produced)
+            await stream.aclose()
+            return first, count
+
+        first, count = asyncio.run(stalled_client())
+        self.assertTrue(first.startswith(encoder.encode({"i": 0})))
+        self.assertLess(count, 10)
+
+    def test_benchmark(self):
+        encoder = StreamChunkEncoder("data: ")
+        chunk = chat_chunk(content="hello")
+        count = 20000
+        begin = time.perf_counter()
+        for _ in range(count):
+            self._pydantic_encode(chunk)
+        pydantic_cost = time.perf_counter() - begin
+        begin = time.perf_counter()
+        for _ in range(count):
+            encoder.encode(chunk)
+        encoder_cost = time.perf_counter() - begin
+        logging.info(f"chunks per second per core: pydantic {count / pydantic_cost:.0f}, encoder {count / encoder_cost:.0f}")
+
+if __name__ == '__main__':
+    main()
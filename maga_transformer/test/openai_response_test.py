@@ -21,11 +21,15 @@ from maga_transformer.openai.api_datatype import (
     ContentPart,
     ContentPartTypeEnum,
     RendererInfo,
+    ChatCompletionResponseStreamChoice,
+    DeltaMessage,
 )
 from maga_transformer.openai.openai_endpoint import OpenaiEndopoint
 from maga_transformer.config.generate_config import GenerateConfig
 from maga_transformer.openai.renderer_factory import ChatRendererFactory, CustomChatRenderer, RendererParams
 from maga_transformer.openai.renderers import custom_renderer
+from maga_transformer.openai.renderers.custom_renderer import StreamResponseObject
+from maga_transformer.openai.renderers.qwen_tool_renderer import QwenToolRenderer
 
 async def fake_output_generator(
         output_ids: List[int], max_seq_len: int, eos_id: int, seq_len: int
@@ -50,6 +54,26 @@ async def fake_output_generator(
         ))
         yield outputs
 
+async def fake_complete_output_generator(
+        output_ids: List[int], max_seq_len: int, eos_id: int, seq_len: int
+) -> AsyncGenerator[GenerateOutputs, None]:
+    # not streaming, all output ids in one finished output
+    output_tensor = torch.full((1, max_seq_len), eos_id, dtype=torch.int)
+    output_tensor[0, :len(output_ids)] = torch.tensor(output_ids, dtype=torch.int)
+    outputs = GenerateOutputs()
+    aux = AuxInfo()
+    aux.input_len = seq_len
+    aux.output_len = len(output_ids)
+    outputs.generate_outputs.append(GenerateOutput(
+        hidden_states=None,
+        output_ids=output_tensor,
+        finished=torch.full((1,), True, dtype=torch.bool),
+        aux_info=aux,
+        loss=None,
+        logits=None
+    ))
+    yield outputs
+
 MAX_SEQ_LEN=1024
 
 class FakeModel(BaseModel):
@@ -557,6 +581,109 @@ class OpenaiResponseTest(IsolatedAsyncioTestCase):
             }
         )
         
+    async def _run_qwen_tool(self, text: str, is_streaming: bool):
+        custom_renderer.think_mode = 0
+        os.environ["MODEL_TYPE"] = "qwen_2"
+        tokenizer = AutoTokenizer.from_pretrained("maga_transformer/test/tokenizer_test/testdata/qwen2_tokenizer")
+        self.model.tokenizer = tokenizer
+        self.endpoint = OpenaiEndopoint(self.model.config, self.model.tokenizer, None)
+        render_params = RendererParams(
+            model_type="qwen_tool",
+            max_seq_len=MAX_SEQ_LEN,
+            eos_token_id=tokenizer.eos_token_id or 0,
+            stop_word_ids_list=[],
+        )
+        chat_renderer = QwenToolRenderer(tokenizer, render_params)
+        function = GPTFunctionDefinition(name="get_current_weather", description="Get the current weather.", parameters={})
+        request = ChatCompletionRequest(messages=[ChatMessage(role=RoleEnum.user, content="weather?")],
+                                        tools=[GPTToolDefinition(function=function)])
+        test_ids = tokenizer.encode(text)
+        output_generator = fake_output_generator if is_streaming else fake_complete_output_generator
+        id_generator = output_generator(test_ids, MAX_SEQ_LEN, tokenizer.eos_token_id or 0, 100)
+        stream_generator = chat_renderer.render_response_stream(id_generator, request, GenerateConfig(is_streaming=is_streaming))
+        generate = self.endpoint._complete_stream_response(stream_generator, None)
+        chunks = [x async for x in generate]
+        response = await generate.gen_complete_response_once()
+        return chunks, response.choices[0]
+
+    def _streamed_tool_calls(self, chunks) -> List[Dict[str, Any]]:
+        # tool calls as a client merges the deltas
+        calls: Dict[int, Dict[str, Any]] = {}
+        for chunk in chunks:
+            for tool_call in chunk.choices[0].delta.tool_calls or []:
+                call = calls.setdefault(tool_call.index, {"id": tool_call.id, "name": tool_call.function.name, "arguments": ""})
+                if tool_call.function.name is not None:
+                    self.assertIsNotNone(tool_call.id)
+                    self.assertEqual(call["name"], tool_call.function.name)
+                call["arguments"] += tool_call.function.arguments or ""
+        return [calls[index] for index in sorted(calls)]
+
+    async def test_qwen_tool_stream_same_as_no_stream(self):
+        text = '我来查询天气。\n<tool_call>\n{"name": "get_current_weather", "arguments": {"location": "北京", "unit":"celsius"}}\n</tool_call>' \
+               '\n<tool_call>\n{"name": "get_current_weather", "arguments": {"location": "上海"}}\n</tool_call>'
+        chunks, stream_choice = await self._run_qwen_tool(text, True)
+        _, choice = await self._run_qwen_tool(text, False)
+        self.assertEqual(stream_choice.message.content, choice.message.content)
+        self.assertEqual(stream_choice.message.content, "我来查询天气。")
+        self.assertEqual(stream_choice.finish_reason, FinisheReason.tool_calls)
+        self.assertEqual(choice.finish_reason, FinisheReason.tool_calls)
+        self.assertGreater(len(chunks), 2)
+
+        # the aggregated response merges the argument fragments of each call
+        streamed = self._streamed_tool_calls(chunks)
+        self.assertEqual([(call["name"], call["arguments"]) for call in streamed],
+                         [(tool_call.function.name, tool_call.function.arguments) for tool_call in stream_choice.message.tool_calls])
+        # streamed arguments are the model text, not streamed ones are dumped again: same json, spacing may differ
+        self.assertEqual(streamed[0]["arguments"], '{"location": "北京", "unit":"celsius"}')
+        self.assertEqual(choice.message.tool_calls[0].function.arguments, '{"location": "北京", "unit": "celsius"}')
+        self.assertEqual([(tool_call.index, tool_call.function.name, json.loads(tool_call.function.arguments))
+                          for tool_call in stream_choice.message.tool_calls],
+                         [(tool_call.index, tool_call.function.name, json.loads(tool_call.function.arguments))
+                          for tool_call in choice.message.tool_calls])
+
+    async def test_qwen_tool_invalid_json(self):
+        # no name can be parsed: returned as text, streaming or not
+        text = '好的\n<tool_call>\nnot a json\n</tool_call>'
+        _, stream_choice = await self._run_qwen_tool(text, True)
+        _, choice = await self._run_qwen_tool(text, False)
+        for c in [stream_choice, choice]:
+            self.assertIsNone(c.message.tool_calls)
+            self.assertEqual(c.message.content, text)
+            self.assertEqual(c.finish_reason, FinisheReason.stop)
+
+        # arguments turn out invalid after the name was streamed: the call is already sent, only the
+        # not streamed response can still return the text
+        text = '<tool_call>\n{"name": "get_current_weather", "arguments": {"location": }}\n</tool_call>'
+        chunks, stream_choice = await self._run_qwen_tool(text, True)
+        _, choice = await self._run_qwen_tool(text, False)
+        self.assertEqual(self._streamed_tool_calls(chunks)[0]["name"], "get_current_weather")
+        self.assertEqual(stream_choice.message.tool_calls[0].function.arguments, '{"location": }')
+        self.assertIsNone(choice.message.tool_calls)
+        self.assertEqual(choice.message.content, text)
+
+    def test_collect_complete_response(self):
+        custom_renderer.think_end_tag = '</think>'
+        tokenizer = AutoTokenizer.from_pretrained("maga_transformer/test/tokenizer_test/testdata/qwen2_tokenizer")
+        render_params = RendererParams(
+            model_type="qwen_2",
+            max_seq_len=MAX_SEQ_LEN,
+            eos_token_id=tokenizer.eos_token_id or 0,
+            stop_word_ids_list=[],
+        )
+        chat_renderer = CustomChatRenderer(tokenizer, render_params)
+        def collect(*deltas: str) -> Dict[str, Any]:
+            responses = [StreamResponseObject(choices=[ChatCompletionResponseStreamChoice(
+                index=0, delta=DeltaMessage(content=delta))]) for delta in deltas]
+            return json.loads(chat_renderer.collect_complete_response(responses))["choices"][0]["message"]
+        # empty output is kept as empty content, streamed or not
+        self.assertEqual(collect(""), {"role": "assistant", "content": "", "partial": False})
+        self.assertEqual(collect("", "", ""), {"role": "assistant", "content": "", "partial": False})
+        self.assertEqual(collect("你好"), {"role": "assistant", "content": "你好", "partial": False})
+        self.assertEqual(collect("想", "</thi", "nk>", "你", "好"),
+                         {"role": "assistant", "content": "你好", "reasoning_content": "想", "partial": False})
+        self.assertEqual(collect("想</think>"),
+                         {"role": "assistant", "content": "", "reasoning_content": "想", "partial": False})
+
     async def test_escape(self):     
         think_start_tag = '<think>\n'
         self.assertEqual(think_start_tag, think_start_tag.encode('utf-8').decode('unicode_escape'))
@@ -0,0 +1,77 @@
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Union
+
+import aiohttp
+
+class BackendResponse(object):
+    '''undecoded backend response, the body is passed through to the client as is'''
+    def __init__(self, status: int, content_type: Optional[str], body: bytes):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+
+class AsyncHttpClient(object):
+    '''
+    keep-alive connection pool to local backend http server.
+    aiohttp sessions are bound to the event loop that created them, so the session is created lazily
+    on the running loop.
+    '''
+    def __init__(self, limit: int = 1024, keepalive_timeout: float = 60):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=None))
+        return self._session
+
+    async def request(self, method: str, url: str, req: Union[str, Dict[str, Any]]) -> Any:
+        async with self._get_session().request(method.upper(), url, json=req) as response:
+            return await response.json(content_type=None)
+
+    async def request_raw(self, method: str, url: str, req: Union[str, Dict[str, Any]]) -> BackendResponse:
+        # the connection goes back to the pool when the body is read, even if the client never gets it
+        async with self._get_session().request(method.upper(), url, json=req) as response:
+            return BackendResponse(response.status, response.headers.get('Content-Type'), await response.read())
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+_global_http_client: Optional[AsyncHttpClient] = None
+
+def get_http_client() -> AsyncHttpClient:
+    global _global_http_client
+    if _global_http_client is None:
+        _global_http_client = AsyncHttpClient(
+            limit=int(os.environ.get('BACKEND_HTTP_POOL_SIZE', 1024)),
+            keepalive_timeout=float(os.environ.get('BACKEND_HTTP_KEEPALIVE_TIMEOUT', 60)))
+    return _global_http_client
+
+async def async_request_server(method: str, server_port: int, uri: str = '', req: Union[str, Dict[str, Any]] = {}):
+    if method not in ["get", "post"]:
+        return {"error": "error method"}
+    try:
+        return await get_http_client().request(method, f'http://localhost:{server_port}/{uri}', req)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        return {"error": f"Failed to call {uri}", "details": str(e)}
+
+async def raw_request_server(method: str, server_port: int, uri: str = '',
+                             req: Union[str, Dict[str, Any]] = {}) -> Union[BackendResponse, Dict[str, Any]]:
+    if method not in ["get", "post"]:
+        return {"error": "error method"}
+    try:
+        return await get_http_client().request_raw(method, f'http://localhost:{server_port}/{uri}', req)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logging.warning(f"failed to call backend {uri}: {e}")
+        return {"error": f"Failed to call {uri}", "details": str(e)}
@@ -0,0 +1,90 @@
+import queue
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+_END = object()
+
+class BackgroundEventLoop(object):
+    '''
+    long-lived event loop running in a daemon thread, shared by sync callers of async apis.
+    loop-bound resources (grpc channels, http sessions) are created once and reused across calls.
+    '''
+    def __init__(self, name: str = 'background_event_loop'):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._thread is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+                self._thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+            return self._loop
+
+    def iterate(self, agen_factory: Callable[[], AsyncIterator[Any]]) -> Iterator[Any]:
+        '''
+        run the async generator created by agen_factory on the background loop and yield its items.
+        items are handed over through a blocking queue, consumer wakes up as soon as an item is ready.
+        if the consumer stops iterating, the producer task is cancelled and the async generator closed.
+        '''
+        channel: queue.Queue[Any] = queue.Queue()
+
+        async def produce():
+            agen = None
+            try:
+                # agen_factory may do sync preprocess, run it on the loop too
+                agen = agen_factory()
+                async for item in agen:
+                    channel.put(item)
+                channel.put(_END)
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                channel.put(e)
+            finally:
+                if agen is not None and hasattr(agen, 'aclose'):
+                    await agen.aclose()
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self.loop)
+        try:
+            while True:
+                item = channel.get()
+                if item is _END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                if self._thread is not None:
+                    self._thread.join()
+                self._loop.close()
+                self._loop = None
+                self._thread = None
+
+_global_background_loop: Optional[BackgroundEventLoop] = None
+_global_background_loop_lock = threading.Lock()
+
+def get_background_loop() -> BackgroundEventLoop:
+    global _global_background_loop
+    with _global_background_loop_lock:
+        if _global_background_loop is None:
+            _global_background_loop = BackgroundEventLoop()
+        return _global_background_loop
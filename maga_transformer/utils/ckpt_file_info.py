@@ -1,14 +1,14 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 from pathlib import PosixPath
 import json
 import enum
 import os
+import mmap
 import logging
+import threading
 import torch
 import struct
-from safetensors import safe_open
 
-from maga_transformer.utils.time_util import Timer
 import maga_transformer.utils.meta_pickler as meta_pickler
 
 class CkptType(enum.Enum):
@@ -20,6 +20,32 @@ class FinetuneType(enum.Enum):
     lora = "lora"
     ptuning = "ptuning"
 
+SAFETENSORS_DTYPES: Dict[str, torch.dtype] = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+    "F8_E4M3": torch.float8_e4m3fn,
+    "F8_E5M2": torch.float8_e5m2,
+}
+# dtypes only in newer torch versions
+for _dtype_name, _torch_dtype_name in [("U16", "uint16"), ("U32", "uint32"), ("U64", "uint64"), ("F8_E8M0", "float8_e8m0fnu")]:
+    if hasattr(torch, _torch_dtype_name):
+        SAFETENSORS_DTYPES[_dtype_name] = getattr(torch, _torch_dtype_name)
+
+class TensorInfo(NamedTuple):
+    dtype: torch.dtype
+    shape: Tuple[int, ...]
+    # byte offset from the start of file
+    offset: int
+    nbytes: int
+
 
 class CkptFileInfo:
 
@@ -35,6 +61,12 @@ class CkptFileInfo:
     
 
     def __init__(self, file_name: str, finetune_type: FinetuneType = FinetuneType.pretrain) -> None:
+        self.tensor_infos: Dict[str, TensorInfo] = {}
+        self._read_order: Optional[Dict[str, int]] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._storage: Optional[torch.UntypedStorage] = None
+        self._record_offsets: Optional[Dict[str, int]] = None
+        self._mmap_lock = threading.Lock()
 
         if file_name.endswith(('.safetensors')):
             self.ckpt_type = CkptType.safetensors
@@ -50,6 +82,12 @@ class CkptFileInfo:
     def get_tensor_names(self) -> List[str]:
         return [name for name in self.metadata.keys()]
 
+    def has_tensor(self, name: str) -> bool:
+        return name in self.metadata
+
+    def get_tensor_info(self, name: str) -> TensorInfo:
+        return self.tensor_infos[name]
+
     @property
     def tensor_num(self) -> int:
         return len(self.metadata.keys())
@@ -62,7 +100,7 @@ class CkptFileInfo:
     def get_metadata(self) -> Dict[str, Any]:
         return self.metadata
 
-    def get_tensor_read_order(self, name: str) -> List[str]:
+    def get_tensor_read_order(self, name: str) -> int:
         """
         获取推荐的张量读取顺序，基于物理存储位置优化I/O效率
         
@@ -72,11 +110,11 @@ class CkptFileInfo:
         抛出:
             RuntimeError: 如果文件元数据未正确加载
         """
-        if not hasattr(self, '_sorted_tensor_cache'):
+        if self._read_order is None:
             # 延迟初始化排序缓存
-            self._sorted_tensor_cache = self._build_sorted_tensor_list()
-        
-        return self._sorted_tensor_cache.index(name)
+            self._read_order = {tensor: order for order, tensor in enumerate(self._build_sorted_tensor_list())}
+
+        return self._read_order[name]
     
     def _build_sorted_tensor_list(self) -> List[str]:
         """构建按物理存储位置排序的张量列表"""
@@ -111,13 +149,20 @@ class CkptFileInfo:
         # https://huggingface.co/docs/safetensors/metadata_parsing
         if self.is_safetensor():
             meta = {}
-            with safe_open(file, framework="pt") as f_:
-                with open(file, 'rb') as f:
-                    length_of_header = struct.unpack('<Q', f.read(8))[0]
-                    header = f.read(length_of_header)
-                    metadata = json.loads(header)
-                for key in f_.keys():
-                    meta[key] = metadata[key]['data_offsets'][0]
+            with open(file, 'rb') as f:
+                length_of_header = struct.unpack('<Q', f.read(8))[0]
+                header = f.read(length_of_header)
+                metadata = json.loads(header)
+            data_offset = 8 + length_of_header
+            for key, value in metadata.items():
+                if key == '__metadata__':
+                    continue
+                begin, end = value['data_offsets']
+                meta[key] = begin
+                if value['dtype'] not in SAFETENSORS_DTYPES:
+                    raise Exception(f"tensor {key} in {file} has dtype {value['dtype']} not supported by torch {torch.__version__}")
+                self.tensor_infos[key] = TensorInfo(SAFETENSORS_DTYPES[value['dtype']], tuple(value['shape']),
+                                                    data_offset + begin, end - begin)
             self.metadata = meta
         else:
             self.metadata = torch.load(file, pickle_module=meta_pickler)
@@ -125,57 +170,95 @@ class CkptFileInfo:
     def get_tensor_type(self, tensor_name: str) -> torch.dtype:
         file: str = self.file_name
         if self.is_safetensor():
-            with safe_open(file, framework="pt") as f:
-                if tensor_name not in f.keys():
-                    raise KeyError(f"Tensor '{tensor_name}' not found in the file")
-                tensor = f.get_tensor(tensor_name)
-                return tensor.dtype
+            if tensor_name not in self.tensor_infos:
+                raise KeyError(f"Tensor '{tensor_name}' not found in the file")
+            return self.tensor_infos[tensor_name].dtype
         else:
             data = torch.load(file, map_location="meta")
             if tensor_name not in data:
                 raise KeyError(f"Tensor '{tensor_name}' not found in the file")
             return data[tensor_name].dtype
 
-    def load_tensor(self, name: str, datatype: str = torch.float16) -> torch.Tensor:
-        path: str = self.file_name
+    def _get_mmap(self) -> mmap.mmap:
+        # mapped once and shared by all tensors of this file, private mapping keeps file untouched
+        if self._mmap is None:
+            with self._mmap_lock:
+                if self._mmap is None:
+                    with open(self.file_name, 'rb') as f:
+                        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        return self._mmap
+
+    def _get_storage(self) -> torch.UntypedStorage:
+        # torch checkpoint mapped once as a private mapping: clean pages come from the page cache,
+        # so ranks on the same host loading the same file share physical memory
+        if self._storage is None:
+            with self._mmap_lock:
+                if self._storage is None:
+                    path = self.file_name.as_posix() if isinstance(self.file_name, PosixPath) else self.file_name
+                    self._storage = torch.UntypedStorage.from_file(path, False, os.path.getsize(path))
+        return self._storage
+
+    def _get_record_offset(self, key: str) -> int:
+        # zip records of all storages are located with a single pass over the central directory
+        if self._record_offsets is None:
+            with self._mmap_lock:
+                if self._record_offsets is None:
+                    keys = {meta[0][2] for meta in self.metadata.values()}
+                    with open(self.file_name, 'rb') as f:
+                        with torch.serialization._open_zipfile_reader(f) as zip_file_reader:
+                            self._record_offsets = {k: zip_file_reader.get_record_offset('data/' + k) for k in keys}
+        return self._record_offsets[key]
+
+    def _prefetch(self, offset: int, nbytes: int) -> None:
+        # ask the kernel to read ahead the tensor bytes (e.g. from Fuse) instead of copying them through user space
+        if nbytes == 0 or not hasattr(os, 'posix_fadvise'):
+            return
+        fd = os.open(self.file_name, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, offset, nbytes, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+    def _storage_range(self, name: str) -> Tuple[int, int]:
+        storage_args = self.metadata[name][0]
+        n_bytes = storage_args[4] * torch._utils._element_size(storage_args[1].dtype)
+        return self._get_record_offset(storage_args[2]), n_bytes
+
+    def get_tensor_view(self, name: str) -> torch.Tensor:
+        '''
+        tensor in checkpoint dtype viewing the mapped file, only pages touched by the caller are read,
+        so a tp shard can be cut and converted without materializing the full tensor.
+        '''
         if self.is_safetensor():
-            with safe_open(path, framework="pt") as f:
-                return f.get_tensor(name).to(datatype)
-        else:
-            meta = self.metadata[name]
-            def __preload_tensor_content(file, tensor, meta, storage_offset):
-                tensor_offset = meta[1] * torch._utils._element_size(dtype)
-                tensor_bytes = tensor.numel() * torch._utils._element_size(dtype)
-                with Timer() as t:
-                    with open(file, 'rb') as f:
-                        f.seek(storage_offset + tensor_offset)
-                        f.read(tensor_bytes)
-            with open(path, 'rb') as f:
-                size = os.path.getsize(path)
-                if isinstance(path, PosixPath):
-                    path = path.as_posix()
-                overall_storage = torch.UntypedStorage.from_file(path, False, size)
-                with torch.serialization._open_zipfile_reader(f) as zip_file_reader:
-                    storage_args = meta[0]
-                    dtype = storage_args[1].dtype
-                    name = 'data/' + storage_args[2]
-                    n_elements = storage_args[4]
-                    n_bytes = n_elements * torch._utils._element_size(dtype)
-                    storage_offset = zip_file_reader.get_record_offset(name)
-                    storage = overall_storage[storage_offset:storage_offset + n_bytes]
-                    typed_storage = torch.storage.TypedStorage(
-                        wrap_storage=storage,
-                        dtype=dtype,
-                        _internal=True)
-                    tensor = torch._utils._rebuild_tensor_v2(typed_storage, *meta[1:])
-                    # preread tensor content to memory: avoid multi-thread read file (e.g. from Fuse) cause cache miss
-                    __preload_tensor_content(path, tensor, meta, storage_offset)
-                    tensor = tensor.contiguous().to(datatype)
-
-                    return tensor
-
-
-    def load_tensors(self, device: str = "cuda:0", direct_io=True):
+            info = self.tensor_infos[name]
+            if info.nbytes == 0:
+                return torch.empty(info.shape, dtype=info.dtype)
+            tensor = torch.frombuffer(self._get_mmap(), dtype=torch.uint8, count=info.nbytes, offset=info.offset)
+            return tensor.view(info.dtype).reshape(info.shape)
+        meta = self.metadata[name]
+        storage_offset, n_bytes = self._storage_range(name)
+        storage = self._get_storage()[storage_offset:storage_offset + n_bytes]
+        typed_storage = torch.storage.TypedStorage(wrap_storage=storage, dtype=meta[0][1].dtype, _internal=True)
+        return torch._utils._rebuild_tensor_v2(typed_storage, *meta[1:])
+
+    def load_tensor(self, name: str, datatype: Optional[torch.dtype] = torch.float16) -> torch.Tensor:
+        tensor = self.get_tensor_view(name)
+        if datatype is None:
+            return tensor
+        if self.is_safetensor():
+            # copy out of the mapping, so the returned tensor does not pin the file
+            return tensor.to(datatype, copy=True)
+        # whole tensor is needed: avoid multi-thread read file (e.g. from Fuse) cause cache miss
+        self._prefetch(*self._storage_range(name))
+        # single pass: layout and dtype are fixed in the same copy, no copy at all if neither changes
+        return tensor.to(datatype, memory_format=torch.contiguous_format)
+
+    def release(self) -> None:
+        # tensors viewing the mapping keep it alive, so it is unmapped once they are gone
+        self._mmap = None
+        self._storage = None
+
+    def load_tensors(self, device: str = "cuda:0", direct_io=True, prefix_list: Optional[Tuple[str, ...]] = None):
         file_path = os.path.abspath(self.file_name)
         if file_path.startswith(('/dev/shm', '/run/shm', '/sys/fs/cgroup')):
             logging.info(f"abs path : {file_path} cannot use direct_io")
@@ -194,7 +277,10 @@ class CkptFileInfo:
                 from safetensors.torch import load_file
                 return load_file(self.file_name, device=device)
         else:
-            return torch.load(self.file_name, map_location=torch.device(device))
+            # mapped instead of deserialized, only tensors matching prefix_list are read and moved to device
+            tensors = torch.load(self.file_name, map_location="cpu", mmap=True)
+            return {k: v.to(torch.device(device)) for k, v in tensors.items()
+                    if prefix_list is None or k.startswith(prefix_list)}
 
 
     def __lt__(self, other):
@@ -1,39 +1,48 @@
-from typing import AsyncGenerator, List, Callable, Any
+from typing import AsyncGenerator, Callable, Any
+
+class ResponseAggregator(object):
+    '''
+    folds each streamed response into the complete response as it passes,
+    so responses are not kept alive until the request ends.
+    '''
+    def add(self, response: Any) -> None:
+        raise NotImplementedError
+
+    def result(self) -> Any:
+        '''complete response of the responses added so far, does not change the aggregator'''
+        raise NotImplementedError
+
+class LastValueAggregator(ResponseAggregator):
+    def __init__(self):
+        self._response = None
+
+    def add(self, response: Any) -> None:
+        self._response = response
+
+    def result(self) -> Any:
+        return self._response
 
 class CompleteResponseAsyncGenerator:
-    def __init__(self, generator: AsyncGenerator, collect_complete_response_func: Callable):
+    def __init__(self, generator: AsyncGenerator, create_aggregator_func: Callable[[], ResponseAggregator]):
         self._generator = generator
-        self._collect_complete_response_func = collect_complete_response_func
-        self._all_responses = []
+        self._create_aggregator_func = create_aggregator_func
+        self._aggregator = create_aggregator_func()
 
     def __aiter__(self):
         return self
 
     async def __anext__(self):
-        try:
-            response = await self._generator.__anext__()
-            self._all_responses.append(response)
-            return response
-        except StopAsyncIteration:
-            raise
+        response = await self._generator.__anext__()
+        self._aggregator.add(response)
+        return response
 
     async def aclose(self):
         return await self._generator.aclose()
 
     async def gen_complete_response_once(self) -> Any:
-        return await self._collect_complete_response_func(CompleteResponseAsyncGenerator.generate_from_list(self._all_responses))
-
-    @staticmethod
-    async def generate_from_list(response_list) -> AsyncGenerator:
-        for response in response_list:
-            yield response
+        # built from the responses streamed so far on each call, may be called in the middle of the stream
+        return self._aggregator.result()
 
     @staticmethod
-    async def get_last_value(all_responses: AsyncGenerator):
-        response = None
-        try:
-            async for response in all_responses:
-                pass
-        except StopAsyncIteration:
-            pass
-        return response
\ No newline at end of file
+    def get_last_value() -> ResponseAggregator:
+        return LastValueAggregator()
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Set, Union, Optional, NamedTuple
+from typing import Any, Dict, List, Set, Tuple, Union, Optional, NamedTuple
 from pathlib import PosixPath, Path
 import json
 import os
@@ -20,6 +20,9 @@ class BaseDatabase:
     def load_tensor(self, name: str, datatype: Optional[torch.dtype] = torch.float16) -> List[torch.Tensor]:
         raise NotImplementedError
 
+    def release(self) -> None:
+        pass
+
     def get_tensor_order(self, name: str) -> List[int]:
         raise NotImplementedError
     
@@ -32,6 +35,8 @@ class CkptDatabase(BaseDatabase):
     PretrainFileList : List[CkptFileInfo]
     FinetuneFileList : List[CkptFileInfo]
     LoraCkpt: LoraCkpt
+    # tensor name -> files containing it, pretrain files first
+    _tensor_index: Optional[Dict[str, List[CkptFileInfo]]] = None
 
     finetune_type : FinetuneType
 
@@ -51,6 +56,8 @@ class CkptDatabase(BaseDatabase):
 
         self.load_ptuning_meta(ptuning_path)
 
+        self._build_tensor_index()
+
         logging.debug(f"CkptDatabase all tensor names = {self.get_pretrain_tensor_names()}")
 
     def load_hf_meta(self, path: str):
@@ -93,6 +100,18 @@ class CkptDatabase(BaseDatabase):
                 return True
         return False
 
+    def _build_tensor_index(self) -> Dict[str, List[CkptFileInfo]]:
+        tensor_index: Dict[str, List[CkptFileInfo]] = {}
+        for ckpt_file in self.PretrainFileList + self.FinetuneFileList:
+            for name in ckpt_file.get_metadata().keys():
+                tensor_index.setdefault(name, []).append(ckpt_file)
+        self._tensor_index = tensor_index
+        return tensor_index
+
+    def _get_ckpt_files(self, name: str) -> List[CkptFileInfo]:
+        tensor_index = self._tensor_index if self._tensor_index is not None else self._build_tensor_index()
+        return tensor_index.get(name, [])
+
     def get_pretrain_tensor_names(self) -> List[str]:
         tensor_names = []
         for ckptfile in self.PretrainFileList:
@@ -104,39 +123,24 @@ class CkptDatabase(BaseDatabase):
         return tensor_names
 
     def load_tensor(self, name: str, datatype: Optional[torch.dtype] = torch.float16) -> List[torch.Tensor]:
-        tensors = []
-        for ckpt_file in self.PretrainFileList:
-            if name in ckpt_file.get_tensor_names():
-                tensors.append(ckpt_file.load_tensor(name, datatype))
-        logging.debug(f"self.FinetuneFileList: {self.FinetuneFileList}, PretrainFileList: {self.PretrainFileList}")
-
-        for ckpt_file in self.FinetuneFileList:
-            logging.debug(f"load tensor {name} from {ckpt_file.file_name}")
-            if name in ckpt_file.get_tensor_names():
-                tensors.append(ckpt_file.load_tensor(name, datatype))
-
-        return tensors
-    
+        return [ckpt_file.load_tensor(name, datatype) for ckpt_file in self._get_ckpt_files(name)]
+
+    def release(self) -> None:
+        '''drops file mappings kept for loading, files are mapped again if tensors are loaded later'''
+        for ckpt_file in self.PretrainFileList + self.FinetuneFileList:
+            ckpt_file.release()
+
     def get_tensor_type(self, name: str) -> torch.dtype:
         return self.PretrainFileList[0].get_tensor_type(name)
 
     def get_tensor_order(self, name: str) -> List[int]:
-        orders = []
-        for ckpt_file in self.PretrainFileList:
-            if name in ckpt_file.get_tensor_names():
-                orders.append((ckpt_file.file_name, ckpt_file.get_tensor_read_order(name)))
-
-        for ckpt_file in self.FinetuneFileList:
-            if name in ckpt_file.get_tensor_names():
-                orders.append((ckpt_file.file_name, ckpt_file.get_tensor_read_order(name)))
-
-        return orders 
+        return [(ckpt_file.file_name, ckpt_file.get_tensor_read_order(name)) for ckpt_file in self._get_ckpt_files(name)]
 
     def load_tensors_by_prefix(self, prefix_list: List[str], device: str, direct_io: bool) -> dict[str, List[torch.Tensor]]:
         res = {}
         for ckptfile in self.PretrainFileList:
             if any(tensor.startswith(prefix_list) for tensor in ckptfile.get_tensor_names()):
-                tensors = ckptfile.load_tensors(device, direct_io)
+                tensors = ckptfile.load_tensors(device, direct_io, prefix_list)
                 for k, v in tensors.items():
                     if not k.startswith(prefix_list):
                         continue
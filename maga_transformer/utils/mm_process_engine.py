@@ -9,6 +9,7 @@ from concurrent.futures import ThreadPoolExecutor, Future
 from maga_transformer.utils.util import to_torch_dtype, check_with_info
 from maga_transformer.utils.multimodal_util import (vit_emb_cache_,
                                                     get_bytes_io_from_url,
+                                                    prefetch_urls,
                                                     MMUrlType,
                                                     MMPreprocessConfig)
 
@@ -33,6 +34,12 @@ class MMProcessEngine:
             return [tensor]
 
     def submit(self, urls: List[str], types: Optional[List[MMUrlType]] = None, tensors: Optional[List[torch.Tensor]] = None, preprocess_configs: Optional[List[List[int]]] = None):
+        # all urls of the request are downloaded concurrently, embedding waits for each one when it gets there
+        fetch_urls = [url for index, url in enumerate(urls) if not types or types[index] != MMUrlType.TENSOR]
+        with prefetch_urls(fetch_urls):
+            return self._submit(urls, types, tensors, preprocess_configs)
+
+    def _submit(self, urls: List[str], types: Optional[List[MMUrlType]] = None, tensors: Optional[List[torch.Tensor]] = None, preprocess_configs: Optional[List[List[int]]] = None):
         if self.run_batch:
             res, pos = self.model.mm_part.mm_embedding(urls, types, tensors)
             return MMEmbeddingRes(res, pos)
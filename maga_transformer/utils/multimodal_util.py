@@ -1,16 +1,30 @@
 import os
 import torch
 import json
+import hashlib
+import logging
 import requests
 import threading
 from enum import IntEnum
 from io import BytesIO
-from typing import Any, Callable, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from requests.adapters import HTTPAdapter
 from PIL import Image
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, astuple
 
-from maga_transformer.utils.lru_dict import LruDict
 from maga_transformer.utils.oss_util import get_bytes_io_from_oss_path
+from maga_transformer.metrics import kmonitor, AccMetrics
+
+try:
+    import xxhash
+    def _content_hash(data: Union[bytes, memoryview]) -> bytes:
+        return xxhash.xxh3_128_digest(data)
+except ModuleNotFoundError:
+    def _content_hash(data: Union[bytes, memoryview]) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
 
 if os.environ.get('DOWNLOAD_HEADERS', '') != '':
     HTTP_HEADS = json.loads(os.environ['DOWNLOAD_HEADERS'])
@@ -56,52 +70,173 @@ def get_vit_compute_dtype(dtype: str):
     else:
         return torch.half
 
-def get_bytes_io_from_url(url: str):
-    cached_res = url_data_cache_.check_cache(url)
-    if cached_res is None:
-        try:
-            if url.startswith("http") or url.startswith("https"):
-                response = requests.get(url, stream=True, headers=HTTP_HEADS, timeout=10)
-                if response.status_code == 200:
-                    res = BytesIO(response.content)
-                else:
-                    raise Exception(f'download failed, error code: {response.status_code}')
-            elif url.startswith("oss"):
-                res = get_bytes_io_from_oss_path(url)
+MM_DOWNLOAD_TIMEOUT = float(os.environ.get('MM_DOWNLOAD_TIMEOUT', '10'))
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+def _get_http_session() -> requests.Session:
+    '''session shared by all downloads: keep-alive connections, at most MM_HTTP_MAX_CONN_PER_HOST per host'''
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=int(os.environ.get('MM_HTTP_POOL_HOSTS', '16')),
+                                  pool_maxsize=int(os.environ.get('MM_HTTP_MAX_CONN_PER_HOST', '8')),
+                                  pool_block=True)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(HTTP_HEADS)
+            _http_session = session
+        return _http_session
+
+def _download_url(url: str) -> bytes:
+    try:
+        if url.startswith("http"):
+            response = _get_http_session().get(url, timeout=MM_DOWNLOAD_TIMEOUT)
+            if response.status_code == 200:
+                return response.content
             else:
-                # treat url as local path
-                with open(url, "rb") as fh:
-                    buf = BytesIO(fh.read())
-                res = buf
-        except Exception as e:
-            raise Exception(f"download and load {url} error, exception {e}")
-        url_data_cache_.insert_cache(url, res)
-        return res
-    else:
-        cached_res.seek(0)
-        return cached_res
-
-class MMDataCache(object):
-    def __init__(self, cache_size: int = 10):
-        self.mm_data_cache: Optional[LruDict] = None
-        self.cache_lock = threading.Lock()
-        if cache_size > 0:
-            self.mm_data_cache = LruDict(cache_size)
-
-    def check_cache(self, url: str):
-        if self.mm_data_cache == None:
+                raise Exception(f'download failed, error code: {response.status_code}')
+        elif url.startswith("oss"):
+            return get_bytes_io_from_oss_path(url).getvalue()
+        else:
+            # treat url as local path
+            with open(url, "rb") as fh:
+                return fh.read()
+    except Exception as e:
+        raise Exception(f"download and load {url} error, exception {e}")
+
+def _fetch_url(url: str) -> bytes:
+    data = _download_url(url)
+    url_data_cache_.insert_cache(url, data)
+    return data
+
+_fetch_executor = ThreadPoolExecutor(int(os.environ.get('MM_DOWNLOAD_THREADS', '16')), thread_name_prefix='mm_download')
+# downloads started by prefetch_urls, by url
+_pending_fetches: Dict[str, Future] = {}
+_pending_fetches_lock = threading.Lock()
+
+@contextmanager
+def prefetch_urls(urls: List[str]):
+    '''
+    download urls concurrently while the block runs, get_bytes_io_from_url waits for them
+    instead of downloading one after another.
+    '''
+    started: List[str] = []
+    with _pending_fetches_lock:
+        for url in urls:
+            if not url or url in _pending_fetches or url_data_cache_.check_cache(url) is not None:
+                continue
+            _pending_fetches[url] = _fetch_executor.submit(_fetch_url, url)
+            started.append(url)
+    try:
+        yield
+    finally:
+        with _pending_fetches_lock:
+            for url in started:
+                _pending_fetches.pop(url, None)
+
+def get_bytes_io_from_url(url: str):
+    data = url_data_cache_.check_cache(url)
+    if data is None:
+        with _pending_fetches_lock:
+            future = _pending_fetches.get(url)
+        data = future.result() if future is not None else _fetch_url(url)
+    return BytesIO(data)
+
+class UrlDataCache(object):
+    '''downloaded data by url, least recently used entries are evicted to keep the total under max_bytes'''
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_cache(self, url: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._cache.get(url)
+            if data is not None:
+                self._cache.move_to_end(url)
+            return data
+
+    def insert_cache(self, url: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._cache.pop(url, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            self._cache[url] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+def _features_bytes(features: Any) -> int:
+    if isinstance(features, torch.Tensor):
+        return features.nelement() * features.element_size()
+    if isinstance(features, (tuple, list)):
+        return sum(_features_bytes(item) for item in features)
+    return 0
+
+class MMEmbeddingCache(object):
+    '''
+    vit embeddings keyed by the content of the downloaded data with mm type and preprocess config, so the same
+    image behind different urls (signed links, cdn query strings) hits, and the same url preprocessed with
+    another config misses. least recently used entries are evicted to keep the total under max_bytes.
+    '''
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._cache: OrderedDict[bytes, Tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def cache_key(data: Union[bytes, memoryview], mm_type: MMUrlType, config: Optional[MMPreprocessConfig] = None) -> bytes:
+        config_values = astuple(config) if config is not None else ()
+        return _content_hash(data) + repr((int(mm_type), config_values)).encode()
+
+    def check_cache(self, key: bytes) -> Optional[Any]:
+        if not self.enabled:
             return None
-        with self.cache_lock:
-            if url in self.mm_data_cache:
-                return self.mm_data_cache[url]
-            else:
-                return None
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+        kmonitor.report(AccMetrics.VIT_CACHE_HIT_QPS_METRIC if entry is not None else AccMetrics.VIT_CACHE_MISS_QPS_METRIC, 1)
+        return entry[0] if entry is not None else None
 
-    def insert_cache(self, url: str, features: torch.Tensor):
-        if self.mm_data_cache == None:
+    def insert_cache(self, key: bytes, features: Any):
+        size = _features_bytes(features)
+        if not self.enabled or size > self.max_bytes:
             return
-        with self.cache_lock:
-            self.mm_data_cache[url] = features
+        evicted_num = 0
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._cache[key] = (features, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self.total_bytes -= evicted_size
+                evicted_num += 1
+        if evicted_num:
+            kmonitor.report(AccMetrics.VIT_CACHE_EVICT_QPS_METRIC, evicted_num)
+
+def _vit_emb_cache_bytes() -> int:
+    if 'MM_EMBEDDING_CACHE_BYTES' in os.environ:
+        return int(os.environ['MM_EMBEDDING_CACHE_BYTES'])
+    if int(os.environ.get('MM_CACHE_ITEM_NUM', '0')) > 0:
+        # cache size is bounded by bytes now, MM_CACHE_ITEM_NUM only turns it on
+        logging.warning("MM_CACHE_ITEM_NUM is deprecated, use MM_EMBEDDING_CACHE_BYTES, default 1GB is used")
+        return 1024 * 1024 * 1024
+    return 0
 
-vit_emb_cache_ = MMDataCache(int(os.environ.get('MM_CACHE_ITEM_NUM', '0')))
-url_data_cache_ = MMDataCache(100)
+vit_emb_cache_ = MMEmbeddingCache(_vit_emb_cache_bytes())
+url_data_cache_ = UrlDataCache(int(os.environ.get('MM_URL_CACHE_BYTES', str(512 * 1024 * 1024))))
@@ -0,0 +1,233 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from maga_transformer.metrics import kmonitor, AccMetrics
+
+class PromptTokenCache(object):
+    '''
+    token ids of prompt prefixes, shared by requests repeating a system prompt or tool schema, and by
+    conversations that only append turns.
+    prompts are cut into blocks right before special tokens: tokenizers split text at special tokens before
+    tokenizing, so the ids of a prompt are the ids of its blocks concatenated. each block is stored under a hash
+    of the whole prompt up to its end, a prompt only tokenizes the text after its longest cached prefix.
+    blocks are evicted least recently used beyond `max_tokens`. the first `verify_count` prompts and then one in
+    every `verify_interval` are also tokenized as a whole, the cache is disabled once they differ.
+    '''
+    def __init__(self,
+                 encode_func: Callable[[str], List[int]],
+                 special_tokens: Dict[str, int],
+                 max_tokens: int,
+                 wrap_func: Optional[Callable[[List[int]], List[int]]] = None,
+                 full_encode_func: Optional[Callable[[str], List[int]]] = None,
+                 verify_count: int = 8,
+                 verify_interval: int = 100):
+        # encode_func tokenizes a block without adding bos/eos, wrap_func adds them to the prompt ids
+        self.encode_func = encode_func
+        self.wrap_func = wrap_func
+        self.full_encode_func = full_encode_func
+        self.max_tokens = max_tokens
+        self.verify_count = verify_count if full_encode_func is not None else 0
+        self.verify_interval = verify_interval if full_encode_func is not None else 0
+        self._encode_num = 0
+        self.enabled = len(special_tokens) > 0
+        self._special_ids = set(special_tokens.values())
+        # longest first, as tokenizers match special tokens
+        self._pattern = re.compile('|'.join(
+            re.escape(token) for token in sorted(special_tokens.keys(), key=len, reverse=True))) if self.enabled else None
+        self._blocks: OrderedDict[bytes, array] = OrderedDict()
+        self._token_num = 0
+        self._lock = threading.Lock()
+
+    def _wrap(self, ids: List[int]) -> List[int]:
+        return self.wrap_func(ids) if self.wrap_func is not None else ids
+
+    def encode(self, text: str) -> Tuple[List[int], int]:
+        '''token ids of text and the number of them taken from cache'''
+        if not self.enabled:
+            return self._wrap(self.encode_func(text)), 0
+        starts = [match.start() for match in self._pattern.finditer(text)]
+        boundaries = [start for start in starts if start > 0]
+        keys = _prefix_hashes(text, boundaries)
+
+        ids: List[int] = []
+        hit = 0
+        with self._lock:
+            for key in keys:
+                block = self._blocks.get(key)
+                if block is None:
+                    break
+                self._blocks.move_to_end(key)
+                ids.extend(block)
+                hit += 1
+        cached_length = len(ids)
+        start = boundaries[hit - 1] if hit else 0
+        suffix_ids = self.encode_func(text[start:])
+        self._store(keys[hit:], boundaries[hit:], start, starts, suffix_ids)
+        ids.extend(suffix_ids)
+        ids = self._wrap(ids)
+
+        if self._should_verify():
+            expected = self.full_encode_func(text)
+            if expected != ids:
+                logging.warning(f"prompt token cache disabled: prefix tokenization differs from tokenizing the whole prompt")
+                with self._lock:
+                    self.enabled = False
+                    self._blocks.clear()
+                    self._token_num = 0
+                return expected, 0
+        return ids, cached_length
+
+    def _should_verify(self) -> bool:
+        with self._lock:
+            self._encode_num += 1
+            if self.verify_count > 0:
+                self.verify_count -= 1
+                return True
+            return self.verify_interval > 0 and self._encode_num % self.verify_interval == 0
+
+    def _store(self, keys: Sequence[bytes], boundaries: Sequence[int], start: int,
+               starts: Sequence[int], suffix_ids: List[int]) -> None:
+        if not keys or self.max_tokens <= 0:
+            return
+        # each special token in the suffix text is exactly one special id in suffix_ids
+        special_positions = [i for i, id in enumerate(suffix_ids) if id in self._special_ids]
+        special_starts = [pos for pos in starts if pos >= start]
+        if len(special_positions) != len(special_starts):
+            logging.debug(f"special tokens of prompt do not match, skip caching")
+            return
+        id_index = dict(zip(special_starts, special_positions))
+        begin = id_index.get(start, 0)
+        with self._lock:
+            for key, boundary in zip(keys, boundaries):
+                end = id_index[boundary]
+                if key not in self._blocks:
+                    block = array('l', suffix_ids[begin:end])
+                    self._blocks[key] = block
+                    self._token_num += len(block)
+                begin = end
+            while self._token_num > self.max_tokens and self._blocks:
+                _, block = self._blocks.popitem(last=False)
+                self._token_num -= len(block)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+            self._token_num = 0
+
+    @property
+    def token_num(self) -> int:
+        return self._token_num
+
+def _prefix_hashes(text: str, boundaries: Sequence[int]) -> List[bytes]:
+    hasher = hashlib.blake2b(digest_size=16)
+    keys: List[bytes] = []
+    prev = 0
+    for boundary in boundaries:
+        hasher.update(text[prev:boundary].encode('utf-8', errors='surrogatepass'))
+        keys.append(hasher.copy().digest())
+        prev = boundary
+    return keys
+
+def _special_tokens(tokenizer: Any) -> Dict[str, int]:
+    '''special token strings of tokenizer with their ids'''
+    tokens: Dict[str, int] = {}
+    for token in getattr(tokenizer, 'all_special_tokens', None) or []:
+        tokens[token] = tokenizer.convert_tokens_to_ids(token)
+    for id, token in (getattr(tokenizer, 'added_tokens_decoder', None) or {}).items():
+        if getattr(token, 'special', False):
+            tokens[str(token)] = id
+    for id, token in (getattr(tokenizer, 'added_tokens_decoder', None) or {}).items():
+        # lstrip tokens take the whitespace before them, prompts can not be cut right before them
+        if getattr(token, 'lstrip', False):
+            tokens.pop(str(token), None)
+    # tiktoken based tokenizers (qwen) keep special tokens in a dict
+    special_tokens = getattr(tokenizer, 'special_tokens', None)
+    if isinstance(special_tokens, dict):
+        for token, id in special_tokens.items():
+            tokens.setdefault(token, id)
+    return {token: id for token, id in tokens.items() if isinstance(token, str) and token and isinstance(id, int)}
+
+def create_prompt_token_cache(tokenizer: Any) -> Optional[PromptTokenCache]:
+    max_tokens = int(os.environ.get('PROMPT_TOKEN_CACHE_MAX_TOKENS', 2 * 1024 * 1024))
+    if max_tokens <= 0:
+        return None
+    try:
+        special_tokens = _special_tokens(tokenizer)
+    except Exception as e:
+        logging.warning(f"failed to get special tokens of tokenizer {type(tokenizer)}: {e}, prompt token cache disabled")
+        return None
+    if not special_tokens:
+        return None
+    wrap_func = getattr(tokenizer, 'build_inputs_with_special_tokens', None)
+    return PromptTokenCache(
+        encode_func=lambda text: tokenizer.encode(text, add_special_tokens=False),
+        special_tokens=special_tokens,
+        max_tokens=max_tokens,
+        wrap_func=wrap_func,
+        full_encode_func=tokenizer.encode,
+        verify_count=int(os.environ.get('PROMPT_TOKEN_CACHE_VERIFY_COUNT', 8)),
+        verify_interval=int(os.environ.get('PROMPT_TOKEN_CACHE_VERIFY_INTERVAL', 100)))
+
+class CachedEncodeTokenizer(object):
+    '''
+    tokenizer proxy memoizing `encode` of prompt segments, for renderers tokenizing a prompt piece by piece
+    (system prompt, each turn). other attributes are forwarded to the wrapped tokenizer.
+    '''
+    def __init__(self, tokenizer: Any, max_tokens: int):
+        self._tokenizer = tokenizer
+        self._max_tokens = max_tokens
+        self._cache: OrderedDict[Tuple[Any, ...], List[int]] = OrderedDict()
+        self._token_num = 0
+        self._lock = threading.Lock()
+        self.hit_tokens = 0
+        self.encoded_tokens = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._tokenizer, name)
+
+    def encode(self, text: str, **kwargs: Any) -> List[int]:
+        try:
+            key = (text,) + tuple(sorted((k, v if not isinstance(v, (set, list)) else tuple(sorted(v)))
+                                         for k, v in kwargs.items()))
+            hash(key)
+        except TypeError:
+            return self._report(self._tokenizer.encode(text, **kwargs), False)
+        with self._lock:
+            ids = self._cache.get(key)
+            if ids is not None:
+                self._cache.move_to_end(key)
+                ids = list(ids)
+        if ids is not None:
+            return self._report(ids, True)
+        ids = self._tokenizer.encode(text, **kwargs)
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = list(ids)
+                self._token_num += len(ids)
+            while self._token_num > self._max_tokens and self._cache:
+                _, evicted = self._cache.popitem(last=False)
+                self._token_num -= len(evicted)
+        return self._report(ids, False)
+
+    def _report(self, ids: List[int], hit: bool) -> List[int]:
+        # hit rate of the segment cache is hit tokens / encoded tokens
+        with self._lock:
+            self.encoded_tokens += len(ids)
+            if hit:
+                self.hit_tokens += len(ids)
+        kmonitor.report(AccMetrics.PROMPT_SEGMENT_ENCODE_TOKEN_METRIC, len(ids))
+        if hit:
+            kmonitor.report(AccMetrics.PROMPT_SEGMENT_CACHE_HIT_TOKEN_METRIC, len(ids))
+        return ids
+
+def create_cached_encode_tokenizer(tokenizer: Any) -> Any:
+    max_tokens = int(os.environ.get('PROMPT_TOKEN_CACHE_MAX_TOKENS', 2 * 1024 * 1024))
+    if max_tokens <= 0:
+        return tokenizer
+    return CachedEncodeTokenizer(tokenizer, max_tokens)
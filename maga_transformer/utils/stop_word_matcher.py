@@ -0,0 +1,239 @@
+import functools
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+StopWord = Union[str, Sequence[int]]
+
+class StopWordAutomaton(object):
+    '''
+    aho-corasick automaton over a set of stop words, works on both str and token id sequences.
+    compiled once per stop word set (see `get_stop_word_automaton`) and shared by all streams.
+    any stop word or stop word prefix ending a sequence lies within its last `max_len` symbols,
+    so suffix queries only scan that tail, independent of text length and stop word count.
+    '''
+    def __init__(self, stop_words: Sequence[StopWord]):
+        self.stop_words = list(stop_words)
+        self.max_len = max([len(word) for word in self.stop_words], default=0)
+        self._goto: List[Dict[Any, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._depth: List[int] = [0]
+        # index in `stop_words` of the first stop word ending exactly at node, -1 if none
+        self._word: List[int] = [-1]
+        # nearest node on the fail chain (node itself included) that ends a stop word
+        self._out: List[int] = [0]
+        # length of the longest stop word that is a suffix of node
+        self._longest: List[int] = [0]
+        for index, word in enumerate(self.stop_words):
+            if len(word) == 0:
+                continue
+            node = 0
+            for symbol in word:
+                next_node = self._goto[node].get(symbol)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][symbol] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._depth.append(self._depth[node] + 1)
+                    self._word.append(-1)
+                    self._out.append(0)
+                    self._longest.append(0)
+                node = next_node
+            if self._word[node] < 0:
+                self._word[node] = index
+        self._build_fail()
+
+    def _build_fail(self) -> None:
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for symbol, child in self._goto[node].items():
+                if node != 0:
+                    self._fail[child] = self._step(self._fail[node], symbol)
+                fail = self._fail[child]
+                if self._word[child] >= 0:
+                    self._out[child] = child
+                    self._longest[child] = self._depth[child]
+                else:
+                    self._out[child] = self._out[fail]
+                    self._longest[child] = self._longest[fail]
+                queue.append(child)
+
+    def _step(self, state: int, symbol: Any) -> int:
+        goto = self._goto
+        while state and symbol not in goto[state]:
+            state = self._fail[state]
+        return goto[state].get(symbol, 0)
+
+    def _scan_tail(self, seq: Sequence[Any]) -> int:
+        state = 0
+        for symbol in seq[-self.max_len:]:
+            state = self._step(state, symbol)
+        return state
+
+    def __len__(self) -> int:
+        return len(self.stop_words)
+
+    def depth(self, state: int) -> int:
+        return self._depth[state]
+
+    def find(self, seq: Sequence[Any]) -> int:
+        '''start index of the earliest stop word in seq, -1 if none'''
+        if not self.max_len:
+            return -1
+        state = 0
+        first = -1
+        for i, symbol in enumerate(seq):
+            # stop words ending from here on start after `first`
+            if first >= 0 and i >= first + self.max_len:
+                break
+            state = self._step(state, symbol)
+            if self._longest[state]:
+                start = i - self._longest[state] + 1
+                if first < 0 or start < first:
+                    first = start
+        return first
+
+    def match_suffix_length(self, seq: Sequence[Any]) -> int:
+        '''length of the stop word seq ends with (first one in list order if several), 0 if none'''
+        if not self.max_len:
+            return 0
+        node = self._out[self._scan_tail(seq)]
+        best = 0
+        while node:
+            if not best or self._word[node] < self._word[best]:
+                best = node
+            node = self._out[self._fail[node]]
+        return self._depth[best]
+
+    def partial_suffix_length(self, seq: Sequence[Any]) -> int:
+        '''length of the longest suffix of seq that is a (possibly complete) prefix of some stop word'''
+        if not self.max_len:
+            return 0
+        return self._depth[self._scan_tail(seq)]
+
+    def truncate(self, seq: Sequence[Any], is_streaming: bool = True, partial: bool = False) -> Sequence[Any]:
+        '''
+        streaming: strip the stop word (or with `partial`, the stop word prefix) seq ends with.
+        non streaming: cut seq at the earliest stop word, with `partial` also hold back a trailing prefix.
+        '''
+        if is_streaming:
+            if partial:
+                length = self.partial_suffix_length(seq)
+            else:
+                length = self.match_suffix_length(seq)
+            return seq[:len(seq) - length]
+        index = self.find(seq)
+        if index >= 0:
+            return seq[:index]
+        if partial:
+            return seq[:len(seq) - self.partial_suffix_length(seq)]
+        return seq
+
+    def is_truncated(self, seq: Sequence[Any], is_streaming: bool = True, partial: bool = False) -> bool:
+        return len(seq) > 0 and len(self.truncate(seq, is_streaming, partial)) != len(seq)
+
+class StopWordMatcher(object):
+    '''
+    per-stream matching state over an append-only str or token id stream.
+    each call only scans the symbols appended since the previous one.
+    '''
+    def __init__(self, automaton: StopWordAutomaton):
+        self.automaton = automaton
+        self.state = 0
+        self.length = 0
+        # start index (in stream coordinates) of the first completed stop word, -1 if none
+        self.stop_index = -1
+        # last `max_len` symbols fed
+        self._context: Optional[Sequence[Any]] = None
+
+    @property
+    def hold_length(self) -> int:
+        '''number of trailing symbols that may still grow into a stop word'''
+        return self.automaton.depth(self.state)
+
+    def feed(self, delta: Sequence[Any]) -> int:
+        automaton = self.automaton
+        if not automaton.max_len or self.stop_index >= 0:
+            self.length += len(delta)
+            return self.stop_index
+        state = self.state
+        longest = automaton._longest
+        # earliest start relative to delta, negative if the stop word begins in a previous delta
+        first: Optional[int] = None
+        for i, symbol in enumerate(delta):
+            # like `StopWordAutomaton.find`, stop words ending from here on start after `first`
+            if first is not None and i >= first + automaton.max_len:
+                break
+            state = automaton._step(state, symbol)
+            if longest[state]:
+                start = i + 1 - longest[state]
+                if first is None or start < first:
+                    first = start
+        if first is not None:
+            self.stop_index = self.length + first
+        self.state = state
+        self.length += len(delta)
+        context = delta if self._context is None else self._context + delta
+        self._context = context[-automaton.max_len:]
+        return self.stop_index
+
+    def update(self, seq: Sequence[Any]) -> int:
+        '''
+        seq is the whole stream so far. matching state only depends on the last `max_len` symbols,
+        if those were rewritten (e.g. a trailing incomplete char decoded again), rescan the tail of seq.
+        '''
+        if self._context is not None and \
+                (len(seq) < self.length or seq[self.length - len(self._context):self.length] != self._context):
+            self.state = 0
+            self.length = max(len(seq) - self.automaton.max_len, 0)
+            self._context = None
+        return self.feed(seq[self.length:])
+
+def _to_key(stop_words: Sequence[StopWord]) -> Tuple[Any, ...]:
+    return tuple(word if isinstance(word, str) else tuple(word) for word in stop_words)
+
+@functools.lru_cache(maxsize=256)
+def _compile(key: Tuple[Any, ...]) -> StopWordAutomaton:
+    return StopWordAutomaton(key)
+
+def get_stop_word_automaton(stop_words: Sequence[StopWord]) -> StopWordAutomaton:
+    '''compiled automaton for stop_words, shared by requests with the same stop word list'''
+    return _compile(_to_key(stop_words))
+
+class StopWordIdsTable(object):
+    '''
+    stop word id sequences compiled once for per-step checks on a growing output.
+    `is_stopped` walks the automaton over the last `max_len` ids, `remove_stop_word_ids` only
+    compares the stop word prefixes ending with the last id, in most steps none does.
+    '''
+    def __init__(self, stop_word_ids_list: Sequence[Sequence[int]]):
+        self.stop_word_ids_list = [list(stop_word_ids) for stop_word_ids in stop_word_ids_list]
+        self.automaton = get_stop_word_automaton(self.stop_word_ids_list)
+        # per stop word: last id -> lengths (longest first) of the prefixes that may end with it
+        self._prefix_lengths: List[Dict[int, List[int]]] = []
+        for stop_word_ids in self.stop_word_ids_list:
+            prefix_lengths: Dict[int, List[int]] = {}
+            if stop_word_ids:
+                # a slice one longer than the stop word matches only an output equal to the whole stop word
+                prefix_lengths[stop_word_ids[-1]] = [len(stop_word_ids) + 1]
+            for i in range(len(stop_word_ids), 1, -1):
+                prefix_lengths.setdefault(stop_word_ids[i - 1], []).append(i)
+            self._prefix_lengths.append(prefix_lengths)
+        self._last_ids = set(id for prefix_lengths in self._prefix_lengths for id in prefix_lengths)
+
+    def is_stopped(self, token_ids: Sequence[int]) -> bool:
+        return self.automaton.match_suffix_length(token_ids) > 0
+
+    def remove_stop_word_ids(self, output_ids: List[int]) -> List[int]:
+        '''for each stop word in turn, strip the longest prefix (at least 2 ids) of it that output_ids ends with'''
+        if not output_ids or output_ids[-1] not in self._last_ids:
+            return output_ids
+        for stop_word_ids, prefix_lengths in zip(self.stop_word_ids_list, self._prefix_lengths):
+            if not output_ids:
+                break
+            for i in prefix_lengths.get(output_ids[-1], []):
+                if output_ids[-i:] == stop_word_ids[:i]:
+                    output_ids = output_ids[:-i]
+                    break
+        return output_ids
@@ -0,0 +1,79 @@
+import asyncio
+from unittest import TestCase, main
+
+from aiohttp import web
+
+from maga_transformer.utils.async_http_client import AsyncHttpClient, BackendResponse
+
+class AsyncHttpClientTest(TestCase):
+    @staticmethod
+    async def _start_server() -> web.AppRunner:
+        async def echo(request: web.Request) -> web.Response:
+            return web.json_response({"method": request.method, "req": await request.json()})
+        async def text(request: web.Request) -> web.Response:
+            return web.Response(text="not json", status=500)
+        app = web.Application()
+        app.router.add_route('*', '/echo', echo)
+        app.router.add_post('/text', text)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, 'localhost', 0)
+        await site.start()
+        return runner
+
+    def _run(self, func, client: AsyncHttpClient):
+        async def run():
+            runner = await self._start_server()
+            port = runner.addresses[0][1]
+            try:
+                return await func(f'http://localhost:{port}')
+            finally:
+                await client.close()
+                await runner.cleanup()
+        return asyncio.run(run())
+
+    def test_request(self):
+        client = AsyncHttpClient()
+        async def func(url: str):
+            self.assertEqual(await client.request('get', f'{url}/echo', {"a": 1}), {"method": "GET", "req": {"a": 1}})
+            self.assertEqual(await client.request('post', f'{url}/echo', {}), {"method": "POST", "req": {}})
+            with self.assertRaises(ValueError):
+                await client.request('post', f'{url}/text', {})
+        self._run(func, client)
+
+    def test_request_raw(self):
+        client = AsyncHttpClient()
+        async def func(url: str):
+            response = await client.request_raw('post', f'{url}/echo', {"a": [1, 2]})
+            self.assertIsInstance(response, BackendResponse)
+            self.assertEqual(response.status, 200)
+            self.assertTrue(response.content_type.startswith('application/json'))
+            self.assertEqual(response.body, b'{"method": "POST", "req": {"a": [1, 2]}}')
+            response = await client.request_raw('post', f'{url}/text', {})
+            self.assertEqual((response.status, response.body), (500, b'not json'))
+        self._run(func, client)
+
+    def test_connection_released(self):
+        # one connection in the pool: every request waits for the previous one to give it back
+        client = AsyncHttpClient(limit=1)
+        async def func(url: str):
+            for _ in range(3):
+                await asyncio.wait_for(client.request_raw('post', f'{url}/echo', {}), 5)
+                await asyncio.wait_for(client.request_raw('post', f'{url}/text', {}), 5)
+                await asyncio.wait_for(client.request('post', f'{url}/echo', {}), 5)
+        self._run(func, client)
+
+    def test_new_event_loop(self):
+        client = AsyncHttpClient()
+        sessions = []
+        async def func(url: str):
+            await client.request('post', f'{url}/echo', {})
+            sessions.append(client._session)
+            await client.request('post', f'{url}/echo', {})
+            self.assertIs(client._session, sessions[-1])
+        self._run(func, client)
+        self._run(func, client)
+        self.assertIsNot(sessions[0], sessions[1])
+
+if __name__ == '__main__':
+    main()
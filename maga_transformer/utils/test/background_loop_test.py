@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, main
+
+from maga_transformer.utils.background_loop import BackgroundEventLoop
+
+
+class BackgroundEventLoopTest(TestCase):
+    def setUp(self):
+        self.background_loop = BackgroundEventLoop()
+
+    def tearDown(self):
+        self.background_loop.close()
+
+    def test_iterate(self):
+        async def gen(n):
+            for i in range(n):
+                await asyncio.sleep(0)
+                yield i
+        self.assertEqual(list(self.background_loop.iterate(lambda: gen(5))), list(range(5)))
+        self.assertEqual(list(self.background_loop.iterate(lambda: gen(0))), [])
+
+    def test_exception(self):
+        async def gen():
+            yield 1
+            raise ValueError("bad request")
+        it = self.background_loop.iterate(gen)
+        self.assertEqual(next(it), 1)
+        with self.assertRaises(ValueError):
+            next(it)
+
+        def factory():
+            raise ValueError("bad prompt")
+        with self.assertRaises(ValueError):
+            list(self.background_loop.iterate(factory))
+
+    def test_cancel_when_consumer_stops(self):
+        closed = threading.Event()
+        async def gen():
+            try:
+                i = 0
+                while True:
+                    yield i
+                    i += 1
+                    await asyncio.sleep(0.001)
+            finally:
+                closed.set()
+        it = self.background_loop.iterate(gen)
+        self.assertEqual(next(it), 0)
+        it.close()
+        self.assertTrue(closed.wait(5))
+
+    def test_shared_loop(self):
+        loops = set()
+        async def gen():
+            loops.add(id(asyncio.get_running_loop()))
+            await asyncio.sleep(0.01)
+            yield threading.current_thread().name
+
+        thread_num = threading.active_count()
+        with ThreadPoolExecutor(32) as executor:
+            names = list(executor.map(lambda _: list(self.background_loop.iterate(gen)), range(256)))
+        self.assertEqual(len(loops), 1)
+        self.assertEqual(set(name for result in names for name in result), {'background_event_loop'})
+        # only the loop thread is added, no thread per call
+        self.assertLessEqual(threading.active_count(), thread_num + 1)
+
+    def test_handover(self):
+        loop = self.background_loop.loop
+        acks = []
+        async def gen():
+            for i in range(100):
+                acks.append(asyncio.Event())
+                yield i
+                # next item only after the consumer got this one
+                await acks[i].wait()
+        received = []
+        for item in self.background_loop.iterate(gen):
+            received.append(item)
+            loop.call_soon_threadsafe(acks[item].set)
+        self.assertEqual(received, list(range(100)))
+
+
+if __name__ == '__main__':
+    main()
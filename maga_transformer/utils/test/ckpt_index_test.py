@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from unittest import TestCase, main, mock
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+from maga_transformer.utils.database import CkptDatabase
+from maga_transformer.utils.ckpt_file_info import CkptFileInfo
+
+
+def create_sharded_ckpt(path: str, shard_num: int, tensor_num_per_shard: int):
+    weight_map = {}
+    tensors = {}
+    for shard in range(shard_num):
+        shard_tensors = {}
+        for i in range(tensor_num_per_shard):
+            name = f"model.layers.{shard}.experts.{i}.weight"
+            dtype = torch.bfloat16 if i % 3 == 0 else torch.float32
+            shard_tensors[name] = torch.randn(4, i % 5 + 1).to(dtype)
+        file_name = f"model-{shard:05d}-of-{shard_num:05d}.safetensors"
+        save_file(shard_tensors, os.path.join(path, file_name))
+        weight_map.update({name: file_name for name in shard_tensors})
+        tensors.update(shard_tensors)
+    with open(os.path.join(path, 'model.safetensors.index.json'), 'w') as f:
+        json.dump({'weight_map': weight_map}, f)
+    return tensors
+
+
+def scan_load_tensor(database: CkptDatabase, name: str, datatype: torch.dtype):
+    # lookup before tensor index: scan every shard and reopen the file per tensor
+    tensors = []
+    for ckpt_file in database.PretrainFileList:
+        if name in ckpt_file.get_tensor_names():
+            with safe_open(ckpt_file.file_name, framework="pt") as f:
+                tensors.append(f.get_tensor(name).to(datatype))
+    return tensors
+
+
+class CkptIndexTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tensors = create_sharded_ckpt(self.tmp_dir.name, 40, 100)
+        self.database = CkptDatabase(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_tensor(self):
+        for name, tensor in self.tensors.items():
+            loaded = self.database.load_tensor(name, torch.float32)
+            self.assertEqual(len(loaded), 1)
+            self.assertTrue(torch.equal(loaded[0], tensor.to(torch.float32)))
+            file_name = self.database.get_tensor_order(name)[0][0]
+            ckpt_file = [ckpt for ckpt in self.database.PretrainFileList if ckpt.file_name == file_name][0]
+            self.assertEqual(ckpt_file.get_tensor_type(name), tensor.dtype)
+            self.assertEqual(ckpt_file.get_tensor_info(name).shape, tuple(tensor.shape))
+        self.assertEqual(self.database.load_tensor("not_exist"), [])
+
+    def test_loaded_tensor_is_writable(self):
+        name = "model.layers.0.experts.0.weight"
+        loaded = self.database.load_tensor(name, torch.bfloat16)[0]
+        loaded.fill_(0)
+        self.assertTrue(torch.equal(self.database.load_tensor(name, torch.bfloat16)[0], self.tensors[name]))
+
+    def test_release(self):
+        name = "model.layers.1.experts.2.weight"
+        loaded = self.database.load_tensor(name, None)[0]
+        self.database.release()
+        self.assertTrue(torch.equal(loaded, self.tensors[name]))
+        self.assertTrue(torch.equal(self.database.load_tensor(name, None)[0], self.tensors[name]))
+
+    def test_unsupported_dtype(self):
+        path = os.path.join(self.tmp_dir.name, "bad")
+        os.makedirs(path)
+        header = json.dumps({"bad.weight": {"dtype": "X9", "shape": [1], "data_offsets": [0, 1]}}).encode()
+        with open(os.path.join(path, "model.safetensors"), "wb") as f:
+            f.write(len(header).to_bytes(8, "little") + header + b"\0")
+        with self.assertRaisesRegex(Exception, "bad.weight.*X9"):
+            CkptDatabase(path).get_tensor_type("bad.weight")
+
+    def test_read_order(self):
+        ckpt_file = self.database.PretrainFileList[0]
+        names = ckpt_file.get_tensor_names()
+        orders = sorted(names, key=ckpt_file.get_tensor_read_order)
+        offsets = [ckpt_file.get_tensor_info(name).offset for name in orders]
+        self.assertEqual(offsets, sorted(offsets))
+
+    def test_benchmark(self):
+        names = list(self.tensors.keys())
+        begin = time.perf_counter()
+        for name in names:
+            scan_load_tensor(self.database, name, torch.float16)
+        scan_cost = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        for name in names:
+            self.database.load_tensor(name, torch.float16)
+        index_cost = time.perf_counter() - begin
+        logging.info(f"load {len(names)} tensors from {len(self.database.PretrainFileList)} shards: "
+                     f"scan {scan_cost:.3f}s, index {index_cost:.3f}s")
+
+    def test_index_avoids_scan(self):
+        names = list(self.tensors.keys())
+        with mock.patch.object(CkptFileInfo, 'get_tensor_names', autospec=True,
+                               side_effect=CkptFileInfo.get_tensor_names) as get_tensor_names, \
+                mock.patch.object(CkptFileInfo, 'load_tensor', autospec=True,
+                                  side_effect=CkptFileInfo.load_tensor) as load_tensor:
+            for name in names:
+                self.assertEqual(len(self.database.load_tensor(name, torch.float16)), 1)
+            self.database.load_tensor("not_exist")
+        # no shard is scanned, each tensor is read from the one shard holding it
+        self.assertEqual(get_tensor_names.call_count, 0)
+        self.assertEqual(load_tensor.call_count, len(names))
+        for call, name in zip(load_tensor.call_args_list, names):
+            ckpt_file, loaded_name = call.args[:2]
+            self.assertEqual(loaded_name, name)
+            self.assertIn(name, ckpt_file.get_tensor_names())
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,7 @@ from maga_transformer.models.qwen import QWenTokenizer
 from maga_transformer.models.chat_glm_v2 import ChatGLMTokenizer as ChatGLMTokenizerV2
 from maga_transformer.models.llama import LlamaTokenizer
 from maga_transformer.models.starcoder import StarcoderTokenizer
-from maga_transformer.utils.tokenizer_utils import DecodingState, IncrementDecodingUtils
+from maga_transformer.utils.tokenizer_utils import DecodingState, IncrementDecodingUtils, StreamDetokenizer
 
 print(os.getcwd())
 print('PYTHONPATH=' + os.environ['PYTHONPATH'] + ' LD_LIBRARY_PATH=' + os.environ['LD_LIBRARY_PATH'] + ' ' + sys.executable + ' ')
@@ -73,6 +73,27 @@ class IncrementalDecodeTest(TestCase):
                 base_output = tokenizer.decode(tokens)
                 cmp_output = self._run_incremental_decode_random(tokenizer, tokens, False)
                 self.assertEqual(base_output, cmp_output)
+    def _run_stream_detokenizer(self, tokenizer, all_input_ids):
+        text = ""
+        detokenizer = StreamDetokenizer(tokenizer, max_window=4)
+        for i in range(0, len(all_input_ids), 1):
+            out = detokenizer.decode(all_input_ids[:i + 1])
+            # renderers hold incomplete chars back and do not commit
+            if out.endswith("\uFFFD"):
+                continue
+            text += out
+            detokenizer.commit()
+        return text
+
+    def test_stream_detokenizer(self):
+        for input in self.inputs:
+            for tokenizer in self._get_tokenizer_list():
+                logging.info("Test Tokenizer: " + str(tokenizer.__class__))
+                tokens = tokenizer.encode(input)
+
+                base_output = tokenizer.decode(tokens)
+                cmp_output = self._run_stream_detokenizer(tokenizer, tokens)
+                self.assertEqual(base_output, cmp_output)
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO,
@@ -0,0 +1,74 @@
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import TestCase, main
+
+from maga_transformer.utils import multimodal_util
+from maga_transformer.utils.multimodal_util import UrlDataCache, get_bytes_io_from_url, prefetch_urls
+
+LATENCY_S = 0.3
+
+class SlowImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY_S)
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.path.encode() * 100
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class MultimodalUtilTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowImageHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        multimodal_util.url_data_cache_ = UrlDataCache(1024 * 1024)
+
+    def test_prefetch_concurrently(self):
+        urls = [f"{self.base_url}/image_{i}.jpg" for i in range(8)]
+        begin = time.perf_counter()
+        with prefetch_urls(urls):
+            datas = [get_bytes_io_from_url(url).read() for url in urls]
+        cost = time.perf_counter() - begin
+        self.assertEqual(datas, [f"/image_{i}.jpg".encode() * 100 for i in range(8)])
+        self.assertLess(cost, LATENCY_S * 4)
+        # cached
+        begin = time.perf_counter()
+        self.assertEqual(get_bytes_io_from_url(urls[0]).read(), datas[0])
+        self.assertLess(time.perf_counter() - begin, LATENCY_S)
+
+    def test_download_error(self):
+        url = f"{self.base_url}/missing.jpg"
+        with prefetch_urls([url]):
+            with self.assertRaisesRegex(Exception, "error code: 404"):
+                get_bytes_io_from_url(url)
+
+    def test_cache_bytes_bound(self):
+        cache = UrlDataCache(100)
+        cache.insert_cache("a", b"a" * 60)
+        cache.insert_cache("b", b"b" * 30)
+        self.assertIsNotNone(cache.check_cache("a"))
+        cache.insert_cache("c", b"c" * 30)
+        # b is least recently used
+        self.assertIsNone(cache.check_cache("b"))
+        self.assertEqual(cache.total_bytes, 90)
+        cache.insert_cache("d", b"d" * 200)
+        self.assertIsNone(cache.check_cache("d"))
+        self.assertLessEqual(cache.total_bytes, 100)
+
+if __name__ == '__main__':
+    main()
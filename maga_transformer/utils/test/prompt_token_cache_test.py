@@ -0,0 +1,138 @@
+import re
+from typing import List
+from unittest import TestCase, main
+from concurrent.futures import ThreadPoolExecutor
+
+from maga_transformer.utils.prompt_token_cache import PromptTokenCache, CachedEncodeTokenizer
+
+SPECIAL_TOKENS = {"<|im_start|>": 1, "<|im_end|>": 2}
+BOS = 0
+
+class FakeTokenizer(object):
+    '''splits at special tokens, then merges every two chars into one token, so ids depend on where text is cut'''
+    def __init__(self):
+        self.vocab = {}
+        self.encode_count = 0
+
+    def encode(self, text: str, add_special_tokens: bool = True) -> List[int]:
+        self.encode_count += 1
+        ids = [BOS] if add_special_tokens else []
+        for piece in re.split("(<\\|im_start\\|>|<\\|im_end\\|>)", text):
+            if piece in SPECIAL_TOKENS:
+                ids.append(SPECIAL_TOKENS[piece])
+                continue
+            for i in range(0, len(piece), 2):
+                ids.append(self.vocab.setdefault(piece[i:i + 2], len(self.vocab) + 10))
+        return ids
+
+def render(messages) -> str:
+    prompt = "".join(f"<|im_start|>{role}\n{content}<|im_end|>\n" for role, content in messages)
+    return prompt + "<|im_start|>assistant\n"
+
+class PromptTokenCacheTest(TestCase):
+    def _create_cache(self, tokenizer: FakeTokenizer, max_tokens: int = 1024, verify_count: int = 0):
+        return PromptTokenCache(
+            encode_func=lambda text: tokenizer.encode(text, add_special_tokens=False),
+            special_tokens=SPECIAL_TOKENS,
+            max_tokens=max_tokens,
+            wrap_func=lambda ids: [BOS] + ids,
+            full_encode_func=tokenizer.encode,
+            verify_count=verify_count)
+
+    def test_multi_turn(self):
+        tokenizer = FakeTokenizer()
+        cache = self._create_cache(tokenizer)
+        messages = [("system", "you are a helpful assistant."), ("user", "hello")]
+        ids, reuse_length = cache.encode(render(messages))
+        self.assertEqual(ids, tokenizer.encode(render(messages)))
+        self.assertEqual(reuse_length, 0)
+
+        # everything before the generation prompt of the last turn is reused
+        prev_prompt = render(messages)
+        prefix = prev_prompt[:prev_prompt.rindex("<|im_start|>")]
+        messages += [("assistant", "hi, what can i do for you?"), ("user", "tell me a joke")]
+        ids, reuse_length = cache.encode(render(messages))
+        self.assertEqual(ids, tokenizer.encode(render(messages)))
+        self.assertEqual(reuse_length, len(tokenizer.encode(prefix, add_special_tokens=False)))
+
+    def test_shared_system_prompt(self):
+        tokenizer = FakeTokenizer()
+        cache = self._create_cache(tokenizer)
+        system = ("system", "a long system prompt with tool schemas " * 10)
+        cache.encode(render([system, ("user", "question one")]))
+        prompt = render([system, ("user", "question two")])
+        ids, reuse_length = cache.encode(prompt)
+        self.assertEqual(ids, tokenizer.encode(prompt))
+        self.assertGreater(reuse_length, 200)
+
+    def test_evict(self):
+        tokenizer = FakeTokenizer()
+        cache = self._create_cache(tokenizer, max_tokens=64)
+        for i in range(20):
+            prompt = render([("system", f"system prompt {i} " * 5), ("user", "hello")])
+            self.assertEqual(cache.encode(prompt)[0], tokenizer.encode(prompt))
+            self.assertLessEqual(cache.token_num, 64)
+
+    def test_verify(self):
+        tokenizer = FakeTokenizer()
+        # full encode adds an eos the cache does not know of
+        cache = PromptTokenCache(
+            encode_func=lambda text: tokenizer.encode(text, add_special_tokens=False),
+            special_tokens=SPECIAL_TOKENS,
+            max_tokens=1024,
+            full_encode_func=lambda text: tokenizer.encode(text) + [3],
+            verify_count=2)
+        prompt = render([("user", "hello")])
+        self.assertEqual(cache.encode(prompt), (tokenizer.encode(prompt) + [3], 0))
+        self.assertFalse(cache.enabled)
+        self.assertEqual(cache.token_num, 0)
+
+    def test_verify_sampled(self):
+        tokenizer = FakeTokenizer()
+        # tokenization of the cache starts to differ after the first verified prompts
+        mismatch = [False]
+        cache = PromptTokenCache(
+            encode_func=lambda text: tokenizer.encode(text, add_special_tokens=False),
+            special_tokens=SPECIAL_TOKENS,
+            max_tokens=1024,
+            wrap_func=lambda ids: [BOS] + ids,
+            full_encode_func=lambda text: tokenizer.encode(text) + ([3] if mismatch[0] else []),
+            verify_count=2,
+            verify_interval=5)
+        prompt = render([("user", "hello")])
+        for _ in range(3):
+            cache.encode(prompt)
+        self.assertTrue(cache.enabled)
+        mismatch[0] = True
+        # prompt 4 is not verified, prompt 5 is
+        self.assertEqual(cache.encode(prompt)[0], tokenizer.encode(prompt))
+        self.assertTrue(cache.enabled)
+        self.assertEqual(cache.encode(prompt), (tokenizer.encode(prompt) + [3], 0))
+        self.assertFalse(cache.enabled)
+
+    def test_concurrent_verify(self):
+        tokenizer = FakeTokenizer()
+        cache = self._create_cache(tokenizer, verify_count=50)
+        prompts = [render([("system", "system prompt"), ("user", f"question {i}")]) for i in range(200)]
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(cache.encode, prompts))
+        for prompt, (ids, _) in zip(prompts, results):
+            self.assertEqual(ids, tokenizer.encode(prompt))
+        self.assertEqual(cache.verify_count, 0)
+        self.assertTrue(cache.enabled)
+
+    def test_cached_encode_tokenizer(self):
+        tokenizer = FakeTokenizer()
+        cached_tokenizer = CachedEncodeTokenizer(tokenizer, max_tokens=1024)
+        self.assertEqual(cached_tokenizer.encode("hello"), tokenizer.encode("hello"))
+        count = tokenizer.encode_count
+        self.assertEqual(cached_tokenizer.encode("hello"), tokenizer.encode("hello"))
+        self.assertEqual(tokenizer.encode_count, count + 1)
+        self.assertNotEqual(cached_tokenizer.encode("hello", add_special_tokens=False), tokenizer.encode("hello"))
+        hello_len = len(tokenizer.encode("hello"))
+        self.assertEqual(cached_tokenizer.hit_tokens, hello_len)
+        self.assertEqual(cached_tokenizer.encoded_tokens, hello_len * 2 + len(tokenizer.encode("hello", add_special_tokens=False)))
+        self.assertEqual(cached_tokenizer.vocab, tokenizer.vocab)
+
+if __name__ == '__main__':
+    main()
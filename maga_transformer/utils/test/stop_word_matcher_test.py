@@ -0,0 +1,111 @@
+import random
+from unittest import TestCase, main
+
+from maga_transformer.utils.stop_word_matcher import StopWordMatcher, StopWordIdsTable, get_stop_word_automaton
+from maga_transformer.utils.word_util import get_stop_word_slices, truncate_response_with_stop_words, \
+    truncate_token_with_stop_word_id, match_stop_words
+
+
+def naive_truncate(response, stop_words, is_streaming):
+    if is_streaming:
+        for stop_word in stop_words:
+            if stop_word and response[len(response) - len(stop_word):] == stop_word:
+                return response[:len(response) - len(stop_word)]
+        return response
+    indexes = [response.find(stop_word) for stop_word in stop_words if stop_word]
+    indexes = [index for index in indexes if index != -1]
+    return response[:min(indexes)] if indexes else response
+
+
+def naive_remove_stop_word_ids(output_ids, stop_word_ids_list):
+    # renderer implementation before stop word ids were compiled
+    for stop_word_ids in stop_word_ids_list:
+        for i in range(len(stop_word_ids) + 1, 1, -1):
+            if output_ids[-i:] == stop_word_ids[:i]:
+                output_ids = output_ids[:-i]
+                break
+    return output_ids
+
+
+class StopWordMatcherTest(TestCase):
+    def setUp(self):
+        random.seed(0)
+
+    def test_same_as_naive_scan(self):
+        for _ in range(300):
+            stop_words = [''.join(random.choices('abc', k=random.randint(1, 4))) for _ in range(random.randint(1, 4))]
+            slices = get_stop_word_slices(stop_words)
+            text = ''.join(random.choices('abcd', k=random.randint(0, 12)))
+            for is_streaming in [True, False]:
+                self.assertEqual(truncate_response_with_stop_words(text, stop_words, is_streaming),
+                                 naive_truncate(text, stop_words, is_streaming))
+                self.assertEqual(truncate_response_with_stop_words(text, slices, is_streaming),
+                                 naive_truncate(text, slices, is_streaming))
+            self.assertEqual(match_stop_words(text, stop_words),
+                             any(text.endswith(stop_word) for stop_word in stop_words))
+
+    def test_token_ids(self):
+        stop_word_ids = [[1, 2, 3], [2, 3], [7]]
+        self.assertEqual(truncate_token_with_stop_word_id([5, 1, 2, 3], stop_word_ids), [5])
+        self.assertEqual(truncate_token_with_stop_word_id([5, 2, 3], stop_word_ids), [5])
+        self.assertEqual(truncate_token_with_stop_word_id([5, 3], stop_word_ids), [5, 3])
+        automaton = get_stop_word_automaton(stop_word_ids)
+        self.assertEqual(automaton.truncate([5, 1, 2], partial=True), [5])
+        self.assertEqual(automaton.truncate([4, 2, 3, 5], partial=True), [4, 2, 3, 5])
+
+    def test_cached_by_stop_words(self):
+        self.assertIs(get_stop_word_automaton(['</s>', '<|im_end|>']), get_stop_word_automaton(['</s>', '<|im_end|>']))
+        self.assertIs(get_stop_word_automaton([[1, 2]]), get_stop_word_automaton([[1, 2]]))
+        self.assertIsNot(get_stop_word_automaton(['</s>']), get_stop_word_automaton(['<|im_end|>']))
+
+    def test_incremental_matcher(self):
+        matcher = StopWordMatcher(get_stop_word_automaton(['<|im_end|>', 'Observation:']))
+        text = ''
+        for delta in ['Hello <', '|im', '_e', 'nd', '|> tail']:
+            text += delta
+            stop_index = matcher.update(text)
+            if delta == '|im':
+                self.assertEqual(stop_index, -1)
+                self.assertEqual(matcher.hold_length, len('<|im'))
+        self.assertEqual(stop_index, len('Hello '))
+
+        # stop word in the middle of a multi token step
+        matcher = StopWordMatcher(get_stop_word_automaton(['Observation:']))
+        self.assertEqual(matcher.feed('a'), -1)
+        self.assertEqual(matcher.feed('bc Observation: xyz'), len('abc '))
+
+        # a shorter stop word ends first inside a longer one, the earliest start wins
+        matcher = StopWordMatcher(get_stop_word_automaton(['abcd', 'bc']))
+        self.assertEqual(matcher.feed('abcd'), 0)
+        matcher = StopWordMatcher(get_stop_word_automaton(['abcd', 'bc']))
+        self.assertEqual(matcher.feed('x'), -1)
+        self.assertEqual(matcher.feed('abcdbc'), get_stop_word_automaton(['abcd', 'bc']).find('xabcdbc'))
+
+    def test_rewritten_tail(self):
+        matcher = StopWordMatcher(get_stop_word_automaton(['好的']))
+        self.assertEqual(matcher.update('你�'), -1)
+        self.assertEqual(matcher.hold_length, 0)
+        # last char decoded again once the multi byte token is complete
+        self.assertEqual(matcher.update('你好'), -1)
+        self.assertEqual(matcher.hold_length, 1)
+        self.assertEqual(matcher.update('你好的'), 1)
+
+    def test_no_stop_words(self):
+        matcher = StopWordMatcher(get_stop_word_automaton([]))
+        self.assertEqual(matcher.update('abc'), -1)
+        self.assertEqual(matcher.hold_length, 0)
+        self.assertEqual(truncate_response_with_stop_words('abc', [], False), 'abc')
+
+    def test_stop_word_ids_table(self):
+        for _ in range(500):
+            stop_word_ids_list = [random.choices(range(4), k=random.randint(1, 4)) for _ in range(random.randint(1, 4))]
+            table = StopWordIdsTable(stop_word_ids_list)
+            output_ids = random.choices(range(5), k=random.randint(0, 10))
+            self.assertEqual(table.remove_stop_word_ids(output_ids),
+                             naive_remove_stop_word_ids(output_ids, stop_word_ids_list))
+            self.assertEqual(table.is_stopped(output_ids),
+                             any(output_ids[-len(ids):] == ids for ids in stop_word_ids_list if len(output_ids) >= len(ids)))
+
+
+if __name__ == '__main__':
+    main()
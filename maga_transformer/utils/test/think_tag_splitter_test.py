@@ -0,0 +1,53 @@
+import random
+from unittest import TestCase, main
+
+from maga_transformer.utils.think_tag_splitter import ThinkTagSplitter, split_think_tag
+
+
+class ThinkTagSplitterTest(TestCase):
+    def _feed(self, splitter: ThinkTagSplitter, deltas):
+        reasoning, content = "", ""
+        for delta in deltas:
+            r, c = splitter.feed(delta)
+            reasoning += r
+            content += c
+        return reasoning, content
+
+    def test_split(self):
+        splitter = ThinkTagSplitter("<think>\n", "</think>\n\n")
+        self.assertEqual(splitter.feed("<thi"), ("", ""))
+        self.assertEqual(splitter.feed("nk>\nabc</th"), ("abc", ""))
+        self.assertEqual(splitter.feed("ink"), ("", ""))
+        self.assertEqual(splitter.feed(">x"), ("</think>x", ""))
+        self.assertEqual(splitter.feed("</think>\n\nhello"), ("", "hello"))
+        self.assertFalse(splitter.in_think_mode)
+        self.assertEqual(splitter.feed("</think>\n\n"), ("", "</think>\n\n"))
+
+    def test_no_start_tag(self):
+        splitter = ThinkTagSplitter("<think>\n", "</think>\n\n")
+        self.assertEqual(self._feed(splitter, ["<t", "ool>", "</think>\n\n", "a"]), ("<tool>", "a"))
+        splitter = ThinkTagSplitter("<think>\n", "</think>\n\n", in_think_mode=False)
+        self.assertEqual(self._feed(splitter, ["<think>\n", "a</think>\n\nb"]), ("", "<think>\na</think>\n\nb"))
+
+    def test_random_deltas(self):
+        rand = random.Random(0)
+        for _ in range(200):
+            reasoning = "".join(rand.choice("<>/thinkab\n") for _ in range(rand.randint(0, 30)))
+            if "</think>\n\n" in reasoning:
+                continue
+            content = "".join(rand.choice("<>/thinkab\n") for _ in range(rand.randint(0, 30)))
+            text = "<think>\n" + reasoning + "</think>\n\n" + content
+            cuts = sorted(rand.sample(range(1, len(text)), rand.randint(0, 8)))
+            deltas = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+            splitter = ThinkTagSplitter("<think>\n", "</think>\n\n")
+            self.assertEqual(self._feed(splitter, deltas), (reasoning, content), deltas)
+            self.assertEqual(split_think_tag(text, "</think>\n\n"), (content, "<think>\n" + reasoning))
+
+    def test_split_think_tag(self):
+        self.assertEqual(split_think_tag(None, "</think>"), (None, None))
+        self.assertEqual(split_think_tag("abc", "</think>"), ("abc", None))
+        self.assertEqual(split_think_tag("a</think>b</think>", "</think>"), ("b</think>", "a"))
+
+
+if __name__ == '__main__':
+    main()
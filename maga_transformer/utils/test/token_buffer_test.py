@@ -0,0 +1,108 @@
+import time
+import logging
+from unittest import TestCase, main
+
+import torch
+from types import SimpleNamespace
+
+from maga_transformer.utils.token_buffer import TokenBuffer
+from maga_transformer.utils.token_processor import TokenProcessor, TokenProcessorPerStream
+from maga_transformer.utils.word_util import remove_padding_eos
+
+
+class TokenBufferTest(TestCase):
+    def test_append(self):
+        eos_token_id = 2
+        buffer = TokenBuffer(eos_token_id, initial_capacity=2)
+        history = torch.empty((1, 0), dtype=torch.int32)
+        for step in range(100):
+            step_ids = torch.tensor([[step % 5, step % 7]], dtype=torch.int32)
+            buffer.append(step_ids)
+            history = torch.cat((history, step_ids), dim=1)
+            self.assertTrue(torch.equal(buffer.output_ids(), history))
+            self.assertEqual(buffer.token_ids, remove_padding_eos(history, eos_token_id).tolist())
+
+    def test_views_not_changed_by_append(self):
+        buffer = TokenBuffer(initial_capacity=1)
+        buffer.append(torch.tensor([[1]], dtype=torch.int32))
+        view = buffer.output_ids()
+        for i in range(10):
+            buffer.append(torch.tensor([[i + 2]], dtype=torch.int32))
+        self.assertEqual(view.tolist(), [[1]])
+        self.assertEqual(buffer.output_ids().tolist(), [list(range(1, 12))])
+
+    def test_keep_extra_dims(self):
+        buffer = TokenBuffer()
+        buffer.append(torch.tensor([[[3]]]))
+        buffer.append(torch.tensor([[[4]]]))
+        self.assertEqual(list(buffer.output_ids().shape), [1, 2, 1])
+        self.assertEqual(buffer.token_ids, [3, 4])
+
+    @staticmethod
+    def _cost_per_step(buffer, start_len, steps=256):
+        for _ in range(start_len):
+            buffer.append(torch.tensor([[1]], dtype=torch.int32))
+        begin = time.perf_counter()
+        for _ in range(steps):
+            buffer.append(torch.tensor([[1]], dtype=torch.int32))
+            buffer.output_ids()
+            buffer.token_ids[-4:]
+        return (time.perf_counter() - begin) / steps
+
+    def test_grow_count(self):
+        buffer = TokenBuffer(0, initial_capacity=256)
+        for _ in range(16384):
+            buffer.append(torch.tensor([[1]], dtype=torch.int32))
+        # capacity doubles: 256 -> 16384, instead of one copy per step with torch.cat
+        self.assertEqual(buffer.grow_count, 6)
+        buffer.append(torch.tensor([[1] * 100], dtype=torch.int32))
+        self.assertEqual(buffer.grow_count, 7)
+        self.assertEqual(len(buffer), 16484)
+
+    def test_benchmark_flat_step_cost(self):
+        short_cost = self._cost_per_step(TokenBuffer(0), 256)
+        long_cost = self._cost_per_step(TokenBuffer(0), 16384)
+        logging.info(f"token buffer cost per step: {short_cost * 1e6:.2f} us at 256 tokens, "
+                     f"{long_cost * 1e6:.2f} us at 16384 tokens")
+
+
+class FakeTokenizer(object):
+    def decode(self, token_ids):
+        return "".join(chr(ord('a') + token_id) for token_id in token_ids)
+
+class TokenProcessorPerStreamTest(TestCase):
+    def _create(self, num_beams: int) -> TokenProcessorPerStream:
+        token_processor = TokenProcessor(FakeTokenizer(), SimpleNamespace(eos_token_id=0))
+        return TokenProcessorPerStream(num_beams, 1, token_processor)
+
+    def test_decode_steps(self):
+        stream = self._create(1)
+        texts = []
+        for step, token_id in enumerate([1, 2, 0, 3]):
+            output_len, text = stream.decode_tokens(0, torch.tensor([[token_id]], dtype=torch.int32),
+                                                    step == 3, False, [], [], return_incremental=True)
+            texts.append(text)
+        # eos is padding, not output
+        self.assertEqual(output_len, 3)
+        self.assertEqual("".join(texts), "bcd")
+        self.assertEqual(stream.ouput_tokens_list[0].output_ids().tolist(), [[1, 2, 0, 3]])
+
+    def test_stop_words(self):
+        stream = self._create(1)
+        texts = []
+        for step, token_id in enumerate([1, 2, 3, 4]):
+            _, text = stream.decode_tokens(0, torch.tensor([[token_id]], dtype=torch.int32),
+                                           step == 3, False, ["cd"], [], return_incremental=True)
+            texts.append(text)
+        self.assertEqual("".join(texts), "b")
+
+    def test_beam_search(self):
+        # beams return all output tokens each step
+        stream = self._create(2)
+        stream.decode_tokens(0, torch.tensor([[1]], dtype=torch.int32), False, False, [], [])
+        output_len, text = stream.decode_tokens(0, torch.tensor([[2, 3]], dtype=torch.int32), True, False, [], [])
+        self.assertEqual((output_len, text), (2, "cd"))
+
+
+if __name__ == '__main__':
+    main()
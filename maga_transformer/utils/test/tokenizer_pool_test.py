@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from typing import Any, Dict, List
+from unittest import TestCase, main
+from transformers import AutoTokenizer
+
+from maga_transformer.utils.tokenizer_pool import TokenizerPool
+
+ENCODE_KWARGS = dict(max_length=64, return_attention_mask=False, padding=False, return_length=True, truncation=True, return_tensors='np')
+
+class MainProcessTokenizer(object):
+    '''can be pickled, but only encodes in the process that created it'''
+    def __init__(self, tokenizer: Any):
+        self.tokenizer = tokenizer
+        self.pid = os.getpid()
+
+    def __call__(self, *args: Any, **kwargs: Any):
+        if os.getpid() != self.pid:
+            raise RuntimeError("tokenizer not usable in worker process")
+        return self.tokenizer(*args, **kwargs)
+
+class TokenizerPoolTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        tokenizer_path = os.path.join(os.getcwd(), "maga_transformer/test/model_test/fake_test/testdata/starcoder/tokenizer")
+        cls.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        words = ["def", "return", "import", "class", "hello", "world", "numpy", "torch", "self", "value", "1024", "+"]
+        rng = np.random.default_rng(0)
+        cls.prompts = [" ".join(rng.choice(words, rng.integers(1, 100))) for _ in range(100)]
+
+    def _check_encoded(self, encoded: Dict[str, List[Any]], prompts: List[str]):
+        expected = self.tokenizer(prompts, **ENCODE_KWARGS)
+        self.assertEqual(set(encoded.keys()), set(expected.keys()))
+        self.assertEqual(len(encoded['input_ids']), len(prompts))
+        for ids, expected_ids in zip(encoded['input_ids'], expected['input_ids']):
+            self.assertTrue(np.array_equal(ids, expected_ids))
+        self.assertTrue(np.array_equal(np.asarray(encoded['length']), expected['length']))
+
+    def test_thread_pool(self):
+        pool = TokenizerPool(self.tokenizer, pool_size=4, min_chunk_size=8)
+        try:
+            self.assertEqual([len(chunk) for chunk in pool._split(self.prompts)], [25, 25, 25, 25])
+            self.assertEqual([len(chunk) for chunk in pool._split(self.prompts[:20])], [10, 10])
+            self._check_encoded(pool.encode(self.prompts, **ENCODE_KWARGS), self.prompts)
+            self._check_encoded(pool.encode(self.prompts[:1], **ENCODE_KWARGS), self.prompts[:1])
+            # concurrent requests with different truncation
+            results: Dict[int, Any] = {}
+            def worker(index: int):
+                results[index] = pool.encode(self.prompts[index:], **dict(ENCODE_KWARGS, max_length=8 + index))
+            threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for index, encoded in results.items():
+                expected = self.tokenizer(self.prompts[index:], **dict(ENCODE_KWARGS, max_length=8 + index))
+                self.assertTrue(np.array_equal(np.asarray(encoded['length']), expected['length']))
+        finally:
+            pool.stop()
+
+    def test_process_pool(self):
+        pool = TokenizerPool(self.tokenizer, pool_size=2, min_chunk_size=8, use_process=True)
+        try:
+            self.assertIsNotNone(pool._process_pool)
+            self._check_encoded(pool.encode(self.prompts, **ENCODE_KWARGS), self.prompts)
+        finally:
+            pool.stop()
+
+    def test_process_pool_fallback(self):
+        pool = TokenizerPool(MainProcessTokenizer(self.tokenizer), pool_size=2, min_chunk_size=8, use_process=True)
+        try:
+            self.assertIsNone(pool._process_pool)
+            self.assertIsNotNone(pool._thread_pool)
+            self._check_encoded(pool.encode(self.prompts, **ENCODE_KWARGS), self.prompts)
+        finally:
+            pool.stop()
+
+    def test_benchmark(self):
+        # concurrent requests of 64 documents each
+        prompts = self.prompts * 8
+        kwargs = dict(ENCODE_KWARGS, max_length=512)
+        def run(pool: TokenizerPool, request_num: int = 32, thread_num: int = 8) -> float:
+            def worker(num: int):
+                for _ in range(num):
+                    pool.encode(prompts[:64], **kwargs)
+            start = time.time()
+            threads = [threading.Thread(target=worker, args=(request_num // thread_num,)) for _ in range(thread_num)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return request_num / (time.time() - start)
+        throughputs = {}
+        for pool_size in [1, 4]:
+            pool = TokenizerPool(self.tokenizer, pool_size=pool_size, min_chunk_size=16)
+            try:
+                throughputs[pool_size] = run(pool)
+            finally:
+                pool.stop()
+        logging.info(f"tokenized requests/s on {os.cpu_count()} cpus, one tokenizer: {throughputs[1]:.0f}, "
+                     f"pool of 4: {throughputs[4]:.0f}")
+
+if __name__ == '__main__':
+    main()
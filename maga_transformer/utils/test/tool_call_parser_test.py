@@ -0,0 +1,62 @@
+import json
+import random
+from unittest import TestCase, main
+
+from maga_transformer.utils.tool_call_parser import StreamToolCallParser
+
+
+class StreamToolCallParserTest(TestCase):
+    def _parse(self, deltas, skip_invalid=False):
+        parser = StreamToolCallParser(skip_invalid=skip_invalid)
+        text = ""
+        calls = {}
+        for delta in deltas + [None]:
+            delta_text, call_deltas = parser.feed(delta) if delta is not None else parser.flush()
+            text += delta_text
+            for call_delta in call_deltas:
+                if call_delta.name is not None:
+                    self.assertNotIn(call_delta.index, calls)
+                    calls[call_delta.index] = [call_delta.name, call_delta.arguments]
+                else:
+                    calls[call_delta.index][1] += call_delta.arguments
+        return text, calls
+
+    def test_stream_calls(self):
+        text = '你好\n<tool_call>\n{"name": "get_temperature", "arguments": {"location": "北京, \\"China\\"", ' \
+               '"unit": [1, {"a": "}"}]}}\n</tool_call>\n<tool_call>\n{"arguments": 5, "name": "f"}\n</tool_call>\n'
+        rand = random.Random(0)
+        for _ in range(50):
+            cuts = sorted(rand.sample(range(1, len(text)), rand.randint(0, 20)))
+            deltas = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+            content, calls = self._parse(deltas)
+            self.assertEqual(content, '你好')
+            self.assertEqual(calls[0][0], 'get_temperature')
+            self.assertEqual(json.loads(calls[0][1]), {"location": "北京, \"China\"", "unit": [1, {"a": "}"}]})
+            self.assertEqual(calls[1], ['f', '5'])
+
+    def test_whitespace(self):
+        # same content as the not streamed response: text around calls is kept, the ends are stripped
+        self.assertEqual(self._parse(['a \n', '<tool_call>{"name": "f"}</tool_call>', '\n', 'b\n'])[0], 'a \n\nb')
+        self.assertEqual(self._parse(['a\n', '\n'])[0], 'a\n\n')
+        self.assertEqual(self._parse(['a\n<tool_call>oops</tool_call>\n'])[0], 'a\n<tool_call>oops</tool_call>\n')
+
+    def test_name_before_end_tag(self):
+        parser = StreamToolCallParser()
+        self.assertEqual(parser.feed('<tool_call>\n{"name": "f'), ("", []))
+        _, call_deltas = parser.feed('", "arguments": {"a"')
+        self.assertEqual([(x.index, x.name, x.arguments) for x in call_deltas], [(0, 'f', '{"a"')])
+        _, call_deltas = parser.feed(': 1}}\n</tool_')
+        self.assertEqual([(x.index, x.name, x.arguments) for x in call_deltas], [(0, None, ': 1}')])
+        self.assertTrue(parser.in_tool_call)
+        self.assertEqual(parser.feed('call>'), ("", []))
+        self.assertFalse(parser.in_tool_call)
+
+    def test_invalid_call(self):
+        deltas = ['a<tool_call>oops</tool_call>b <tool', '_c']
+        self.assertEqual(self._parse(deltas), ('a<tool_call>oops</tool_call>b <tool_c', {}))
+        self.assertEqual(self._parse(deltas, skip_invalid=True), ('ab <tool_c', {}))
+        self.assertEqual(self._parse(['x<tool_call>{"name"']), ('x<tool_call>{"name"', {}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+from unittest import TestCase, main
+
+import torch
+
+from maga_transformer.utils.ckpt_file_info import CkptFileInfo
+
+
+class TorchCkptMmapTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, 'pytorch_model.bin')
+        base = torch.randn(8, 6)
+        self.tensors = {
+            'model.layers.0.weight': torch.randn(16, 4),
+            'model.layers.0.bias': torch.randn(16).to(torch.bfloat16),
+            # stored with an offset into a shared storage and non-contiguous strides
+            'model.layers.1.weight': base[2:].t(),
+            'model.layers.1.base': base,
+            'lm_head.weight': torch.randn(3, 16).to(torch.float16),
+        }
+        torch.save(self.tensors, self.file_name)
+        self.ckpt_file = CkptFileInfo(self.file_name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_tensor(self):
+        for name, tensor in self.tensors.items():
+            loaded = self.ckpt_file.load_tensor(name, torch.float16)
+            self.assertEqual(loaded.dtype, torch.float16)
+            self.assertTrue(loaded.is_contiguous())
+            self.assertTrue(torch.equal(loaded, tensor.to(torch.float16)), name)
+
+    def test_view_keeps_checkpoint_dtype(self):
+        view = self.ckpt_file.get_tensor_view('model.layers.0.bias')
+        self.assertEqual(view.dtype, torch.bfloat16)
+        self.assertTrue(torch.equal(view, self.tensors['model.layers.0.bias']))
+        # same dtype needs no copy, tensors of one file share a single mapping
+        weight = self.ckpt_file.load_tensor('lm_head.weight', torch.float16)
+        self.assertEqual(weight.untyped_storage().data_ptr(),
+                         self.ckpt_file.get_tensor_view('lm_head.weight').untyped_storage().data_ptr())
+
+    def test_convert_slice_only(self):
+        view = self.ckpt_file.get_tensor_view('model.layers.0.weight')
+        for rank in range(4):
+            shard = view.chunk(4)[rank].to(torch.float16, memory_format=torch.contiguous_format, copy=True)
+            expected = self.tensors['model.layers.0.weight'].to(torch.float16).chunk(4)[rank]
+            self.assertTrue(torch.equal(shard, expected))
+            self.assertEqual(shard.untyped_storage().nbytes(), 4 * 4 * 2)
+
+    def test_private_mapping(self):
+        view = self.ckpt_file.get_tensor_view('model.layers.0.weight')
+        view.zero_()
+        self.assertTrue(torch.equal(torch.load(self.file_name)['model.layers.0.weight'],
+                                    self.tensors['model.layers.0.weight']))
+
+    def test_load_tensors_by_prefix(self):
+        loaded = self.ckpt_file.load_tensors('cpu', prefix_list=('model.layers.1.',))
+        self.assertEqual(set(loaded.keys()), {'model.layers.1.weight', 'model.layers.1.base'})
+        for name, tensor in loaded.items():
+            self.assertTrue(torch.equal(tensor, self.tensors[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+from typing import Optional, Tuple
+
+from maga_transformer.utils.stop_word_matcher import StopWordMatcher, get_stop_word_automaton
+
+class ThinkTagSplitter(object):
+    '''
+    per-stream splitter of streamed text into reasoning text and content.
+    reasoning text starts after an optional leading start tag and ends at the first end tag, text after it is content.
+    the end tag automaton is compiled once and shared, each delta is scanned once; only a trailing
+    tag prefix is held back until the next delta.
+    '''
+    def __init__(self, start_tag: str, end_tag: str, in_think_mode: bool = True):
+        self.start_tag = start_tag
+        self.end_tag = end_tag
+        self.in_think_mode = in_think_mode
+        self._end_matcher = StopWordMatcher(get_stop_word_automaton([end_tag]))
+        # whether the leading start tag is still being matched
+        self._match_start = bool(start_tag)
+        # held back text, a prefix of the start tag or of the end tag
+        self._held = ""
+        # number of chars fed into the end tag matcher
+        self._fed = 0
+
+    def feed(self, delta: str) -> Tuple[str, str]:
+        '''reasoning text and content of delta'''
+        if not self.in_think_mode:
+            return "", delta
+        if self._match_start:
+            text = self._held + delta
+            if len(text) < len(self.start_tag) and self.start_tag.startswith(text):
+                self._held = text
+                return "", ""
+            self._held = ""
+            self._match_start = False
+            if text.startswith(self.start_tag):
+                text = text[len(self.start_tag):]
+            delta = text
+        # matcher state covers everything fed so far, text fed before but still held is in self._held
+        base = self._fed - len(self._held)
+        text = self._held + delta
+        stop_index = self._end_matcher.feed(delta)
+        self._fed += len(delta)
+        if stop_index >= 0:
+            self.in_think_mode = False
+            self._held = ""
+            end = stop_index - base
+            return text[:end], text[end + len(self.end_tag):]
+        hold = self._end_matcher.hold_length
+        self._held = text[len(text) - hold:] if hold else ""
+        return text[:len(text) - hold], ""
+
+def split_think_tag(text: Optional[str], end_tag: str) -> Tuple[Optional[str], Optional[str]]:
+    '''content and reasoning text of a complete response, reasoning is None without an end tag'''
+    if text is None:
+        return None, None
+    index = text.find(end_tag)
+    if index < 0:
+        return text, None
+    return text[index + len(end_tag):], text[:index]
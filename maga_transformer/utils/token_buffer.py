@@ -0,0 +1,53 @@
+import numpy as np
+import torch
+from typing import List, Optional, Tuple
+
+class TokenBuffer(object):
+    '''
+    append-only output token buffer of one stream.
+    raw output ids (including padding eos) are kept in a numpy array grown by doubling, so `output_ids`
+    is a zero-copy tensor view of the history; eos-cleaned ids are kept in a python list extended per step.
+    appending k tokens costs O(k) amortized regardless of the history length.
+    '''
+    def __init__(self, eos_token_id: Optional[int] = None, initial_capacity: int = 256):
+        self.eos_token_id = eos_token_id
+        self.token_ids: List[int] = []
+        self.finished = False
+        self._initial_capacity = max(1, initial_capacity)
+        self._raw: Optional[np.ndarray] = None
+        self._raw_len = 0
+        self._tail_shape: Tuple[int, ...] = ()
+        # times the raw array was grown, O(log n) for n tokens
+        self.grow_count = 0
+
+    def __len__(self) -> int:
+        return len(self.token_ids)
+
+    def _reserve(self, size: int, dtype: np.dtype) -> None:
+        if self._raw is None:
+            self._raw = np.empty(max(self._initial_capacity, size), dtype=dtype)
+        elif size > self._raw.shape[0]:
+            capacity = self._raw.shape[0]
+            while capacity < size:
+                capacity *= 2
+            # views handed out before keep referencing the old array, which is never written again
+            raw = np.empty(capacity, dtype=self._raw.dtype)
+            raw[:self._raw_len] = self._raw[:self._raw_len]
+            self._raw = raw
+            self.grow_count += 1
+
+    def append(self, output_ids: torch.Tensor) -> None:
+        # output_ids shape: [1, step_len, ...]
+        self._tail_shape = tuple(output_ids.shape[2:])
+        new_ids = output_ids.cpu().numpy().reshape(-1)
+        self._reserve(self._raw_len + new_ids.shape[0], new_ids.dtype)
+        self._raw[self._raw_len:self._raw_len + new_ids.shape[0]] = new_ids
+        self._raw_len += new_ids.shape[0]
+        if self.eos_token_id is not None:
+            new_ids = new_ids[new_ids != self.eos_token_id]
+        self.token_ids.extend(new_ids.tolist())
+
+    def output_ids(self) -> torch.Tensor:
+        if self._raw is None:
+            return torch.empty((1, 0) + self._tail_shape, dtype=torch.int32)
+        return torch.from_numpy(self._raw[:self._raw_len]).reshape((1, -1) + self._tail_shape)
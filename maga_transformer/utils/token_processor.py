@@ -7,8 +7,9 @@ from concurrent.futures import ThreadPoolExecutor, Future
 from typing import Any, Optional, List
 
 from maga_transformer.utils.tokenizer_utils import DecodingState, IncrementDecodingUtils
-from maga_transformer.utils.word_util import remove_padding_eos, get_stop_word_slices, \
-            truncate_response_with_stop_words, truncate_token_with_stop_word_id, match_stop_words
+from maga_transformer.utils.token_buffer import TokenBuffer
+from maga_transformer.utils.word_util import remove_padding_eos
+from maga_transformer.utils.stop_word_matcher import StopWordMatcher, get_stop_word_automaton
 
 class TokenProcessor:
     def __init__(self, tokenizer, special_tokens):
@@ -27,8 +28,9 @@ class TokenProcessor:
 
 class TokenProcessorPerStream:
     decoding_states: List[DecodingState]
-    ouput_tokens_list: List[torch.Tensor]
+    ouput_tokens_list: List[TokenBuffer]
     token_buffers: List[str]
+    stop_word_matchers: List[Optional[StopWordMatcher]]
     num_beams: int
 
     def __init__(self, num_beams: int, size: int, token_processor: TokenProcessor):
@@ -41,7 +43,8 @@ class TokenProcessorPerStream:
             # num_beams不等于1的情况下，不能进行增量decode，因为过去的token id会变化
             self.decoding_states = [None] * size
         self.token_buffers = [""] * size
-        self.ouput_tokens_list = [torch.empty(0, dtype=torch.int32) for _ in range(size)]
+        self.stop_word_matchers = [None] * size
+        self.ouput_tokens_list = [TokenBuffer(self.special_tokens.eos_token_id) for _ in range(size)]
 
     def decode_tokens(self,
                       i: int,
@@ -52,17 +55,21 @@ class TokenProcessorPerStream:
                       stop_word_ids: List[List[int]],
                       return_incremental: bool = False):
         if self.num_beams == 1:
-            self.ouput_tokens_list[i] = torch.cat((self.ouput_tokens_list[i], tokens), dim=1)
-        tokens = self.ouput_tokens_list[i]
-        tokens = remove_padding_eos(tokens, self.special_tokens.eos_token_id)
-        output_len = tokens.nelement()
-        tokens = self.process_stop_id(print_stop_words, finished, tokens.tolist(), stop_word_ids)
+            self.ouput_tokens_list[i].append(tokens)
+            token_ids = self.ouput_tokens_list[i].token_ids
+        else:
+            # beam search returns all output tokens each step
+            token_ids = remove_padding_eos(tokens, self.special_tokens.eos_token_id).tolist()
+        output_len = len(token_ids)
+        tokens = self.process_stop_id(print_stop_words, finished, token_ids, stop_word_ids)
         text, all_text = self.tokenids_decode(tokens, self.decoding_states[i], return_incremental)
+        if self.stop_word_matchers[i] is None:
+            self.stop_word_matchers[i] = StopWordMatcher(get_stop_word_automaton(stop_word_str_list))
         text, self.token_buffers[i] = self.process_stop_str(finished,
                                                             return_incremental,
                                                             print_stop_words,
                                                             text, all_text,
-                                                            stop_word_str_list,
+                                                            self.stop_word_matchers[i],
                                                             self.token_buffers[i])
         return output_len, text
 
@@ -71,13 +78,8 @@ class TokenProcessorPerStream:
                         finished: bool,
                         tokens: List[int],
                         stop_word_ids: List[List[int]]) -> List[int]:
-
-        stop_word_id_slices = get_stop_word_slices(stop_word_ids)
         if not print_stop_words:
-            if not finished:
-                tokens = truncate_token_with_stop_word_id(tokens, stop_word_id_slices)
-            else:
-                tokens = truncate_token_with_stop_word_id(tokens, stop_word_ids)
+            tokens = get_stop_word_automaton(stop_word_ids).truncate(tokens, partial=not finished)
         return tokens
 
     def process_stop_str(self,
@@ -86,28 +88,26 @@ class TokenProcessorPerStream:
                          print_stop_words: bool,
                          text: str,
                          all_text: str,
-                         stop_word_str_list: List[str],
+                         stop_word_matcher: StopWordMatcher,
                          token_buffer: str):
 
-        if stop_word_str_list and not finished and match_stop_words(all_text, stop_word_str_list):
+        stop_index = stop_word_matcher.update(all_text)
+        if stop_index >= 0:
             finished = True
 
-        stop_word_str_slices = get_stop_word_slices(stop_word_str_list)
-
         if not print_stop_words:
-            if not return_incremental:
-                if not finished:
-                    text = truncate_response_with_stop_words(text, stop_word_str_slices)
-                else:
-                    text = truncate_response_with_stop_words(text, stop_word_str_list)
-            else:
-                if not finished:
-                    text = token_buffer + text
-                    trunc_text = truncate_response_with_stop_words(text, stop_word_str_slices)
-                    token_buffer = text[len(trunc_text):]
-                    text = trunc_text
-                else:
-                    text = truncate_response_with_stop_words(token_buffer + text, stop_word_str_list)
+            if return_incremental:
+                text = token_buffer + text
+                token_buffer = ""
+            # text is a suffix of all_text
+            offset = len(all_text) - len(text)
+            if stop_index >= 0:
+                text = text[:max(stop_index - offset, 0)]
+            elif not finished:
+                hold_length = min(stop_word_matcher.hold_length, len(text))
+                if return_incremental:
+                    token_buffer = text[len(text) - hold_length:]
+                text = text[:len(text) - hold_length]
         return text, token_buffer
 
     def tokenids_decode(self,
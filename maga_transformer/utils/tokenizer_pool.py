@@ -0,0 +1,107 @@
+import os
+import copy
+import math
+import queue
+import pickle
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+_PROBE_PROMPT = 'hello world'
+
+# tokenizer of each spawned worker process
+_worker_tokenizer: Any = None
+
+def _init_worker(tokenizer: Any):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+def _encode(tokenizer: Any, prompts: List[Any], kwargs: Dict[str, Any]) -> Dict[str, List[Any]]:
+    # fast tokenizers batch encode the prompts in rust without the gil
+    encoded = tokenizer(prompts, **kwargs)
+    return {key: list(value) for key, value in encoded.items()}
+
+def _encode_in_worker(prompts: List[Any], kwargs: Dict[str, Any]) -> Dict[str, List[Any]]:
+    return _encode(_worker_tokenizer, prompts, kwargs)
+
+class TokenizerPool(object):
+    '''
+    encodes prompts with `pool_size` tokenizers, so that requests are tokenized concurrently and a large request
+    is split in order into chunks of at least `min_chunk_size` prompts, one chunk per tokenizer. tokenizers are
+    copies used by one thread at a time, or live in spawned processes with `use_process` for slow python
+    tokenizers which hold the gil.
+    '''
+    def __init__(self, tokenizer: Any, pool_size: int = 1, min_chunk_size: int = 16, use_process: bool = False):
+        self.pool_size = max(1, pool_size)
+        self.min_chunk_size = max(1, min_chunk_size)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        if use_process:
+            try:
+                pickle.dumps(tokenizer)
+                self._process_pool = ProcessPoolExecutor(self.pool_size, mp_context=multiprocessing.get_context('spawn'),
+                                                         initializer=_init_worker, initargs=(tokenizer,))
+                # tokenizer may fail to load or run in a worker process, e.g. remote code not importable there
+                self._process_pool.submit(_encode_in_worker, [_PROBE_PROMPT], {}).result()
+            except Exception as e:
+                logging.warning(f"tokenizer can not be used in worker processes: {e}, use tokenizer copies in threads")
+                if self._process_pool is not None:
+                    self._process_pool.shutdown()
+                    self._process_pool = None
+        if self._process_pool is None:
+            self._tokenizers: queue.Queue = queue.Queue()
+            self._tokenizers.put(tokenizer)
+            for _ in range(self.pool_size - 1):
+                self._tokenizers.put(copy.deepcopy(tokenizer))
+            if self.pool_size > 1:
+                self._thread_pool = ThreadPoolExecutor(self.pool_size, thread_name_prefix='tokenizer_pool')
+
+    def _split(self, prompts: List[Any]) -> List[List[Any]]:
+        chunk_num = max(1, min(self.pool_size, len(prompts) // self.min_chunk_size))
+        chunk_size = max(1, math.ceil(len(prompts) / chunk_num))
+        return [prompts[i: i + chunk_size] for i in range(0, len(prompts), chunk_size)] or [prompts]
+
+    def _encode_with_copy(self, prompts: List[Any], kwargs: Dict[str, Any]) -> Dict[str, List[Any]]:
+        # a tokenizer is not thread safe, truncation and padding settings are changed on each call
+        tokenizer = self._tokenizers.get()
+        try:
+            return _encode(tokenizer, prompts, kwargs)
+        finally:
+            self._tokenizers.put(tokenizer)
+
+    def encode(self, prompts: List[Any], **kwargs: Any) -> Dict[str, List[Any]]:
+        '''encodes like tokenizer(prompts, **kwargs), each key has one value per prompt in the input order'''
+        chunks = self._split(prompts)
+        if self._process_pool is not None:
+            futures = [self._process_pool.submit(_encode_in_worker, chunk, kwargs) for chunk in chunks]
+            results = [future.result() for future in futures]
+        else:
+            futures = [self._thread_pool.submit(self._encode_with_copy, chunk, kwargs) for chunk in chunks[1:]] \
+                if self._thread_pool is not None else []
+            results = [self._encode_with_copy(chunks[0], kwargs)] + [future.result() for future in futures]
+        if len(results) == 1:
+            return results[0]
+        return {key: [value for result in results for value in result[key]] for key in results[0]}
+
+    def stop(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+
+_tokenizer_pools: Dict[int, Tuple[Any, TokenizerPool]] = {}
+_tokenizer_pools_lock = threading.Lock()
+
+def get_tokenizer_pool(tokenizer: Any) -> TokenizerPool:
+    '''one pool per tokenizer, shared by the input generators of a model'''
+    with _tokenizer_pools_lock:
+        if id(tokenizer) not in _tokenizer_pools:
+            pool = TokenizerPool(tokenizer,
+                                 pool_size=int(os.environ.get('TOKENIZER_POOL_SIZE', '1')),
+                                 min_chunk_size=int(os.environ.get('TOKENIZER_POOL_MIN_CHUNK_SIZE', '16')),
+                                 use_process=bool(int(os.environ.get('TOKENIZER_POOL_USE_PROCESS', '0'))))
+            # keep tokenizer alive so that its id is not reused
+            _tokenizer_pools[id(tokenizer)] = (tokenizer, pool)
+        return _tokenizer_pools[id(tokenizer)][1]
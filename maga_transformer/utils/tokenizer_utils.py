@@ -1,4 +1,4 @@
-from typing import List, Optional, Tuple, Union
+from typing import Any, List, Optional, Tuple, Union
 
 from transformers import (PreTrainedTokenizer,
                           PreTrainedTokenizerFast)
@@ -132,3 +132,40 @@ class IncrementDecodingUtils(object):
                 spaces_between_special_tokens=spaces_between_special_tokens,
             )
         return prefix_text, new_text
+
+class StreamDetokenizer(object):
+    '''
+    incremental detokenizer of one output stream, kept across steps by the renderers.
+    `decode` returns the text of the tokens after `read_offset`, decoding only tokens[prefix_offset:];
+    the text of the committed tokens[prefix_offset:read_offset] is kept from the step that committed it
+    instead of being decoded again. once the window exceeds `max_window` tokens it restarts `context`
+    tokens before read_offset, so the decoded window stays short.
+    '''
+    def __init__(self, tokenizer: Any, max_window: int = 32, context: int = 4):
+        self.tokenizer = tokenizer
+        self.max_window = max_window
+        self.context = context
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.prefix_text = ""
+        self._token_ids: List[int] = []
+        self._pending: Optional[Tuple[int, str]] = None
+
+    def decode(self, token_ids: List[int]) -> str:
+        if len(token_ids) <= self.read_offset:
+            self._pending = None
+            return ""
+        window_text = self.tokenizer.decode(token_ids[self.prefix_offset:])
+        self._token_ids = token_ids
+        self._pending = (len(token_ids), window_text)
+        return window_text[len(self.prefix_text):]
+
+    def commit(self) -> None:
+        '''mark the tokens of the last `decode` as responded'''
+        if self._pending is None:
+            return
+        self.read_offset, self.prefix_text = self._pending
+        self._pending = None
+        if self.read_offset - self.prefix_offset > self.max_window:
+            self.prefix_offset = max(self.read_offset - self.context, 0)
+            self.prefix_text = self.tokenizer.decode(self._token_ids[self.prefix_offset:self.read_offset])
@@ -0,0 +1,243 @@
+import json
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from maga_transformer.utils.stop_word_matcher import StopWordMatcher, get_stop_word_automaton
+
+@dataclass
+class ToolCallDelta:
+    index: int
+    # only set on the first delta of a call
+    name: Optional[str] = None
+    # raw json fragment of the arguments value
+    arguments: str = ""
+
+class StreamToolCallParser(object):
+    '''
+    incremental parser of `<tool_call>{"name": ..., "arguments": ...}</tool_call>` blocks in streamed text.
+    text outside the blocks is passed through; a call's name is reported as soon as it is complete, then its
+    arguments as raw json fragments while they stream in. each char is scanned once, tags split across
+    deltas are held back until they can be told apart from text.
+    calls whose name can not be parsed are returned as text, or dropped with `skip_invalid`. once the name is
+    reported the call is kept, even if its arguments turn out not to be valid json.
+    like the not streamed response, trailing whitespace of the text is held until more text follows, and dropped
+    at the end if there are tool calls. arguments are passed on as the model wrote them, while the not streamed
+    response dumps them again, so both parse to the same json but spacing and escapes may differ.
+    '''
+    def __init__(self, begin_tag: str = "<tool_call>", end_tag: str = "</tool_call>", skip_invalid: bool = False):
+        self.begin_tag = begin_tag
+        self.end_tag = end_tag
+        self.skip_invalid = skip_invalid
+        self.call_count = 0
+        self.in_tool_call = False
+        # text held back as a possible tag prefix
+        self._held = ""
+        # trailing whitespace of text, dropped at the end if there are tool calls
+        self._space = ""
+        self._new_matcher(begin_tag)
+
+    def _new_matcher(self, tag: str) -> None:
+        self._matcher = StopWordMatcher(get_stop_word_automaton([tag]))
+        self._fed = 0
+
+    def _match(self, delta: str) -> Tuple[str, int]:
+        '''held text + delta, and the index of the tag in it (-1 if not found) or the length confirmed not to be tag'''
+        base = self._fed - len(self._held)
+        text = self._held + delta
+        stop_index = self._matcher.feed(delta)
+        self._fed += len(delta)
+        if stop_index >= 0:
+            self._held = ""
+            return text, stop_index - base
+        hold = self._matcher.hold_length
+        self._held = text[len(text) - hold:] if hold else ""
+        return text, -1
+
+    def feed(self, delta: str) -> Tuple[str, List[ToolCallDelta]]:
+        '''text outside tool calls and tool call deltas of delta'''
+        texts: List[str] = []
+        deltas: List[ToolCallDelta] = []
+        while True:
+            text, index = self._match(delta)
+            if not self.in_tool_call:
+                if index < 0:
+                    self._emit_text(text[:len(text) - len(self._held)], texts)
+                    break
+                self._emit_text(text[:index], texts)
+                self._start_call()
+                delta = text[index + len(self.begin_tag):]
+            else:
+                if index < 0:
+                    self._scan(text[:len(text) - len(self._held)])
+                    self._emit_call(deltas)
+                    break
+                self._scan(text[:index])
+                self._end_call(texts, deltas)
+                delta = text[index + len(self.end_tag):]
+        return "".join(texts), deltas
+
+    def flush(self) -> Tuple[str, List[ToolCallDelta]]:
+        '''end of stream: held text and the rest of an unfinished call'''
+        texts: List[str] = []
+        deltas: List[ToolCallDelta] = []
+        if not self.in_tool_call:
+            if self._held:
+                texts.append(self._space + self._held)
+            elif self.call_count == 0:
+                texts.append(self._space)
+        else:
+            self._scan(self._held)
+            self._emit_call(deltas)
+            if self._name_emitted:
+                logging.warning(f"tool call {self.call_count} is not finished")
+            elif not self.skip_invalid:
+                texts.append(self._space + self.begin_tag + "".join(self._raw))
+            self.in_tool_call = False
+        self._held = ""
+        self._space = ""
+        return "".join(texts), deltas
+
+    def _emit_text(self, text: str, texts: List[str]) -> None:
+        content = text.rstrip()
+        if not content:
+            self._space += text
+            return
+        texts.append(self._space + content)
+        self._space = text[len(content):]
+
+    def _start_call(self) -> None:
+        self.in_tool_call = True
+        self._new_matcher(self.end_tag)
+        self._raw: List[str] = []
+        self._name: Optional[str] = None
+        self._name_emitted = False
+        self._arguments: List[str] = []
+        self._failed = False
+        # json scan state, `_top` is the expected token of the outermost object
+        self._top = 'start'
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = ""
+        self._capture: Optional[List[str]] = None
+
+    def _end_call(self, texts: List[str], deltas: List[ToolCallDelta]) -> None:
+        self.in_tool_call = False
+        self._new_matcher(self.begin_tag)
+        self._emit_call(deltas)
+        if self._name_emitted:
+            if self._top != 'done':
+                logging.warning(f"tool call {self.call_count} is not a complete json object")
+            self.call_count += 1
+        elif not self.skip_invalid:
+            logging.warning(f"failed to parse tool call: {''.join(self._raw)}")
+            texts.append(self._space + self.begin_tag + "".join(self._raw) + self.end_tag)
+            self._space = ""
+
+    def _emit_call(self, deltas: List[ToolCallDelta]) -> None:
+        if self._name is None:
+            return
+        arguments = "".join(self._arguments)
+        self._arguments = []
+        if not self._name_emitted:
+            self._name_emitted = True
+            self._raw = []
+            deltas.append(ToolCallDelta(self.call_count, self._name, arguments))
+        elif arguments:
+            deltas.append(ToolCallDelta(self.call_count, None, arguments))
+
+    def _end_value(self) -> None:
+        if self._key == 'name' and self._capture is not None:
+            try:
+                name = json.loads("".join(self._capture))
+                if isinstance(name, str):
+                    self._name = name
+            except ValueError:
+                pass
+        self._capture = None
+        self._top = 'comma'
+
+    def _value_char(self, ch: str) -> None:
+        if self._key == 'arguments':
+            self._arguments.append(ch)
+        elif self._capture is not None:
+            self._capture.append(ch)
+
+    def _scan(self, text: str) -> None:
+        if not self._name_emitted:
+            self._raw.append(text)
+        if self._failed:
+            return
+        for ch in text:
+            if self._in_string:
+                if self._top == 'key':
+                    self._capture.append(ch)
+                else:
+                    self._value_char(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._top == 'key':
+                        try:
+                            self._key = json.loads("".join(self._capture))
+                        except ValueError:
+                            self._failed = True
+                            return
+                        self._top = 'colon'
+                    elif self._depth == 1:
+                        self._end_value()
+                continue
+            if self._depth > 1:
+                self._value_char(ch)
+                if ch == '"':
+                    self._in_string = True
+                elif ch == '{' or ch == '[':
+                    self._depth += 1
+                elif ch == '}' or ch == ']':
+                    self._depth -= 1
+                    if self._depth == 1:
+                        self._end_value()
+                continue
+            if ch.isspace() and self._top != 'primitive':
+                continue
+            top = self._top
+            if top == 'start':
+                if ch != '{':
+                    self._failed = True
+                    return
+                self._depth = 1
+                self._top = 'key'
+            elif top == 'key' and ch == '"':
+                self._in_string = True
+                self._capture = ['"']
+            elif top == 'colon' and ch == ':':
+                self._top = 'value'
+            elif top == 'value':
+                self._capture = [] if self._key == 'name' else None
+                self._value_char(ch)
+                if ch == '"':
+                    self._in_string = True
+                elif ch == '{' or ch == '[':
+                    self._depth += 1
+                else:
+                    self._top = 'primitive'
+            elif top == 'primitive' and not (ch == ',' or ch == '}' or ch.isspace()):
+                self._value_char(ch)
+            elif (top == 'comma' or top == 'primitive' or top == 'key') and ch == '}':
+                self._end_value()
+                self._depth = 0
+                self._top = 'done'
+            elif (top == 'comma' or top == 'primitive') and ch == ',':
+                self._end_value()
+                self._top = 'key'
+            elif top == 'primitive' and ch.isspace():
+                self._end_value()
+            elif top == 'done':
+                continue
+            else:
+                self._failed = True
+                return
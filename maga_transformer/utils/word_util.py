@@ -2,6 +2,8 @@ import numpy as np
 import torch
 from typing import List, Union, Any
 
+from maga_transformer.utils.stop_word_matcher import get_stop_word_automaton
+
 def remove_padding_eos(token_ids: torch.Tensor, eos_token_id: int) -> torch.Tensor:
     # token_ids shape: [max_length]
     out_token_ids = token_ids.cpu().numpy()
@@ -66,39 +68,16 @@ def get_stop_word_slices(stop_word_list: List[Union[str, List[int]]]) -> List[Un
     return result
 
 def is_truncated(input_str: str, trunc_strs: List[str], is_streaming: bool):
-    if len(input_str) > 0 and len(truncate_response_with_stop_words(input_str, trunc_strs, is_streaming)) != len(input_str):
-        return True
-    return False
+    return get_stop_word_automaton(trunc_strs).is_truncated(input_str, is_streaming)
 
 def truncate_response_with_stop_words(response: str, stop_word_strs: List[str], is_streaming: bool = True):
-    if is_streaming:
-        for stop_word in stop_word_strs:
-            if stop_word and response.endswith(stop_word):
-                response = response[:(-len(stop_word))]
-                break
-    else:
-        min_index = len(response)
-        for stop_word in stop_word_strs:
-            if stop_word:
-                index = response.find(stop_word)
-                if index != -1 and index < min_index:
-                    min_index = index
-        if min_index != len(response):
-            response = response[:min_index]
-    return response
-
-def truncate_token_with_stop_word_id(tokens: List[int], stop_word_ids: List[int]):
-    for stop_word_id in stop_word_ids:
-        if stop_word_id and tokens[-len(stop_word_id):] == stop_word_id:
-            tokens = tokens[:(-len(stop_word_id))]
-            break
-    return tokens
+    return get_stop_word_automaton(stop_word_strs).truncate(response, is_streaming)
+
+def truncate_token_with_stop_word_id(tokens: List[int], stop_word_ids: List[List[int]]):
+    return get_stop_word_automaton(stop_word_ids).truncate(tokens)
 
 def match_stop_words(response: str, stop_word_strs: List[str]) -> bool:
-    for stop_word in stop_word_strs:
-        if stop_word and response.endswith(stop_word):
-            return True
-    return False
+    return get_stop_word_automaton(stop_word_strs).match_suffix_length(response) > 0
 
 # main
 if __name__ == "__main__":